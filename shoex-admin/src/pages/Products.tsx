@@ -45,25 +45,35 @@ const formatCurrency = (amount: number) => {
   }).format(amount)
 }
 
+const PAGE_SIZE = 50
+
 const GET_PRODUCTS = gql`
-  query GetProducts($search: String) {
-    products(search: $search) {
-      productId
-      name
-      basePrice
-      isActive
-      store {
-        name
-      }
-      category {
-        name
+  query GetProducts($search: String, $first: Int, $after: String) {
+    products(search: $search, first: $first, after: $after) {
+      pageInfo {
+        hasNextPage
+        endCursor
       }
-      createdAt
-      galleryImages {
-        id
-        image
-        isThumbnail
-        altText
+      edges {
+        node {
+          productId
+          name
+          basePrice
+          isActive
+          store {
+            name
+          }
+          category {
+            name
+          }
+          createdAt
+          galleryImages {
+            id
+            image
+            isThumbnail
+            altText
+          }
+        }
       }
     }
   }
@@ -73,27 +83,52 @@ const Products: React.FC = () => {
   const [searchTerm, setSearchTerm] = useState('')
   const [debouncedSearchTerm, setDebouncedSearchTerm] = useState('')
   const queryVariables = useMemo(() => ({
-    search: debouncedSearchTerm.trim() ? debouncedSearchTerm.trim() : null
+    search: debouncedSearchTerm.trim() ? debouncedSearchTerm.trim() : null,
+    first: PAGE_SIZE
   }), [debouncedSearchTerm])
-  const [getProducts, { loading: queryLoading, error, data }] = useLazyQuery(GET_PRODUCTS)
+  const [getProducts, { loading: queryLoading, error, data, fetchMore }] = useLazyQuery(GET_PRODUCTS)
+  const [loadingMore, setLoadingMore] = useState(false)
   const [createProduct] = useMutation(PRODUCT_CREATE)
   const [updateProduct] = useMutation(PRODUCT_UPDATE)
   const [uploadProductImage] = useMutation(UPLOAD_PRODUCT_IMAGE)
 
   // Initial load and debounced search
   useEffect(() => {
-    getProducts({ variables: { search: null } })
+    getProducts({ variables: { search: null, first: PAGE_SIZE } })
   }, [getProducts])
 
   useEffect(() => {
     const timer = setTimeout(() => {
       setDebouncedSearchTerm(searchTerm)
-      getProducts({ variables: { search: searchTerm.trim() ? searchTerm.trim() : null } })
+      getProducts({ variables: { search: searchTerm.trim() ? searchTerm.trim() : null, first: PAGE_SIZE } })
     }, 300)
 
     return () => clearTimeout(timer)
   }, [searchTerm, getProducts])
 
+  // Keyset pagination: load the next page after the last cursor and append its edges
+  const handleLoadMore = async () => {
+    const pageInfo = data?.products?.pageInfo
+    if (!pageInfo?.hasNextPage || !fetchMore) return
+    setLoadingMore(true)
+    try {
+      await fetchMore({
+        variables: { ...queryVariables, after: pageInfo.endCursor },
+        updateQuery: (prev: any, { fetchMoreResult }: any) => {
+          if (!fetchMoreResult) return prev
+          return {
+            products: {
+              ...fetchMoreResult.products,
+              edges: [...prev.products.edges, ...fetchMoreResult.products.edges]
+            }
+          }
+        }
+      })
+    } finally {
+      setLoadingMore(false)
+    }
+  }
+
   const handleOpenModal = () => {
     setOpenModal(true)
     setFormErrors([])
@@ -222,7 +257,8 @@ const Products: React.FC = () => {
   if (queryLoading) return <Typography>Loading...</Typography>
   if (error) return <Typography>Error: {error.message}</Typography>
 
-  const products = data?.products || []
+  const products = data?.products?.edges?.map((edge: { node: Product }) => edge.node) || []
+  const hasNextPage = Boolean(data?.products?.pageInfo?.hasNextPage)
 
   return (
     <Box>
@@ -313,6 +349,14 @@ const Products: React.FC = () => {
         </Table>
       </TableContainer>
 
+      {hasNextPage && (
+        <Box display="flex" justifyContent="center" mt={2}>
+          <Button variant="outlined" onClick={handleLoadMore} disabled={loadingMore}>
+            {loadingMore ? 'Loading...' : 'Load more'}
+          </Button>
+        </Box>
+      )}
+
       <Dialog open={openModal} onClose={handleCloseModal} maxWidth="sm" fullWidth>
         <DialogTitle>{isEditMode ? 'Edit Product' : 'Add New Product'}</DialogTitle>
         <DialogContent>
@@ -39,6 +39,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',  # Full-text / trigram search (products.search)
     'corsheaders',  # Thêm CORS support
     "graphene_django",
     "django_filters", #Đức thêm
@@ -65,6 +66,7 @@ MIDDLEWARE = [
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'SHOEX.products.history.HistoryBufferMiddleware',  # Ghi lịch sử kho / giá theo lô mỗi request
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -148,6 +150,9 @@ USE_I18N = True
 
 USE_TZ = True
 
+# Múi giờ cửa hàng: ngày hiệu lực voucher, sang ngày mới lúc nửa đêm giờ này (discount.index)
+STORE_TIME_ZONE = 'Asia/Ho_Chi_Minh'
+
 
 # Static files (CSS, JavaScript, Images)
 # https://docs.djangoproject.com/en/5.2/howto/static-files/
@@ -1,7 +1,6 @@
 
 from django.contrib import admin
 from django.urls import path, include
-from graphene_django.views import GraphQLView  # Thay đổi import
 from django.conf import settings
 from django.conf.urls.static import static
 from django.http import HttpResponse
@@ -17,6 +16,8 @@ sys.path.insert(0, project_root)
 
 # Import schema từ graphql app
 from graphql_api.api import schema
+from graphql_api.core.views import ShoexGraphQLView  # GraphQLView + DataLoader registry theo request
+from SHOEX.products.views import catalog_export
 
 def home_view(request):
     return HttpResponse("""
@@ -30,8 +31,9 @@ urlpatterns = [
     path('', home_view, name='home'),  # Root URL
     path('admin/', admin.site.urls),
     # Accept both with and without trailing slash to avoid APPEND_SLASH POST errors
-    path('graphql/', csrf_exempt(GraphQLView.as_view(graphiql=True, schema=schema))),  # Sử dụng GraphQLView
-    path('graphql', csrf_exempt(GraphQLView.as_view(graphiql=True, schema=schema))),  # Accept no-trailing-slash POSTs
+    path('graphql/', csrf_exempt(ShoexGraphQLView.as_view(graphiql=True, schema=schema))),  # Sử dụng ShoexGraphQLView
+    path('graphql', csrf_exempt(ShoexGraphQLView.as_view(graphiql=True, schema=schema))),  # Accept no-trailing-slash POSTs
+    path('exports/catalog/', catalog_export, name='catalog-export'),  # Xuất catalog theo luồng (NDJSON / CSV)
 ]
 if settings.DEBUG:
     urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
\ No newline at end of file
@@ -9,11 +9,11 @@ from .models import (
 class VoucherAdmin(admin.ModelAdmin):
     list_display = [
         'code', 'type', 'discount_type', 'discount_value',
-        'start_date', 'end_date', 'is_active', 'is_auto'
+        'start_date', 'end_date', 'used_count', 'usage_limit', 'is_active', 'is_auto'
     ]
     list_filter = ['type', 'discount_type', 'is_active', 'is_auto', 'start_date', 'end_date']
     search_fields = ['code', 'seller__username']
-    readonly_fields = ['created_at', 'updated_at']
+    readonly_fields = ['used_count', 'created_at', 'updated_at']
     
     fieldsets = (
         ('Thông tin cơ bản', {
@@ -26,7 +26,7 @@ class VoucherAdmin(admin.ModelAdmin):
             'fields': ('start_date', 'end_date')
         }),
         ('Giới hạn sử dụng', {
-            'fields': ('usage_limit', 'per_user_limit')
+            'fields': ('usage_limit', 'per_user_limit', 'used_count')
         }),
         ('Trạng thái', {
             'fields': ('is_active', 'is_auto')
@@ -76,9 +76,9 @@ class UserVoucherAdmin(admin.ModelAdmin):
 @admin.register(OrderVoucher)
 class OrderVoucherAdmin(admin.ModelAdmin):
     list_display = [
-        'order', 'voucher', 'discount_amount', 'applied_at'
+        'order', 'voucher', 'discount_amount', 'applied_at', 'released_at'
     ]
-    list_filter = ['applied_at', 'voucher__type']
+    list_filter = ['applied_at', 'released_at', 'voucher__type']
     search_fields = ['order__order_id', 'voucher__code']
-    readonly_fields = ['applied_at']
+    readonly_fields = ['applied_at', 'released_at']
     raw_id_fields = ['order', 'voucher']
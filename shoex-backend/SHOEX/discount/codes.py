@@ -0,0 +1,291 @@
+"""
+Sinh mã voucher hàng loạt và tra mã voucher người dùng gõ
+
+Sinh mã (create_vouchers_bulk):
+- Mã ngẫu nhiên (secrets) trên bảng 32 chữ không có ký tự dễ nhầm (0/O, 1/I)
+- Theo lô: bỏ trùng trong lô, bỏ mã đã có trong DB (1 query / lô), bulk_create;
+  đụng mã do ghi đồng thời (IntegrityError) => sinh lại cả lô
+- bulk_create không bắn signal => tự tăng version chỉ mục voucher và bộ lọc mã trong từng lô
+
+Tra mã (lookup_voucher_id / check_voucher_code):
+- Bloom filter chứa mọi mã trong DB: mã không có trong filter (và version không đổi)
+  => chắc chắn không tồn tại, không cần tra bảng voucher (phần lớn trường hợp gõ dở / gõ sai)
+- LRU {mã: voucher_id | None} cho các mã đã tra => gõ lại cùng mã không query lại
+- Version trong DB như index.py (shared_version): signal tạo / đổi mã / xóa voucher tăng
+  version cùng transaction với dòng voucher
+- Version đổi => chỉ thêm mã của voucher ghi từ mốc lần dựng trước (trừ CODES_OVERLAP cho
+  transaction commit muộn), không dựng lại cả bộ lọc; dựng lại khi vượt sức chứa
+- Không bao giờ trả lời sai "không tồn tại": filter báo thiếu mã => đọc lại version ngay,
+  version đã đổi thì cập nhật filter rồi tra lại
+"""
+
+import hashlib
+import math
+import secrets
+import threading
+from collections import OrderedDict
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from .index import CACHE_ALIAS, bump_version, get_voucher_index, invalidate_voucher_index, shared_version
+from .models import Voucher, VoucherProduct, VoucherCategory, VoucherStore
+
+
+CODE_ALPHABET = '23456789ABCDEFGHJKLMNPQRSTUVWXYZ'  # 32 ký tự => mỗi byte ngẫu nhiên & 31
+CODES_VERSION = 'voucher_codes'
+CODES_SNAPSHOT_KEY = 'discount:voucher_codes'
+CODES_SNAPSHOT_TIMEOUT = 24 * 60 * 60
+CODES_OVERLAP = timedelta(minutes=5)   # updated_at đặt trước commit => quét lùi thêm
+BLOOM_ERROR_RATE = 0.01
+BLOOM_HEADROOM = 1.25                  # Chỗ trống cho mã thêm dần trước khi phải dựng lại
+LRU_SIZE = getattr(settings, 'VOUCHER_CODE_LRU_SIZE', 10000)
+
+# Các field sao chép từ voucher mẫu khi sinh hàng loạt
+TEMPLATE_FIELDS = (
+    'type', 'seller_id', 'discount_type', 'discount_value', 'min_order_amount', 'max_discount',
+    'start_date', 'end_date', 'usage_limit', 'per_user_limit', 'is_active', 'is_auto',
+)
+
+
+def normalize_code(code):
+    return (code or '').strip()
+
+
+# ===== SINH MÃ HÀNG LOẠT =====
+
+def random_code(prefix='', length=10):
+    return prefix + ''.join(CODE_ALPHABET[byte & 31] for byte in secrets.token_bytes(length))
+
+
+def _new_codes(size, prefix, length):
+    """size mã khác nhau, chưa có trong DB"""
+    codes = set()
+    while len(codes) < size:
+        batch = {random_code(prefix, length) for _ in range(size - len(codes))}
+        batch -= set(Voucher.objects.filter(code__in=batch).values_list('code', flat=True))
+        codes |= batch
+    return sorted(codes)
+
+
+def template_from_voucher(voucher):
+    """Voucher mẫu -> (template dict, links) cho create_vouchers_bulk"""
+    template = {field: getattr(voucher, field) for field in TEMPLATE_FIELDS}
+    links = {
+        'product_ids': list(voucher.voucher_products.values_list('product_id', flat=True)),
+        'category_ids': list(voucher.voucher_categories.values_list('category_id', flat=True)),
+        'store_ids': list(voucher.voucher_stores.values_list('store_id', flat=True)),
+    }
+    return template, links
+
+
+def create_vouchers_bulk(template, count, prefix='', length=10, batch_size=1000, links=None):
+    """
+    Tạo `count` voucher cùng cấu hình `template` với mã ngẫu nhiên không trùng
+    links: {'product_ids': [...], 'category_ids': [...], 'store_ids': [...]} sao chép cho mọi voucher
+    Trả về số voucher đã tạo
+    """
+    if len(CODE_ALPHABET) ** length < count * 100:
+        # Không gian mã quá nhỏ => tỉ lệ đụng cao, sinh lại liên tục
+        raise ValueError(f"Độ dài mã {length} quá ngắn cho {count} voucher")
+    Voucher(code=prefix or 'X', **template).full_clean(exclude=['code'])
+    links = links or {}
+
+    created = 0
+    while created < count:
+        size = min(batch_size, count - created)
+        codes = _new_codes(size, prefix, length)
+        try:
+            with transaction.atomic():
+                vouchers = Voucher.objects.bulk_create([
+                    Voucher(code=code, **template) for code in codes
+                ])
+                for model, field, key in (
+                    (VoucherProduct, 'product_id', 'product_ids'),
+                    (VoucherCategory, 'category_id', 'category_ids'),
+                    (VoucherStore, 'store_id', 'store_ids'),
+                ):
+                    if links.get(key):
+                        model.objects.bulk_create([
+                            model(voucher_id=voucher.pk, **{field: target_id})
+                            for voucher in vouchers for target_id in links[key]
+                        ], batch_size=batch_size)
+                invalidate_voucher_index()
+                invalidate_voucher_codes()
+        except IntegrityError:
+            continue  # Mã vừa bị process khác tạo trước => sinh lại lô này
+        created += len(vouchers)
+
+    return created
+
+
+# ===== BLOOM FILTER + LRU =====
+
+class BloomFilter:
+    """Bloom filter trên bytearray, k vị trí bằng double hashing từ blake2b"""
+
+    def __init__(self, capacity, error_rate=BLOOM_ERROR_RATE):
+        capacity = max(capacity, 1)
+        self.size = max(int(-capacity * math.log(error_rate) / (math.log(2) ** 2)), 8)
+        self.hash_count = max(int(round(self.size / capacity * math.log(2))), 1)
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, value):
+        digest = hashlib.blake2b(value.encode(), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], 'little')
+        second = int.from_bytes(digest[8:], 'little') | 1
+        return [(first + i * second) % self.size for i in range(self.hash_count)]
+
+    def add(self, value):
+        bits = self.bits
+        for position in self._positions(value):
+            bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, value):
+        bits = self.bits
+        return all(bits[position >> 3] & (1 << (position & 7)) for position in self._positions(value))
+
+
+class VoucherCodeFilter:
+    """
+    Bloom filter các mã voucher trong DB + LRU kết quả tra cứu
+
+    watermark: thời điểm bắt đầu lần dựng / cập nhật gần nhất (mã của voucher ghi sau đó
+    được thêm ở lần refresh sau); count / capacity: số mã đã thêm / sức chứa của bloom
+    """
+
+    def __init__(self, version, bloom, watermark, count, capacity):
+        self.version = version
+        self.bloom = bloom
+        self.watermark = watermark
+        self.count = count
+        self.capacity = capacity
+        self._lru = OrderedDict()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def build(cls, version=0):
+        """Đọc mọi mã theo luồng (iterator) => bộ nhớ chỉ tốn cho bit array"""
+        watermark = timezone.now()
+        capacity = int(Voucher.objects.count() * BLOOM_HEADROOM) + 1000
+        bloom = BloomFilter(capacity)
+        count = 0
+        for code in Voucher.objects.values_list('code', flat=True).iterator(chunk_size=5000):
+            bloom.add(normalize_code(code))
+            count += 1
+        return cls(version, bloom, watermark, count, capacity)
+
+    def refresh(self, version):
+        """
+        Thêm mã của voucher ghi từ watermark - CODES_OVERLAP (mã đã xóa vẫn nằm trong bloom,
+        chỉ thành dương tính giả). Trả về False nếu vượt sức chứa => cần build() lại
+        """
+        watermark = timezone.now()
+        codes = list(
+            Voucher.objects.filter(updated_at__gte=self.watermark - CODES_OVERLAP)
+            .values_list('code', flat=True)
+        )
+        codes = {normalize_code(code) for code in codes}
+        codes = [code for code in codes if code not in self.bloom]  # Quét lùi => phần lớn đã có
+        if self.count + len(codes) > self.capacity:
+            return False
+        for code in codes:
+            self.bloom.add(code)
+        self.count += len(codes)
+        self.version = version
+        self.watermark = watermark
+        with self._lock:
+            self._lru.clear()  # Bỏ các kết quả "không tồn tại" đã nhớ
+        return True
+
+    def __getstate__(self):
+        # Snapshot trong cache chỉ cần bloom, LRU là của riêng từng process
+        return {
+            'version': self.version, 'bloom': self.bloom, 'watermark': self.watermark,
+            'count': self.count, 'capacity': self.capacity,
+        }
+
+    def __setstate__(self, state):
+        self.__init__(state['version'], state['bloom'], state['watermark'], state['count'], state['capacity'])
+
+    def lookup(self, code):
+        """voucher_id của mã, None nếu không tồn tại"""
+        code = normalize_code(code)
+        if not code or code not in self.bloom:
+            return None
+        with self._lock:
+            if code in self._lru:
+                self._lru.move_to_end(code)
+                return self._lru[code]
+        voucher_id = Voucher.objects.filter(code=code).values_list('voucher_id', flat=True).first()
+        with self._lock:
+            self._lru[code] = voucher_id
+            if len(self._lru) > LRU_SIZE:
+                self._lru.popitem(last=False)
+        return voucher_id
+
+
+_lock = threading.Lock()
+_current = None
+
+
+def _cache():
+    return caches[CACHE_ALIAS]
+
+
+def get_voucher_code_filter(fresh=False):
+    """
+    Bộ lọc mã của version hiện tại (version trong DB đọc lại mỗi vài giây, fresh => đọc ngay)
+    Version đổi => cập nhật dần từ snapshot trong cache / bản trong process
+    """
+    global _current
+    version = shared_version(CODES_VERSION, fresh=fresh)
+    current = _current
+    if current is not None and current.version >= version:
+        return current
+
+    with _lock:
+        current = _current
+        if current is not None and current.version >= version:
+            return current
+        code_filter = _cache().get(CODES_SNAPSHOT_KEY) or current
+        if code_filter is None or (code_filter.version < version and not code_filter.refresh(version)):
+            code_filter = VoucherCodeFilter.build(version)
+        _cache().set(CODES_SNAPSHOT_KEY, code_filter, timeout=CODES_SNAPSHOT_TIMEOUT)
+        _current = code_filter
+        return code_filter
+
+
+def invalidate_voucher_codes():
+    """Mã voucher được thêm / đổi / xóa => tăng version (trong transaction hiện tại)"""
+    bump_version(CODES_VERSION)
+
+
+def lookup_voucher_id(code):
+    code_filter = get_voucher_code_filter()
+    version = code_filter.version
+    voucher_id = code_filter.lookup(code)
+    if voucher_id is None:
+        # Mã có thể vừa được tạo ở process khác: đọc lại version ngay (1 query khóa chính)
+        # thay vì chờ vài giây; version không đổi => filter đã có mọi mã, "không tồn tại" là đúng
+        latest = get_voucher_code_filter(fresh=True)
+        if latest.version != version:
+            voucher_id = latest.lookup(code)
+    return voucher_id
+
+
+def check_voucher_code(code):
+    """
+    Kiểm tra mã người dùng nhập: (voucher_id | None, thông báo)
+    Mã không tồn tại: bloom + 1 query version theo khóa chính (không quét bảng voucher);
+    không hiệu lực hôm nay: trả lời từ chỉ mục trong bộ nhớ
+    """
+    voucher_id = lookup_voucher_id(code)
+    if voucher_id is None:
+        return None, "Mã voucher không tồn tại"
+    if voucher_id not in get_voucher_index().vouchers:
+        return None, "Voucher không còn hiệu lực"
+    return voucher_id, "Mã voucher hợp lệ"
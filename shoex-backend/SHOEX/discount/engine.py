@@ -0,0 +1,72 @@
+"""
+Tính giảm giá sản phẩm theo voucher (dùng cho danh sách / chi tiết sản phẩm)
+
+DiscountEngine đọc chỉ mục voucher hiệu lực dùng chung của process (xem index.py),
+sau đó tính % giảm tối đa cho cả trang sản phẩm trong bộ nhớ (không query theo
+từng sản phẩm). Một engine sống trong một request (xem MaxDiscountByProductIdLoader)
+và memo kết quả theo product.
+"""
+
+from decimal import Decimal
+
+from .index import get_voucher_index
+
+
+HUNDRED = Decimal('100')
+ZERO = Decimal('0')
+
+
+class DiscountEngine:
+    """% giảm tối đa theo lô sản phẩm, dựa trên chỉ mục voucher hiệu lực"""
+
+    def __init__(self, index=None):
+        self._index = index
+        self._memo = {}
+
+    @property
+    def index(self):
+        # Lấy một lần / engine => cả request dùng cùng một bản chỉ mục
+        if self._index is None:
+            self._index = get_voucher_index()
+        return self._index
+
+    # ===== TÍNH GIẢM GIÁ =====
+
+    def _percent(self, voucher_id, base_price):
+        """% giảm của một voucher trên giá base_price (voucher % bị chặn bởi max_discount)"""
+        discount_type, value, max_discount = self.index.vouchers[voucher_id]
+        if discount_type == 'percent':
+            if max_discount and base_price > 0:
+                return min(value, max_discount / base_price * HUNDRED)
+            return value
+        if base_price > 0:
+            return value / base_price * HUNDRED
+        return ZERO
+
+    def max_discounts(self, products):
+        """
+        products: iterable (product_id, category_id, store_id, base_price)
+        Trả về {product_id: Decimal % giảm tối đa}, có memo theo product trong engine
+        """
+        index = self.index
+        result = {}
+        for product_id, category_id, store_id, base_price in products:
+            if product_id in self._memo:
+                result[product_id] = self._memo[product_id]
+                continue
+            voucher_ids = index.voucher_ids_for(product_id, category_id, store_id)
+            best = max((self._percent(voucher_id, base_price) for voucher_id in voucher_ids), default=ZERO)
+            result[product_id] = self._memo[product_id] = best
+        return result
+
+    def max_discount(self, product):
+        """% giảm tối đa cho một Product instance"""
+        return self.max_discounts([
+            (product.product_id, product.category_id, product.store_id, product.base_price)
+        ])[product.product_id]
+
+
+def apply_discount(price, percent):
+    """Giá sau khi giảm percent % (làm tròn 2 chữ số như cột giá)"""
+    price = price * (Decimal('1.0') - Decimal(percent) / HUNDRED)
+    return price.quantize(Decimal('0.01'))
@@ -0,0 +1,170 @@
+"""
+Chỉ mục voucher đang hiệu lực dùng chung trong process
+
+Tập "voucher hiệu lực hôm nay" chỉ đổi khi voucher / liên kết của nó được ghi,
+hoặc khi sang ngày mới (theo múi giờ cửa hàng STORE_TIME_ZONE). Vì vậy chỉ mục
+được dựng một lần rồi dùng lại cho mọi request:
+
+- Signal save/delete của Voucher, VoucherProduct, VoucherCategory, VoucherStore
+  tăng version trong DB (DiscountCacheVersion, cùng transaction với thay đổi)
+- Mỗi process đọc lại version trong DB tối đa mỗi VERSION_CHECK_SECONDS giây
+  (1 query theo khóa chính) => process khác thấy thay đổi sau vài giây, không phụ thuộc
+  CACHES dùng chung hay LocMemCache riêng từng process
+- Khóa theo ngày: qua nửa đêm (giờ cửa hàng) thì tự dựng lại
+- Bản dựng được lưu vào cache (VOUCHER_INDEX_CACHE) theo (ngày, version) để các
+  process khác dùng luôn nếu cache dùng chung, không phải query lại DB
+"""
+
+import threading
+import time as monotonic_time
+import zoneinfo
+from collections import defaultdict
+from datetime import datetime, time, timedelta
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import DiscountCacheVersion, Voucher, VoucherProduct, VoucherCategory, VoucherStore
+
+
+CACHE_ALIAS = getattr(settings, 'VOUCHER_INDEX_CACHE', 'default')
+VERSION_CHECK_SECONDS = getattr(settings, 'VOUCHER_VERSION_CHECK_SECONDS', 5)
+INDEX_VERSION = 'voucher_index'
+SNAPSHOT_KEY = 'discount:voucher_index:{day}:{version}'
+
+
+def store_today():
+    """Ngày hiện tại theo múi giờ cửa hàng"""
+    tz = zoneinfo.ZoneInfo(getattr(settings, 'STORE_TIME_ZONE', settings.TIME_ZONE))
+    return timezone.now().astimezone(tz).date()
+
+
+def _seconds_until_midnight(day):
+    tz = zoneinfo.ZoneInfo(getattr(settings, 'STORE_TIME_ZONE', settings.TIME_ZONE))
+    midnight = datetime.combine(day + timedelta(days=1), time.min, tzinfo=tz)
+    return max(int((midnight - timezone.now()).total_seconds()), 1)
+
+
+class VoucherIndex:
+    """
+    Voucher hiệu lực trong một ngày, đánh chỉ mục theo product / category / store
+
+    vouchers: {voucher_id: (discount_type, discount_value, max_discount)}
+    by_product / by_category / by_store: {id: (voucher_id, ...)}
+    """
+
+    def __init__(self, day, version, vouchers, by_product, by_category, by_store):
+        self.day = day
+        self.version = version
+        self.vouchers = vouchers
+        self.by_product = by_product
+        self.by_category = by_category
+        self.by_store = by_store
+
+    @classmethod
+    def build(cls, day, version=0):
+        """Dựng chỉ mục từ DB: 1 query voucher + 1 query cho mỗi bảng liên kết"""
+        vouchers = {
+            voucher_id: (discount_type, discount_value, max_discount)
+            for voucher_id, discount_type, discount_value, max_discount in Voucher.objects.filter(
+                is_active=True,
+                start_date__lte=day,
+                end_date__gte=day
+            ).values_list('voucher_id', 'discount_type', 'discount_value', 'max_discount')
+        }
+        indexes = []
+        for model, field in (
+            (VoucherProduct, 'product_id'),
+            (VoucherCategory, 'category_id'),
+            (VoucherStore, 'store_id'),
+        ):
+            index = defaultdict(list)
+            if vouchers:
+                for target_id, voucher_id in model.objects.filter(
+                    voucher_id__in=vouchers.keys()
+                ).values_list(field, 'voucher_id'):
+                    index[target_id].append(voucher_id)
+            indexes.append({target_id: tuple(ids) for target_id, ids in index.items()})
+        return cls(day, version, vouchers, *indexes)
+
+    def voucher_ids_for(self, product_id, category_id, store_id):
+        """Các voucher áp dụng được cho một sản phẩm"""
+        voucher_ids = set(self.by_product.get(product_id, ()))
+        voucher_ids.update(self.by_category.get(category_id, ()))
+        voucher_ids.update(self.by_store.get(store_id, ()))
+        return voucher_ids
+
+    def product_filter(self):
+        """Q lọc Product có ít nhất một voucher hiệu lực (dùng cho filter has_discount)"""
+        return (
+            Q(product_id__in=list(self.by_product))
+            | Q(category_id__in=list(self.by_category))
+            | Q(store_id__in=list(self.by_store))
+        )
+
+
+# ===== VERSION TRONG DB (dùng chung với codes.py) =====
+
+_versions = {}     # {tên: (version, thời điểm đọc - monotonic)}
+
+
+def shared_version(name, fresh=False):
+    """Version trong DB, đọc lại tối đa mỗi VERSION_CHECK_SECONDS giây (fresh => đọc ngay)"""
+    cached = _versions.get(name)
+    now = monotonic_time.monotonic()
+    if fresh or cached is None or now - cached[1] >= VERSION_CHECK_SECONDS:
+        cached = (DiscountCacheVersion.current(name), now)
+        _versions[name] = cached
+    return cached[0]
+
+
+def bump_version(name):
+    """
+    Tăng version trong transaction hiện tại (thấy cùng lúc với thay đổi voucher khi commit);
+    process hiện tại đọc lại ngay sau commit
+    """
+    DiscountCacheVersion.bump(name)
+    transaction.on_commit(lambda: _versions.pop(name, None))
+
+
+# ===== CHỈ MỤC DÙNG CHUNG =====
+
+_lock = threading.Lock()
+_current = None
+
+
+def _cache():
+    return caches[CACHE_ALIAS]
+
+
+def get_voucher_index():
+    """
+    Chỉ mục của ngày hôm nay (giờ cửa hàng), dựng lại khi version trong DB đổi
+    hoặc sang ngày mới. Đọc bình thường: không query (version đọc lại mỗi vài giây)
+    """
+    global _current
+    day = store_today()
+    version = shared_version(INDEX_VERSION)
+    current = _current
+    if current is not None and current.day == day and current.version == version:
+        return current
+
+    with _lock:
+        current = _current
+        if current is not None and current.day == day and current.version == version:
+            return current
+        key = SNAPSHOT_KEY.format(day=day.isoformat(), version=version)
+        index = _cache().get(key)
+        if index is None:
+            index = VoucherIndex.build(day, version)
+            _cache().set(key, index, timeout=_seconds_until_midnight(day))
+        _current = index
+        return index
+
+
+def invalidate_voucher_index():
+    """Đánh dấu chỉ mục hết hạn cho mọi process (gọi từ signal khi voucher thay đổi)"""
+    bump_version(INDEX_VERSION)
@@ -0,0 +1,47 @@
+"""
+Sinh hàng loạt voucher mã ngẫu nhiên theo cấu hình của một voucher mẫu
+(loại, mức giảm, thời hạn, giới hạn và liên kết product / category / store):
+    python manage.py generate_vouchers --from SUMMER --count 1000000 --prefix SUM
+"""
+
+import time
+
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+
+from SHOEX.discount.codes import create_vouchers_bulk, template_from_voucher
+from SHOEX.discount.models import Voucher
+
+
+class Command(BaseCommand):
+    help = 'Generate N vouchers with unique random codes, copying settings from a template voucher'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--from', dest='template', required=True, help='Mã voucher mẫu')
+        parser.add_argument('--count', type=int, required=True, help='Số voucher cần sinh')
+        parser.add_argument('--prefix', default='', help='Tiền tố mã')
+        parser.add_argument('--length', type=int, default=10, help='Số ký tự ngẫu nhiên sau tiền tố')
+        parser.add_argument('--batch-size', type=int, default=5000, help='Số voucher mỗi lô bulk_create')
+
+    def handle(self, *args, **options):
+        try:
+            voucher = Voucher.objects.get(code=options['template'])
+        except Voucher.DoesNotExist:
+            raise CommandError(f"Voucher {options['template']} does not exist")
+
+        template, links = template_from_voucher(voucher)
+        started = time.perf_counter()
+        try:
+            created = create_vouchers_bulk(
+                template,
+                options['count'],
+                prefix=options['prefix'],
+                length=options['length'],
+                batch_size=options['batch_size'],
+                links=links,
+            )
+        except (ValueError, ValidationError) as e:
+            raise CommandError(str(e))
+        self.stdout.write(
+            self.style.SUCCESS(f'Created {created} vouchers in {time.perf_counter() - started:.1f}s')
+        )
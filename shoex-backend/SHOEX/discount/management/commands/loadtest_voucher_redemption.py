@@ -0,0 +1,90 @@
+"""
+Load test dùng lượt voucher đồng thời: chứng minh không vượt usage_limit
+Tạo một voucher tạm, cho nhiều thread cùng giữ lượt (mỗi lần một transaction),
+rồi so số lượt thành công với used_count và usage_limit; xóa voucher khi xong:
+    python manage.py loadtest_voucher_redemption --limit 100 --attempts 1000 --threads 50
+Nên chạy trên PostgreSQL (sqlite khóa cả file nên các lần ghi bị tuần tự hóa).
+"""
+
+import threading
+import time
+import uuid
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.utils import OperationalError
+
+from SHOEX.discount.index import store_today
+from SHOEX.discount.models import Voucher
+from SHOEX.discount.redemption import VoucherRedemptionError, reserve_usage
+
+
+class Command(BaseCommand):
+    help = 'Concurrently redeem a temporary voucher and verify it is never over-redeemed'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--limit', type=int, default=100, help='usage_limit của voucher tạm')
+        parser.add_argument('--attempts', type=int, default=1000, help='Tổng số lần dùng voucher')
+        parser.add_argument('--threads', type=int, default=50, help='Số thread chạy đồng thời')
+
+    def handle(self, *args, **options):
+        limit, attempts, threads = options['limit'], options['attempts'], options['threads']
+        today = store_today()
+        voucher = Voucher.objects.create(
+            code=f'LOADTEST-{uuid.uuid4().hex[:12].upper()}',
+            type='platform',
+            discount_type='fixed',
+            discount_value=1,
+            start_date=today,
+            end_date=today + timedelta(days=1),
+            usage_limit=limit,
+            is_active=False,
+        )
+        # Bật sau khi tạo bằng update() => không tính vào chỉ mục voucher đang chạy thật
+        Voucher.objects.filter(pk=voucher.pk).update(is_active=True)
+
+        results = {'redeemed': 0, 'rejected': 0, 'errors': 0}
+        lock = threading.Lock()
+        remaining = iter(range(attempts))
+        start = threading.Barrier(threads)
+
+        def worker():
+            start.wait()
+            try:
+                while True:
+                    with lock:
+                        if next(remaining, None) is None:
+                            return
+                    try:
+                        with transaction.atomic():
+                            reserve_usage([voucher.pk])
+                        outcome = 'redeemed'
+                    except VoucherRedemptionError:
+                        outcome = 'rejected'
+                    except OperationalError:
+                        outcome = 'errors'
+                    with lock:
+                        results[outcome] += 1
+            finally:
+                connection.close()
+
+        started = time.perf_counter()
+        workers = [threading.Thread(target=worker) for _ in range(threads)]
+        for thread in workers:
+            thread.start()
+        for thread in workers:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        used_count = Voucher.objects.filter(pk=voucher.pk).values_list('used_count', flat=True).get()
+        Voucher.objects.filter(pk=voucher.pk).delete()
+
+        self.stdout.write(
+            f"{attempts} attempts / {threads} threads in {elapsed:.2f}s: "
+            f"redeemed={results['redeemed']} rejected={results['rejected']} "
+            f"errors={results['errors']} used_count={used_count} limit={limit}"
+        )
+        if results['redeemed'] > limit or used_count != results['redeemed']:
+            raise CommandError('Voucher was over-redeemed')
+        self.stdout.write(self.style.SUCCESS('No over-redemption'))
@@ -0,0 +1,42 @@
+# Generated by Django 5.2.6 on 2026-10-18 04:22
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def backfill_used_count(apps, schema_editor):
+    """used_count = số OrderVoucher hiện có (chặn ở usage_limit để thỏa constraint)"""
+    Voucher = apps.get_model('discount', 'Voucher')
+    vouchers = []
+    for voucher in Voucher.objects.annotate(times_used=Count('order_vouchers')).filter(times_used__gt=0):
+        used = voucher.times_used
+        if voucher.usage_limit is not None:
+            used = min(used, voucher.usage_limit)
+        voucher.used_count = used
+        vouchers.append(voucher)
+    Voucher.objects.bulk_update(vouchers, ['used_count'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('discount', '0003_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ordervoucher',
+            name='released_at',
+            field=models.DateTimeField(blank=True, help_text='Đơn bị hủy => lượt dùng đã được trả lại cho voucher (NULL = đang giữ lượt)', null=True, verbose_name='Thời điểm hoàn lượt'),
+        ),
+        migrations.AddField(
+            model_name='voucher',
+            name='used_count',
+            field=models.IntegerField(default=0, editable=False, help_text='Số lượt đã dùng toàn hệ thống, chỉ thay đổi qua discount/redemption.py', verbose_name='Số lượt đã dùng'),
+        ),
+        migrations.RunPython(backfill_used_count, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='voucher',
+            constraint=models.CheckConstraint(condition=models.Q(('used_count__gte', 0), models.Q(('usage_limit__isnull', True), ('used_count__lte', models.F('usage_limit')), _connector='OR')), name='voucher_used_count_within_limit'),
+        ),
+    ]
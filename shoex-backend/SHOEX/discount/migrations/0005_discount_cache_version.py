@@ -0,0 +1,24 @@
+# Generated by Django 5.2.6 on 2026-10-18 05:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('discount', '0004_voucher_used_count'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DiscountCacheVersion',
+            fields=[
+                ('name', models.CharField(max_length=50, primary_key=True, serialize=False, verbose_name='Tên dữ liệu')),
+                ('value', models.BigIntegerField(default=0, verbose_name='Version')),
+            ],
+            options={
+                'verbose_name': 'Version dữ liệu voucher',
+                'verbose_name_plural': 'Version dữ liệu voucher',
+            },
+        ),
+    ]
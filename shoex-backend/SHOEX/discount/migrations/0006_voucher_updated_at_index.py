@@ -0,0 +1,18 @@
+# Generated by Django 5.2.6 on 2026-10-18 05:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('discount', '0005_discount_cache_version'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='voucher',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, db_index=True, help_text='Ngày giờ voucher được cập nhật lần cuối', verbose_name='Ngày cập nhật'),
+        ),
+    ]
@@ -1,4 +1,4 @@
-from django.db import models
+from django.db import models, transaction
 from django.core.validators import MinValueValidator, MaxValueValidator
 from decimal import Decimal
 
@@ -88,6 +88,12 @@ class Voucher(models.Model):
         verbose_name="Giới hạn sử dụng",
         help_text="Số lượt sử dụng tối đa toàn hệ thống (NULL = không giới hạn)"
     )
+    used_count = models.IntegerField(
+        default=0,
+        editable=False,
+        verbose_name="Số lượt đã dùng",
+        help_text="Số lượt đã dùng toàn hệ thống, chỉ thay đổi qua discount/redemption.py"
+    )
     per_user_limit = models.IntegerField(
         default=1,
         validators=[MinValueValidator(1)],
@@ -111,6 +117,7 @@ class Voucher(models.Model):
     )
     updated_at = models.DateTimeField(
         auto_now=True,
+        db_index=True,  # Bộ lọc mã (codes.py) thêm dần mã của voucher mới ghi
         verbose_name="Ngày cập nhật",
         help_text="Ngày giờ voucher được cập nhật lần cuối"
     )
@@ -119,13 +126,49 @@ class Voucher(models.Model):
         verbose_name = "Voucher"
         verbose_name_plural = "Vouchers"
         ordering = ['-created_at']
+        constraints = [
+            # Chốt chặn cuối ở DB: không bao giờ vượt usage_limit kể cả khi ghi đồng thời
+            models.CheckConstraint(
+                condition=models.Q(used_count__gte=0) & (
+                    models.Q(usage_limit__isnull=True) | models.Q(used_count__lte=models.F('usage_limit'))
+                ),
+                name='voucher_used_count_within_limit'
+            ),
+        ]
 
     def __str__(self):
         return f"{self.code} - {self.get_type_display()}"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Ghi nhớ mã lúc load để chỉ làm mới bộ lọc mã (codes.py) khi mã đổi
+        if 'code' in instance.__dict__:
+            instance._loaded_code = instance.code
+        return instance
+
+    # Chỉ đổi bằng UPDATE F() có điều kiện (redemption.py) => save() thường không ghi đè
+    COUNTER_FIELDS = ('used_count',)
+
+    def save(self, *args, **kwargs):
+        """
+        Sửa voucher (mutation / admin) không ghi lại used_count đã load: checkout đồng thời
+        có thể vừa giữ lượt. Muốn ghi used_count: truyền update_fields=['used_count', ...]
+
+        Dòng voucher và version tăng trong signal (chỉ mục, bộ lọc mã) commit cùng lúc
+        => không process nào thấy mã mới mà vẫn đọc version cũ
+        """
+        if not self._state.adding and kwargs.get('update_fields') is None and not kwargs.get('force_insert'):
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in self.COUNTER_FIELDS
+            ]
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+
     def clean(self):
         from django.core.exceptions import ValidationError
-        
+
         # Validation: Seller voucher phải có seller_id
         if self.type == 'seller' and not self.seller:
             raise ValidationError("Seller voucher phải có thông tin seller")
@@ -142,6 +185,17 @@ class Voucher(models.Model):
         if self.discount_type == 'fixed' and self.max_discount:
             raise ValidationError("Max discount chỉ áp dụng cho voucher giảm theo %")
 
+        # Validation: không hạ usage_limit xuống dưới số lượt đã dùng
+        if self.usage_limit is not None and self.usage_limit < self.used_count:
+            raise ValidationError(f"Giới hạn sử dụng không được nhỏ hơn số lượt đã dùng ({self.used_count})")
+
+    @property
+    def remaining_uses(self):
+        """Số lượt còn lại (None = không giới hạn)"""
+        if self.usage_limit is None:
+            return None
+        return max(self.usage_limit - self.used_count, 0)
+
 
 class VoucherProduct(models.Model):
     """
@@ -305,6 +359,12 @@ class OrderVoucher(models.Model):
         verbose_name="Thời điểm áp dụng",
         help_text="Thời điểm voucher được áp dụng vào đơn hàng"
     )
+    released_at = models.DateTimeField(
+        null=True,
+        blank=True,
+        verbose_name="Thời điểm hoàn lượt",
+        help_text="Đơn bị hủy => lượt dùng đã được trả lại cho voucher (NULL = đang giữ lượt)"
+    )
 
     class Meta:
         verbose_name = "Order - Voucher"
@@ -349,3 +409,38 @@ class VoucherStore(models.Model):
     
     def __str__(self):
         return f"{self.voucher.code} - {self.store.name}"
+
+
+class DiscountCacheVersion(models.Model):
+    """
+    Version của dữ liệu voucher dựng sẵn trong bộ nhớ process (chỉ mục voucher, bộ lọc mã)
+
+    Nằm trong DB (không phải cache) => mọi worker thấy cùng một giá trị kể cả khi CACHES là
+    LocMemCache riêng từng process. Tăng trong cùng transaction với thay đổi voucher (signals.py)
+    """
+    name = models.CharField(
+        max_length=50,
+        primary_key=True,
+        verbose_name="Tên dữ liệu"
+    )
+    value = models.BigIntegerField(
+        default=0,
+        verbose_name="Version"
+    )
+
+    class Meta:
+        verbose_name = "Version dữ liệu voucher"
+        verbose_name_plural = "Version dữ liệu voucher"
+
+    def __str__(self):
+        return f"{self.name} = {self.value}"
+
+    @classmethod
+    def current(cls, name):
+        return cls.objects.filter(name=name).values_list('value', flat=True).first() or 0
+
+    @classmethod
+    def bump(cls, name):
+        if not cls.objects.filter(name=name).update(value=models.F('value') + 1):
+            cls.objects.get_or_create(name=name)
+            cls.objects.filter(name=name).update(value=models.F('value') + 1)
@@ -0,0 +1,461 @@
+"""
+Chọn voucher tối ưu cho giỏ hàng nhiều cửa hàng (lúc checkout)
+
+Quy tắc ghép voucher:
+- Tối đa 1 voucher platform cho cả giỏ + tối đa 1 voucher seller cho mỗi cửa hàng
+- Voucher có liên kết product / category / store chỉ tính trên các dòng khớp liên kết,
+  không có liên kết => cả giỏ (platform) hoặc cả cửa hàng (seller)
+- Voucher seller giảm trước; voucher platform tính trên phần còn lại
+  (giảm giá seller được chia đều theo tỉ lệ cho các dòng của cửa hàng)
+- min_order_amount so với phần tiền áp dụng được; max_discount chặn voucher %
+
+Thuật toán (optimize_vouchers) - thời gian bị chặn:
+1. Mỗi cửa hàng: các lựa chọn voucher seller, sắp giảm dần theo số tiền giảm
+2. Không platform: chọn voucher seller lớn nhất mỗi cửa hàng (tối ưu)
+3. Với từng voucher platform (cận trên lớn trước, cắt nhánh theo cận trên):
+   - Chọn seller lớn nhất; nếu phần còn lại vẫn đủ min_order của platform => tối ưu
+     (giảm thêm 1đ ở seller làm platform giảm tối đa 1đ)
+   - Ngược lại: knapsack nhiều lựa chọn, tham lam hạ voucher seller có
+     "tiền mất / tiền nhả ra" nhỏ nhất tới khi đủ min_order, rồi tìm kiếm cục bộ
+     đổi voucher từng cửa hàng (_improve)
+4. Hết ngân sách thời gian (kiểm tra cả trong bước hạ / tìm kiếm cục bộ, không chỉ giữa các
+   voucher platform) => trả kết quả tốt nhất hiện có (complete=False)
+5. Số tiền giảm platform của kết quả tính như evaluate_vouchers => khớp khi đặt hàng
+"""
+
+import time
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db.models import Q
+
+from .index import store_today
+from .models import Voucher, VoucherProduct, VoucherCategory, VoucherStore, UserVoucher
+
+
+ZERO = Decimal('0')
+CENT = Decimal('0.01')
+DEFAULT_TIME_BUDGET = 0.015  # giây
+
+
+class CartLine:
+    """Một dòng giỏ hàng đã quy về số tiền"""
+    __slots__ = ('product_id', 'category_id', 'store_id', 'amount')
+
+    def __init__(self, product_id, category_id, store_id, amount):
+        self.product_id = product_id
+        self.category_id = category_id
+        self.store_id = store_id
+        self.amount = Decimal(amount)
+
+
+class VoucherCandidate:
+    """Voucher người dùng có thể dùng, kèm phạm vi áp dụng"""
+    __slots__ = (
+        'voucher', 'voucher_id', 'is_platform', 'store_id', 'discount_type', 'discount_value',
+        'max_discount', 'min_order_amount', 'product_ids', 'category_ids', 'store_ids', 'restricted'
+    )
+
+    def __init__(self, voucher, product_ids=(), category_ids=(), store_ids=()):
+        self.voucher = voucher
+        self.voucher_id = voucher.voucher_id
+        self.is_platform = voucher.type == 'platform'
+        self.store_id = voucher.seller_id
+        self.discount_type = voucher.discount_type
+        self.discount_value = voucher.discount_value
+        self.max_discount = voucher.max_discount
+        self.min_order_amount = voucher.min_order_amount or ZERO
+        self.product_ids = frozenset(product_ids)
+        self.category_ids = frozenset(category_ids)
+        self.store_ids = frozenset(store_ids)
+        # Không liên kết => áp dụng cho cả giỏ / cả cửa hàng, khỏi duyệt từng dòng
+        self.restricted = bool(self.product_ids or self.category_ids or self.store_ids)
+
+    def matches(self, line):
+        if not self.restricted:
+            return True
+        return (
+            line.product_id in self.product_ids
+            or line.category_id in self.category_ids
+            or line.store_id in self.store_ids
+        )
+
+    def discount(self, base):
+        """Số tiền giảm trên phần tiền áp dụng được `base`"""
+        if base <= 0 or base < self.min_order_amount:
+            return ZERO
+        if self.discount_type == 'percent':
+            amount = (base * self.discount_value / 100).quantize(CENT)
+            if self.max_discount:
+                amount = min(amount, self.max_discount)
+        else:
+            amount = self.discount_value
+        return min(amount, base)
+
+
+class VoucherPlan:
+    """Kết quả: voucher platform + voucher mỗi cửa hàng và số tiền giảm"""
+
+    def __init__(self, platform=None, platform_discount=ZERO, stores=None, complete=True):
+        self.platform = platform
+        self.platform_discount = platform_discount
+        self.stores = stores or {}  # {store_id: (VoucherCandidate, discount)}
+        self.complete = complete
+
+    @property
+    def seller_discount(self):
+        return sum((discount for _, discount in self.stores.values()), ZERO)
+
+    @property
+    def total_discount(self):
+        return self.seller_discount + self.platform_discount
+
+
+# ===== THUẬT TOÁN =====
+
+def _platform_base(lines, platform, stores, subtotals):
+    """Phần tiền platform áp dụng được sau giảm giá seller (chia theo tỉ lệ cho các dòng của cửa hàng)"""
+    base = ZERO
+    for line in lines:
+        if platform.matches(line):
+            seller_discount = stores[line.store_id][1] if line.store_id in stores else ZERO
+            subtotal = subtotals[line.store_id]
+            base += line.amount - (seller_discount * line.amount / subtotal if subtotal else ZERO)
+    return base.quantize(CENT)
+
+
+def _seller_options(groups, subtotals, candidates):
+    """{store_id: [(discount, candidate), ...]} giảm dần, bỏ lựa chọn 0đ"""
+    options = defaultdict(list)
+    for candidate in candidates:
+        if candidate.is_platform or candidate.store_id not in groups:
+            continue
+        if candidate.restricted:
+            base = sum((line.amount for line in groups[candidate.store_id] if candidate.matches(line)), ZERO)
+        else:
+            base = subtotals[candidate.store_id]
+        discount = candidate.discount(base)
+        if discount > 0:
+            options[candidate.store_id].append((discount, candidate))
+    for store_options in options.values():
+        store_options.sort(key=lambda option: (-option[0], option[1].voucher_id))
+    return options
+
+
+def _fit_platform(picks, options, weights, budget, deadline):
+    """
+    Hạ dần voucher seller tới khi tổng "phần giảm seller trên dòng của platform" <= budget
+    picks: {store_id: vị trí đang chọn trong options (len => không dùng)}
+    Không vừa được (hoặc quá deadline) => None
+    """
+    used = sum(
+        weights[store_id] * options[store_id][index][0]
+        for store_id, index in picks.items() if index < len(options[store_id])
+    )
+    while used > budget:
+        if time.perf_counter() > deadline:
+            return None
+        best = None
+        for store_id, index in picks.items():
+            weight = weights[store_id]
+            store_options = options[store_id]
+            if not weight or index >= len(store_options):
+                continue
+            current = store_options[index][0]
+            following = store_options[index + 1][0] if index + 1 < len(store_options) else ZERO
+            released = weight * (current - following)
+            if released <= 0:
+                continue
+            ratio = (current - following) / released
+            if best is None or ratio < best[0]:
+                best = (ratio, store_id, released)
+        if best is None:
+            return None
+        _, store_id, released = best
+        picks[store_id] += 1
+        used -= released
+    return used
+
+
+def _improve(picks, options, weights, budget, used, candidate, total, deadline, rounds=2):
+    """
+    Tìm kiếm cục bộ sau bước tham lam: đổi voucher của từng cửa hàng
+    (giữ nguyên cửa hàng khác), hoặc nâng voucher một cửa hàng rồi hạ các cửa hàng
+    khác cho vừa min_order; nhận nước đi nếu tổng giảm tăng
+    Quá deadline => dừng, giữ các nước đi đã nhận (picks luôn hợp lệ)
+    """
+    def value(option_index, store_id, current_used):
+        store_options = options[store_id]
+        seller = store_options[option_index][0] if option_index < len(store_options) else ZERO
+        return seller + candidate.discount(total - current_used)
+
+    for _ in range(rounds):
+        changed = False
+        for store_id, index in picks.items():
+            if time.perf_counter() > deadline:
+                return used
+            store_options = options[store_id]
+            weight = weights[store_id]
+            current = store_options[index][0] if index < len(store_options) else ZERO
+            base_used = used - weight * current
+            best_index, best_value = index, value(index, store_id, used)
+            for option_index in range(len(store_options) + 1):
+                seller = store_options[option_index][0] if option_index < len(store_options) else ZERO
+                option_used = base_used + weight * seller
+                if option_used > budget:
+                    continue
+                option_value = value(option_index, store_id, option_used)
+                if option_value > best_value:
+                    best_index, best_value = option_index, option_value
+            if best_index != index:
+                seller = store_options[best_index][0] if best_index < len(store_options) else ZERO
+                used = base_used + weight * seller
+                picks[store_id] = best_index
+                changed = True
+                continue
+            # Nâng voucher cửa hàng này rồi hạ các cửa hàng khác cho vừa min_order
+            for option_index in range(index):
+                if time.perf_counter() > deadline:
+                    return used
+                trial = dict(picks)
+                trial[store_id] = option_index
+                others = {other: trial.pop(other) for other in list(trial) if other != store_id}
+                own_used = weight * store_options[option_index][0]
+                if own_used > budget:
+                    continue
+                other_used = _fit_platform(others, options, weights, budget - own_used, deadline)
+                if other_used is None:
+                    continue
+                trial_used = own_used + other_used
+                trial_value = store_options[option_index][0] + candidate.discount(total - trial_used) + sum(
+                    options[other][other_index][0]
+                    for other, other_index in others.items() if other_index < len(options[other])
+                )
+                current_value = value(index, store_id, used) + sum(
+                    options[other][other_index][0]
+                    for other, other_index in picks.items()
+                    if other != store_id and other_index < len(options[other])
+                )
+                if trial_value > current_value:
+                    others[store_id] = option_index
+                    picks.update(others)
+                    used = trial_used
+                    changed = True
+                    break
+        if not changed:
+            break
+    return used
+
+
+def optimize_vouchers(lines, candidates, time_budget=DEFAULT_TIME_BUDGET):
+    """
+    Chọn tổ hợp voucher giảm nhiều nhất cho một giỏ hàng
+    lines: [CartLine], candidates: [VoucherCandidate] (đã lọc hiệu lực / lượt dùng)
+    """
+    deadline = time.perf_counter() + time_budget
+    groups = defaultdict(list)
+    for line in lines:
+        groups[line.store_id].append(line)
+    subtotals = {store_id: sum((line.amount for line in store_lines), ZERO) for store_id, store_lines in groups.items()}
+    options = _seller_options(groups, subtotals, candidates)
+
+    def plan_for(picks, platform=None):
+        stores = {
+            store_id: (options[store_id][index][1], options[store_id][index][0])
+            for store_id, index in picks.items() if index < len(options[store_id])
+        }
+        # Tính lại như evaluate_vouchers (làm tròn từng đồng) => kết quả khớp khi đặt hàng
+        platform_discount = platform.discount(_platform_base(lines, platform, stores, subtotals)) if platform else ZERO
+        return VoucherPlan(platform, platform_discount, stores)
+
+    greedy = {store_id: 0 for store_id in options}
+    best = plan_for(greedy)
+    seller_max = best.seller_discount
+
+    platforms = []
+    for candidate in candidates:
+        if not candidate.is_platform:
+            continue
+        if candidate.restricted:
+            eligible = defaultdict(lambda: ZERO)
+            for line in lines:
+                if candidate.matches(line):
+                    eligible[line.store_id] += line.amount
+        else:
+            eligible = subtotals
+        total = sum(eligible.values(), ZERO)
+        upper = candidate.discount(total)
+        if upper > 0:
+            platforms.append((upper, candidate, eligible, total))
+    platforms.sort(key=lambda item: (-item[0], item[1].voucher_id))
+
+    for upper, candidate, eligible, total in platforms:
+        if best.total_discount >= seller_max + upper:
+            break  # Cận trên của các platform còn lại không vượt được kết quả hiện tại
+        if time.perf_counter() > deadline:
+            best.complete = False
+            break
+        # Tỉ lệ tiền của cửa hàng nằm trong phạm vi platform (giảm seller chia theo tỉ lệ)
+        weights = {
+            store_id: (eligible.get(store_id, ZERO) / subtotals[store_id]) if subtotals[store_id] else ZERO
+            for store_id in options
+        }
+        picks = dict(greedy)
+        used = _fit_platform(picks, options, weights, total - candidate.min_order_amount, deadline)
+        if used is None:
+            continue
+        budget = total - candidate.min_order_amount
+        _improve(picks, options, weights, budget, used, candidate, total, deadline)
+        plan = plan_for(picks, candidate)
+        if plan.total_discount > best.total_discount:
+            best = plan
+        if time.perf_counter() > deadline:
+            best.complete = False
+            break
+    return best
+
+
+def evaluate_vouchers(lines, candidates):
+    """
+    Tổ hợp voucher người dùng tự chọn (cùng quy tắc ghép với optimize_vouchers) -> VoucherPlan
+    Sai quy tắc / không áp dụng được cho giỏ => ValueError
+    """
+    groups = defaultdict(list)
+    for line in lines:
+        groups[line.store_id].append(line)
+    subtotals = {store_id: sum((line.amount for line in store_lines), ZERO) for store_id, store_lines in groups.items()}
+
+    platform, stores = None, {}
+    for candidate in candidates:
+        code = candidate.voucher.code
+        if candidate.is_platform:
+            if platform is not None:
+                raise ValueError("Chỉ được dùng 1 voucher platform cho mỗi đơn")
+            platform = candidate
+            continue
+        if candidate.store_id in stores:
+            raise ValueError(f"Chỉ được dùng 1 voucher cho mỗi cửa hàng ({code})")
+        base = sum((line.amount for line in groups.get(candidate.store_id, ()) if candidate.matches(line)), ZERO)
+        discount = candidate.discount(base)
+        if discount <= 0:
+            raise ValueError(f"Voucher {code} không áp dụng được cho đơn hàng")
+        stores[candidate.store_id] = (candidate, discount)
+
+    platform_discount = ZERO
+    if platform is not None:
+        platform_discount = platform.discount(_platform_base(lines, platform, stores, subtotals))
+        if platform_discount <= 0:
+            raise ValueError(f"Voucher {platform.voucher.code} không áp dụng được cho đơn hàng")
+    return VoucherPlan(platform, platform_discount, stores)
+
+
+# ===== NẠP DỮ LIỆU =====
+
+def _with_links(vouchers):
+    """{voucher_id: Voucher} -> {voucher_id: VoucherCandidate} kèm liên kết product / category / store"""
+    links = {voucher_id: ([], [], []) for voucher_id in vouchers}
+    for position, (model, field) in enumerate((
+        (VoucherProduct, 'product_id'),
+        (VoucherCategory, 'category_id'),
+        (VoucherStore, 'store_id'),
+    )):
+        for voucher_id, target_id in model.objects.filter(voucher_id__in=vouchers.keys()).values_list('voucher_id', field):
+            links[voucher_id][position].append(target_id)
+    return {voucher_id: VoucherCandidate(voucher, *links[voucher_id]) for voucher_id, voucher in vouchers.items()}
+
+
+def load_candidates(user_ids, store_ids=None, day=None):
+    """
+    Voucher dùng được của nhiều user cùng lúc (số query cố định):
+    voucher đã lưu còn lượt (UserVoucher.can_use) + voucher tự áp dụng (is_auto),
+    đang hiệu lực hôm nay và chưa hết usage_limit toàn hệ thống
+    Trả về {user_id: [VoucherCandidate]}
+    """
+    day = day or store_today()
+    user_ids = list(set(user_ids))
+    active = Q(is_active=True, start_date__lte=day, end_date__gte=day)
+    if store_ids is not None:
+        active &= Q(type='platform') | Q(seller_id__in=store_ids)
+
+    saved = defaultdict(set)
+    for user_id, voucher_id, used_count, per_user_limit in UserVoucher.objects.filter(
+        user_id__in=user_ids,
+        voucher__in=Voucher.objects.filter(active)
+    ).values_list('user_id', 'voucher_id', 'used_count', 'voucher__per_user_limit'):
+        if used_count < per_user_limit:
+            saved[user_id].add(voucher_id)
+
+    vouchers = {
+        voucher.voucher_id: voucher
+        for voucher in Voucher.objects.filter(active).filter(
+            Q(voucher_id__in={voucher_id for ids in saved.values() for voucher_id in ids}) | Q(is_auto=True)
+        )
+        if voucher.usage_limit is None or voucher.used_count < voucher.usage_limit
+    }
+    candidates = _with_links(vouchers)
+    auto = [candidate for candidate in candidates.values() if candidate.voucher.is_auto]
+    result = {}
+    for user_id in user_ids:
+        own = [candidates[voucher_id] for voucher_id in saved.get(user_id, ()) if voucher_id in candidates]
+        result[user_id] = own + [candidate for candidate in auto if candidate.voucher_id not in saved.get(user_id, ())]
+    return result
+
+
+def cart_lines(cart_items):
+    """CartItem (đã select_related variant__product) -> [CartLine]"""
+    return [
+        CartLine(
+            item.variant.product.product_id,
+            item.variant.product.category_id,
+            item.variant.product.store_id,
+            item.unit_price * item.quantity,
+        )
+        for item in cart_items
+    ]
+
+
+def optimize_carts(carts, time_budget=DEFAULT_TIME_BUDGET):
+    """
+    API theo lô: carts = {key: (user_id, [CartLine])} -> {key: VoucherPlan}
+    Voucher của mọi user được nạp chung một lần
+    """
+    store_ids = {line.store_id for _, lines in carts.values() for line in lines}
+    candidates = load_candidates([user_id for user_id, _ in carts.values()], store_ids)
+    return {
+        key: optimize_vouchers(lines, candidates.get(user_id, []), time_budget)
+        for key, (user_id, lines) in carts.items()
+    }
+
+
+def resolve_order_vouchers(user_id, lines, voucher_ids, day=None):
+    """
+    Voucher khách chọn lúc đặt hàng (đã lưu, tự áp dụng hoặc nhập mã) -> VoucherPlan
+    Chỉ nhận voucher đang hiệu lực hôm nay, còn lượt toàn hệ thống và của user, là voucher
+    platform hoặc của cửa hàng có trong giỏ; sau đó kiểm tra quy tắc ghép / min_order_amount
+    Không hợp lệ => ValueError (lượt thật được giữ ở redemption.py)
+    """
+    day = day or store_today()
+    voucher_ids = {int(voucher_id) for voucher_id in voucher_ids}
+    store_ids = {line.store_id for line in lines if line.store_id is not None}
+    vouchers = {
+        voucher.voucher_id: voucher
+        for voucher in Voucher.objects.filter(
+            Q(type='platform') | Q(seller_id__in=store_ids),
+            pk__in=voucher_ids, is_active=True, start_date__lte=day, end_date__gte=day
+        )
+        if voucher.usage_limit is None or voucher.used_count < voucher.usage_limit
+    }
+    used = dict(
+        UserVoucher.objects.filter(user_id=user_id, voucher_id__in=vouchers.keys())
+        .values_list('voucher_id', 'used_count')
+    )
+    vouchers = {
+        voucher_id: voucher for voucher_id, voucher in vouchers.items()
+        if used.get(voucher_id, 0) < voucher.per_user_limit
+    }
+    missing = voucher_ids - vouchers.keys()
+    if missing:
+        codes = sorted(Voucher.objects.filter(pk__in=missing).values_list('code', flat=True)) or sorted(missing)
+        raise ValueError(f"Voucher không dùng được cho đơn hàng: {', '.join(map(str, codes))}")
+    candidates = _with_links(vouchers)
+    return evaluate_vouchers(lines, [candidates[voucher_id] for voucher_id in sorted(voucher_ids)])
@@ -0,0 +1,128 @@
+"""
+Dùng / hoàn lượt voucher khi đặt / hủy đơn (an toàn khi ghi đồng thời)
+
+Không đọc - kiểm tra - ghi trong Python (hai checkout cùng đọc "còn 1 lượt" sẽ
+cùng ghi). Mỗi lượt được giữ bằng một câu UPDATE có điều kiện:
+
+    UPDATE voucher SET used_count = used_count + 1
+    WHERE voucher_id = %s AND (usage_limit IS NULL OR used_count < usage_limit)
+
+Row lock của UPDATE tuần tự hóa các checkout cùng voucher; số dòng cập nhật = 0
+nghĩa là hết lượt. CheckConstraint voucher_used_count_within_limit là chốt chặn
+cuối ở DB. Lượt theo user (UserVoucher.used_count < per_user_limit) giữ y hệt.
+
+Các hàm chạy trong transaction của đơn hàng (savepoint riêng): đơn rollback =>
+lượt giữ cũng rollback. Voucher được cập nhật theo thứ tự voucher_id để hai
+checkout dùng chung nhiều voucher không deadlock.
+"""
+
+from collections import Counter
+
+from django.db import transaction
+from django.db.models import F, OuterRef, Q, Subquery
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+from .index import store_today
+from .models import Voucher, UserVoucher, OrderVoucher
+
+
+class VoucherRedemptionError(Exception):
+    """Voucher không dùng được (hết lượt toàn hệ thống / của user, hết hạn, bị tắt)"""
+
+    def __init__(self, voucher_id, message):
+        super().__init__(message)
+        self.voucher_id = voucher_id
+
+
+def _available(day):
+    return Q(is_active=True, start_date__lte=day, end_date__gte=day) & (
+        Q(usage_limit__isnull=True) | Q(used_count__lt=F('usage_limit'))
+    )
+
+
+def _failure_message(voucher_id, day):
+    voucher = Voucher.objects.filter(pk=voucher_id).only(
+        'code', 'is_active', 'start_date', 'end_date', 'usage_limit', 'used_count'
+    ).first()
+    if voucher is None:
+        return "Voucher không tồn tại"
+    if not voucher.is_active or not (voucher.start_date <= day <= voucher.end_date):
+        return f"Voucher {voucher.code} không còn hiệu lực"
+    return f"Voucher {voucher.code} đã hết lượt sử dụng"
+
+
+def reserve_usage(voucher_ids, user_id=None, day=None):
+    """
+    Giữ 1 lượt cho mỗi voucher (toàn hệ thống + của user nếu có user_id)
+    Lỗi => raise VoucherRedemptionError, mọi lượt đã giữ trong lần gọi này được trả lại
+    """
+    voucher_ids = sorted(set(int(voucher_id) for voucher_id in voucher_ids))
+    if not voucher_ids:
+        return
+    day = day or store_today()
+    with transaction.atomic():
+        for voucher_id in voucher_ids:
+            updated = Voucher.objects.filter(_available(day), pk=voucher_id)\
+                .update(used_count=F('used_count') + 1)
+            if not updated:
+                raise VoucherRedemptionError(voucher_id, _failure_message(voucher_id, day))
+
+        if user_id is None:
+            return
+        # Voucher tự áp dụng / nhập mã chưa có UserVoucher => tạo để đếm lượt của user
+        UserVoucher.objects.bulk_create(
+            [UserVoucher(user_id=user_id, voucher_id=voucher_id) for voucher_id in voucher_ids],
+            ignore_conflicts=True
+        )
+        per_user_limit = Subquery(
+            Voucher.objects.filter(pk=OuterRef('voucher_id')).values('per_user_limit')[:1]
+        )
+        for voucher_id in voucher_ids:
+            updated = UserVoucher.objects.filter(
+                user_id=user_id, voucher_id=voucher_id, used_count__lt=per_user_limit
+            ).update(used_count=F('used_count') + 1)
+            if not updated:
+                code = Voucher.objects.filter(pk=voucher_id).values_list('code', flat=True).first()
+                raise VoucherRedemptionError(voucher_id, f"Bạn đã dùng hết lượt của voucher {code}")
+
+
+def redeem_vouchers(order, applications, day=None):
+    """
+    Áp dụng voucher cho đơn hàng: giữ lượt rồi ghi OrderVoucher một lần (bulk_create)
+    applications: [(voucher_id, discount_amount)]
+    """
+    applications = [(int(voucher_id), amount) for voucher_id, amount in applications]
+    with transaction.atomic():
+        reserve_usage([voucher_id for voucher_id, _ in applications], order.buyer_id, day)
+        return OrderVoucher.objects.bulk_create([
+            OrderVoucher(order=order, voucher_id=voucher_id, discount_amount=amount)
+            for voucher_id, amount in applications
+        ])
+
+
+def release_vouchers(order_ids):
+    """
+    Trả lượt voucher của các đơn bị hủy (theo lô, gọi lại nhiều lần không trả trùng)
+    Trả về số OrderVoucher được hoàn lượt
+    """
+    with transaction.atomic():
+        # Khóa các dòng chưa hoàn => hai lần hủy đồng thời không trả lượt hai lần
+        rows = list(
+            OrderVoucher.objects.select_for_update(of=('self',))
+            .filter(order_id__in=order_ids, released_at__isnull=True)
+            .values_list('pk', 'voucher_id', 'order__buyer_id')
+        )
+        if not rows:
+            return 0
+        OrderVoucher.objects.filter(pk__in=[pk for pk, _, _ in rows]).update(released_at=timezone.now())
+
+        for voucher_id, count in sorted(Counter(voucher_id for _, voucher_id, _ in rows).items()):
+            Voucher.objects.filter(pk=voucher_id)\
+                .update(used_count=Greatest(F('used_count') - count, 0))
+        for (voucher_id, user_id), count in sorted(Counter(
+            (voucher_id, user_id) for _, voucher_id, user_id in rows
+        ).items()):
+            UserVoucher.objects.filter(user_id=user_id, voucher_id=voucher_id)\
+                .update(used_count=Greatest(F('used_count') - count, 0))
+        return len(rows)
@@ -0,0 +1,48 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from SHOEX.orders.models import Order
+
+from .codes import invalidate_voucher_codes
+from .index import invalidate_voucher_index
+from .models import Voucher, VoucherProduct, VoucherCategory, VoucherStore
+from .redemption import release_vouchers
+
+
+# ===== ACTIVE VOUCHER INDEX (index.py) =====
+
+@receiver(post_save, sender=Voucher)
+@receiver(post_delete, sender=Voucher)
+@receiver(post_save, sender=VoucherProduct)
+@receiver(post_delete, sender=VoucherProduct)
+@receiver(post_save, sender=VoucherCategory)
+@receiver(post_delete, sender=VoucherCategory)
+@receiver(post_save, sender=VoucherStore)
+@receiver(post_delete, sender=VoucherStore)
+def invalidate_voucher_index_on_change(sender, instance, **kwargs):
+    # Tăng version trong cùng transaction: process khác thấy version mới cùng lúc với dữ liệu mới
+    invalidate_voucher_index()
+
+
+# ===== VOUCHER CODE FILTER (codes.py) =====
+
+@receiver(post_save, sender=Voucher)
+def invalidate_voucher_codes_on_save(sender, instance, created, **kwargs):
+    # Cùng transaction với dòng voucher (Voucher.save bọc atomic) như chỉ mục ở trên
+    if created or getattr(instance, '_loaded_code', instance.code) != instance.code:
+        invalidate_voucher_codes()
+    instance._loaded_code = instance.code
+
+
+@receiver(post_delete, sender=Voucher)
+def invalidate_voucher_codes_on_delete(sender, instance, **kwargs):
+    invalidate_voucher_codes()
+
+
+# ===== VOUCHER REDEMPTION (redemption.py) =====
+
+@receiver(post_save, sender=Order)
+def release_vouchers_on_cancel(sender, instance, **kwargs):
+    # Cùng transaction với việc đổi trạng thái; đơn đã hoàn lượt thì không trả lần nữa
+    if instance.status == 'cancelled':
+        release_vouchers([instance.pk])
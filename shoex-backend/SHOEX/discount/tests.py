@@ -1,3 +1,300 @@
-from django.test import TestCase
+import itertools
+import random
+import threading
+import time
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.core.cache import caches
+from django.db import connection, connections
+from django.test import SimpleTestCase, TestCase, TransactionTestCase
+
+from SHOEX.address.models import Address
+from SHOEX.orders.models import Order
+from SHOEX.users.models import User
+
+from . import codes, index
+from .codes import BloomFilter, VoucherCodeFilter, create_vouchers_bulk, lookup_voucher_id, template_from_voucher
+from .index import get_voucher_index, store_today
+from .models import OrderVoucher, UserVoucher, Voucher
+from .optimizer import CartLine, VoucherCandidate, evaluate_vouchers, optimize_vouchers
+from .redemption import VoucherRedemptionError, redeem_vouchers, release_vouchers, reserve_usage
+
+
+def create_voucher(code='GIAM10K', usage_limit=None, per_user_limit=1):
+    today = store_today()
+    return Voucher.objects.create(
+        code=code, type='platform', discount_type='fixed', discount_value=Decimal('10000'),
+        start_date=today, end_date=today + timedelta(days=3),
+        usage_limit=usage_limit, per_user_limit=per_user_limit
+    )
+
+
+def create_buyer(username):
+    user = User.objects.create_user(username=username, email=f'{username}@shoex.vn', password='x')
+    address = Address.objects.create(user=user, province='HCM', ward='Bến Nghé', detail='1 Lê Lợi')
+    return user, address
+
+
+def reset_voucher_caches():
+    """Chỉ mục / bộ lọc mã là biến toàn cục của process => mỗi test bắt đầu lại từ đầu"""
+    index._versions.clear()
+    index._current = None
+    codes._current = None
+    caches[index.CACHE_ALIAS].clear()
+
+
+# ===== DÙNG / HOÀN LƯỢT VOUCHER (redemption.py) =====
+
+class VoucherRedemptionTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.voucher = create_voucher(usage_limit=2, per_user_limit=1)
+        cls.buyers = [create_buyer('buyer1'), create_buyer('buyer2'), create_buyer('buyer3')]
+
+    def order(self, index=0):
+        user, address = self.buyers[index]
+        return Order.objects.create(buyer=user, address=address, total_amount=Decimal('500000'))
+
+    def used(self, user=None):
+        if user is None:
+            return Voucher.objects.values_list('used_count', flat=True).get(pk=self.voucher.pk)
+        return UserVoucher.objects.values_list('used_count', flat=True).get(user=user, voucher=self.voucher)
+
+    def test_redeem_counts_usage(self):
+        order = self.order()
+        redeem_vouchers(order, [(self.voucher.pk, Decimal('10000'))])
+        self.assertEqual((self.used(), self.used(order.buyer)), (1, 1))
+        self.assertEqual(OrderVoucher.objects.get(order=order).discount_amount, Decimal('10000'))
+
+    def test_per_user_limit_returns_global_usage(self):
+        redeem_vouchers(self.order(), [(self.voucher.pk, Decimal('10000'))])
+        with self.assertRaises(VoucherRedemptionError) as raised:
+            redeem_vouchers(self.order(), [(self.voucher.pk, Decimal('10000'))])
+        self.assertEqual(raised.exception.voucher_id, self.voucher.pk)
+        # Lượt toàn hệ thống đã giữ trong lần gọi lỗi được trả lại
+        self.assertEqual(self.used(), 1)
+        self.assertEqual(OrderVoucher.objects.count(), 1)
+
+    def test_usage_limit(self):
+        redeem_vouchers(self.order(0), [(self.voucher.pk, Decimal('10000'))])
+        redeem_vouchers(self.order(1), [(self.voucher.pk, Decimal('10000'))])
+        with self.assertRaisesMessage(VoucherRedemptionError, "Voucher GIAM10K đã hết lượt sử dụng"):
+            redeem_vouchers(self.order(2), [(self.voucher.pk, Decimal('10000'))])
+        self.assertEqual(self.used(), 2)
+
+    def test_expired_voucher(self):
+        Voucher.objects.filter(pk=self.voucher.pk).update(end_date=store_today() - timedelta(days=1))
+        with self.assertRaisesMessage(VoucherRedemptionError, "Voucher GIAM10K không còn hiệu lực"):
+            reserve_usage([self.voucher.pk])
+
+    def test_cancel_releases_once(self):
+        order = self.order()
+        redeem_vouchers(order, [(self.voucher.pk, Decimal('10000'))])
+        order.status = 'cancelled'
+        order.save()      # signal hoàn lượt
+        order.save()
+        self.assertEqual(release_vouchers([order.pk]), 0)
+        self.assertEqual((self.used(), self.used(order.buyer)), (0, 0))
+
+        # Đã hoàn lượt => user dùng lại được
+        redeem_vouchers(self.order(), [(self.voucher.pk, Decimal('10000'))])
+        self.assertEqual(self.used(), 1)
+
+
+@skipUnless(connection.vendor == 'postgresql', "Cần PostgreSQL (row lock) để kiểm tra đồng thời")
+class VoucherConcurrencyTests(TransactionTestCase):
+    def test_parallel_redemptions_respect_usage_limit(self):
+        voucher = create_voucher(usage_limit=5, per_user_limit=1)
+        buyers = [create_buyer(f'buyer{index}') for index in range(10)]
+        results = []
+        barrier = threading.Barrier(len(buyers))
+
+        def checkout(user, address):
+            try:
+                order = Order.objects.create(buyer=user, address=address, total_amount=Decimal('500000'))
+                barrier.wait()
+                redeem_vouchers(order, [(voucher.pk, Decimal('10000'))])
+                results.append(True)
+            except VoucherRedemptionError:
+                results.append(False)
+            finally:
+                connections.close_all()
+
+        threads = [threading.Thread(target=checkout, args=buyer) for buyer in buyers]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(results.count(True), 5)
+        voucher.refresh_from_db()
+        self.assertEqual(voucher.used_count, 5)
+        self.assertEqual(OrderVoucher.objects.filter(voucher=voucher).count(), 5)
+
+
+# ===== CHỈ MỤC VOUCHER (index.py) =====
+
+class VoucherIndexTests(TestCase):
+    def setUp(self):
+        reset_voucher_caches()
+        self.addCleanup(reset_voucher_caches)
+
+    def later(self):
+        """Đồng hồ sau VERSION_CHECK_SECONDS => version trong DB được đọc lại"""
+        return mock.patch.object(
+            index.monotonic_time, 'monotonic', return_value=time.monotonic() + index.VERSION_CHECK_SECONDS
+        )
+
+    def test_reused_without_queries(self):
+        voucher = create_voucher()
+        built = get_voucher_index()
+        self.assertIn(voucher.pk, built.vouchers)
+        with self.assertNumQueries(0):
+            self.assertIs(get_voucher_index(), built)
+
+    def test_local_write_rebuilds_after_commit(self):
+        get_voucher_index()
+        with self.captureOnCommitCallbacks(execute=True):
+            voucher = create_voucher()
+        self.assertIn(voucher.pk, get_voucher_index().vouchers)
+
+    def test_other_process_write_seen_after_version_check(self):
+        built = get_voucher_index()
+        # Process khác ghi voucher: version trong DB tăng, version nhớ trong process này chưa bị xóa
+        voucher = create_voucher()
+        self.assertIs(get_voucher_index(), built)
+        with self.later():
+            self.assertIn(voucher.pk, get_voucher_index().vouchers)
+
+    def test_rebuilt_on_new_day(self):
+        voucher = create_voucher()
+        self.assertIn(voucher.pk, get_voucher_index().vouchers)
+        with mock.patch.object(index, 'store_today', return_value=voucher.end_date + timedelta(days=1)):
+            self.assertNotIn(voucher.pk, get_voucher_index().vouchers)
+
+
+# ===== TRA MÃ VOUCHER (codes.py) =====
+
+class VoucherCodeLookupTests(TestCase):
+    def setUp(self):
+        reset_voucher_caches()
+        self.addCleanup(reset_voucher_caches)
+
+    def test_bloom_has_no_false_negatives(self):
+        bloom = BloomFilter(1000)
+        added = [f'MA{number}' for number in range(1000)]
+        for code in added:
+            bloom.add(code)
+        self.assertTrue(all(code in bloom for code in added))
+        false_positives = sum(f'KHAC{number}' in bloom for number in range(1000))
+        self.assertLess(false_positives, 50)
+
+    def test_lookup_and_lru(self):
+        voucher = create_voucher()
+        self.assertEqual(lookup_voucher_id(' GIAM10K '), voucher.pk)
+        # Đã tra => LRU, không query
+        with self.assertNumQueries(0):
+            self.assertEqual(lookup_voucher_id('GIAM10K'), voucher.pk)
+        # Mã không có: chỉ đọc lại version (version không đổi => chắc chắn không tồn tại)
+        with self.assertNumQueries(1):
+            self.assertIsNone(lookup_voucher_id('KHONGCO'))
+
+    def test_new_code_never_rejected_after_bump_version(self):
+        create_voucher()
+        self.assertIsNone(lookup_voucher_id('MOI20K'))     # LRU nhớ "không tồn tại"
+        # Process khác tạo mã (signal tăng version), version nhớ trong process này chưa hết hạn
+        voucher = create_voucher(code='MOI20K')
+        self.assertEqual(lookup_voucher_id('MOI20K'), voucher.pk)
+
+        renamed = Voucher.objects.get(pk=voucher.pk)
+        renamed.code = 'DOITEN30K'
+        renamed.save()
+        self.assertEqual(lookup_voucher_id('DOITEN30K'), voucher.pk)
+
+    def test_bulk_codes_found(self):
+        lookup_voucher_id('GIAM10K')
+        template, links = template_from_voucher(create_voucher())
+        self.assertEqual(create_vouchers_bulk(template, 30, prefix='SALE', batch_size=10, links=links), 30)
+        for code, voucher_id in Voucher.objects.filter(code__startswith='SALE').values_list('code', 'voucher_id'):
+            self.assertEqual(lookup_voucher_id(code), voucher_id)
+
+    def test_refresh_over_capacity_rebuilds(self):
+        create_voucher()
+        code_filter = VoucherCodeFilter.build(version=1)
+        code_filter.capacity = code_filter.count   # Hết chỗ trống
+        create_voucher(code='MOI20K')
+        self.assertFalse(code_filter.refresh(2))
+        self.assertEqual(VoucherCodeFilter.build(version=2).count, 2)
+
+
+# ===== CHỌN VOUCHER TỐI ƯU (optimizer.py) =====
+
+def random_cart(rng, stores, lines, seller_vouchers, platform_vouchers):
+    """Giỏ ngẫu nhiên (CartLine) + voucher chưa lưu DB: % / cố định, min_order, max_discount, liên kết"""
+    cart = [
+        CartLine(product_id, rng.choice((1, 2)), rng.randrange(stores), rng.randrange(50, 500) * 1000)
+        for product_id in range(lines)
+    ]
+    candidates = []
+    for voucher_id in range(seller_vouchers + platform_vouchers):
+        percent = rng.random() < 0.5
+        voucher = Voucher(
+            voucher_id=voucher_id, code=f'V{voucher_id}',
+            type='seller' if voucher_id < seller_vouchers else 'platform',
+            seller_id=rng.randrange(stores) if voucher_id < seller_vouchers else None,
+            discount_type='percent' if percent else 'fixed',
+            discount_value=Decimal(rng.choice((5, 10, 20))) if percent else Decimal(rng.randrange(10, 150) * 1000),
+            max_discount=Decimal(rng.randrange(20, 100) * 1000) if percent and rng.random() < 0.5 else None,
+            min_order_amount=Decimal(rng.randrange(0, 800) * 1000) if rng.random() < 0.7 else None,
+        )
+        links = rng.choice(({}, {}, {'product_ids': [rng.randrange(lines)]}, {'category_ids': [rng.choice((1, 2))]}))
+        candidates.append(VoucherCandidate(voucher, **links))
+    return cart, candidates
+
+
+def brute_force_discount(lines, candidates):
+    """Thử mọi tổ hợp (≤ 1 platform, ≤ 1 voucher / cửa hàng) qua evaluate_vouchers"""
+    platforms = [None] + [candidate for candidate in candidates if candidate.is_platform]
+    per_store = [
+        [None] + [candidate for candidate in candidates if not candidate.is_platform and candidate.store_id == store_id]
+        for store_id in {line.store_id for line in lines}
+    ]
+    best = Decimal('0')
+    for platform in platforms:
+        for sellers in itertools.product(*per_store):
+            chosen = [candidate for candidate in (platform, *sellers) if candidate is not None]
+            try:
+                best = max(best, evaluate_vouchers(lines, chosen).total_discount)
+            except ValueError:
+                continue
+    return best
+
+
+class VoucherOptimizerTests(SimpleTestCase):
+    def test_matches_brute_force_on_small_carts(self):
+        rng = random.Random(12)
+        for case in range(300):
+            lines, candidates = random_cart(
+                rng, stores=rng.randint(1, 3), lines=rng.randint(1, 5),
+                seller_vouchers=rng.randint(0, 5), platform_vouchers=rng.randint(0, 3)
+            )
+            with self.subTest(case=case):
+                plan = optimize_vouchers(lines, candidates, time_budget=1)
+                self.assertTrue(plan.complete)
+                self.assertEqual(plan.total_discount, brute_force_discount(lines, candidates))
+                # Tổ hợp được chọn tính lại lúc đặt hàng (evaluate_vouchers) ra đúng số tiền đó
+                chosen = [candidate for candidate, _ in plan.stores.values()] + ([plan.platform] if plan.platform else [])
+                self.assertEqual(evaluate_vouchers(lines, chosen).total_discount, plan.total_discount)
+
+    def test_time_bound(self):
+        # Vài chục dòng, vài trăm voucher
+        lines, candidates = random_cart(
+            random.Random(7), stores=20, lines=60, seller_vouchers=300, platform_vouchers=100
+        )
+        started = time.perf_counter()
+        plan = optimize_vouchers(lines, candidates)
+        self.assertLess(time.perf_counter() - started, 0.020)
+        chosen = [candidate for candidate, _ in plan.stores.values()] + ([plan.platform] if plan.platform else [])
+        self.assertEqual(evaluate_vouchers(lines, chosen).total_discount, plan.total_discount)
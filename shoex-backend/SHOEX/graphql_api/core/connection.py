@@ -1,14 +1,219 @@
+import base64
+import json
+from datetime import date, datetime
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import F, OrderBy, Q
 from graphene import relay
+from graphql import GraphQLError
+
+
+# Số bản ghi mặc định / tối đa cho một trang
+DEFAULT_PAGE_SIZE = getattr(settings, 'GRAPHQL_DEFAULT_PAGE_SIZE', 20)
+MAX_PAGE_SIZE = getattr(settings, 'GRAPHQL_MAX_PAGE_SIZE', 100)
+
+
+# ===== CURSOR =====
+
+def _to_json(value):
+    if isinstance(value, Decimal):
+        return str(value)
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return value
+
+
+def encode_cursor(values):
+    """Cursor = base64(JSON list giá trị các cột sắp xếp)"""
+    payload = json.dumps([_to_json(value) for value in values], separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode()).decode()
+
+
+def decode_cursor(cursor, size):
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode()).decode())
+    except (ValueError, TypeError):
+        raise GraphQLError("Cursor không hợp lệ")
+    if not isinstance(values, list) or len(values) != size:
+        raise GraphQLError("Cursor không khớp với kiểu sắp xếp hiện tại")
+    return values
+
+
+# ===== KEYSET =====
+
+def _ordering_name(field):
+    """Tên cột ('-' khi giảm) của một phần tử ordering: chuỗi hoặc F('x').asc() / .desc()"""
+    if isinstance(field, str) and field != '?':
+        return field
+    if isinstance(field, OrderBy) and isinstance(field.expression, F):
+        return f"-{field.expression.name}" if field.descending else field.expression.name
+    raise GraphQLError(f"Phân trang cursor không hỗ trợ ordering {field!r}")
+
+
+def get_keyset_ordering(queryset):
+    """
+    Danh sách cột sắp xếp của queryset, luôn kết thúc bằng khóa chính
+    để (sort key, pk) là duy nhất => keyset ổn định
+    """
+    ordering = list(queryset.query.order_by) or list(queryset.model._meta.ordering)
+    pk_name = queryset.model._meta.pk.name
+    names = [_ordering_name(field) for field in ordering]
+    if not any(name.lstrip('-') in (pk_name, 'pk') for name in names):
+        descending = bool(names) and names[-1].startswith('-')
+        names.append(f"-{pk_name}" if descending else pk_name)
+    return names
+
+
+def _reverse(ordering):
+    return [name[1:] if name.startswith('-') else f"-{name}" for name in ordering]
+
 
+def _nullable_fields(queryset, ordering):
+    """
+    Cột sắp xếp có thể NULL (field null=True, annotation / field qua quan hệ: coi như có thể)
+    {cột: NULL lớn hơn mọi giá trị?}: mặc định như PostgreSQL; F('x').desc(nulls_last=True)
+    / .asc(nulls_first=True) trong order_by => NULL nhỏ hơn mọi giá trị
+    """
+    explicit = {
+        field.expression.name: bool(field.nulls_last) != field.descending
+        for field in queryset.query.order_by
+        if isinstance(field, OrderBy) and (field.nulls_first or field.nulls_last)
+    }
+    nullable = {}
+    for name in ordering:
+        field = name.lstrip('-')
+        if field == 'pk':
+            continue
+        try:
+            model_field = queryset.model._meta.get_field(field)
+        except FieldDoesNotExist:
+            nullable[field] = explicit.get(field, True)
+            continue
+        if model_field.null:
+            nullable[field] = explicit.get(field, True)
+    return nullable
+
+
+def _order_by(ordering, nullable):
+    """
+    order_by với vị trí NULL cố định trên mọi DB (NULL lớn: cuối khi tăng, đầu khi giảm;
+    NULL nhỏ: ngược lại) => khớp với _keyset_filter, đảo chiều vẫn đúng
+    """
+    expressions = []
+    for name in ordering:
+        field = name.lstrip('-')
+        if field not in nullable:
+            expressions.append(name)
+        elif name.startswith('-'):
+            nulls = 'nulls_first' if nullable[field] else 'nulls_last'
+            expressions.append(F(field).desc(**{nulls: True}))
+        else:
+            nulls = 'nulls_last' if nullable[field] else 'nulls_first'
+            expressions.append(F(field).asc(**{nulls: True}))
+    return expressions
+
+
+def _keyset_filter(ordering, values, nullable=None):
+    """
+    Điều kiện "đứng sau cursor" theo ordering, vd (-price, -pk):
+        price < v0 OR (price = v0 AND pk < v1)
+    Cột có thể NULL (nullable: {cột: NULL lớn hơn mọi giá trị?}, xem _order_by), ví dụ NULL lớn:
+        tăng, v0 có giá trị: price > v0 OR price IS NULL;  v0 NULL: không có giá trị nào lớn hơn
+        giảm, v0 có giá trị: price < v0;                    v0 NULL: price IS NOT NULL
+        bằng v0 NULL: price IS NULL (= NULL không bao giờ đúng)
+    """
+    nullable = nullable or {}
+    condition = Q()
+    equal = Q()
+    for name, value in zip(ordering, values):
+        field = name.lstrip('-')
+        descending = name.startswith('-')
+        # NULL đứng sau mọi giá trị theo chiều đang duyệt?
+        nulls_after = field in nullable and descending != nullable[field]
+        if field not in nullable:
+            after = Q(**{f"{field}__{'lt' if descending else 'gt'}": value})
+            same = Q(**{field: value})
+        elif value is None:
+            after = None if nulls_after else Q(**{f"{field}__isnull": False})
+            same = Q(**{f"{field}__isnull": True})
+        else:
+            after = Q(**{f"{field}__{'lt' if descending else 'gt'}": value})
+            if nulls_after:
+                after |= Q(**{f"{field}__isnull": True})
+            same = Q(**{field: value})
+        if after is not None:
+            condition |= equal & after
+        equal &= same
+    return condition
 
-def create_connection_slice(iterable, info, args, connection_type, edge_type=None, pageinfo_type=None):
+
+def _ensure_loaded(queryset, ordering):
+    """Cột sắp xếp phải được load để tạo cursor (queryset có thể đã only())"""
+    field_names, defer = queryset.query.deferred_loading
+    if defer or not field_names:
+        return queryset
+    concrete = {field.name for field in queryset.model._meta.concrete_fields}
+    missing = [name.lstrip('-') for name in ordering if name.lstrip('-') in concrete]
+    return queryset.only(*field_names, *missing)
+
+
+def _page_size(args):
+    first, last = args.get('first'), args.get('last')
+    if first is not None and last is not None:
+        raise GraphQLError("Không dùng đồng thời 'first' và 'last'")
+    size = first if first is not None else last
+    if size is None:
+        return DEFAULT_PAGE_SIZE
+    if size < 0:
+        raise GraphQLError("'first' / 'last' phải >= 0")
+    if size > MAX_PAGE_SIZE:
+        raise GraphQLError(f"'first' / 'last' tối đa {MAX_PAGE_SIZE}")
+    return size
+
+
+def create_connection_slice(queryset, info, args, connection_type, edge_type=None, pageinfo_type=None):
     """
-    Create a connection slice for pagination
-    This is a simplified version of the Saleor connection slice
+    Phân trang keyset (cursor) cho Relay connection
+
+    - Không dùng OFFSET: lọc theo (sort key, pk) của cursor => trang 1 hay trang 500 đều nhanh như nhau
+    - Hỗ trợ first/after (tiến) và last/before (lùi)
+    - Giới hạn kích thước trang bởi MAX_PAGE_SIZE
     """
-    # This would need proper implementation with relay pagination
-    # For now, returning a basic structure
-    return connection_type(
-        edges=[],
-        page_info={'has_next_page': False, 'has_previous_page': False}
-    )
\ No newline at end of file
+    edge_type = edge_type or connection_type.Edge
+    pageinfo_type = pageinfo_type or relay.PageInfo
+
+    size = _page_size(args)
+    ordering = get_keyset_ordering(queryset)
+    backward = args.get('last') is not None
+    cursor = args.get('before') if backward else args.get('after')
+
+    # Lùi trang: đảo ordering, lấy rồi đảo lại kết quả
+    query_ordering = _reverse(ordering) if backward else ordering
+    nullable = _nullable_fields(queryset, ordering)
+    queryset = _ensure_loaded(queryset.order_by(*_order_by(query_ordering, nullable)), ordering)
+    if cursor:
+        values = decode_cursor(cursor, len(ordering))
+        queryset = queryset.filter(_keyset_filter(query_ordering, values, nullable))
+
+    rows = list(queryset[:size + 1])
+    has_more = len(rows) > size
+    rows = rows[:size]
+    if backward:
+        rows.reverse()
+
+    edges = [
+        edge_type(
+            node=row,
+            cursor=encode_cursor([getattr(row, name.lstrip('-')) for name in ordering])
+        )
+        for row in rows
+    ]
+    page_info = pageinfo_type(
+        start_cursor=edges[0].cursor if edges else None,
+        end_cursor=edges[-1].cursor if edges else None,
+        has_previous_page=has_more if backward else bool(cursor),
+        has_next_page=bool(cursor) if backward else has_more,
+    )
+    return connection_type(edges=edges, page_info=page_info)
@@ -0,0 +1,118 @@
+from collections import defaultdict
+
+from django.db import models
+from django.db.models.query import QuerySet
+
+
+class DataLoaderRegistry:
+    """
+    Registry DataLoader cho một request GraphQL
+
+    - Mỗi request có một registry riêng (tạo trong ShoexGraphQLView.get_context)
+    - Mỗi loader class chỉ được khởi tạo 1 lần / request, kết quả được cache theo key
+    - DataLoaderMiddleware ghi nhận các instance model đã được resolve (list sản phẩm,
+      list biến thể...). Khi một field cần load dữ liệu, registry gom luôn key của tất cả
+      instance đã ghi nhận vào cùng một batch => số query không phụ thuộc kích thước trang
+    - Kết quả mỗi batch cũng được ghi nhận => loader lồng nhau (variant -> product của variant)
+      gom key của cả trang, không phải từng instance cha
+
+    Loader khai báo key cần gom qua thuộc tính `batch_keys`:
+        batch_keys = [(Product, 'product_id'), (ProductVariant, 'product_id')]
+    """
+
+    def __init__(self):
+        self._loaders = {}
+        self._results = defaultdict(dict)
+        self._cursors = defaultdict(dict)
+        self._seen = defaultdict(list)
+
+    # ===== GHI NHẬN INSTANCE =====
+
+    def remember(self, result):
+        """Ghi nhận các model instance trong kết quả resolve, trả lại kết quả (đã evaluate nếu là QuerySet)"""
+        if isinstance(result, QuerySet):
+            result = list(result)
+
+        if isinstance(result, models.Model):
+            self._seen[type(result)].append(result)
+        elif isinstance(result, (list, tuple)):
+            for item in result:
+                if isinstance(item, models.Model):
+                    self._seen[type(item)].append(item)
+        elif isinstance(getattr(result, 'edges', None), list):
+            # Relay connection: ghi nhận node của từng edge
+            for edge in result.edges:
+                node = getattr(edge, 'node', None)
+                if isinstance(node, models.Model):
+                    self._seen[type(node)].append(node)
+        return result
+
+    # ===== LOADERS =====
+
+    def get(self, loader_class):
+        """Lấy (hoặc tạo) instance loader cho request hiện tại"""
+        loader = self._loaders.get(loader_class)
+        if loader is None:
+            loader = self._loaders[loader_class] = loader_class()
+        return loader
+
+    def prime(self, loader_class, key, value):
+        """Đưa sẵn giá trị vào cache của loader"""
+        self._results[loader_class].setdefault(key, value)
+
+    def load(self, loader_class, key):
+        """Load một key, batch cùng các key đang chờ của những instance đã ghi nhận"""
+        cache = self._results[loader_class]
+        if key in cache:
+            return cache[key]
+
+        keys = [key]
+        cursors = self._cursors[loader_class]
+        for model, attr in getattr(loader_class, 'batch_keys', ()):
+            seen = self._seen.get(model, [])
+            start = cursors.get(model, 0)
+            for instance in seen[start:]:
+                # Đọc thẳng __dict__: cột bị defer (only()) không kích hoạt query lẻ
+                value = instance.__dict__.get(attr)
+                if value is not None and value not in cache:
+                    keys.append(value)
+            cursors[model] = len(seen)
+
+        keys = list(dict.fromkeys(keys))
+        values = self.get(loader_class).batch_load_fn(keys)
+        if hasattr(values, 'get'):
+            # batch_load_fn của promise.DataLoader trả về Promise đã resolve
+            values = values.get()
+        cache.update(zip(keys, values))
+        for value in values:
+            self.remember(value)
+        return cache[key]
+
+    def load_many(self, loader_class, keys):
+        return [self.load(loader_class, key) for key in keys]
+
+
+class DataLoaderMiddleware:
+    """Middleware ghi nhận các instance đã resolve vào registry của request"""
+
+    def resolve(self, next, root, info, **args):
+        result = next(root, info, **args)
+        registry = getattr(info.context, 'dataloaders', None)
+        if registry is None:
+            return result
+        return registry.remember(result)
+
+
+def get_dataloader_registry(info):
+    """Lấy registry từ GraphQL context (tạo mới nếu view chưa gắn sẵn)"""
+    context = info.context
+    registry = getattr(context, 'dataloaders', None)
+    if registry is None:
+        registry = DataLoaderRegistry()
+        context.dataloaders = registry
+    return registry
+
+
+def load(info, loader_class, key):
+    """Shortcut: load một key qua registry của request"""
+    return get_dataloader_registry(info).load(loader_class, key)
@@ -0,0 +1,143 @@
+from django.core.exceptions import FieldDoesNotExist
+from graphene.utils.str_converters import to_camel_case
+from graphql.language import FieldNode, FragmentSpreadNode, InlineFragmentNode
+
+
+class QueryHint:
+    """
+    Khai báo dữ liệu mà một field GraphQL cần từ QuerySet
+
+    - only: cột model cần load (FK dùng tên field, vd 'category')
+    - select_related / prefetch_related: quan hệ cần load kèm
+    - annotate: các hàm `qs -> qs` thêm annotation (được gọi 1 lần dù nhiều field cùng cần)
+
+    Khai báo trên type qua thuộc tính `query_hints`:
+        query_hints = {
+            'total_sold': QueryHint(annotate=[annotate_sales_stats]),
+            'final_price': QueryHint(only=['base_price'], select_related=['category']),
+        }
+    """
+
+    def __init__(self, only=(), select_related=(), prefetch_related=(), annotate=()):
+        self.only = tuple(only)
+        self.select_related = tuple(select_related)
+        self.prefetch_related = tuple(prefetch_related)
+        self.annotate = tuple(annotate)
+
+
+# ===== SELECTION SET =====
+
+def _collect_fields(selection_set, info, fields):
+    """Gom FieldNode theo tên (đi qua fragment spread và inline fragment)"""
+    if selection_set is None:
+        return fields
+    for selection in selection_set.selections:
+        if isinstance(selection, FieldNode):
+            fields.setdefault(selection.name.value, []).append(selection)
+        elif isinstance(selection, InlineFragmentNode):
+            _collect_fields(selection.selection_set, info, fields)
+        elif isinstance(selection, FragmentSpreadNode):
+            fragment = info.fragments.get(selection.name.value)
+            if fragment is not None:
+                _collect_fields(fragment.selection_set, info, fields)
+    return fields
+
+
+def get_selected_fields(info, path=()):
+    """
+    Tên các field (theo GraphQL) được chọn trong field đang resolve
+
+    path dùng để đi xuống bên trong, vd connection: ('edges', 'node')
+    """
+    nodes = list(info.field_nodes)
+    for name in path:
+        children = []
+        for node in nodes:
+            children.extend(_collect_fields(node.selection_set, info, {}).get(name, []))
+        nodes = children
+
+    fields = {}
+    for node in nodes:
+        _collect_fields(node.selection_set, info, fields)
+    return set(fields)
+
+
+# ===== OPTIMIZER =====
+
+def _field_names(graphene_type):
+    """Map tên GraphQL -> tên attribute của type"""
+    names = {}
+    for attr, field in graphene_type._meta.fields.items():
+        names[getattr(field, 'name', None) or to_camel_case(attr)] = attr
+        names.setdefault(attr, attr)
+    return names
+
+
+def optimize_queryset(queryset, info, graphene_type, path=(), annotate=()):
+    """
+    Tối ưu QuerySet theo các field client thực sự yêu cầu
+
+    - Field có trong `graphene_type.query_hints` dùng hint đã khai báo
+    - Field model thường: only() cột đó; FK / one-to-one tự select_related
+    - Quan hệ ngược / many-to-many không có resolver riêng: prefetch_related
+    - Gặp field không biết cần gì => bỏ only() để tránh query lẻ do cột bị defer
+
+    annotate: các hàm `qs -> qs` bắt buộc (vd filter/sort cần annotation)
+    """
+    model = queryset.model
+    hints = getattr(graphene_type, 'query_hints', {})
+    names = _field_names(graphene_type)
+
+    only = {model._meta.pk.name}
+    use_only = True
+    select_related = []
+    prefetch_related = []
+    annotations = list(annotate)
+
+    for graphql_name in get_selected_fields(info, path):
+        if graphql_name.startswith('__'):
+            continue
+        attr = names.get(graphql_name)
+        if attr is None:
+            continue
+
+        hint = hints.get(attr)
+        if hint is not None:
+            only.update(hint.only)
+            select_related.extend(hint.select_related)
+            prefetch_related.extend(hint.prefetch_related)
+            annotations.extend(hint.annotate)
+            continue
+
+        if attr == 'id':
+            continue
+
+        try:
+            field = model._meta.get_field(attr[:-4] if attr.endswith('_set') else attr)
+        except FieldDoesNotExist:
+            use_only = False
+            continue
+
+        if field.concrete and not field.many_to_many:
+            only.add(field.name)
+            if field.is_relation:
+                select_related.append(field.name)
+        elif field.one_to_one:
+            select_related.append(field.name)
+        elif not hasattr(graphene_type, f'resolve_{attr}'):
+            prefetch_related.append(field.get_accessor_name() if hasattr(field, 'get_accessor_name') else field.name)
+
+    for annotate_fn in dict.fromkeys(annotations):
+        queryset = annotate_fn(queryset)
+    if select_related:
+        queryset = queryset.select_related(*dict.fromkeys(select_related))
+        # FK được select_related không được phép bị defer
+        for relation in select_related:
+            field = model._meta.get_field(relation.split('__')[0])
+            if field.concrete:
+                only.add(field.name)
+    if prefetch_related:
+        queryset = queryset.prefetch_related(*dict.fromkeys(prefetch_related))
+    if use_only:
+        queryset = queryset.only(*only)
+    return queryset
@@ -0,0 +1,25 @@
+from graphene_django.views import GraphQLView
+from graphql.execution.middleware import MiddlewareManager
+
+from .dataloaders import DataLoaderRegistry, DataLoaderMiddleware
+
+
+class ShoexGraphQLView(GraphQLView):
+    """
+    GraphQLView của SHOEX
+    - Tạo DataLoaderRegistry mới cho mỗi request (gắn vào info.context.dataloaders)
+    - Luôn bật DataLoaderMiddleware để gom key theo batch
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        if isinstance(self.middleware, MiddlewareManager):
+            return
+        middleware = list(self.middleware or [])
+        if not any(isinstance(m, DataLoaderMiddleware) for m in middleware):
+            middleware.append(DataLoaderMiddleware())
+        self.middleware = middleware
+
+    def get_context(self, request):
+        request.dataloaders = DataLoaderRegistry()
+        return request
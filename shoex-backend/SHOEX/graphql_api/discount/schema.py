@@ -4,7 +4,12 @@ from graphene_django import DjangoObjectType
 from django.db.models import Q
 from decimal import Decimal as DecimalType
 
+from django.core.exceptions import ValidationError
+
 from SHOEX.discount.models import Voucher, VoucherProduct, VoucherCategory, VoucherStore, UserVoucher, OrderVoucher
+from SHOEX.discount.codes import check_voucher_code, create_vouchers_bulk
+from SHOEX.discount.optimizer import cart_lines, optimize_carts
+from SHOEX.store.models import StoreUser
 
 
 class VoucherType(DjangoObjectType):
@@ -43,12 +48,42 @@ class OrderVoucherType(DjangoObjectType):
         fields = '__all__'
 
 
+class StoreVoucherChoiceType(ObjectType):
+    """Voucher seller được chọn cho một cửa hàng trong giỏ"""
+    store_id = String()
+    voucher = Field(VoucherType)
+    discount = Decimal()
+
+
+class CartVoucherPlanType(ObjectType):
+    """Tổ hợp voucher giảm nhiều nhất cho giỏ hàng (1 platform + 1 voucher / cửa hàng)"""
+    platform_voucher = Field(VoucherType)
+    platform_discount = Decimal()
+    store_vouchers = List(StoreVoucherChoiceType)
+    seller_discount = Decimal()
+    total_discount = Decimal()
+    complete = Boolean(description="False nếu hết ngân sách thời gian trước khi xét hết voucher platform")
+
+    @staticmethod
+    def from_plan(plan):
+        return CartVoucherPlanType(
+            platform_voucher=plan.platform.voucher if plan.platform else None,
+            platform_discount=plan.platform_discount,
+            store_vouchers=[
+                StoreVoucherChoiceType(store_id=store_id, voucher=candidate.voucher, discount=discount)
+                for store_id, (candidate, discount) in plan.stores.items()
+            ],
+            seller_discount=plan.seller_discount,
+            total_discount=plan.total_discount,
+            complete=plan.complete,
+        )
+
+
 # ===================================================================
 # ============================ INPUTS ================================
 # ===================================================================
 
-class VoucherCreateInput(graphene.InputObjectType):
-    code = String(required=True)
+class VoucherTemplateInput(graphene.InputObjectType):
     type = String(required=True)  # 'platform' or 'seller'
     discount_type = String(required=True)  # 'percent' or 'fixed'
     discount_value = Decimal(required=True)
@@ -62,6 +97,17 @@ class VoucherCreateInput(graphene.InputObjectType):
     seller_id = ID(required=False)  # For seller vouchers
 
 
+class VoucherCreateInput(VoucherTemplateInput):
+    code = String(required=True)
+
+
+class VoucherCodeCheckType(ObjectType):
+    """Kết quả kiểm tra mã voucher người dùng nhập"""
+    valid = Boolean()
+    message = String()
+    voucher = Field(VoucherType)
+
+
 class DiscountQuery(ObjectType):
     """GraphQL queries cho Discount module"""
 
@@ -71,12 +117,39 @@ class DiscountQuery(ObjectType):
     # List queries
     vouchers = List(VoucherType, search=String(required=False))
 
+    # Checkout
+    check_voucher_code = Field(
+        VoucherCodeCheckType,
+        code=String(required=True),
+        description="Kiểm tra mã voucher (mã không tồn tại được trả lời không cần DB)"
+    )
+    best_cart_vouchers = Field(
+        CartVoucherPlanType,
+        description="Tổ hợp voucher tối ưu cho giỏ hàng của người dùng hiện tại"
+    )
+
     def resolve_voucher(self, info, id):
         try:
             return Voucher.objects.get(pk=id)
         except Voucher.DoesNotExist:
             return None
 
+    def resolve_check_voucher_code(self, info, code):
+        voucher_id, message = check_voucher_code(code)
+        if voucher_id is None:
+            return VoucherCodeCheckType(valid=False, message=message, voucher=None)
+        return VoucherCodeCheckType(valid=True, message=message, voucher=Voucher.objects.filter(pk=voucher_id).first())
+
+    def resolve_best_cart_vouchers(self, info):
+        from SHOEX.cart.models import CartItem
+
+        user = info.context.user
+        if not user.is_authenticated:
+            return None
+        items = CartItem.objects.filter(cart__user=user).select_related('variant__product')
+        plans = optimize_carts({user.pk: (user.pk, cart_lines(items))})
+        return CartVoucherPlanType.from_plan(plans[user.pk])
+
     def resolve_vouchers(self, info, search=None):
         """Lấy danh sách vouchers"""
         qs = Voucher.objects.all()
@@ -153,10 +226,74 @@ class UpdateVoucher(graphene.Mutation):
             return UpdateVoucher(success=False, message=f"Lỗi: {str(e)}", voucher=None)
 
 
+class GenerateVouchers(graphene.Mutation):
+    """Sinh hàng loạt voucher mã ngẫu nhiên (số lượng rất lớn: dùng lệnh generate_vouchers)"""
+    MAX_COUNT = 100000
+
+    class Arguments:
+        input = VoucherTemplateInput(required=True)
+        count = Int(required=True)
+        prefix = String(required=False)
+        length = Int(required=False)
+
+    success = Boolean()
+    message = String()
+    created_count = Int()
+
+    @staticmethod
+    def mutate(root, info, input, count, prefix=None, length=None):
+        user = info.context.user
+        if not user.is_authenticated:
+            return GenerateVouchers(
+                success=False,
+                message="Bạn cần đăng nhập để thực hiện thao tác này",
+                created_count=0
+            )
+        # Admin sinh mọi loại voucher; chủ cửa hàng chỉ sinh voucher của cửa hàng mình
+        if not user.is_staff and not (
+            input.seller_id and StoreUser.objects.filter(
+                store_id=input.seller_id, user=user, role='owner', status='active'
+            ).exists()
+        ):
+            return GenerateVouchers(
+                success=False,
+                message="Bạn không có quyền thực hiện thao tác này",
+                created_count=0
+            )
+        if not 0 < count <= GenerateVouchers.MAX_COUNT:
+            return GenerateVouchers(
+                success=False,
+                message=f"Số lượng phải từ 1 đến {GenerateVouchers.MAX_COUNT}",
+                created_count=0
+            )
+        template = {
+            'type': input.type,
+            'discount_type': input.discount_type,
+            'discount_value': input.discount_value,
+            'min_order_amount': input.min_order_amount or 0,
+            'max_discount': input.max_discount,
+            'start_date': input.start_date,
+            'end_date': input.end_date,
+            'usage_limit': input.usage_limit,
+            'per_user_limit': input.per_user_limit or 1,
+            'is_active': input.is_active if input.is_active is not None else True,
+            'is_auto': False,
+            'seller_id': input.seller_id if input.seller_id else None,
+        }
+        try:
+            created = create_vouchers_bulk(template, count, prefix=prefix or '', length=length or 10)
+            return GenerateVouchers(success=True, message=f"Đã tạo {created} voucher", created_count=created)
+        except ValidationError as e:
+            return GenerateVouchers(success=False, message="; ".join(e.messages), created_count=0)
+        except Exception as e:
+            return GenerateVouchers(success=False, message=f"Lỗi: {str(e)}", created_count=0)
+
+
 class DiscountMutation(ObjectType):
     """GraphQL mutations cho Discount module"""
     create_voucher = CreateVoucher.Field()
     update_voucher = UpdateVoucher.Field()
+    generate_vouchers = GenerateVouchers.Field()
 
 
 # Main schema for discount module
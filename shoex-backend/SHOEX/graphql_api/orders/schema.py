@@ -1,10 +1,16 @@
 import graphene
 from graphene import ObjectType, Field, List, String, Int, Boolean, ID, Date, DateTime, Decimal
 from graphene_django import DjangoObjectType
+from django.db import transaction
 from django.db.models import Q
 
 from SHOEX.orders.models import Order, OrderItem
 from SHOEX.address.models import Address
+from SHOEX.discount.optimizer import CartLine, cart_lines, resolve_order_vouchers
+from SHOEX.discount.redemption import VoucherRedemptionError, redeem_vouchers
+from SHOEX.cart.models import Cart
+from SHOEX.products.inventory import commit_reservations
+from ..core.optimizer import QueryHint, optimize_queryset
 
 
 class AddressType(DjangoObjectType):
@@ -17,6 +23,15 @@ class OrderType(DjangoObjectType):
     class Meta:
         model = Order
         fields = '__all__'
+
+    # Query hints cho optimize_queryset
+    query_hints = {
+        'buyer': QueryHint(select_related=['buyer']),
+        'address': QueryHint(select_related=['address']),
+        'order_items': QueryHint(prefetch_related=['order_items']),
+        'sub_orders': QueryHint(prefetch_related=['sub_orders']),
+        'order_vouchers': QueryHint(prefetch_related=['order_vouchers']),
+    }
     
     # Explicitly resolve buyer field to ensure proper serialization
     def resolve_buyer(self, info):
@@ -42,6 +57,7 @@ class OrderCreateInput(graphene.InputObjectType):
     payment_method = String(required=False)
     shipping_fee = Decimal(required=False)
     notes = String(required=False)
+    voucher_ids = List(ID, required=False)
 
 
 class OrderQuery(ObjectType):
@@ -55,13 +71,13 @@ class OrderQuery(ObjectType):
 
     def resolve_order(self, info, id):
         try:
-            return Order.objects.get(pk=id)
+            return optimize_queryset(Order.objects.all(), info, OrderType).get(pk=id)
         except Order.DoesNotExist:
             return None
 
     def resolve_orders(self, info, search=None):
         """Lấy danh sách orders"""
-        qs = Order.objects.all()
+        qs = optimize_queryset(Order.objects.all(), info, OrderType)
         if search:
             q = Q(buyer__username__icontains=search) | Q(buyer__full_name__icontains=search) | Q(buyer__email__icontains=search)
             qs = qs.filter(q)
@@ -83,24 +99,71 @@ class CreateOrder(graphene.Mutation):
     @staticmethod
     def mutate(root, info, input):
         try:
-            order = Order.objects.create(
-                buyer_id=input.buyer_id,
-                address_id=input.address_id,
-                total_amount=input.total_amount,
-                status=input.status or 'pending',
-                payment_status=input.payment_status or 'pending',
-                payment_method=input.payment_method,
-                shipping_fee=input.shipping_fee or 0,
-                notes=input.notes
-            )
+            with transaction.atomic():
+                order = Order.objects.create(
+                    buyer_id=input.buyer_id,
+                    address_id=input.address_id,
+                    total_amount=input.total_amount,
+                    status=input.status or 'pending',
+                    payment_status=input.payment_status or 'pending',
+                    payment_method=input.payment_method,
+                    shipping_fee=input.shipping_fee or 0,
+                    notes=input.notes
+                )
+                # Hàng đang giữ cho giỏ của người mua được chốt vào đơn (không hết hạn nữa)
+                cart = Cart.objects.filter(user_id=input.buyer_id).first()
+                if cart is not None:
+                    commit_reservations(order, cart=cart)
+                if input.voucher_ids:
+                    # Voucher phải qua cùng kiểm tra với gợi ý checkout (hiệu lực, cửa hàng,
+                    # min_order_amount, lượt của user, quy tắc ghép)
+                    items = cart.items.select_related('variant__product') if cart is not None else []
+                    lines = cart_lines(items) or [CartLine(None, None, None, order.total_amount)]
+                    plan = resolve_order_vouchers(order.buyer_id, lines, input.voucher_ids)
+                    applications = [(candidate.voucher_id, discount) for candidate, discount in plan.stores.values()]
+                    if plan.platform is not None:
+                        applications.append((plan.platform.voucher_id, plan.platform_discount))
+                    # Giữ lượt voucher trong cùng transaction với đơn (hết lượt => không tạo đơn)
+                    redeem_vouchers(order, applications)
+                    order.total_amount = max(order.total_amount - plan.total_discount, 0)
+                    order.save(update_fields=['total_amount'])
             return CreateOrder(success=True, message="Tạo đơn hàng thành công", order=order)
+        except (VoucherRedemptionError, ValueError) as e:
+            return CreateOrder(success=False, message=str(e), order=None)
         except Exception as e:
             return CreateOrder(success=False, message=f"Lỗi: {str(e)}", order=None)
 
 
+class CancelOrder(graphene.Mutation):
+    """Hủy đơn: lượt voucher của đơn được trả lại (signal discount.release_vouchers_on_cancel)"""
+    class Arguments:
+        id = ID(required=True)
+
+    success = Boolean()
+    message = String()
+    order = Field(OrderType)
+
+    @staticmethod
+    def mutate(root, info, id):
+        try:
+            with transaction.atomic():
+                order = Order.objects.select_for_update().get(pk=id)
+                if order.status in ('shipped', 'delivered', 'returned'):
+                    return CancelOrder(success=False, message="Đơn hàng đã gửi đi, không thể hủy", order=order)
+                if order.status != 'cancelled':
+                    order.status = 'cancelled'
+                    order.save(update_fields=['status', 'updated_at'])
+            return CancelOrder(success=True, message="Hủy đơn hàng thành công", order=order)
+        except Order.DoesNotExist:
+            return CancelOrder(success=False, message="Đơn hàng không tồn tại", order=None)
+        except Exception as e:
+            return CancelOrder(success=False, message=f"Lỗi: {str(e)}", order=None)
+
+
 class OrderMutation(ObjectType):
     """GraphQL mutations cho Order module"""
     create_order = CreateOrder.Field()
+    cancel_order = CancelOrder.Field()
 
 
 # Main schema for order module
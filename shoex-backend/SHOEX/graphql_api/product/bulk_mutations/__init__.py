@@ -5,6 +5,8 @@ from .bulk_product_mutations import (
     BulkProductVariantCreate,
     BulkStockUpdate,
     BulkPriceUpdate,
+    BulkInventoryUpload,
+    StartProductImport,
     BulkProductStatusUpdate,
     BulkOperationResult
 )
@@ -13,7 +15,8 @@ from .bulk_variants_mutations import (
     BulkVariantStatusUpdate,
     BulkVariantDelete,
     BulkProductDelete,
-    BulkStockTransfer
+    BulkStockTransfer,
+    GenerateProductVariants
 )
 
 __all__ = [
@@ -23,6 +26,8 @@ __all__ = [
     'BulkProductVariantCreate',
     'BulkStockUpdate',
     'BulkPriceUpdate',
+    'BulkInventoryUpload',
+    'StartProductImport',
     'BulkProductStatusUpdate',
     
     # Variant bulk operations
@@ -30,6 +35,7 @@ __all__ = [
     'BulkVariantDelete',
     'BulkProductDelete',
     'BulkStockTransfer',
+    'GenerateProductVariants',
     
     # Result types
     'BulkOperationResult'
@@ -1,9 +1,20 @@
+from decimal import Decimal
+from itertools import islice
+
 import graphene
 from graphene import InputObjectType, Mutation
+from graphene_file_upload.scalars import Upload
 from django.db import transaction
+from django.db.models import BooleanField, Exists, OuterRef, Q, Value
 from django.core.exceptions import ValidationError
-from SHOEX.products.models import Product, ProductVariant, Category
-from ..types.product import ProductType, ProductVariantType
+from django.utils import timezone
+from SHOEX.products.models import Product, ProductVariant, Category, ProductImportJob
+from SHOEX.store.models import Store, StoreUser
+from SHOEX.products.utils import variant_summary_batch, schedule_variant_summary
+from SHOEX.products.inventory import adjust_stock
+from SHOEX.products.history import record_stock_changes, record_price_changes
+from SHOEX.products.imports import detect_format, iter_records, start_import
+from ..types.product import ProductType, ProductVariantType, ProductImportJobType
 from ..mutations.product_mutations import ProductCreateInput, ProductVariantCreateInput
 
 
@@ -299,7 +310,7 @@ class BulkProductVariantCreate(Mutation):
         error_count = 0
         
         try:
-            with transaction.atomic():
+            with transaction.atomic(), variant_summary_batch():
                 for i, variant_data in enumerate(variants_data):
                     try:
                         # Validate product
@@ -364,8 +375,146 @@ class BulkProductVariantCreate(Mutation):
         )
 
 
+# ===== SET-BASED STOCK / PRICE =====
+
+STORE_EDITOR_ROLES = ('owner', 'admin', 'manager')
+APPLY_BATCH_SIZE = 500        # Số SKU mỗi câu UPDATE (giữ biểu thức WHERE / CASE vừa phải)
+SYNC_CHUNK_SIZE = 5000        # Số dòng file mỗi transaction khi upload
+MAX_REPORTED_ERRORS = 1000    # Chặn kích thước response khi file có rất nhiều dòng lỗi
+
+
+def can_edit_annotation(user, store_field='store_id'):
+    """
+    Biểu thức "user được sửa": staff hoặc thành viên active owner/admin/manager
+    của store (store_field: đường dẫn tới store_id từ model đang query)
+    """
+    if user.is_staff:
+        return Value(True, output_field=BooleanField())
+    return Exists(StoreUser.objects.filter(
+        store_id=OuterRef(store_field),
+        user=user,
+        status='active',
+        role__in=STORE_EDITOR_ROLES
+    ))
+
+
+def _fetch_variants(user, variant_ids=(), skus=()):
+    """
+    Một query (khóa dòng theo thứ tự variant_id): variant kèm quyền sửa của user
+    Trả về ({variant_id: row}, {sku: row}), row = (variant_id, product_id, stock, price, can_edit)
+    """
+    rows = ProductVariant.objects.filter(Q(pk__in=variant_ids) | Q(sku__in=skus))\
+        .annotate(can_edit=can_edit_annotation(user, 'product__store_id'))\
+        .select_for_update(of=('self',))\
+        .order_by('pk')\
+        .values_list('pk', 'sku', 'product_id', 'stock', 'price', 'can_edit')
+    by_id, by_sku = {}, {}
+    for variant_id, sku, product_id, stock, price, editable in rows:
+        by_id[variant_id] = by_sku[sku] = (variant_id, product_id, stock, price, editable)
+    return by_id, by_sku
+
+
+def _resolve_rows(user, rows, errors):
+    """rows: [(label, variant_id, sku, value, reason)] -> [(label, variant row, value, reason)] có quyền sửa"""
+    by_id, by_sku = _fetch_variants(
+        user,
+        {row[1] for row in rows if row[1] is not None},
+        {row[2] for row in rows if row[1] is None and row[2]}
+    )
+    resolved = []
+    for label, variant_id, sku, value, reason in rows:
+        variant = by_id.get(variant_id) if variant_id is not None else by_sku.get(sku)
+        if variant is None:
+            errors.append(f"{label}: Variant not found")
+        elif not variant[4]:
+            errors.append(f"{label}: Permission denied")
+        else:
+            resolved.append((label, variant, value, reason))
+    return resolved
+
+
+def apply_stock_rows(user, rows, source='bulk'):
+    """
+    Cộng / trừ kho cả lô với số query cố định (gọi trong transaction.atomic)
+    rows: [(label, variant_id | None, sku | None, stock_change, reason)]
+    Dòng được xét theo thứ tự như khi cập nhật từng dòng: dòng làm kho âm bị báo lỗi
+    Sổ cái ghi từng dòng thành công (kèm lý do riêng), theo lô sau commit
+    Trả về (success_count, errors)
+    """
+    errors = []
+    current, changes, entries, product_ids = {}, {}, [], {}
+    for label, (variant_id, product_id, stock, _, _), stock_change, reason in _resolve_rows(user, rows, errors):
+        new_stock = current.get(variant_id, stock) + stock_change
+        if new_stock < 0:
+            errors.append(f"{label}: Stock cannot be negative")
+            continue
+        current[variant_id] = new_stock
+        changes[variant_id] = changes.get(variant_id, 0) + stock_change
+        entries.append((variant_id, stock_change, reason))
+        product_ids[variant_id] = product_id
+
+    # Các dòng đã khóa ở _fetch_variants => UPDATE có điều kiện không thể thiếu hàng
+    items = list(changes.items())
+    for start in range(0, len(items), APPLY_BATCH_SIZE):
+        batch = dict(items[start:start + APPLY_BATCH_SIZE])
+        adjust_stock(batch, log=False, product_ids={product_ids[variant_id] for variant_id in batch})
+    record_stock_changes(entries, source, user=user)
+    return len(entries), errors
+
+
+def apply_price_rows(user, rows, source='bulk'):
+    """
+    Đổi giá cả lô bằng bulk_update (gọi trong transaction.atomic + variant_summary_batch)
+    rows: [(label, variant_id | None, sku | None, new_price, reason)]; trùng variant => dòng sau thắng
+    Trả về (success_count, errors)
+    """
+    errors = []
+    prices, product_ids, entries = {}, set(), []
+    for label, (variant_id, product_id, _, price, _), new_price, reason in _resolve_rows(user, rows, errors):
+        if new_price is None or new_price <= 0:
+            errors.append(f"{label}: Price must be positive")
+            continue
+        entries.append((variant_id, prices.get(variant_id, price), new_price, reason))
+        prices[variant_id] = new_price
+        product_ids.add(product_id)
+
+    now = timezone.now()
+    ProductVariant.objects.bulk_update(
+        [ProductVariant(variant_id=variant_id, price=price, updated_at=now) for variant_id, price in prices.items()],
+        ['price', 'updated_at'],
+        batch_size=APPLY_BATCH_SIZE
+    )
+    # bulk_update không bắn post_save => tự làm mới min_price / max_price, tự ghi lịch sử giá
+    schedule_variant_summary(product_ids)
+    record_price_changes(entries, source, user=user)
+    return len(entries), errors
+
+
+def _bulk_result(total_count, success_count, errors):
+    error_count = len(errors)
+    if error_count > MAX_REPORTED_ERRORS:
+        errors = errors[:MAX_REPORTED_ERRORS] + [f"... and {error_count - MAX_REPORTED_ERRORS} more errors"]
+    return BulkOperationResult(
+        success_count=success_count,
+        error_count=error_count,
+        total_count=total_count,
+        errors=errors,
+        success=success_count > 0
+    )
+
+
+def _failed_result(total_count, error):
+    return BulkOperationResult(
+        success_count=0,
+        error_count=total_count,
+        total_count=total_count,
+        errors=[error],
+        success=False
+    )
+
+
 class BulkStockUpdate(Mutation):
-    """Bulk cập nhật tồn kho nhiều variants"""
+    """Bulk cập nhật tồn kho nhiều variants (1 query đọc + UPDATE theo lô)"""
     
     class Arguments:
         updates = graphene.List(BulkStockUpdateInput, required=True)
@@ -376,76 +525,23 @@ class BulkStockUpdate(Mutation):
         user = info.context.user
         
         if not user.is_authenticated:
-            return BulkOperationResult(
-                success_count=0,
-                error_count=0,
-                total_count=0,
-                errors=["Authentication required"],
-                success=False
-            )
-        
-        total_count = len(updates)
-        success_count = 0
-        error_count = 0
-        errors = []
+            return _failed_result(0, "Authentication required")
         
+        rows = [
+            (f"Stock update {i+1}", update_data.variant_id, None, update_data.stock_change, update_data.reason)
+            for i, update_data in enumerate(updates)
+        ]
         try:
-            with transaction.atomic():
-                for i, update_data in enumerate(updates):
-                    try:
-                        # Get variant
-                        try:
-                            variant = ProductVariant.objects.get(variant_id=update_data.variant_id)
-                        except ProductVariant.DoesNotExist:
-                            error_count += 1
-                            errors.append(f"Stock update {i+1}: Variant not found")
-                            continue
-                        
-                        # Check permission
-                        if variant.product.seller != user and not user.is_staff:
-                            error_count += 1
-                            errors.append(f"Stock update {i+1}: Permission denied")
-                            continue
-                        
-                        # Calculate new stock
-                        new_stock = variant.stock + update_data.stock_change
-                        
-                        if new_stock < 0:
-                            error_count += 1
-                            errors.append(f"Stock update {i+1}: Stock cannot be negative")
-                            continue
-                        
-                        variant.stock = new_stock
-                        variant.save()
-                        
-                        # TODO: Log stock history
-                        
-                        success_count += 1
-                        
-                    except Exception as e:
-                        error_count += 1
-                        errors.append(f"Stock update {i+1}: {str(e)}")
-                
+            with transaction.atomic(), variant_summary_batch():
+                success_count, errors = apply_stock_rows(user, rows)
         except Exception as e:
-            return BulkOperationResult(
-                success_count=0,
-                error_count=total_count,
-                total_count=total_count,
-                errors=[f"Transaction failed: {str(e)}"],
-                success=False
-            )
+            return _failed_result(len(rows), f"Transaction failed: {str(e)}")
         
-        return BulkOperationResult(
-            success_count=success_count,
-            error_count=error_count,
-            total_count=total_count,
-            errors=errors,
-            success=success_count > 0
-        )
+        return _bulk_result(len(rows), success_count, errors)
 
 
 class BulkPriceUpdate(Mutation):
-    """Bulk cập nhật giá nhiều variants"""
+    """Bulk cập nhật giá nhiều variants (1 query đọc + bulk_update)"""
     
     class Arguments:
         updates = graphene.List(BulkPriceUpdateInput, required=True)
@@ -456,70 +552,136 @@ class BulkPriceUpdate(Mutation):
         user = info.context.user
         
         if not user.is_authenticated:
-            return BulkOperationResult(
-                success_count=0,
-                error_count=0,
-                total_count=0,
-                errors=["Authentication required"],
-                success=False
-            )
-        
-        total_count = len(updates)
-        success_count = 0
-        error_count = 0
-        errors = []
+            return _failed_result(0, "Authentication required")
         
+        rows = [
+            (f"Price update {i+1}", update_data.variant_id, None, update_data.new_price, update_data.reason)
+            for i, update_data in enumerate(updates)
+        ]
         try:
-            with transaction.atomic():
-                for i, update_data in enumerate(updates):
-                    try:
-                        # Get variant
-                        try:
-                            variant = ProductVariant.objects.get(variant_id=update_data.variant_id)
-                        except ProductVariant.DoesNotExist:
-                            error_count += 1
-                            errors.append(f"Price update {i+1}: Variant not found")
-                            continue
-                        
-                        # Check permission
-                        if variant.product.seller != user and not user.is_staff:
-                            error_count += 1
-                            errors.append(f"Price update {i+1}: Permission denied")
-                            continue
-                        
-                        # Validate price
-                        if update_data.new_price <= 0:
-                            error_count += 1
-                            errors.append(f"Price update {i+1}: Price must be positive")
-                            continue
-                        
-                        variant.price = update_data.new_price
-                        variant.save()
-                        
-                        # TODO: Log price history
-                        
-                        success_count += 1
-                        
-                    except Exception as e:
-                        error_count += 1
-                        errors.append(f"Price update {i+1}: {str(e)}")
-                
+            with transaction.atomic(), variant_summary_batch():
+                success_count, errors = apply_price_rows(user, rows)
         except Exception as e:
-            return BulkOperationResult(
-                success_count=0,
-                error_count=total_count,
-                total_count=total_count,
-                errors=[f"Transaction failed: {str(e)}"],
-                success=False
-            )
+            return _failed_result(len(rows), f"Transaction failed: {str(e)}")
         
-        return BulkOperationResult(
-            success_count=success_count,
-            error_count=error_count,
-            total_count=total_count,
-            errors=errors,
-            success=success_count > 0
-        )
+        return _bulk_result(len(rows), success_count, errors)
+
+
+def _iter_sync_rows(upload, value_field, parse_value):
+    """
+    Đọc file CSV (có header), JSON lines hoặc XLSX theo luồng
+    Mỗi dòng có variant_id hoặc sku, cùng cột value_field (cột reason tùy chọn)
+    Trả về từng (label, variant_id, sku, value, reason) hoặc (label, None, None, ValueError, None)
+    """
+    records = iter_records(upload, detect_format(upload.name) or 'csv')
+    while True:
+        try:
+            number, record = next(records)
+        except StopIteration:
+            return
+        except ValueError as e:
+            yield "File", None, None, e, None
+            return
+        label = f"Row {number}"
+        try:
+            if isinstance(record, Exception):
+                raise record
+            variant_id = record.get('variant_id')
+            variant_id = int(variant_id) if variant_id not in (None, '') else None
+            sku = str(record.get('sku') or '').strip() or None
+            if variant_id is None and sku is None:
+                raise ValueError("variant_id or sku is required")
+            yield label, variant_id, sku, parse_value(record.get(value_field)), str(record.get('reason') or '')
+        except (ValueError, TypeError, ArithmeticError, AttributeError) as e:
+            yield label, None, None, ValueError(str(e) or f"invalid {value_field}"), None
+
+
+class BulkInventoryUpload(Mutation):
+    """
+    Đồng bộ kho / giá từ file (CSV có header, JSON lines hoặc XLSX), cho file hàng trăm nghìn dòng
+    - mode 'stock': cột stock_change; mode 'price': cột new_price
+    - Mỗi dòng có variant_id hoặc sku, cột reason tùy chọn (ghi vào lịch sử)
+    - Xử lý theo từng khối SYNC_CHUNK_SIZE dòng, mỗi khối một transaction
+    """
+    MODES = {
+        'stock': ('stock_change', int, apply_stock_rows),
+        'price': ('new_price', lambda value: Decimal(str(value).strip()), apply_price_rows),
+    }
+
+    class Arguments:
+        file = Upload(required=True)
+        mode = graphene.String(required=True, description="'stock' (cột stock_change) hoặc 'price' (cột new_price)")
+
+    Output = BulkOperationResult
+
+    def mutate(self, info, file, mode):
+        user = info.context.user
+
+        if not user.is_authenticated:
+            return _failed_result(0, "Authentication required")
+        if mode not in BulkInventoryUpload.MODES:
+            return _failed_result(0, "Mode must be 'stock' or 'price'")
+        value_field, parse_value, apply_rows = BulkInventoryUpload.MODES[mode]
+
+        total_count, success_count, errors = 0, 0, []
+        rows = _iter_sync_rows(file, value_field, parse_value)
+        while True:
+            chunk, read = [], 0
+            for row in islice(rows, SYNC_CHUNK_SIZE):
+                read += 1
+                if isinstance(row[3], ValueError):
+                    errors.append(f"{row[0]}: {row[3]}")
+                else:
+                    chunk.append(row)
+            total_count += read
+            if chunk:
+                try:
+                    with transaction.atomic(), variant_summary_batch():
+                        chunk_success, chunk_errors = apply_rows(user, chunk, source='import')
+                except Exception as e:
+                    chunk_success = 0
+                    chunk_errors = [f"{chunk[0][0]} - {chunk[-1][0]}: Transaction failed: {str(e)}"]
+                success_count += chunk_success
+                errors.extend(chunk_errors)
+            if read < SYNC_CHUNK_SIZE:
+                break
+
+        return _bulk_result(total_count, success_count, errors)
+
+
+class StartProductImport(Mutation):
+    """
+    Nhập sản phẩm / biến thể từ file (CSV có header, JSON lines hoặc XLSX) cho một store
+    Chạy nền theo từng khối; theo dõi tiến độ và lỗi từng dòng qua query productImportJob
+    """
+
+    class Arguments:
+        file = Upload(required=True)
+        store_id = graphene.ID(required=True)
+
+    success = graphene.Boolean()
+    job = graphene.Field(ProductImportJobType)
+    errors = graphene.List(graphene.String)
+
+    def mutate(self, info, file, store_id):
+        user = info.context.user
+
+        if not user.is_authenticated:
+            return StartProductImport(success=False, errors=["Authentication required"])
+        format = detect_format(file.name)
+        if format is None:
+            return StartProductImport(success=False, errors=["File must be .csv, .jsonl or .xlsx"])
+        if not user.is_staff and not StoreUser.objects.filter(
+            store_id=store_id, user=user, status='active', role__in=STORE_EDITOR_ROLES
+        ).exists():
+            return StartProductImport(success=False, errors=["Permission denied"])
+        if not Store.objects.filter(pk=store_id).exists():
+            return StartProductImport(success=False, errors=["Store not found"])
+
+        with transaction.atomic():
+            job = ProductImportJob.objects.create(store_id=store_id, user=user, file=file, format=format)
+            start_import(job.pk)
+        return StartProductImport(success=True, job=job, errors=[])
 
 
 class BulkProductStatusUpdate(Mutation):
@@ -549,7 +711,7 @@ class BulkProductStatusUpdate(Mutation):
         errors = []
         
         try:
-            with transaction.atomic():
+            with transaction.atomic(), variant_summary_batch():
                 for i, product_id in enumerate(product_ids):
                     try:
                         # Get product
@@ -571,6 +733,7 @@ class BulkProductStatusUpdate(Mutation):
                         
                         # Also update variants status
                         product.variants.update(is_active=is_active)
+                        schedule_variant_summary([product.pk])
                         
                         success_count += 1
                         
@@ -1,6 +1,9 @@
 import graphene
 from django.db import transaction
 from SHOEX.products.models import Product, ProductVariant
+from SHOEX.products.utils import variant_summary_batch
+from SHOEX.products.inventory import InsufficientStock, adjust_stock
+from SHOEX.products.variants import generate_variants
 from ..types.product import ProductVariantType
 from .bulk_product_mutations import (
     BulkProductCreate,
@@ -9,7 +12,8 @@ from .bulk_product_mutations import (
     BulkStockUpdate,
     BulkPriceUpdate,
     BulkProductStatusUpdate,
-    BulkOperationResult
+    BulkOperationResult,
+    can_edit_annotation
 )
 
 
@@ -42,7 +46,7 @@ class BulkVariantStatusUpdate(graphene.Mutation):
         errors = []
         
         try:
-            with transaction.atomic():
+            with transaction.atomic(), variant_summary_batch():
                 for i, variant_id in enumerate(variant_ids):
                     try:
                         # Get variant
@@ -113,7 +117,7 @@ class BulkVariantDelete(graphene.Mutation):
         errors = []
         
         try:
-            with transaction.atomic():
+            with transaction.atomic(), variant_summary_batch():
                 for i, variant_id in enumerate(variant_ids):
                     try:
                         # Get variant
@@ -189,7 +193,7 @@ class BulkProductDelete(graphene.Mutation):
         errors = []
         
         try:
-            with transaction.atomic():
+            with transaction.atomic(), variant_summary_batch():
                 for i, product_id in enumerate(product_ids):
                     try:
                         # Get product
@@ -275,10 +279,16 @@ class BulkStockTransfer(graphene.Mutation):
                 errors=["Quantity must be positive"]
             )
         
+        if from_variant_id == to_variant_id:
+            return BulkStockTransfer.Output(
+                success=False,
+                errors=["Source and destination variants must be different"]
+            )
+        
         errors = []
         
         try:
-            with transaction.atomic():
+            with transaction.atomic(), variant_summary_batch():
                 # Get variants
                 try:
                     from_variant = ProductVariant.objects.get(variant_id=from_variant_id)
@@ -297,21 +307,22 @@ class BulkStockTransfer(graphene.Mutation):
                         errors=["Permission denied"]
                     )
                 
-                # Check stock availability
-                if from_variant.stock < quantity:
+                # Transfer stock: một câu UPDATE, chỉ chạy khi nguồn còn đủ hàng
+                try:
+                    adjust_stock(
+                        {from_variant.variant_id: -quantity, to_variant.variant_id: quantity},
+                        source='transfer',
+                        reason=reason or '',
+                        user=user,
+                        product_ids={from_variant.product_id, to_variant.product_id}
+                    )
+                except InsufficientStock:
                     return BulkStockTransfer.Output(
                         success=False,
                         errors=["Insufficient stock in source variant"]
                     )
-                
-                # Transfer stock
-                from_variant.stock -= quantity
-                to_variant.stock += quantity
-                
-                from_variant.save()
-                to_variant.save()
-                
-                # TODO: Log stock transfer history
+                from_variant.refresh_from_db(fields=['stock'])
+                to_variant.refresh_from_db(fields=['stock'])
                 
                 return BulkStockTransfer.Output(
                     success=True,
@@ -327,6 +338,75 @@ class BulkStockTransfer(graphene.Mutation):
             )
 
 
+class GenerateProductVariants(graphene.Mutation):
+    """Tạo toàn bộ biến thể còn thiếu từ tùy chọn thuộc tính của các product"""
+    
+    class Arguments:
+        product_ids = graphene.List(graphene.Int, required=True)
+        price = graphene.Decimal(description="Giá variant mới (mặc định base_price của product)")
+        stock = graphene.Int(default_value=0, description="Tồn kho ban đầu của variant mới")
+    
+    Output = BulkOperationResult
+    
+    def mutate(self, info, product_ids, price=None, stock=0):
+        user = info.context.user
+        
+        if not user.is_authenticated:
+            return BulkOperationResult(
+                success_count=0,
+                error_count=0,
+                total_count=0,
+                errors=["Authentication required"],
+                success=False
+            )
+        if stock < 0 or (price is not None and price <= 0):
+            return BulkOperationResult(
+                success_count=0,
+                error_count=len(product_ids),
+                total_count=len(product_ids),
+                errors=["Price must be positive and stock must not be negative"],
+                success=False
+            )
+        
+        errors = []
+        editable = dict(
+            Product.objects.filter(pk__in=product_ids)
+            .annotate(can_edit=can_edit_annotation(user))
+            .values_list('pk', 'can_edit')
+        )
+        allowed = []
+        for product_id in product_ids:
+            if product_id not in editable:
+                errors.append(f"Product {product_id}: Not found")
+            elif not editable[product_id]:
+                errors.append(f"Product {product_id}: Permission denied")
+            else:
+                allowed.append(product_id)
+        
+        created = 0
+        if allowed:
+            try:
+                result = generate_variants(allowed, price=price, stock=stock)
+            except ValueError as e:
+                errors.append(str(e))
+                result = {}
+            except Exception as e:
+                errors.append(f"Transaction failed: {str(e)}")
+                result = {}
+            for product_id, count in result.items():
+                if count is None:
+                    errors.append(f"Product {product_id}: No attribute options")
+            created = sum(count for count in result.values() if count)
+        
+        return BulkOperationResult(
+            success_count=created,
+            error_count=len(errors),
+            total_count=len(product_ids),
+            errors=errors,
+            success=created > 0 or not errors
+        )
+
+
 # ===== EXPORT ALL BULK MUTATIONS =====
 
 __all__ = [
@@ -340,5 +420,6 @@ __all__ = [
     'BulkVariantDelete',
     'BulkProductDelete',
     'BulkStockTransfer',
+    'GenerateProductVariants',
     'BulkOperationResult'
 ]
\ No newline at end of file
@@ -1,7 +1,8 @@
 from collections import defaultdict
 from promise import Promise
 from promise.dataloader import DataLoader
-from SHOEX.products.models import Product, Category, ProductVariant, ProductAttribute, ProductAttributeOption, ProductImage
+from SHOEX.discount.engine import DiscountEngine
+from SHOEX.products.models import Product, Category, CategoryClosure, ProductVariant, VariantOptionValue, ProductAttribute, ProductAttributeOption, ProductImage
 
 
 class CategoryByIdLoader(DataLoader):
@@ -9,6 +10,8 @@ class CategoryByIdLoader(DataLoader):
     DataLoader để load Category theo ID
     Tối ưu cho việc load category của nhiều products cùng lúc
     """
+    batch_keys = [(Product, 'category_id'), (Category, 'parent_id')]
+
     def batch_load_fn(self, category_ids):
         # Lấy tất cả categories trong 1 query
         categories = Category.objects.filter(
@@ -25,10 +28,12 @@ class ProductByIdLoader(DataLoader):
     """
     DataLoader để load Product theo ID
     """
+    batch_keys = [(ProductVariant, 'product_id')]
+
     def batch_load_fn(self, product_ids):
         products = Product.objects.filter(
             product_id__in=product_ids
-        ).select_related('seller', 'category').in_bulk(field_name='product_id')
+        ).select_related('store', 'category', 'brand').in_bulk(field_name='product_id')
         
         return Promise.resolve([
             products.get(product_id) for product_id in product_ids
@@ -40,12 +45,14 @@ class ProductsByCategoryIdLoader(DataLoader):
     DataLoader để load Products theo Category ID
     Dùng cho resolver products của Category
     """
+    batch_keys = [(Category, 'category_id')]
+
     def batch_load_fn(self, category_ids):
         # Query tất cả products của các categories
         products = Product.objects.filter(
             category_id__in=category_ids,
             is_active=True
-        ).select_related('seller', 'category')
+        ).select_related('store', 'category')
         
         # Nhóm products theo category_id
         products_by_category = defaultdict(list)
@@ -62,12 +69,12 @@ class ProductVariantsByProductIdLoader(DataLoader):
     """
     DataLoader để load ProductVariants theo Product ID
     Tối ưu cho việc load variants của nhiều products
+    Mọi variant (kể cả đã ẩn) như quan hệ product.variants: màn hình seller / admin cần SKU đã ẩn
     """
+    batch_keys = [(Product, 'product_id')]
+
     def batch_load_fn(self, product_ids):
-        variants = ProductVariant.objects.filter(
-            product_id__in=product_ids,
-            is_active=True
-        ).select_related('product')
+        variants = ProductVariant.objects.filter(product_id__in=product_ids)
         
         # Nhóm variants theo product_id
         variants_by_product = defaultdict(list)
@@ -83,6 +90,8 @@ class ProductVariantByIdLoader(DataLoader):
     """
     DataLoader để load ProductVariant theo ID
     """
+    batch_keys = [(ProductVariant, 'variant_id')]
+
     def batch_load_fn(self, variant_ids):
         variants = ProductVariant.objects.filter(
             variant_id__in=variant_ids
@@ -98,16 +107,17 @@ class ProductAttributeOptionsByProductIdLoader(DataLoader):
     DataLoader để load ProductAttributeOptions theo Product ID
     Dùng để lấy các tùy chọn thuộc tính của sản phẩm
     """
+    batch_keys = [(Product, 'product_id'), (ProductVariant, 'product_id')]
+
     def batch_load_fn(self, product_ids):
         options = ProductAttributeOption.objects.filter(
-            attribute__product_id__in=product_ids
-        ).select_related('attribute').order_by('attribute__display_order', 'display_order')
+            product_id__in=product_ids
+        ).select_related('attribute')
         
         # Nhóm options theo product_id
         options_by_product = defaultdict(list)
         for option in options:
-            product_id = option.attribute.product_id
-            options_by_product[product_id].append(option)
+            options_by_product[option.product_id].append(option)
         
         return Promise.resolve([
             options_by_product[product_id] for product_id in product_ids
@@ -118,6 +128,8 @@ class ProductAttributeByIdLoader(DataLoader):
     """
     DataLoader để load ProductAttribute theo ID
     """
+    batch_keys = [(ProductAttributeOption, 'attribute_id')]
+
     def batch_load_fn(self, attribute_ids):
         attributes = ProductAttribute.objects.filter(
             attribute_id__in=attribute_ids
@@ -133,10 +145,13 @@ class ProductImagesByProductIdLoader(DataLoader):
     DataLoader để load ProductImages theo Product ID
     Dùng để lấy gallery images của sản phẩm
     """
+    batch_keys = [(Product, 'product_id')]
+
     def batch_load_fn(self, product_ids):
+        # Giữ ordering mặc định của model (ảnh đại diện luôn đầu tiên)
         images = ProductImage.objects.filter(
             product_id__in=product_ids
-        ).order_by('display_order', 'image_id')
+        )
         
         # Nhóm images theo product_id
         images_by_product = defaultdict(list)
@@ -153,6 +168,8 @@ class SubcategoriesByCategoryIdLoader(DataLoader):
     DataLoader để load subcategories theo Category ID
     Dùng cho category tree
     """
+    batch_keys = [(Category, 'category_id')]
+
     def batch_load_fn(self, category_ids):
         subcategories = Category.objects.filter(
             parent_id__in=category_ids,
@@ -169,6 +186,70 @@ class SubcategoriesByCategoryIdLoader(DataLoader):
         ])
 
 
+class CategoryPathByCategoryIdLoader(DataLoader):
+    """
+    DataLoader để load đường dẫn [gốc, ..., chính nó] theo Category ID
+    Một query trên bảng closure cho cả trang (full_path, breadcrumb)
+    """
+    batch_keys = [(Category, 'category_id'), (Product, 'category_id')]
+
+    def batch_load_fn(self, category_ids):
+        paths = CategoryClosure.ancestors_of(category_ids)
+        return Promise.resolve([
+            paths.get(category_id, []) for category_id in category_ids
+        ])
+
+
+class VariantCountByOptionIdLoader(DataLoader):
+    """
+    DataLoader đếm variants active có tùy chọn (ProductAttributeOption) này
+    Một query GROUP BY trên bảng VariantOptionValue
+    """
+    batch_keys = [(ProductAttributeOption, 'option_id')]
+
+    def batch_load_fn(self, option_ids):
+        from django.db.models import Count
+
+        counts = dict(
+            VariantOptionValue.objects.filter(option_id__in=option_ids, variant__is_active=True)
+            .values('option_id')
+            .annotate(count=Count('variant_id'))
+            .values_list('option_id', 'count')
+        )
+        return Promise.resolve([counts.get(option_id, 0) for option_id in option_ids])
+
+
+class AvailableCombinationsByOptionIdLoader(DataLoader):
+    """
+    DataLoader lấy các kết hợp còn hàng khi chọn tùy chọn này
+    Một query (self-join VariantOptionValue) cho tất cả option
+    """
+    batch_keys = [(ProductAttributeOption, 'option_id')]
+
+    def batch_load_fn(self, option_ids):
+        combinations = VariantOptionValue.available_combinations(option_ids)
+        return Promise.resolve([combinations.get(option_id, {}) for option_id in option_ids])
+
+
+class MaxDiscountByProductIdLoader(DataLoader):
+    """
+    DataLoader % giảm giá tối đa (Decimal) theo Product ID
+    Đọc chỉ mục voucher dùng chung (DiscountEngine), cả trang tính trong bộ nhớ
+    """
+    batch_keys = [(Product, 'product_id'), (ProductVariant, 'product_id')]
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.engine = DiscountEngine()
+
+    def batch_load_fn(self, product_ids):
+        products = Product.objects.filter(product_id__in=product_ids).values_list(
+            'product_id', 'category_id', 'store_id', 'base_price'
+        )
+        discounts = self.engine.max_discounts(products)
+        return Promise.resolve([discounts.get(product_id, 0) for product_id in product_ids])
+
+
 class SellerByIdLoader(DataLoader):
     """
     DataLoader để load User (Seller) theo ID
@@ -194,6 +275,8 @@ class ProductStockByProductIdLoader(DataLoader):
     DataLoader để tính tổng stock theo Product ID
     Tối ưu cho resolve_total_stock
     """
+    batch_keys = [(Product, 'product_id')]
+
     def batch_load_fn(self, product_ids):
         from django.db.models import Sum
         
@@ -221,6 +304,8 @@ class ProductPriceRangeByProductIdLoader(DataLoader):
     DataLoader để tính price range theo Product ID
     Tối ưu cho resolve_min_price, resolve_max_price
     """
+    batch_keys = [(Product, 'product_id')]
+
     def batch_load_fn(self, product_ids):
         from django.db.models import Min, Max
         
@@ -241,12 +326,40 @@ class ProductPriceRangeByProductIdLoader(DataLoader):
                 'max': item['max_price']
             }
         
+        # Product chưa có variant active => None (resolver fallback về base_price)
         return Promise.resolve([
-            price_ranges.get(product_id, {'min': 0, 'max': 0}) 
+            price_ranges.get(product_id, {'min': None, 'max': None}) 
             for product_id in product_ids
         ])
 
 
+class ProductCountByCategoryIdLoader(DataLoader):
+    """
+    DataLoader để đếm số product active theo Category ID
+    Tối ưu cho CategoryType.resolve_product_count
+    """
+    batch_keys = [(Category, 'category_id')]
+
+    def batch_load_fn(self, category_ids):
+        from django.db.models import Count
+        
+        count_data = Product.objects.filter(
+            category_id__in=category_ids,
+            is_active=True
+        ).values('category_id').annotate(
+            product_count=Count('product_id')
+        )
+        
+        counts = {
+            item['category_id']: item['product_count']
+            for item in count_data
+        }
+        
+        return Promise.resolve([
+            counts.get(category_id, 0) for category_id in category_ids
+        ])
+
+
 class ProductsBySellerLoader(DataLoader):
     """
     DataLoader để load Products theo Seller ID
@@ -318,7 +431,12 @@ def get_dataloader_context():
         'product_attribute_by_id_loader': ProductAttributeByIdLoader(),
         'product_images_by_product_id_loader': ProductImagesByProductIdLoader(),
         'subcategories_by_category_id_loader': SubcategoriesByCategoryIdLoader(),
+        'category_path_by_category_id_loader': CategoryPathByCategoryIdLoader(),
+        'variant_count_by_option_id_loader': VariantCountByOptionIdLoader(),
+        'available_combinations_by_option_id_loader': AvailableCombinationsByOptionIdLoader(),
+        'max_discount_by_product_id_loader': MaxDiscountByProductIdLoader(),
         'seller_by_id_loader': SellerByIdLoader(),
         'product_stock_by_product_id_loader': ProductStockByProductIdLoader(),
         'product_price_range_by_product_id_loader': ProductPriceRangeByProductIdLoader(),
+        'product_count_by_category_id_loader': ProductCountByCategoryIdLoader(),
     }
\ No newline at end of file
@@ -1,8 +1,10 @@
 import graphene
 from graphene import InputObjectType
-from django.db.models import Q, Sum, Avg, F, Case, When, Value, BooleanField
+from django.db.models import Q, Sum, Avg, F, Case, When, Value, BooleanField, Exists, OuterRef
 from django.db.models.functions import Coalesce
-from SHOEX.products.models import Product, Category
+from SHOEX.products.models import Product, CategoryClosure, ProductSalesStats, VariantOptionValue
+from SHOEX.products.search import search_products
+from SHOEX.discount.index import get_voucher_index
 from django.utils import timezone
 from datetime import timedelta
 
@@ -62,74 +64,77 @@ class ProductFilterInput(InputObjectType):
 
 
 
-    # ===== GET SUBCATEGORY IDS =====
-def get_subcategory_ids(category_id):
-    subcategories = Category.objects.filter(parent_id=category_id, is_active=True)
-    ids = []
-    for sub in subcategories:
-        ids.append(sub.category_id)
-        ids.extend(get_subcategory_ids(sub.category_id))
-    return ids
-
 # ===== APPLY PRODUCT FILTERS =====
 def apply_product_filters(queryset, filters):
     if not filters:
         return queryset
 
     if getattr(filters, "search", None):
-        queryset = queryset.filter(Q(name__icontains=filters.search) |
-                                   Q(description__icontains=filters.search))
-
-    if getattr(filters, "category_id", None):
-        cat_id = filters.category_id
-        if getattr(filters, "include_subcategories", True):
-            all_ids = [cat_id] + get_subcategory_ids(cat_id)
-            queryset = queryset.filter(category_id__in=all_ids)
+        queryset = search_products(queryset, filters.search)
+
+    # Danh mục: cây con lấy từ bảng closure (subquery, không đệ quy theo từng nút)
+    include_subcategories = getattr(filters, "include_subcategories", True)
+    for category_ids in (
+        [filters.category_id] if getattr(filters, "category_id", None) else None,
+        getattr(filters, "category_ids", None),
+    ):
+        if not category_ids:
+            continue
+        if include_subcategories:
+            queryset = queryset.filter(category_id__in=CategoryClosure.subtree_ids(category_ids))
         else:
-            queryset = queryset.filter(category_id=cat_id)
-
-    if getattr(filters, "category_ids", None):
-        ids = []
-        for cid in filters.category_ids:
-            ids.append(cid)
-            if getattr(filters, "include_subcategories", True):
-                ids.extend(get_subcategory_ids(cid))
-        queryset = queryset.filter(category_id__in=ids)
+            queryset = queryset.filter(category_id__in=category_ids)
 
     if getattr(filters, "store_id", None):
         queryset = queryset.filter(store_id=filters.store_id)
     if getattr(filters, "store_name", None):
         queryset = queryset.filter(store__name__icontains=filters.store_name)
 
+    # Giá / tồn kho: cột tổng hợp từ variants active trên Product (không join variants)
     if getattr(filters, "price_range", None):
         pr = filters.price_range
         if pr.min_price is not None:
-            queryset = queryset.filter(base_price__gte=pr.min_price)
+            queryset = queryset.filter(min_price__gte=pr.min_price)
         if pr.max_price is not None:
-            queryset = queryset.filter(base_price__lte=pr.max_price)
+            queryset = queryset.filter(min_price__lte=pr.max_price)
+
+    # Thuộc tính: có variant active mang giá trị đó (join chỉ mục VariantOptionValue)
+    for attribute_filter in getattr(filters, "attributes", None) or []:
+        queryset = queryset.filter(Exists(VariantOptionValue.objects.filter(
+            variant__product=OuterRef('pk'),
+            variant__is_active=True,
+            attribute__name__iexact=attribute_filter.attribute_name,
+            option__value__in=attribute_filter.values,
+        )))
 
     if getattr(filters, "has_stock", None) is not None:
         if filters.has_stock:
-            queryset = queryset.filter(variants__stock__gt=0).distinct()
+            queryset = queryset.filter(total_stock__gt=0)
         else:
-            queryset = queryset.exclude(variants__stock__gt=0).distinct()
+            queryset = queryset.filter(total_stock__lte=0)
 
     if getattr(filters, "has_discount", None):
         if filters.has_discount:
-            queryset = queryset.filter(variants__price__lt=F('base_price')).distinct()
+            # Variant rẻ hơn giá gốc, hoặc có voucher hiệu lực (chỉ mục voucher dùng chung)
+            queryset = queryset.filter(
+                Q(min_price__lt=F('base_price')) | get_voucher_index().product_filter()
+            )
 
+    # Bán chạy / rating: cột có index của bảng rollup ProductSalesStats
     if getattr(filters, "is_hot", None):
         if filters.is_hot:
-            queryset = queryset.filter(is_hot=True)
+            queryset = queryset.filter(
+                sales_stats__sold_count_last_30__gte=ProductSalesStats.HOT_SOLD_THRESHOLD
+            )
 
     if getattr(filters, "is_new", None):
         if filters.is_new:
             queryset = queryset.filter(is_new=True)
 
     if getattr(filters, "min_rating", None):
-        queryset = queryset.filter(avg_rating_last_30__gte=filters.min_rating)
+        queryset = queryset.filter(sales_stats__avg_rating_last_30__gte=filters.min_rating)
 
     if getattr(filters, "min_sold", None):
-        queryset = queryset.filter(sold_count_last_30__gte=filters.min_sold)
+        queryset = queryset.filter(sales_stats__sold_count_last_30__gte=filters.min_sold)
 
     return queryset
\ No newline at end of file
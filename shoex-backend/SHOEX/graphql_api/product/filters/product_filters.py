@@ -3,7 +3,7 @@ from graphene import InputObjectType
 from django_filters import FilterSet, CharFilter, NumberFilter, BooleanFilter, OrderingFilter
 from django.db import models
 from django.db.models import Q, Min, Max, Count, F
-from SHOEX.products.models import Product, Category, ProductVariant
+from SHOEX.products.models import Product, CategoryClosure, ProductVariant, VariantOptionValue
 
 
 class ProductFilterSet(FilterSet):
@@ -223,25 +223,18 @@ def apply_product_filters(queryset, filters):
             Q(description__icontains=search_term)
         )
     
-    # Danh mục
+    # Danh mục (cây con lấy từ bảng closure)
     if filters.get('category_id'):
         category_id = filters['category_id']
         if filters.get('include_subcategories', True):
-            # Bao gồm cả danh mục con
-            subcategory_ids = get_subcategory_ids(category_id)
-            all_category_ids = [category_id] + subcategory_ids
-            queryset = queryset.filter(category_id__in=all_category_ids)
+            queryset = queryset.filter(category_id__in=CategoryClosure.subtree_ids([category_id]))
         else:
             queryset = queryset.filter(category_id=category_id)
     
     if filters.get('category_ids'):
         category_ids = filters['category_ids']
         if filters.get('include_subcategories', True):
-            # Bao gồm cả danh mục con cho tất cả categories
-            all_ids = list(category_ids)
-            for cat_id in category_ids:
-                all_ids.extend(get_subcategory_ids(cat_id))
-            queryset = queryset.filter(category_id__in=all_ids)
+            queryset = queryset.filter(category_id__in=CategoryClosure.subtree_ids(category_ids))
         else:
             queryset = queryset.filter(category_id__in=category_ids)
     
@@ -265,10 +258,12 @@ def apply_product_filters(queryset, filters):
         for attr_filter in filters['attributes']:
             attr_name = attr_filter['attribute_name']
             values = attr_filter['values']
-            queryset = queryset.filter(
-                options__attribute__name__iexact=attr_name,
-                options__value__in=values
-            ).distinct()
+            queryset = queryset.filter(models.Exists(VariantOptionValue.objects.filter(
+                variant__product=models.OuterRef('pk'),
+                variant__is_active=True,
+                attribute__name__iexact=attr_name,
+                option__value__in=values
+            )))
     
     # Trạng thái
     if filters.get('is_active') is not None:
@@ -327,22 +322,6 @@ def apply_product_sorting(queryset, sort_input):
         return queryset.order_by('-created_at')
 
 
-def get_subcategory_ids(category_id):
-    """
-    Lấy tất cả subcategory IDs của một category
-    Recursive function để lấy all levels
-    """
-    subcategories = Category.objects.filter(parent_id=category_id, is_active=True)
-    subcategory_ids = []
-    
-    for subcategory in subcategories:
-        subcategory_ids.append(subcategory.category_id)
-        # Recursive call cho subcategories của subcategory
-        subcategory_ids.extend(get_subcategory_ids(subcategory.category_id))
-    
-    return subcategory_ids
-
-
 # ===== CATEGORY HELPERS =====
 
 def apply_category_filters(queryset, filters):
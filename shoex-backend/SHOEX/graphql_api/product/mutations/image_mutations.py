@@ -5,7 +5,8 @@ from django.db import transaction
 from django.core.exceptions import ValidationError
 
 from SHOEX.products.models import Product, ProductImage, ProductAttributeOption
-from SHOEX.products.utils import validate_image, resize_image
+from SHOEX.products.utils import validate_image
+from SHOEX.products.images import store_original
 from ..types.product import ProductImageType, ProductAttributeOptionType
 
 
@@ -25,25 +26,25 @@ class UploadProductImage(graphene.Mutation):
     @classmethod
     def mutate(cls, root, info, product_id, image, **kwargs):
         try:
+            # Validate product tồn tại
+            try:
+                product = Product.objects.get(product_id=product_id)
+            except Product.DoesNotExist:
+                return UploadProductImage(
+                    errors=[ErrorType(message="Sản phẩm không tồn tại")]
+                )
+            
+            # Validate ảnh
+            validation = validate_image(image)
+            if not validation['valid']:
+                return UploadProductImage(
+                    errors=[ErrorType(message=validation['error'])]
+                )
+            
+            # Lưu ảnh gốc ngoài transaction; bản thu nhỏ sinh nền sau commit (images.py)
+            stored = store_original(ProductImage, image)
+            
             with transaction.atomic():
-                # Validate product tồn tại
-                try:
-                    product = Product.objects.get(product_id=product_id)
-                except Product.DoesNotExist:
-                    return UploadProductImage(
-                        errors=[ErrorType(message="Sản phẩm không tồn tại")]
-                    )
-                
-                # Validate ảnh
-                validation = validate_image(image)
-                if not validation['valid']:
-                    return UploadProductImage(
-                        errors=[ErrorType(message=validation['error'])]
-                    )
-                
-                # Resize ảnh
-                resized_image = resize_image(image)
-                
                 # Xử lý thumbnail unique
                 is_thumbnail = kwargs.get('is_thumbnail', False)
                 if is_thumbnail:
@@ -53,18 +54,22 @@ class UploadProductImage(graphene.Mutation):
                         is_thumbnail=True
                     ).update(is_thumbnail=False)
                 
-                # Tạo ProductImage
-                product_image = ProductImage.objects.create(
+                # Tạo ProductImage (kích thước / định dạng / hash đọc từ header lúc validate)
+                product_image = ProductImage(
                     product=product,
-                    image=resized_image,
+                    image=stored,
                     is_thumbnail=is_thumbnail,
                     alt_text=kwargs.get('alt_text', f"{product.name} - Ảnh"),
                     display_order=kwargs.get('display_order', 0)
                 )
+                product_image.set_image_info(validation['info'])
+                product_image.save()
                 
-                return UploadProductImage(product_image=product_image)
+            return UploadProductImage(product_image=product_image)
                 
         except Exception as e:
+            # Không xóa file vừa lưu: có thể dùng chung nội dung với ảnh khác,
+            # chưa có dòng nào tham chiếu => collect_media dọn sau
             return UploadProductImage(
                 errors=[ErrorType(message=f"Lỗi upload: {str(e)}")]
             )
@@ -83,32 +88,34 @@ class UploadAttributeOptionImage(graphene.Mutation):
     @classmethod
     def mutate(cls, root, info, option_id, image):
         try:
-            with transaction.atomic():
-                # Validate option tồn tại
-                try:
-                    option = ProductAttributeOption.objects.get(option_id=option_id)
-                except ProductAttributeOption.DoesNotExist:
-                    return UploadAttributeOptionImage(
-                        errors=[ErrorType(message="Tùy chọn không tồn tại")]
-                    )
-                
-                # Validate ảnh
-                validation = validate_image(image)
-                if not validation['valid']:
-                    return UploadAttributeOptionImage(
-                        errors=[ErrorType(message=validation['error'])]
-                    )
-                
-                # Resize ảnh (nhỏ hơn cho options)
-                resized_image = resize_image(image, max_width=300, max_height=200)
-                
-                # Cập nhật option
-                option.image = resized_image
-                option.save()
-                
-                return UploadAttributeOptionImage(attribute_option=option)
+            # Validate option tồn tại
+            try:
+                option = ProductAttributeOption.objects.get(option_id=option_id)
+            except ProductAttributeOption.DoesNotExist:
+                return UploadAttributeOptionImage(
+                    errors=[ErrorType(message="Tùy chọn không tồn tại")]
+                )
+            
+            # Validate ảnh
+            validation = validate_image(image)
+            if not validation['valid']:
+                return UploadAttributeOptionImage(
+                    errors=[ErrorType(message=validation['error'])]
+                )
+            
+            # Lưu ảnh gốc; bản nhỏ cho option (RENDITION_WIDTHS của model) sinh nền
+            stored = store_original(ProductAttributeOption, image)
+            
+            # Cập nhật option
+            option.image = stored
+            option.set_image_info(validation['info'])
+            option.save()
+            
+            return UploadAttributeOptionImage(attribute_option=option)
                 
         except Exception as e:
+            # Không xóa file vừa lưu: có thể dùng chung nội dung với ảnh khác,
+            # chưa có dòng nào tham chiếu => collect_media dọn sau
             return UploadAttributeOptionImage(
                 errors=[ErrorType(message=f"Lỗi upload: {str(e)}")]
             )
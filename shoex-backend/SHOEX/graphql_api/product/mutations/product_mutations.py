@@ -1,8 +1,15 @@
 import graphene
+from collections import Counter
+from datetime import timedelta
 from graphene import InputObjectType, Mutation
+from django.db import transaction
 from django.contrib.auth import get_user_model
 from django.core.exceptions import ValidationError
+from django.utils import timezone
 from SHOEX.products.models import Product, Category, ProductVariant, ProductAttribute, ProductAttributeOption, ProductImage
+from SHOEX.products.utils import schedule_variant_summary
+from SHOEX.products.inventory import InsufficientStock, adjust_stock, reserve_stock, release_reservations
+from SHOEX.products.history import record_price_changes
 from ..types.product import ProductType, ProductVariantType, CategoryType
 
 User = get_user_model()
@@ -263,6 +270,7 @@ class ProductDelete(Mutation):
             
             # Cũng deactivate tất cả variants
             product.variants.update(is_active=False)
+            schedule_variant_summary([product.pk])
             
             return ProductDelete(
                 success=True,
@@ -589,25 +597,23 @@ class ProductVariantStockUpdate(Mutation):
             )
         
         try:
-            # Tính stock mới
-            new_stock = variant.stock + stock_change
-            
-            # Kiểm tra stock không âm
-            if new_stock < 0:
+            # Cộng / trừ nguyên tử (UPDATE có điều kiện stock >= -stock_change)
+            try:
+                adjust_stock(
+                    {variant.variant_id: stock_change}, reason=reason or '', user=user,
+                    product_ids={variant.product_id}
+                )
+            except InsufficientStock:
                 return ProductVariantStockUpdate(
                     success=False,
                     errors=["Stock cannot be negative"]
                 )
-            
-            variant.stock = new_stock
-            variant.save()
-            
-            # TODO: Log stock history với reason
+            variant.refresh_from_db(fields=['stock'])
             
             return ProductVariantStockUpdate(
                 success=True,
                 variant=variant,
-                new_stock=new_stock,
+                new_stock=variant.stock,
                 errors=[]
             )
             
@@ -618,6 +624,82 @@ class ProductVariantStockUpdate(Mutation):
             )
 
 
+class ReserveCartStock(Mutation):
+    """Giữ hàng cho toàn bộ giỏ hàng của user hiện tại (checkout / flash sale)"""
+    MAX_TTL_MINUTES = 60
+
+    class Arguments:
+        ttl_minutes = graphene.Int(description="Thời gian giữ hàng (phút), mặc định STOCK_RESERVATION_TTL")
+
+    success = graphene.Boolean()
+    reserved_count = graphene.Int()
+    expires_at = graphene.DateTime()
+    errors = graphene.List(graphene.String)
+
+    def mutate(self, info, ttl_minutes=None):
+        from SHOEX.cart.models import Cart, CartItem
+
+        user = info.context.user
+        if not user.is_authenticated:
+            return ReserveCartStock(success=False, errors=["Authentication required"])
+        if ttl_minutes is not None and not 0 < ttl_minutes <= ReserveCartStock.MAX_TTL_MINUTES:
+            return ReserveCartStock(
+                success=False,
+                errors=[f"ttl_minutes must be between 1 and {ReserveCartStock.MAX_TTL_MINUTES}"]
+            )
+
+        cart = Cart.objects.filter(user=user).first()
+        quantities, product_ids = Counter(), set()
+        if cart is not None:
+            for variant_id, product_id, quantity in CartItem.objects.filter(cart=cart).values_list(
+                'variant_id', 'variant__product_id', 'quantity'
+            ):
+                quantities[variant_id] += quantity
+                product_ids.add(product_id)
+        if not quantities:
+            return ReserveCartStock(success=False, errors=["Cart is empty"])
+
+        try:
+            with transaction.atomic():
+                # Giữ lại theo số lượng hiện tại của giỏ: trả phần đang giữ rồi giữ mới
+                release_reservations(cart=cart)
+                reservations = reserve_stock(
+                    quantities,
+                    cart=cart,
+                    ttl=timedelta(minutes=ttl_minutes) if ttl_minutes else None,
+                    product_ids=product_ids
+                )
+        except InsufficientStock as e:
+            return ReserveCartStock(success=False, errors=[str(e)])
+        except Exception as e:
+            return ReserveCartStock(success=False, errors=[f"Error reserving stock: {str(e)}"])
+
+        return ReserveCartStock(
+            success=True,
+            reserved_count=len(reservations),
+            expires_at=reservations[0].expires_at,
+            errors=[]
+        )
+
+
+class ReleaseCartStock(Mutation):
+    """Trả lại hàng đang giữ cho giỏ hàng của user hiện tại"""
+
+    success = graphene.Boolean()
+    released_count = graphene.Int()
+    errors = graphene.List(graphene.String)
+
+    def mutate(self, info):
+        from SHOEX.cart.models import Cart
+
+        user = info.context.user
+        if not user.is_authenticated:
+            return ReleaseCartStock(success=False, errors=["Authentication required"])
+        cart = Cart.objects.filter(user=user).first()
+        released = release_reservations(cart=cart) if cart is not None else 0
+        return ReleaseCartStock(success=True, released_count=released, errors=[])
+
+
 # ===== MISSING MUTATIONS =====
 
 class CategoryUpdateInput(InputObjectType):
@@ -666,6 +748,11 @@ class CategoryUpdate(Mutation):
                 success=False,
                 errors=["Category not found"]
             )
+        except ValidationError as e:
+            return CategoryUpdate(
+                success=False,
+                errors=e.messages
+            )
         except Exception as e:
             return CategoryUpdate(
                 success=False,
@@ -750,10 +837,15 @@ class PriceUpdate(Mutation):
             variant = ProductVariant.objects.get(variant_id=variant_id)
             old_price = variant.price
             
-            variant.price = new_price
-            variant.save()
-            
-            # TODO: Log price history với reason
+            with transaction.atomic():
+                ProductVariant.objects.filter(pk=variant.pk).update(price=new_price, updated_at=timezone.now())
+                record_price_changes(
+                    [(variant.pk, old_price, new_price)],
+                    reason=reason or '',
+                    user=info.context.user
+                )
+                schedule_variant_summary([variant.product_id])
+            variant.refresh_from_db(fields=['price', 'updated_at'])
             
             return PriceUpdate(
                 success=True,
@@ -875,6 +967,11 @@ class CategoryUpdate(Mutation):
                 success=False,
                 errors=["Category not found"]
             )
+        except ValidationError as e:
+            return CategoryUpdate(
+                success=False,
+                errors=e.messages
+            )
         except Exception as e:
             return CategoryUpdate(
                 success=False,
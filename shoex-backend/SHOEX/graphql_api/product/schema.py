@@ -1,5 +1,5 @@
 # ===== IMPORTS =====
-from .ultis.ultis import get_base_product_queryset
+from .ultis.ultis import get_required_annotations
 import graphene
 from django.db.models import Q, Sum, Avg, F, Case, When, BooleanField, Value, OuterRef, Subquery, FloatField, IntegerField
 from django.utils import timezone
@@ -8,8 +8,12 @@ from graphene import relay
 from promise import Promise
 from django.db.models.functions import Coalesce
 # ===== DJANGO MODELS =====
-from SHOEX.products.models import Product, ProductVariant, Category
+from SHOEX.products.models import Product, ProductVariant, Category, InventoryLedger, PriceHistory, ProductImportJob
+from SHOEX.store.models import StoreUser
+from SHOEX.products.search import search_products
 from graphene_django import DjangoConnectionField
+from ..core.optimizer import optimize_queryset
+from ..core.connection import create_connection_slice
 from .sort.sorting import ProductSortInput, apply_product_sorting
 from SHOEX.orders.models import OrderItem  # giả sử OrderItem có field created_at và variant liên kết ProductVariant
 from SHOEX.reviews.models import Review
@@ -18,6 +22,8 @@ from .types.product import (
     # Product related types
     ProductType, 
     ProductVariantType,
+    PriceHistoryType,
+    ProductImportJobType,
     ProductCountableConnection,
     ProductVariantCountableConnection,
     
@@ -49,7 +55,9 @@ from .mutations.product_mutations import (
     ProductVariantUpdate,
     ProductVariantDelete,
     StockUpdate,
-    PriceUpdate
+    PriceUpdate,
+    ReserveCartStock,
+    ReleaseCartStock
 )
 
 # Category mutations
@@ -82,7 +90,10 @@ from .bulk_mutations import (
     # Stock & Price bulk operations
     BulkStockUpdate,
     BulkPriceUpdate,
-    BulkStockTransfer
+    BulkInventoryUpload,
+    StartProductImport,
+    BulkStockTransfer,
+    GenerateProductVariants
 )
 
 # ===== DATALOADERS =====
@@ -119,16 +130,16 @@ class ProductQueries(graphene.ObjectType):
         description="Lấy thông tin một sản phẩm cụ thể"
     )
     
-    # Product collection query
-    products = graphene.List(
-        ProductType,
+    # Product collection query (keyset pagination: first/after, last/before)
+    products = graphene.ConnectionField(
+        ProductCountableConnection,
         search=graphene.Argument(graphene.String, description="Từ khóa tìm kiếm theo tên sản phẩm"),
         filter=ProductFilterInput(description="Bộ lọc sản phẩm"),
         sort_by=graphene.Argument(
             ProductSortInput,
             description="Sắp xếp theo: price_asc, price_desc, name_asc, name_desc, created_at_desc, rating_desc, sales_desc"
         ),
-        description="Danh sách tất cả sản phẩm"
+        description="Danh sách sản phẩm phân trang theo cursor"
     )
     
     # ===== PRODUCT VARIANT QUERIES =====
@@ -151,6 +162,36 @@ class ProductQueries(graphene.ObjectType):
         description="Danh sách tất cả biến thể sản phẩm với pagination"
     )
     
+    # ===== STOCK / PRICE HISTORY =====
+    # Tồn kho tại một thời điểm (từ sổ cái InventoryLedger)
+    stock_at = graphene.Int(
+        sku=graphene.Argument(graphene.String, required=True, description="SKU của biến thể"),
+        at=graphene.Argument(graphene.DateTime, required=True, description="Thời điểm cần xem"),
+        description="Tồn kho của SKU tại thời điểm at (staff / thành viên store)"
+    )
+
+    # Các lần giảm giá gần đây
+    price_drops = graphene.List(
+        PriceHistoryType,
+        since=graphene.Argument(graphene.DateTime, required=True, description="Từ thời điểm"),
+        min_percent=graphene.Argument(graphene.Float, default_value=0, description="Giảm ít nhất (%)"),
+        first=graphene.Argument(graphene.Int, default_value=50, description="Số bản ghi tối đa (<= 500)"),
+        description="Các lần giảm giá từ since, giảm nhiều nhất trước"
+    )
+
+    # ===== PRODUCT IMPORT =====
+    product_import_job = graphene.Field(
+        ProductImportJobType,
+        id=graphene.Argument(graphene.ID, required=True, description="ID lần nhập"),
+        description="Tiến độ và lỗi của một lần nhập sản phẩm (staff / thành viên store)"
+    )
+    product_import_jobs = graphene.List(
+        ProductImportJobType,
+        store_id=graphene.Argument(graphene.ID, required=True, description="ID cửa hàng"),
+        first=graphene.Argument(graphene.Int, default_value=20, description="Số lần nhập gần nhất (<= 100)"),
+        description="Các lần nhập sản phẩm gần nhất của store"
+    )
+    
     # ===== SPECIALIZED PRODUCT QUERIES =====
     # Featured products
     featured_products = graphene.ConnectionField(
@@ -240,14 +281,15 @@ class ProductQueries(graphene.ObjectType):
     
     def resolve_product(self, info, id=None, slug=None):
         """Resolve single product by ID or slug"""
+        qs = optimize_queryset(Product.objects.filter(is_active=True), info, ProductType)
         if id:
             try:
-                return Product.objects.get(product_id=id, is_active=True)
+                return qs.get(product_id=id)
             except Product.DoesNotExist:
                 return None
         elif slug:
             try:
-                return Product.objects.get(slug=slug, is_active=True)
+                return qs.get(slug=slug)
             except Product.DoesNotExist:
                 return None
         return None
@@ -256,44 +298,91 @@ class ProductQueries(graphene.ObjectType):
     
     def resolve_product_variant(self, info, id=None, sku=None):
         """Resolve single product variant by ID or SKU"""
+        qs = optimize_queryset(ProductVariant.objects.filter(is_active=True), info, ProductVariantType)
         if id:
             try:
-                return ProductVariant.objects.get(variant_id=id, is_active=True)
+                return qs.get(variant_id=id)
             except ProductVariant.DoesNotExist:
                 return None
         elif sku:
             try:
-                return ProductVariant.objects.get(sku=sku, is_active=True)
+                return qs.get(sku=sku)
             except ProductVariant.DoesNotExist:
                 return None
         return None
 
+    # ===== STOCK / PRICE HISTORY RESOLVERS =====
+
+    def resolve_stock_at(self, info, sku, at):
+        """Tồn kho của SKU tại thời điểm at"""
+        user = info.context.user
+        if not user.is_authenticated:
+            return None
+        if not user.is_staff and not StoreUser.objects.filter(
+            store__products__variants__sku=sku, user=user, status='active'
+        ).exists():
+            return None
+        return InventoryLedger.stock_at(sku, at)
+
+    def resolve_price_drops(self, info, since, min_percent=0, first=50):
+        """Các lần giảm giá của variant đang bán"""
+        return PriceHistory.price_drops(since, min_percent)\
+            .filter(variant__is_active=True, variant__product__is_active=True)\
+            .select_related('variant')[:min(max(first, 0), 500)]
+
+    # ===== PRODUCT IMPORT RESOLVERS =====
+
+    def resolve_product_import_job(self, info, id):
+        """Một lần nhập của store mà user là thành viên"""
+        user = info.context.user
+        if not user.is_authenticated:
+            return None
+        queryset = ProductImportJob.objects.filter(pk=id)
+        if not user.is_staff:
+            queryset = queryset.filter(store__store_users__user=user, store__store_users__status='active')
+        return queryset.first()
+
+    def resolve_product_import_jobs(self, info, store_id, first=20):
+        """Các lần nhập gần nhất của store"""
+        user = info.context.user
+        if not user.is_authenticated:
+            return []
+        if not user.is_staff and not StoreUser.objects.filter(store_id=store_id, user=user, status='active').exists():
+            return []
+        return ProductImportJob.objects.filter(store_id=store_id).order_by('-created_at')[:min(max(first, 0), 100)]
+
     def resolve_products(self, info, search=None, **kwargs):
         """Resolve danh sách Product với filter và sort"""
-        qs = get_base_product_queryset()
+        filter_data = kwargs.get("filter")
+        sort_by = kwargs.get('sort_by', 'created_at_desc')
 
-        # Apply search
+        # Chỉ select_related / annotate những gì client chọn + những gì filter/sort cần
+        qs = optimize_queryset(
+            Product.objects.filter(is_active=True), info, ProductType,
+            path=('edges', 'node'),
+            annotate=get_required_annotations(filter_data, sort_by)
+        )
+
+        # Apply search (full-text + trigram, xem SHOEX.products.search)
         if search:
-            qs = qs.filter(
-                Q(name__icontains=search) |
-                Q(description__icontains=search)
-            )
+            qs = search_products(qs, search)
 
         # Apply filtering (sử dụng helper)
-        filter_data = kwargs.get("filter")
         if filter_data:
             qs = apply_product_filters(qs, filter_data)
 
         # Apply sorting (sử dụng helper)
-        sort_by = kwargs.get('sort_by', 'created_at_desc')
         qs = apply_product_sorting(qs, sort_by)
 
-
-        return qs
+        # Keyset pagination theo (sort key, product_id)
+        return create_connection_slice(qs, info, kwargs, ProductCountableConnection)
     
     def resolve_product_variants(self, info, **kwargs):
         """Resolve product variants list with filtering and sorting"""
-        qs = ProductVariant.objects.filter(is_active=True).select_related('product')
+        qs = optimize_queryset(
+            ProductVariant.objects.filter(is_active=True), info, ProductVariantType,
+            path=('edges', 'node')
+        )
         
         # Apply sorting
         sort_by = kwargs.get('sort_by', 'created_at_desc')
@@ -318,46 +407,46 @@ class ProductQueries(graphene.ObjectType):
         
         # TODO: Implement proper featured logic based on ratings, sales, etc.
         # For now, return newest products
-        qs = Product.objects.filter(is_active=True).order_by('-created_at')[:first]
-        return qs
+        qs = optimize_queryset(
+            Product.objects.filter(is_active=True), info, ProductType, path=('edges', 'node')
+        )
+        return qs.order_by('-created_at')[:first]
     
     def resolve_products_by_seller(self, info, seller_id, **kwargs):
         """Resolve products by specific seller"""
         qs = Product.objects.filter(
             store_id=seller_id,
             is_active=True
-        ).select_related('category', 'store')
+        )
         
-        return qs
+        return optimize_queryset(qs, info, ProductType, path=('edges', 'node'))
     
     def resolve_products_by_category(self, info, category_id, **kwargs):
         """Resolve products by specific category"""
         qs = Product.objects.filter(
             category_id=category_id,
             is_active=True
-        ).select_related('category', 'store')
+        )
         
-        return qs
+        return optimize_queryset(qs, info, ProductType, path=('edges', 'node'))
     
     # ===== SEARCH RESOLVERS =====
     
     def resolve_search_products(self, info, query, **kwargs):
         """Full-text search products with relevance ranking"""
-        qs = Product.objects.filter(
-            Q(name__icontains=query) | 
-            Q(description__icontains=query),
-            is_active=True
-        ).select_related('category', 'store')
-        
-        # Boost exact matches for better relevance
-        qs = qs.extra(
-            select={
-                'name_match': "CASE WHEN name ILIKE %s THEN 1 ELSE 0 END",
-            },
-            select_params=[f'%{query}%'],
-            order_by=['-name_match', '-created_at']
+        filter_data = kwargs.get("filter")
+        # Như resolve_products: filter isNew cần annotation is_new
+        qs = optimize_queryset(
+            Product.objects.filter(is_active=True), info, ProductType, path=('edges', 'node'),
+            annotate=get_required_annotations(filter_data)
         )
-        
+
+        # tsvector + pg_trgm, bỏ dấu tiếng Việt, xếp theo ts_rank
+        qs = search_products(qs, query, rank=True)
+
+        if filter_data:
+            qs = apply_product_filters(qs, filter_data)
+
         return qs
 
 
@@ -386,6 +475,8 @@ class ProductMutations(graphene.ObjectType):
     # Inventory and pricing operations
     stock_update = StockUpdate.Field()
     price_update = PriceUpdate.Field()
+    reserve_cart_stock = ReserveCartStock.Field()
+    release_cart_stock = ReleaseCartStock.Field()
     
     # ===== IMAGE MUTATIONS =====
     # Image upload and management operations
@@ -408,7 +499,10 @@ class ProductMutations(graphene.ObjectType):
     # Bulk stock & price operations
     bulk_stock_update = BulkStockUpdate.Field()
     bulk_price_update = BulkPriceUpdate.Field()
+    bulk_inventory_upload = BulkInventoryUpload.Field()
+    start_product_import = StartProductImport.Field()
     bulk_stock_transfer = BulkStockTransfer.Field()
+    generate_product_variants = GenerateProductVariants.Field()
     bulk_product_variant_create = BulkProductVariantCreate.Field()
     bulk_stock_update = BulkStockUpdate.Field()
     bulk_price_update = BulkPriceUpdate.Field()
@@ -1,4 +1,6 @@
 import graphene
+from django.db.models import F
+
 class ProductSortInput(graphene.Enum):
     PRICE_ASC = "price_asc"
     PRICE_DESC = "price_desc"
@@ -12,16 +14,20 @@ class ProductSortInput(graphene.Enum):
 
 def apply_product_sorting(qs, sort_key):
     SORT_MAP = {
-        "price_asc": "base_price",
-        "price_desc": "-base_price",
+        # Giá thực tế của variants (cột tổng hợp trên Product)
+        "price_asc": "min_price",
+        "price_desc": "-max_price",
         "name_asc": "name",
         "name_desc": "-name",
         "created_at_desc": "-created_at",
-        "rating_desc": "-avg_rating_last_30",
-        "sales_desc": "-sold_count",
-        "best_selling": "-sold_count_last_30",
+        # Annotation bán hàng (annotate_sales_stats): giá trị NULL (nếu có) luôn xếp cuối
+        "rating_desc": F("avg_rating_last_30").desc(nulls_last=True),
+        "sales_desc": F("sold_count").desc(nulls_last=True),
+        "best_selling": F("sold_count_last_30").desc(nulls_last=True),
         "newest": "-created_at",
     }
 
+    # graphene 3 truyền enum member thay vì value
+    sort_key = getattr(sort_key, "value", sort_key)
     sort_field = SORT_MAP.get(sort_key, "-created_at")
     return qs.order_by(sort_field)
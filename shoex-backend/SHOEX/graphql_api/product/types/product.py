@@ -5,14 +5,51 @@ from graphene_django import DjangoObjectType
 from SHOEX.products.models import (
     Product, Category, ProductVariant, 
     ProductAttribute, ProductAttributeOption,
-    ProductImage
+    ProductImage, PriceHistory, ProductImportJob
 )
 from SHOEX.brand.models import Brand
     
-from .utils import get_max_discount
+from SHOEX.discount.engine import apply_discount
+from ..ultis.ultis import annotate_sales_stats, annotate_is_new
+from ...core.dataloaders import load
+from ...core.optimizer import QueryHint
+from ..dataloaders.product_loaders import (
+    CategoryByIdLoader,
+    CategoryPathByCategoryIdLoader,
+    AvailableCombinationsByOptionIdLoader,
+    VariantCountByOptionIdLoader,
+    MaxDiscountByProductIdLoader,
+    ProductByIdLoader,
+    ProductCountByCategoryIdLoader,
+    ProductVariantsByProductIdLoader,
+    ProductAttributeOptionsByProductIdLoader,
+    ProductImagesByProductIdLoader,
+    SubcategoriesByCategoryIdLoader,
+)
 from django.db.models import Q, Max
 from django.utils import timezone
-from decimal import Decimal
+
+
+def _load_related(instance, field_name, info, loader_class):
+    """Lấy FK: dùng cache nếu đã select_related, ngược lại batch qua DataLoader"""
+    descriptor = getattr(type(instance), field_name)
+    if descriptor.is_cached(instance):
+        return getattr(instance, field_name)
+    key = getattr(instance, f"{field_name}_id")
+    if key is None:
+        return None
+    return load(info, loader_class, key)
+
+
+def _available_options(product, info, attribute_name=None):
+    """Các tùy chọn thuộc tính còn hàng của product (lọc trong Python từ DataLoader)"""
+    options = load(info, ProductAttributeOptionsByProductIdLoader, product.product_id)
+    return [
+        option for option in options
+        if option.is_available and (attribute_name is None or option.attribute.name == attribute_name)
+    ]
+
+
 class BrandType(DjangoObjectType):
     class Meta:
         model = Brand
@@ -35,7 +72,11 @@ class CategoryType(DjangoObjectType):
     
     def resolve_product_count(self, info):
         """Đếm số lượng sản phẩm active trong danh mục"""
-        return self.products.filter(is_active=True).count()
+        return load(info, ProductCountByCategoryIdLoader, self.category_id)
+
+    def resolve_parent(self, info):
+        """Danh mục cha (batch qua DataLoader)"""
+        return _load_related(self, 'parent', info, CategoryByIdLoader)
     
     def resolve_thumbnail_image(self, info):
         """Lấy ảnh đại diện của danh mục"""
@@ -65,18 +106,59 @@ class CategoryType(DjangoObjectType):
         return None
     
     def resolve_full_path(self, info):
-        path = [self]  # bắt đầu từ chính category hiện tại
-        parent = self.parent
-        while parent:
-            path.insert(0, parent)  # chèn parent lên đầu danh sách
-            parent = parent.parent
-        return path
+        """Đường dẫn từ danh mục gốc tới danh mục hiện tại (bảng closure, batch qua DataLoader)"""
+        return load(info, CategoryPathByCategoryIdLoader, self.category_id)
+
     def resolve_subcategories(self, info):
         """Resolve subcategories - danh mục con"""
-        return self.subcategories.filter(is_active=True).order_by('name')
+        return load(info, SubcategoriesByCategoryIdLoader, self.category_id)
+
+
+class ImageRenditionType(graphene.ObjectType):
+    """Một bản thu nhỏ của ảnh (sinh nền sau upload)"""
+    label = graphene.String(description="thumb, 400, 800, 1600...")
+    width = graphene.Int()
+    height = graphene.Int()
+    format = graphene.String(description="jpeg hoặc webp")
+    url = graphene.String()
+
+
+class RenditionFields:
+    """Field bản thu nhỏ dùng chung cho ProductImageType / ProductAttributeOptionType"""
+    renditions_status = graphene.String(description="pending, processing, ready, failed")
+    renditions = graphene.List(
+        ImageRenditionType,
+        format=graphene.String(default_value='webp', description="jpeg hoặc webp"),
+        description="Các bản thu nhỏ đã sinh (rỗng khi đang xử lý)"
+    )
+    srcset = graphene.String(
+        format=graphene.String(default_value='webp', description="jpeg hoặc webp"),
+        description='Chuỗi srcset "url 400w, url 800w" (rỗng khi đang xử lý)'
+    )
+    thumbnail_url = graphene.String(description="URL bản thumb (ảnh gốc khi chưa render)")
+
+    def resolve_renditions(self, info, format='webp'):
+        return [
+            ImageRenditionType(
+                label=label,
+                width=rendition['width'],
+                height=rendition['height'],
+                format=format,
+                url=self.rendition_url(label, format)
+            )
+            for label, rendition in (self.renditions or {}).items() if rendition.get(format)
+        ]
+
+    def resolve_srcset(self, info, format='webp'):
+        return self.srcset(format)
+
+    def resolve_thumbnail_url(self, info):
+        if not self.image:
+            return None
+        return self.rendition_url('thumb') or self.image.url
 
 
-class ProductImageType(DjangoObjectType):
+class ProductImageType(RenditionFields, DjangoObjectType):
     """Ảnh chung của sản phẩm (đại diện + gallery)"""
     class Meta:
         model = ProductImage
@@ -84,12 +166,12 @@ class ProductImageType(DjangoObjectType):
         interfaces = (relay.Node,)
     
     # Thêm field tùy chỉnh để trả về URL ảnh
-    image_url = graphene.String(description="URL của ảnh")
+    image_url = graphene.String(description="URL ảnh hiển thị (bản 800px khi đã render, ảnh gốc khi đang xử lý)")
     
     def resolve_image_url(self, info):
         """Trả về URL của ảnh"""
         if self.image and hasattr(self.image, 'url'):
-            return self.image.url
+            return self.rendition_url() or self.image.url
         return None
 
 
@@ -108,7 +190,7 @@ class ProductAttributeType(DjangoObjectType):
         return self.product_options.filter(is_available=True).count()
 
 
-class ProductAttributeOptionType(DjangoObjectType):
+class ProductAttributeOptionType(RenditionFields, DjangoObjectType):
     """Tùy chọn thuộc tính sản phẩm với hình ảnh"""
     class Meta:
         model = ProductAttributeOption
@@ -116,12 +198,12 @@ class ProductAttributeOptionType(DjangoObjectType):
         interfaces = (relay.Node,)
     
     # Thêm field tùy chỉnh để trả về URL ảnh
-    image_url = graphene.String(description="URL của ảnh tùy chọn")
+    image_url = graphene.String(description="URL ảnh tùy chọn (bản 300px khi đã render, ảnh gốc khi đang xử lý)")
     
     def resolve_image_url(self, info):
         """Trả về URL của ảnh tùy chọn"""
         if self.image and hasattr(self.image, 'url'):
-            return self.image.url
+            return self.rendition_url() or self.image.url
         return None
     
     # Thêm thông tin động
@@ -129,12 +211,12 @@ class ProductAttributeOptionType(DjangoObjectType):
     available_combinations = graphene.JSONString(description="Các kết hợp có sẵn")
     
     def resolve_variant_count(self, info):
-        """Đếm số variants có tùy chọn này"""
-        return self.get_variants().count()
+        """Đếm số variants có tùy chọn này (batch qua DataLoader)"""
+        return load(info, VariantCountByOptionIdLoader, self.option_id)
     
     def resolve_available_combinations(self, info):
-        """Lấy các kết hợp khác có sẵn khi chọn tùy chọn này"""
-        return self.get_available_combinations()
+        """Lấy các kết hợp khác có sẵn khi chọn tùy chọn này (batch qua DataLoader)"""
+        return load(info, AvailableCombinationsByOptionIdLoader, self.option_id)
 
 
 class ProductVariantType(DjangoObjectType):
@@ -157,20 +239,33 @@ class ProductVariantType(DjangoObjectType):
     
     # ===== TRẠNG THÁI =====
     stock_status = graphene.String(description="Trạng thái kho")
-    
+
+    # ===== QUERY HINTS (optimize_queryset) =====
+    query_hints = {
+        'is_in_stock': QueryHint(only=['stock', 'is_active']),
+        'discount_percentage': QueryHint(only=['product']),
+        'original_price': QueryHint(),
+        'final_price': QueryHint(only=['product', 'price']),
+        'color_name': QueryHint(only=['option_combinations']),
+        'size_name': QueryHint(only=['option_combinations']),
+        'color_image_url': QueryHint(only=['product', 'option_combinations']),
+        'stock_status': QueryHint(only=['stock']),
+    }
+    
+    def resolve_product(self, info):
+        """Sản phẩm cha (batch qua DataLoader)"""
+        return _load_related(self, 'product', info, ProductByIdLoader)
+
     def resolve_is_in_stock(self, info):
         """Kiểm tra còn hàng"""
         return self.is_in_stock
     def resolve_discount_percentage(self, info):
-        # Lấy object product
-        product = self.product
-        # Gọi resolver discount của ProductType
-        discount = get_max_discount(product)
-        return discount
+        """% giảm tối đa của sản phẩm cha (DiscountEngine, batch qua DataLoader)"""
+        return float(load(info, MaxDiscountByProductIdLoader, self.product_id))
 
     def resolve_final_price(self, info):
-        discount = Decimal(get_max_discount(self.product))  # convert float -> Decimal
-        return self.price * (Decimal('1.0') - discount / Decimal('100.0'))
+        discount = load(info, MaxDiscountByProductIdLoader, self.product_id)
+        return apply_discount(self.price, discount)
     
     def resolve_color_name(self, info):
         """Lấy tên màu từ option_combinations"""
@@ -182,7 +277,14 @@ class ProductVariantType(DjangoObjectType):
     
     def resolve_color_image_url(self, info):
         """Lấy ảnh màu tương ứng"""
-        color_image = self.color_image
+        color = self.color_name
+        if color == 'N/A':
+            return None
+        options = load(info, ProductAttributeOptionsByProductIdLoader, self.product_id)
+        color_image = next(
+            (o for o in options if o.attribute.type == 'color' and o.value == color),
+            None
+        )
         if color_image and color_image.image and hasattr(color_image.image, 'url'):
             return color_image.image.url
         return None
@@ -235,14 +337,49 @@ class ProductType(DjangoObjectType):
     # ===== ĐÁNH GIÁ =====
     rating_average = graphene.Float(description="Điểm đánh giá trung bình")
     review_count = graphene.Int(description="Số lượng đánh giá")
+    rating_histogram = graphene.List(graphene.Int, description="Số đánh giá 1, 2, 3, 4, 5 sao")
     
     # ===== TRẠNG THÁI =====
     availability_status = graphene.String(description="Trạng thái hàng")
+    availability_matrix = graphene.JSONString(
+        description="Ma trận còn hàng Màu x Size: axes, available (bitmask theo hàng), variants"
+    )
     
     # ===== THÔNG TIN BỔ SUNG =====
     tags = graphene.List(graphene.String, description="Tags sản phẩm")
+    breadcrumb = graphene.List(CategoryType, description="Đường dẫn danh mục từ gốc tới danh mục của sản phẩm")
     shipping_info = graphene.String(description="Thông tin vận chuyển")
     warranty_info = graphene.String(description="Thông tin bảo hành")
+
+    # ===== QUERY HINTS (optimize_queryset) =====
+    # Field dùng DataLoader chỉ cần product_id => QueryHint() rỗng
+    query_hints = {
+        'price_range': QueryHint(only=['min_price', 'max_price']),
+        'min_price': QueryHint(only=['min_price']),
+        'max_price': QueryHint(only=['max_price']),
+        'discount_percentage': QueryHint(),
+        'final_price': QueryHint(only=['base_price']),
+        'has_discount': QueryHint(),
+        'is_new': QueryHint(annotate=[annotate_is_new]),
+        'is_hot': QueryHint(annotate=[annotate_sales_stats]),
+        'gallery_images': QueryHint(),
+        'thumbnail_image': QueryHint(),
+        'color_images': QueryHint(),
+        'attribute_options': QueryHint(),
+        'available_attributes': QueryHint(),
+        'color_options': QueryHint(),
+        'size_options': QueryHint(),
+        'total_sold': QueryHint(annotate=[annotate_sales_stats]),
+        'total_stock': QueryHint(only=['total_stock']),
+        'variant_count': QueryHint(only=['variant_count']),
+        'available_colors_count': QueryHint(),
+        'rating_average': QueryHint(only=['rating']),
+        'availability_status': QueryHint(only=['total_stock', 'variant_count']),
+        'tags': QueryHint(select_related=['category', 'brand']),
+        'breadcrumb': QueryHint(only=['category']),
+        'shipping_info': QueryHint(),
+        'warranty_info': QueryHint(),
+    }
     
     # ===== RESOLVERS =====
     def resolve_is_new(self, info):
@@ -250,119 +387,118 @@ class ProductType(DjangoObjectType):
     def resolve_is_hot(self, info):
         return self.is_hot
     
+    def resolve_category(self, info):
+        """Danh mục (batch qua DataLoader nếu chưa select_related)"""
+        return _load_related(self, 'category', info, CategoryByIdLoader)
+
+    def resolve_variants(self, info, **kwargs):
+        """Mọi biến thể, kể cả đã ẩn (batch qua DataLoader)"""
+        return load(info, ProductVariantsByProductIdLoader, self.product_id)
+
     def resolve_price_range(self, info):
-        """Khoảng giá từ variants"""
+        """Khoảng giá từ variants (cột tổng hợp min_price / max_price)"""
         min_p, max_p = self.min_price, self.max_price
         if min_p == max_p:
             return f"{min_p:,.0f}đ"
         return f"{min_p:,.0f}đ - {max_p:,.0f}đ"
     
     def resolve_min_price(self, info):
-        """Giá thấp nhất (sử dụng property từ model)"""
+        """Giá thấp nhất của variants"""
         return self.min_price
     
     def resolve_max_price(self, info):
-        """Giá cao nhất (sử dụng property từ model)"""
+        """Giá cao nhất của variants"""
         return self.max_price
 
 
     def resolve_discount_percentage(self, info):
-        return get_max_discount(self)
+        """% giảm tối đa theo voucher (DiscountEngine, batch qua DataLoader)"""
+        return float(load(info, MaxDiscountByProductIdLoader, self.product_id))
 
     def resolve_final_price(self, info):
-        discount = Decimal(get_max_discount(self))  # convert float -> Decimal
-        return self.base_price * (Decimal('1.0') - discount / Decimal('100.0'))
+        discount = load(info, MaxDiscountByProductIdLoader, self.product_id)
+        return apply_discount(self.base_price, discount)
 
     def resolve_has_discount(self, info):
         """Có giảm giá không"""
-        # Always use the resolver for discount_percentage, not a model attribute
-        discount = None
-        # Try to use the resolver if present
-        if hasattr(self, 'resolve_discount_percentage'):
-            discount = self.resolve_discount_percentage(info)
-        elif hasattr(self, 'discount_percentage'):
-            discount = self.discount_percentage
-        else:
-            discount = 0.0
-        return discount > 0
+        return load(info, MaxDiscountByProductIdLoader, self.product_id) > 0
     
     # ===== HÌNH ẢNH THEO MODEL MỚI =====
     def resolve_gallery_images(self, info):
         """Tất cả ảnh gallery"""
-        return self.gallery_images.all()
+        return load(info, ProductImagesByProductIdLoader, self.product_id)
     
     def resolve_thumbnail_image(self, info):
         """Ảnh đại diện"""
-        return self.gallery_images.filter(is_thumbnail=True).first()
+        images = load(info, ProductImagesByProductIdLoader, self.product_id)
+        return next((image for image in images if image.is_thumbnail), None)
     
     def resolve_color_images(self, info):
         """Ảnh theo màu sắc"""
-        return self.attribute_options.filter(
-            attribute__has_image=True,
-            is_available=True
-        )
+        return [
+            option for option in _available_options(self, info)
+            if option.attribute.has_image
+        ]
     
     # ===== THUỘC TÍNH & TÙY CHỌN =====
     def resolve_attribute_options(self, info):
         """Tất cả tùy chọn thuộc tính"""
-        return self.attribute_options.filter(is_available=True)
+        return _available_options(self, info)
     
     def resolve_available_attributes(self, info):
         """Các thuộc tính có sẵn"""
-        attribute_ids = self.attribute_options.filter(
-            is_available=True
-        ).values_list('attribute_id', flat=True).distinct()
-        return ProductAttribute.objects.filter(attribute_id__in=attribute_ids)
+        attributes = {
+            option.attribute.attribute_id: option.attribute
+            for option in _available_options(self, info)
+        }
+        return sorted(attributes.values(), key=lambda attr: (attr.display_order, attr.name))
     
     def resolve_color_options(self, info):
         """Tùy chọn màu sắc"""
-        return self.attribute_options.filter(
-            attribute__name='Color',
-            is_available=True
-        )
+        return _available_options(self, info, attribute_name='Color')
     
     def resolve_size_options(self, info):
         """Tùy chọn kích thước"""
-        return self.attribute_options.filter(
-            attribute__name='Size',
-            is_available=True
-        )
+        return _available_options(self, info, attribute_name='Size')
     
     # ===== THỐNG KÊ =====
     def resolve_total_sold(self, info):
         return self.sold_count
     
     def resolve_total_stock(self, info):
-        """Tổng tồn kho (sử dụng property từ model)"""
+        """Tổng tồn kho của variants active"""
         return self.total_stock
     
     def resolve_variant_count(self, info):
         """Số lượng biến thể"""
-        return self.variants.filter(is_active=True).count()
+        return self.variant_count
     
     def resolve_available_colors_count(self, info):
         """Số màu có sẵn"""
-        return self.attribute_options.filter(
-            attribute__name='Color',
-            is_available=True
-        ).count()
+        return len(_available_options(self, info, attribute_name='Color'))
     
     # ===== ĐÁNH GIÁ =====
     def resolve_rating_average(self, info):
-        """Điểm đánh giá trung bình - TODO: tích hợp review system"""
-        return self.rating  # Mock data
+        """Điểm đánh giá trung bình (cộng dồn khi ghi Review, xem Product.apply_review)"""
+        return self.rating
     
     def resolve_review_count(self, info):
-        """Số lượng đánh giá - TODO: tích hợp review system"""
-        return self.review_count  # Mock data
+        """Số lượng đánh giá"""
+        return self.review_count
+    
+    def resolve_rating_histogram(self, info):
+        return self.rating_histogram
     
     # ===== TRẠNG THÁI =====
+    def resolve_availability_matrix(self, info):
+        """Ma trận tính sẵn trên Product (cập nhật khi ghi variant / tùy chọn)"""
+        return self.availability_matrix
+
     def resolve_availability_status(self, info):
         """Trạng thái hàng"""
-        total_stock = self.total_stock
-        if total_stock > 0:
+        if self.total_stock > 0:
             return "in_stock"
-        elif self.variants.filter(is_active=True).exists():
+        elif self.variant_count:
             return "out_of_stock"
         else:
             return "unavailable"
@@ -370,14 +506,19 @@ class ProductType(DjangoObjectType):
     # ===== THÔNG TIN BỔ SUNG =====
     def resolve_tags(self, info):
         """Tags sản phẩm"""
-        tags = [self.category.name, self.brand.name] if self.brand else [self.category.name]
+        category = _load_related(self, 'category', info, CategoryByIdLoader)
+        tags = [category.name, self.brand.name] if self.brand else [category.name]
         # Thêm tags từ attributes
-        attributes = self.resolve_available_attributes(info)
+        attributes = ProductType.resolve_available_attributes(self, info)
         for attr in attributes:
             tags.append(attr.name)
         
         return list(set(tags))  # Loại bỏ trùng lặp
     
+    def resolve_breadcrumb(self, info):
+        """Breadcrumb danh mục (bảng closure, batch qua DataLoader)"""
+        return load(info, CategoryPathByCategoryIdLoader, self.category_id)
+
     def resolve_shipping_info(self, info):
         """Thông tin vận chuyển"""
         return "Miễn phí vận chuyển cho đơn hàng trên 200.000đ"
@@ -521,6 +662,40 @@ class CreateProduct(graphene.Mutation):
             )
 
 
+# ===== PRICE HISTORY =====
+
+class PriceHistoryType(DjangoObjectType):
+    """Một lần đổi giá của variant"""
+    class Meta:
+        model = PriceHistory
+        fields = ('history_id', 'variant', 'old_price', 'new_price', 'source', 'reason', 'created_at')
+
+    drop_percent = graphene.Float(description="% giảm giá (âm = tăng giá)")
+
+    def resolve_drop_percent(self, info):
+        drop = getattr(self, 'drop_percent', None)
+        if drop is None:
+            change = self.change_percent
+            return None if change is None else float(-change)
+        return float(drop)
+
+
+class ProductImportJobType(DjangoObjectType):
+    """Tiến độ một lần nhập sản phẩm từ file"""
+    class Meta:
+        model = ProductImportJob
+        fields = (
+            'job_id', 'store', 'format', 'status', 'total_rows', 'processed_rows',
+            'created_products', 'updated_products', 'created_variants', 'updated_variants',
+            'error_count', 'started_at', 'finished_at', 'created_at', 'updated_at'
+        )
+
+    errors = graphene.List(graphene.String, description="Lỗi từng dòng (tối đa 1000 lỗi đầu tiên)")
+
+    def resolve_errors(self, info):
+        return self.errors or []
+
+
 # ===== CONNECTION TYPES =====
 
 class ProductConnection(relay.Connection):
@@ -1,47 +1,69 @@
 from datetime import timedelta
 from django.utils import timezone
-from django.db.models import Sum, Avg, Q, Case, When, Value, BooleanField
+from django.db.models import F, Case, When, Value, BooleanField
 from django.db.models.functions import Coalesce
-from SHOEX.products.models import Product
+from SHOEX.products.models import Product, ProductSalesStats
 
-def get_base_product_queryset():
+# Sort cần annotation bán hàng (filter đọc thẳng cột sales_stats)
+SALES_SORT_KEYS = ("rating_desc", "sales_desc", "best_selling")
+
+
+def annotate_sales_stats(qs):
     """
-    Trả về QuerySet Product cơ bản với:
+    Thêm annotation bán hàng, đọc từ bảng rollup ProductSalesStats (không SUM/AVG):
     - tổng số đã bán (sold_count)
     - tổng số bán 30 ngày gần đây (sold_count_last_30)
     - trung bình rating 30 ngày gần đây (avg_rating_last_30)
-    - cờ is_hot và is_new
+    - cờ is_hot
+    Product thiếu dòng thống kê (bulk_create bỏ qua signal) => 0 thay vì NULL
     """
+    return qs.annotate(
+        sold_count=Coalesce(F('sales_stats__sold_count'), 0),
+        sold_count_last_30=Coalesce(F('sales_stats__sold_count_last_30'), 0),
+        avg_rating_last_30=Coalesce(F('sales_stats__avg_rating_last_30'), 0.0),
+        is_hot=Case(
+            When(
+                sales_stats__sold_count_last_30__gte=ProductSalesStats.HOT_SOLD_THRESHOLD,
+                then=Value(True)
+            ),
+            default=Value(False),
+            output_field=BooleanField()
+        )
+    )
+
+
+def annotate_is_new(qs):
+    """Thêm cờ is_new (tạo trong 30 ngày gần đây)"""
     thirty_days_ago = timezone.now() - timedelta(days=30)
 
-    qs = Product.objects.filter(is_active=True)\
-        .select_related("category", "store", "brand")\
-        .prefetch_related("variants", "attribute_options")\
-        .annotate(
-            sold_count=Coalesce(Sum('variants__order_items__quantity'), 0),
-            sold_count_last_30=Coalesce(
-                Sum(
-                    'variants__order_items__quantity',
-                    filter=Q(variants__order_items__order__created_at__gte=thirty_days_ago)
-                ), 0
-            ),
-            avg_rating_last_30=Coalesce(
-                Avg(
-                    'variants__order_items__reviews__rating',
-                    filter=Q(variants__order_items__order__created_at__gte=thirty_days_ago)
-                ), 0.0
-            )
-        )\
-        .annotate(
-            is_hot=Case(
-                When(sold_count_last_30__gte=50, then=Value(True)),
-                default=Value(False),
-                output_field=BooleanField()
-            ),
-            is_new=Case(
-                When(created_at__gte=thirty_days_ago, then=Value(True)),
-                default=Value(False),
-                output_field=BooleanField()
-            )
+    return qs.annotate(
+        is_new=Case(
+            When(created_at__gte=thirty_days_ago, then=Value(True)),
+            default=Value(False),
+            output_field=BooleanField()
         )
-    return qs
+    )
+
+
+def get_required_annotations(filters=None, sort_key=None):
+    """Các annotation bắt buộc để filter / sort chạy được (không phụ thuộc field được chọn)"""
+    annotations = []
+    sort_key = getattr(sort_key, "value", sort_key)
+    if sort_key in SALES_SORT_KEYS:
+        annotations.append(annotate_sales_stats)
+    if getattr(filters, "is_new", None):
+        annotations.append(annotate_is_new)
+    return annotations
+
+
+def get_base_product_queryset():
+    """
+    Trả về QuerySet Product cơ bản với đầy đủ annotation:
+    sold_count, sold_count_last_30, avg_rating_last_30, is_hot, is_new
+
+    Resolver GraphQL nên dùng graphql_api.core.optimizer.optimize_queryset để chỉ
+    thêm những gì client yêu cầu
+    """
+    qs = Product.objects.filter(is_active=True)\
+        .select_related("category", "store", "brand")
+    return annotate_is_new(annotate_sales_stats(qs))
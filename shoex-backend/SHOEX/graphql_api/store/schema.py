@@ -10,6 +10,7 @@ from graphene_file_upload.scalars import Upload
 from graphene_django import DjangoObjectType
 
 from SHOEX.store.models import Store, StoreUser, AddressStore
+from ..core.optimizer import QueryHint, optimize_queryset
 from django.contrib.auth import get_user_model
 
 User = get_user_model()
@@ -24,6 +25,14 @@ class StoreType(DjangoObjectType):
         model = Store
         fields = "__all__"
 
+    # Query hints cho optimize_queryset
+    query_hints = {
+        'store_users': QueryHint(prefetch_related=['store_users__user']),
+        'addresses': QueryHint(prefetch_related=['addresses']),
+        'images': QueryHint(prefetch_related=['images']),
+        'products': QueryHint(prefetch_related=['products']),
+    }
+
 
 class StoreUserType(DjangoObjectType):
     class Meta:
@@ -106,12 +115,12 @@ class StoreQuery(graphene.ObjectType):
 
     def resolve_store(self, info, store_id):
         try:
-            return Store.objects.get(store_id=store_id)
+            return optimize_queryset(Store.objects.all(), info, StoreType).get(store_id=store_id)
         except Store.DoesNotExist:
             return None
 
     def resolve_stores(self, info, search=None):
-        qs = Store.objects.all()
+        qs = optimize_queryset(Store.objects.all(), info, StoreType)
         if search:
             q = Q(name__icontains=search) | Q(email__icontains=search) | Q(phone__icontains=search) | Q(location__icontains=search)
             qs = qs.filter(q)
@@ -10,6 +10,7 @@ User = get_user_model()
 
 class UserLoader(DataLoader):
     """DataLoader cho User"""
+    batch_keys = [(User, 'id')]
     
     def batch_load_fn(self, user_ids):
         """Load users theo batch"""
@@ -40,6 +41,7 @@ class UserByEmailLoader(DataLoader):
 
 class GroupLoader(DataLoader):
     """DataLoader cho Group"""
+    batch_keys = [(Group, 'id')]
     
     def batch_load_fn(self, group_ids):
         """Load groups theo batch"""
@@ -49,23 +51,20 @@ class GroupLoader(DataLoader):
 
 
 class UserGroupsLoader(DataLoader):
-    """DataLoader cho groups của user"""
+    """DataLoader cho groups của user (trả về Group instances)"""
+    batch_keys = [(User, 'id')]
     
     def batch_load_fn(self, user_ids):
         """Load groups cho nhiều users"""
-        # Query tất cả relationships
-        user_groups = User.objects.filter(
-            id__in=user_ids
-        ).prefetch_related('groups').values_list('id', 'groups__id', 'groups__name')
+        # Query bảng trung gian user_groups 1 lần, join sẵn group
+        memberships = User.groups.through.objects.filter(
+            user_id__in=user_ids
+        ).select_related('group').order_by('group__name')
         
         # Tạo map từ user_id -> list groups
         groups_map = defaultdict(list)
-        for user_id, group_id, group_name in user_groups:
-            if group_id:  # Chỉ add nếu có group
-                groups_map[user_id].append({
-                    'id': group_id,
-                    'name': group_name
-                })
+        for membership in memberships:
+            groups_map[membership.user_id].append(membership.group)
         
         # Return danh sách groups cho từng user_id theo đúng thứ tự
         return Promise.resolve([groups_map.get(user_id, []) for user_id in user_ids])
@@ -121,6 +120,7 @@ class UserProductCountLoader(DataLoader):
 
 class UserPermissionsLoader(DataLoader):
     """DataLoader cho permissions của user"""
+    batch_keys = [(User, 'id')]
     
     def batch_load_fn(self, user_ids):
         """Load permissions cho nhiều users"""
@@ -4,6 +4,9 @@ from graphene_django import DjangoObjectType
 from django.contrib.auth import get_user_model
 from django.contrib.auth.models import Group
 
+from ...core.dataloaders import load
+from ..dataloaders.user_loaders import UserGroupsLoader
+
 User = get_user_model()
 
 
@@ -41,7 +44,7 @@ class UserType(DjangoObjectType):
     # age = graphene.Int(description="Tuổi tính từ ngày sinh")
     
     # Relationship fields
-    # user_groups = graphene.List(GroupType, description="Danh sách nhóm của user")
+    user_groups = graphene.List(GroupType, description="Danh sách nhóm của user")
     def resolve_is_authenticated(self, info):
         # CHỈ khi query "me" thì mới đúng nghĩa
         return self.is_authenticated  
@@ -117,8 +120,8 @@ class UserType(DjangoObjectType):
         return f"https://ui-avatars.com/api/?name={display_name}&background=random"
     
     def resolve_user_groups(self, info):
-        """Lấy danh sách groups của user"""
-        return self.groups.all()
+        """Lấy danh sách groups của user (batch qua DataLoader)"""
+        return load(info, UserGroupsLoader, self.id)
     
     def resolve_age(self, info):
         """Tính tuổi từ ngày sinh"""
@@ -220,7 +220,15 @@ class OrderItem(models.Model):
     class Meta:
         verbose_name = "Mục đơn hàng"
         verbose_name_plural = "Mục đơn hàng"
-        
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # variant / số lượng lúc load => signal thống kê bán hàng tính chênh lệch không cần SELECT lại
+        if 'variant_id' in instance.__dict__ and 'quantity' in instance.__dict__:
+            instance._loaded_stats = (instance.variant_id, instance.quantity)
+        return instance
+
     def __str__(self):
         return f"{self.variant.product.name} x{self.quantity}"
     
@@ -5,11 +5,14 @@ from django.urls import reverse
 from django.utils.safestring import mark_safe
 from django.contrib import messages
 import json
-from itertools import product as cartesian_product
 
+from .imports import STALE_AFTER, detect_format, run_import
+from .inventory import release_expired_reservations, release_queryset
+from .variants import generate_variants
 from .models import (
-    Category, Product, ProductAttribute, ProductAttributeOption,
-    ProductVariant, ProductImage
+    Category, CategoryClosure, Product, ProductAttribute, ProductAttributeOption,
+    ProductVariant, ProductImage, ProductSalesStats, StockReservation,
+    InventoryLedger, PriceHistory, ProductImportJob
 )
 
 
@@ -61,57 +64,21 @@ class ProductVariantInline(admin.TabularInline):
 # ===================== ACTIONS =====================
 
 def generate_all_variants(modeladmin, request, queryset):
-    total_created = 0
-    for product in queryset.prefetch_related('attribute_options__attribute'):
-        options = product.attribute_options.select_related('attribute').filter(is_available=True)
-        if not options.exists():
-            messages.warning(request, f"[ {product.name} ] Chưa có tùy chọn thuộc tính nào để tạo variant!")
-            continue
-
-        # Group by attribute
-        groups = {}
-        for opt in options:
-            attr_name = opt.attribute.name
-            groups.setdefault(attr_name, []).append(opt)
-
-        if not groups:
-            continue
-
-        keys = list(groups.keys())
-        value_lists = [groups[k] for k in keys]
-        created_for_this = 0
-
-        for combo in cartesian_product(*value_lists):
-            combination_dict = {opt.attribute.name: opt.value for opt in combo}
-            combination_json = json.dumps(combination_dict, ensure_ascii=False)
-
-            # Tạo SKU
-            suffix = "".join([str(opt.value_code or opt.value)[:4] for opt in combo]).upper()
-            base_sku = f"{product.model_code or product.product_id}-{suffix}"
-            sku = base_sku
-            i = 1
-            while ProductVariant.objects.filter(sku=sku).exists():
-                sku = f"{base_sku}-{i}"
-                i += 1
-
-            variant, created = ProductVariant.objects.get_or_create(
-                product=product,
-                option_combinations=combination_json,
-                defaults={
-                    'sku': sku,
-                    'price': product.base_price,
-                    'stock': 0,
-                    'weight': 0.3,
-                    'is_active': True,
-                }
-            )
-            if created:
-                created_for_this += 1
-
-        total_created += created_for_this
-        messages.success(request, f"Đã tạo {created_for_this} variant cho [{product.name}]")
-
-    if total_created == 0:
+    """Tạo biến thể còn thiếu cho các product được chọn (xem SHOEX/products/variants.py)"""
+    names = dict(queryset.values_list('product_id', 'name'))
+    try:
+        result = generate_variants(names.keys())
+    except ValueError as e:
+        messages.error(request, str(e))
+        return
+
+    for product_id, created in result.items():
+        if created is None:
+            messages.warning(request, f"[ {names[product_id]} ] Chưa có tùy chọn thuộc tính nào để tạo variant!")
+        elif created:
+            messages.success(request, f"Đã tạo {created} variant cho [{names[product_id]}]")
+
+    if not any(result.values()):
         messages.info(request, "Không có variant nào được tạo mới.")
 generate_all_variants.short_description = "Tạo toàn bộ biến thể từ tùy chọn thuộc tính"
 
@@ -124,6 +91,7 @@ class CategoryAdmin(admin.ModelAdmin):
     list_filter = ('is_active', 'parent')
     search_fields = ('name',)
     ordering = ('name',)
+    actions = ['rebuild_closure']
 
     def product_count(self, obj):
         count = obj.products.count()
@@ -131,6 +99,12 @@ class CategoryAdmin(admin.ModelAdmin):
         return format_html('<a href="{}">{} sản phẩm</a>', url, count)
     product_count.short_description = "Số sản phẩm"
 
+    def rebuild_closure(self, request, queryset):
+        """Dựng lại bảng closure (khi cây danh mục bị sửa ngoài save())"""
+        count = CategoryClosure.rebuild()
+        self.message_user(request, f"Đã dựng lại cây cho {count} danh mục", messages.SUCCESS)
+    rebuild_closure.short_description = "Dựng lại cây danh mục (closure)"
+
 
 @admin.register(Product)
 class ProductAdmin(admin.ModelAdmin):
@@ -140,7 +114,7 @@ class ProductAdmin(admin.ModelAdmin):
     ordering = ('-created_at',)
     actions = [generate_all_variants]
     inlines = [ProductImageInline, ProductAttributeOptionInline, ProductVariantInline]
-    readonly_fields = ('size_guide_preview',)
+    readonly_fields = ('size_guide_preview', 'min_price', 'max_price', 'total_stock', 'variant_count')
 
     fieldsets = (
         ('Thông tin chính', {
@@ -156,12 +130,16 @@ class ProductAdmin(admin.ModelAdmin):
         ('Trạng thái', {
             'fields': ('is_active', 'is_featured')
         }),
+        ('Tổng hợp biến thể', {
+            'fields': ('min_price', 'max_price', 'total_stock', 'variant_count'),
+            'classes': ('collapse',)
+        }),
     )
 
     def price_range(self, obj):
-        if obj.variants.exists():
+        if obj.min_price != obj.max_price:
             return f"{obj.min_price:,.0f}₫ → {obj.max_price:,.0f}₫"
-        return f"{obj.base_price:,.0f}₫"
+        return f"{obj.min_price:,.0f}₫"
     price_range.short_description = "Khoảng giá"
 
     def total_stock_colored(self, obj):
@@ -171,8 +149,7 @@ class ProductAdmin(admin.ModelAdmin):
     total_stock_colored.short_description = "Tồn kho"
 
     def variant_count(self, obj):
-        count = obj.variants.count()
-        return format_html('<b>{}</b>', count)
+        return format_html('<b>{}</b>', obj.variant_count)
     variant_count.short_description = "Biến thể"
 
     def size_guide_preview(self, obj):
@@ -241,5 +218,102 @@ class ProductAttributeOptionAdmin(admin.ModelAdmin):
     image_preview.short_description = "Ảnh"
 
 
+@admin.register(ProductSalesStats)
+class ProductSalesStatsAdmin(admin.ModelAdmin):
+    list_display = ('product', 'sold_count', 'sold_count_last_30', 'avg_rating_last_30', 'rating_count_last_30', 'updated_at')
+    search_fields = ('product__name',)
+    ordering = ('-sold_count_last_30',)
+    readonly_fields = (
+        'product', 'sold_count', 'sold_count_last_30', 'rating_sum_last_30',
+        'rating_count_last_30', 'avg_rating_last_30', 'updated_at'
+    )
+    actions = ['rebuild_stats']
+
+    def rebuild_stats(self, request, queryset):
+        """Tính lại thống kê cho các sản phẩm đã chọn"""
+        count = ProductSalesStats.rebuild(product_ids=list(queryset.values_list('product_id', flat=True)))
+        self.message_user(request, f"Đã tính lại thống kê cho {count} sản phẩm", messages.SUCCESS)
+    rebuild_stats.short_description = "Tính lại thống kê bán hàng"
+
+
+@admin.register(StockReservation)
+class StockReservationAdmin(admin.ModelAdmin):
+    list_display = ('reservation_id', 'variant', 'quantity', 'status', 'cart', 'order', 'expires_at', 'created_at')
+    list_filter = ('status',)
+    search_fields = ('variant__sku',)
+    raw_id_fields = ('variant', 'cart', 'order')
+    # Đổi status / quantity tay sẽ lệch với stock => chỉ thao tác qua action
+    readonly_fields = ('variant', 'cart', 'order', 'quantity', 'status', 'expires_at', 'created_at', 'updated_at')
+    actions = ['release_selected', 'release_expired']
+
+    def release_selected(self, request, queryset):
+        """Trả kho cho các reservation đang giữ / đã chốt được chọn"""
+        count = release_queryset(queryset.filter(status__in=['held', 'committed']))
+        self.message_user(request, f"Đã trả kho cho {count} reservation", messages.SUCCESS)
+    release_selected.short_description = "Trả lại kho"
+
+    def release_expired(self, request, queryset):
+        count = release_expired_reservations()
+        self.message_user(request, f"Đã trả kho cho {count} reservation hết hạn", messages.SUCCESS)
+    release_expired.short_description = "Trả kho cho mọi reservation hết hạn"
+
+
+class AppendOnlyAdmin(admin.ModelAdmin):
+    """Lịch sử chỉ xem, không thêm / sửa / xóa tay"""
+    raw_id_fields = ('variant', 'user')
+    search_fields = ('variant__sku', 'reason')
+    list_filter = ('source',)
+    date_hierarchy = 'created_at'
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(InventoryLedger)
+class InventoryLedgerAdmin(AppendOnlyAdmin):
+    list_display = ('entry_id', 'variant', 'change', 'source', 'reason', 'user', 'created_at')
+
+
+@admin.register(PriceHistory)
+class PriceHistoryAdmin(AppendOnlyAdmin):
+    list_display = ('history_id', 'variant', 'old_price', 'new_price', 'source', 'reason', 'user', 'created_at')
+
+
+@admin.register(ProductImportJob)
+class ProductImportJobAdmin(admin.ModelAdmin):
+    list_display = (
+        'job_id', 'store', 'user', 'format', 'status', 'processed_rows', 'total_rows',
+        'created_products', 'updated_products', 'created_variants', 'updated_variants', 'error_count', 'created_at'
+    )
+    list_filter = ('status', 'format')
+    raw_id_fields = ('store', 'user')
+    # Tiến độ do importer ghi, không sửa tay
+    readonly_fields = (
+        'format', 'status', 'total_rows', 'processed_rows', 'created_products', 'updated_products',
+        'created_variants', 'updated_variants', 'error_count', 'errors', 'started_at', 'finished_at',
+        'created_at', 'updated_at'
+    )
+    actions = ['run_selected']
+
+    def save_model(self, request, obj, form, change):
+        if not change:
+            obj.format = detect_format(obj.file.name) or 'csv'
+            obj.user = obj.user or request.user
+        super().save_model(request, obj, form, change)
+
+    def run_selected(self, request, queryset):
+        """Chạy ngay (trong request) các job đang chờ hoặc bị dừng giữa chừng"""
+        done = [run_import(job_id, stale_after=STALE_AFTER) for job_id in queryset.values_list('pk', flat=True)]
+        count = sum(1 for job in done if job is not None)
+        self.message_user(request, f"Đã chạy {count} lần nhập", messages.SUCCESS)
+    run_selected.short_description = "Chạy các lần nhập đã chọn"
+
+
 # ĐĂNG KÝ THÊM NẾU MUỐN
 admin.site.register(ProductImage)  # hoặc tạo riêng nếu cần
\ No newline at end of file
@@ -0,0 +1,180 @@
+"""
+Xuất catalog (product + variant + ảnh) theo luồng: JSON lines hoặc CSV, nén gzip tùy chọn
+
+- Product đọc bằng server-side cursor (.iterator(chunk_size)), variant / ảnh lấy theo từng khối
+  product => bộ nhớ chỉ giữ một khối, số query ~ 3 / khối, không phụ thuộc kích thước catalog
+- JSON lines: mỗi dòng một product kèm "variants" và "images"
+- CSV: mỗi dòng một variant (product chưa có variant: một dòng, cột variant trống);
+  tên cột trùng file nhập (SHOEX/products/imports.py) => xuất ra sửa rồi nhập lại được
+- since: chỉ product đổi từ thời điểm này (product / variant / ảnh mới / sổ kho / lịch sử giá),
+  gồm cả product đã ẩn để feed gỡ xuống. since cho lần sau: next_since() = lúc bắt đầu xuất
+  trừ EXPORT_SINCE_OVERLAP, vì các mốc thời gian không theo thứ tự commit (updated_at đặt trước
+  commit, sổ kho / lịch sử giá ghi theo lô cuối request) => lần sau xuất lặp lại vài product
+  thay vì bỏ sót
+
+Dùng chung cho GET /exports/catalog/ (products/views.py) và `python manage.py export_catalog`.
+"""
+
+import csv
+import json
+import zlib
+from datetime import timedelta
+from itertools import islice
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Exists, OuterRef, Q
+from django.utils import timezone
+
+from .models import InventoryLedger, PriceHistory, Product, ProductImage, ProductVariant
+
+
+EXPORT_CHUNK_SIZE = getattr(settings, 'CATALOG_EXPORT_CHUNK_SIZE', 2000)
+FLUSH_SIZE = 64 * 1024          # Gom output tới ~64KB mỗi lần yield
+FORMATS = ('ndjson', 'csv')
+# Lùi mốc since của lần xuất sau: bao trọn transaction / request dài hơn thời gian này
+EXPORT_SINCE_OVERLAP = timedelta(seconds=getattr(settings, 'CATALOG_EXPORT_OVERLAP_SECONDS', 300))
+
+PRODUCT_FIELDS = {
+    'product_id': 'product_id',
+    'model_code': 'model_code',
+    'slug': 'slug',
+    'name': 'name',
+    'description': 'description',
+    'store_id': 'store_id',
+    'category_id': 'category_id',
+    'category': 'category__name',
+    'brand': 'brand__name',
+    'base_price': 'base_price',
+    'min_price': 'min_price',
+    'max_price': 'max_price',
+    'total_stock': 'total_stock',
+    'is_active': 'is_active',
+    'updated_at': 'updated_at',
+}
+VARIANT_FIELDS = ('variant_id', 'sku', 'price', 'stock', 'weight', 'option_combinations', 'is_active', 'updated_at')
+IMAGE_FIELDS = ('image_id', 'image', 'is_thumbnail', 'alt_text', 'display_order')
+CSV_COLUMNS = [
+    'product_id', 'model_code', 'slug', 'name', 'description', 'store_id', 'category_id', 'category', 'brand',
+    'base_price', 'min_price', 'max_price', 'is_active', 'variant_id', 'sku', 'price', 'stock', 'weight',
+    'options', 'variant_is_active', 'image_url', 'updated_at',
+]
+
+
+# ===== ĐỌC CATALOG =====
+
+def catalog_queryset(since=None, store_id=None, include_inactive=False):
+    """Product cần xuất (since => chỉ product có thay đổi, gồm cả product đã ẩn)"""
+    queryset = Product.objects.all()
+    if store_id is not None:
+        queryset = queryset.filter(store_id=store_id)
+    if since is not None:
+        changed_variants = ProductVariant.objects.filter(product=OuterRef('pk'), updated_at__gte=since)
+        # Trừ kho / đổi giá bằng .update() không chạm variant.updated_at => xem sổ kho và lịch sử giá
+        stock_changes = InventoryLedger.objects.filter(variant__product=OuterRef('pk'), created_at__gte=since)
+        price_changes = PriceHistory.objects.filter(variant__product=OuterRef('pk'), created_at__gte=since)
+        new_images = ProductImage.objects.filter(product=OuterRef('pk'), created_at__gte=since)
+        queryset = queryset.filter(
+            Q(updated_at__gte=since) | Exists(changed_variants) | Exists(stock_changes)
+            | Exists(price_changes) | Exists(new_images)
+        )
+    elif not include_inactive:
+        queryset = queryset.filter(is_active=True)
+    return queryset.order_by('pk')
+
+
+def iter_catalog(queryset, chunk_size=EXPORT_CHUNK_SIZE):
+    """Từng product (dict) kèm "variants" và "images", đọc theo khối chunk_size product"""
+    products = queryset.values_list(*PRODUCT_FIELDS.values()).iterator(chunk_size=chunk_size)
+    while True:
+        chunk = [dict(zip(PRODUCT_FIELDS, row)) for row in islice(products, chunk_size)]
+        if not chunk:
+            return
+        by_id = {}
+        for product in chunk:
+            product['variants'], product['images'] = [], []
+            by_id[product['product_id']] = product
+
+        for product_id, *values in ProductVariant.objects.filter(product_id__in=by_id.keys())\
+                .order_by('product_id', 'variant_id').values_list('product_id', *VARIANT_FIELDS):
+            variant = dict(zip(VARIANT_FIELDS, values))
+            variant['option_combinations'] = ProductVariant.parse_options(variant['option_combinations'])
+            by_id[product_id]['variants'].append(variant)
+
+        for product_id, *values in ProductImage.objects.filter(product_id__in=by_id.keys())\
+                .order_by('product_id', '-is_thumbnail', 'display_order', 'image_id')\
+                .values_list('product_id', *IMAGE_FIELDS):
+            image = dict(zip(IMAGE_FIELDS, values))
+            image['url'] = default_storage.url(image.pop('image')) if image['image'] else None
+            by_id[product_id]['images'].append(image)
+
+        yield from chunk
+
+
+# ===== ĐỊNH DẠNG =====
+
+def iter_ndjson(products):
+    encoder = DjangoJSONEncoder(ensure_ascii=False)
+    for product in products:
+        yield encoder.encode(product) + '\n'
+
+
+class _Line:
+    """File giả cho csv.writer: write() trả về chính dòng vừa ghi"""
+    def write(self, value):
+        return value
+
+
+def iter_csv(products):
+    writer = csv.writer(_Line())
+    yield writer.writerow(CSV_COLUMNS)
+    for product in products:
+        base = [product[column] for column in CSV_COLUMNS[:13]]
+        image_url = product['images'][0]['url'] if product['images'] else ''
+        variants = product['variants'] or [None]
+        for variant in variants:
+            if variant is None:
+                row = [''] * 7
+            else:
+                row = [
+                    variant['variant_id'], variant['sku'], variant['price'], variant['stock'], variant['weight'],
+                    json.dumps(variant['option_combinations'], ensure_ascii=False), variant['is_active'],
+                ]
+            yield writer.writerow(base + row + [image_url, product['updated_at'].isoformat()])
+
+
+def encode_stream(lines, compress=False):
+    """Chuỗi -> khối bytes ~FLUSH_SIZE (gzip khi compress)"""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31) if compress else None    # wbits 31 = header gzip
+    buffer, size = [], 0
+    for line in lines:
+        data = line.encode('utf-8')
+        buffer.append(data)
+        size += len(data)
+        if size >= FLUSH_SIZE:
+            data = b''.join(buffer)
+            buffer, size = [], 0
+            data = compressor.compress(data) if compressor else data
+            if data:
+                yield data
+    data = b''.join(buffer)
+    if compressor:
+        data = compressor.compress(data) + compressor.flush()
+    if data:
+        yield data
+
+
+def export_catalog(format='ndjson', since=None, store_id=None, include_inactive=False, compress=False,
+                   chunk_size=EXPORT_CHUNK_SIZE):
+    """Khối bytes của file xuất; raise ValueError nếu format không hỗ trợ"""
+    if format not in FORMATS:
+        raise ValueError(f"format must be one of {', '.join(FORMATS)}")
+    products = iter_catalog(catalog_queryset(since, store_id, include_inactive), chunk_size)
+    lines = iter_csv(products) if format == 'csv' else iter_ndjson(products)
+    return encode_stream(lines, compress)
+
+
+def next_since():
+    """Mốc since cho lần xuất sau, lấy trước khi bắt đầu đọc (xem EXPORT_SINCE_OVERLAP)"""
+    return timezone.now() - EXPORT_SINCE_OVERLAP
@@ -0,0 +1,149 @@
+"""
+Ghi lịch sử tồn kho / giá (InventoryLedger, PriceHistory) theo lô
+
+Đường trừ kho / đổi giá không INSERT từng dòng lịch sử:
+- record_stock_changes / record_price_changes chỉ đăng ký transaction.on_commit
+  => transaction bị rollback (thiếu hàng, lỗi giữa chừng) thì không ghi gì
+- Sau commit, bản ghi được đưa vào bộ đệm của request (HistoryBufferMiddleware /
+  khối history_buffer()) và ghi một lần bằng bulk_create khi request kết thúc
+- Ngoài bộ đệm (management command, shell): ghi ngay sau commit, mỗi lần gọi một bulk_create
+
+created_at lấy lúc gọi record_*, không phải lúc flush => truy vấn "tồn kho tại T" đúng thời điểm
+
+Sổ cái có thể mất bản ghi (ghi sau commit, ngoài transaction trừ kho): process chết trước khi
+flush hoặc lỗi DB lúc flush => thay đổi kho đã commit nhưng không có dòng lịch sử, và
+stock_at() trước thời điểm đó lệch đúng phần bị mất. Lỗi flush chỉ được ghi log (logger
+SHOEX.products.history), không làm hỏng response của request đã commit
+"""
+
+import logging
+import threading
+from contextlib import contextmanager
+
+from django.db import DatabaseError, transaction
+from django.utils import timezone
+
+from .models import InventoryLedger, PriceHistory
+
+
+FLUSH_BATCH_SIZE = 1000
+
+logger = logging.getLogger(__name__)
+_buffer = threading.local()
+
+
+def _user_id(user):
+    if user is None or not getattr(user, 'is_authenticated', True):
+        return None
+    return getattr(user, 'pk', user)
+
+
+def _write(ledger, prices):
+    """Ghi lô lịch sử; lỗi DB => log rồi bỏ lô (thay đổi kho / giá đã commit từ trước)"""
+    try:
+        with transaction.atomic():
+            if ledger:
+                InventoryLedger.objects.bulk_create(ledger, batch_size=FLUSH_BATCH_SIZE)
+            if prices:
+                PriceHistory.objects.bulk_create(prices, batch_size=FLUSH_BATCH_SIZE)
+    except DatabaseError:
+        logger.exception(
+            "Dropped %d inventory ledger and %d price history entries", len(ledger), len(prices)
+        )
+
+
+def _enqueue(ledger=(), prices=()):
+    def append():
+        pending = getattr(_buffer, 'pending', None)
+        if pending is None:
+            _write(list(ledger), list(prices))
+            return
+        pending[0].extend(ledger)
+        pending[1].extend(prices)
+    transaction.on_commit(append)
+
+
+def record_stock_changes(changes, source='adjust', reason='', user=None):
+    """
+    Ghi sổ cái cho các thay đổi kho đã thực hiện trong transaction hiện tại
+    changes: {variant_id: delta} hoặc [(variant_id, delta, reason)] (lý do riêng từng dòng)
+    """
+    now = timezone.now()
+    user_id = _user_id(user)
+    if isinstance(changes, dict):
+        changes = [(variant_id, delta, reason) for variant_id, delta in changes.items()]
+    _enqueue(ledger=[
+        InventoryLedger(
+            variant_id=variant_id,
+            change=delta,
+            source=source,
+            reason=(row_reason or reason or '')[:255],
+            user_id=user_id,
+            created_at=now,
+        )
+        for variant_id, delta, row_reason in changes if delta
+    ])
+
+
+def record_price_changes(changes, source='adjust', reason='', user=None):
+    """
+    Ghi lịch sử giá cho các lần đổi giá trong transaction hiện tại
+    changes: [(variant_id, old_price, new_price)] hoặc [(variant_id, old_price, new_price, reason)]
+    """
+    now = timezone.now()
+    user_id = _user_id(user)
+    entries = []
+    for variant_id, old_price, new_price, *row_reason in changes:
+        if old_price == new_price:
+            continue
+        entries.append(PriceHistory(
+            variant_id=variant_id,
+            old_price=old_price,
+            new_price=new_price,
+            source=source,
+            reason=((row_reason and row_reason[0]) or reason or '')[:255],
+            user_id=user_id,
+            created_at=now,
+        ))
+    _enqueue(prices=entries)
+
+
+def flush_history():
+    """Ghi ngay các bản ghi đang chờ trong bộ đệm (nếu có)"""
+    pending = getattr(_buffer, 'pending', None)
+    if pending is None:
+        return
+    ledger, prices = pending
+    _buffer.pending = ([], [])
+    _write(ledger, prices)
+
+
+@contextmanager
+def history_buffer():
+    """
+    Gom lịch sử tồn kho / giá của cả khối (một request) => bulk_create khi thoát khối
+    Khối lồng nhau dùng chung bộ đệm của khối ngoài cùng
+    """
+    if getattr(_buffer, 'pending', None) is not None:
+        yield
+        return
+
+    _buffer.pending = ([], [])
+    try:
+        yield
+    finally:
+        try:
+            flush_history()
+        finally:
+            _buffer.pending = None
+
+
+class HistoryBufferMiddleware:
+    """Mỗi request một bộ đệm lịch sử, ghi một lần khi trả response"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with history_buffer():
+            return self.get_response(request)
@@ -0,0 +1,126 @@
+"""
+Cấp model_code và slug cho Product không đụng nhau, theo lô (dùng được trước bulk_create)
+
+model_code "PRD-0001", "PRD-0002"...:
+- PostgreSQL: SEQUENCE products_model_code_seq, lấy n số bằng một câu nextval / generate_series.
+  nextval không bị khóa và không rollback => số có thể nhảy, không bao giờ trùng
+- CSDL khác: bảng CodeSequence, cấp cả khối n số bằng một câu UPDATE value = value + n
+  (row lock giữ tới khi transaction của người gọi commit)
+- Số trùng với mã nhập tay => bỏ qua, cấp tiếp
+Không còn Product.objects.count() mỗi lần thêm (quét cả bảng, trùng khi tạo đồng thời).
+
+slug:
+- slugify(name) cắt ngắn chừa chỗ hậu tố; rỗng (tên toàn ký tự không Latin) => "product"
+- Slug đã dùng được lấy theo tiền tố (một query / lô), hậu tố -2, -3... tính trong bộ nhớ
+"""
+
+from functools import reduce
+from operator import or_
+
+from django.db import connections, transaction
+from django.db.models import F, Q
+from django.utils.text import slugify
+
+from .models import CodeSequence, Product
+
+
+MODEL_CODE_PREFIX = 'PRD-'
+MODEL_CODE_SEQUENCE = 'products_model_code_seq'     # PostgreSQL SEQUENCE / tên dòng CodeSequence
+SLUG_MAX_LENGTH = Product._meta.get_field('slug').max_length
+SLUG_SUFFIX_ROOM = 6                                # "-99999"
+SLUG_PREFIX_BATCH = 200
+DEFAULT_SLUG = 'product'
+
+
+def format_model_code(number):
+    return f"{MODEL_CODE_PREFIX}{number:04d}"
+
+
+def parse_model_code(code):
+    """Số thứ tự trong mã "PRD-0012" (None nếu không theo mẫu)"""
+    if not code or not code.startswith(MODEL_CODE_PREFIX):
+        return None
+    number = code[len(MODEL_CODE_PREFIX):]
+    return int(number) if number.isdigit() else None
+
+
+# ===== MODEL CODE =====
+
+def _next_numbers(count):
+    connection = connections[Product.objects.db]
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT nextval(%s) FROM generate_series(1, %s)",
+                [MODEL_CODE_SEQUENCE, count]
+            )
+            return [row[0] for row in cursor.fetchall()]
+
+    with transaction.atomic():
+        if not CodeSequence.objects.filter(name=MODEL_CODE_SEQUENCE).update(value=F('value') + count):
+            CodeSequence.objects.get_or_create(name=MODEL_CODE_SEQUENCE)
+            CodeSequence.objects.filter(name=MODEL_CODE_SEQUENCE).update(value=F('value') + count)
+        end = CodeSequence.objects.values_list('value', flat=True).get(name=MODEL_CODE_SEQUENCE)
+    return list(range(end - count + 1, end + 1))
+
+
+def allocate_model_codes(count):
+    """count mã model chưa dùng, theo thứ tự tăng dần"""
+    codes = []
+    while len(codes) < count:
+        batch = [format_model_code(number) for number in _next_numbers(count - len(codes))]
+        taken = set(Product.objects.filter(model_code__in=batch).values_list('model_code', flat=True))
+        codes.extend(code for code in batch if code not in taken)
+    return codes
+
+
+# ===== SLUG =====
+
+def slug_base(name):
+    return slugify(name or '')[:SLUG_MAX_LENGTH - SLUG_SUFFIX_ROOM].strip('-') or DEFAULT_SLUG
+
+
+def _taken_slugs(bases):
+    bases = sorted(set(bases))
+    taken = set()
+    for start in range(0, len(bases), SLUG_PREFIX_BATCH):
+        condition = reduce(or_, (Q(slug__startswith=base) for base in bases[start:start + SLUG_PREFIX_BATCH]))
+        taken.update(Product.objects.filter(condition).values_list('slug', flat=True))
+    return taken
+
+
+def allocate_slugs(names, reserved=()):
+    """
+    Một slug chưa dùng cho mỗi tên (trùng trong DB, trong lô hoặc trong reserved => thêm -2, -3...)
+    """
+    bases = [slug_base(name) for name in names]
+    used = _taken_slugs(bases) | set(reserved)
+    slugs = []
+    for base in bases:
+        slug, i = base, 2
+        while slug in used:
+            slug = f"{base}-{i}"
+            i += 1
+        used.add(slug)
+        slugs.append(slug)
+    return slugs
+
+
+# ===== PRODUCT =====
+
+def assign_identifiers(products):
+    """
+    Điền model_code / slug còn trống cho các Product (chưa lưu hoặc đang lưu)
+    Dùng trước bulk_create: số query cố định cho cả lô
+    """
+    products = list(products)
+    missing_code = [product for product in products if not product.model_code]
+    for product, code in zip(missing_code, allocate_model_codes(len(missing_code)) if missing_code else ()):
+        product.model_code = code
+
+    missing_slug = [product for product in products if not product.slug]
+    if missing_slug:
+        reserved = {product.slug for product in products if product.slug}
+        for product, slug in zip(missing_slug, allocate_slugs([p.name for p in missing_slug], reserved)):
+            product.slug = slug
+    return products
@@ -0,0 +1,264 @@
+"""
+Sinh bản thu nhỏ (thumb, 400 / 800 / 1600px, JPEG + WebP) cho ProductImage và ProductAttributeOption
+
+Upload chỉ lưu ảnh gốc (không resize trong transaction / request):
+- Lưu ảnh mới / đổi ảnh => renditions_status = 'pending' (signals.py), sau commit đưa vào
+  thread pool của process (IMAGE_RENDITION_WORKERS luồng; Pillow nhả GIL khi resize / encode)
+- Trạng thái nằm trên chính dòng ảnh => hàng đợi trong DB: `python manage.py render_images`
+  chạy các ảnh còn pending / bị dừng giữa chừng và render lại hàng loạt (--all) bằng process pool
+- Nhận việc bằng một câu UPDATE có điều kiện (pending -> processing) => không render trùng;
+  ghi kết quả chỉ khi dòng vẫn là lần nhận đó (ảnh bị thay giữa chừng => bỏ kết quả)
+
+Ảnh gốc giải mã một lần (JPEG: draft mode, giải mã thẳng ở kích thước nhỏ hơn), các bản nhỏ
+resize nối tiếp từ bản lớn hơn; không phóng to (bản rộng hơn ảnh gốc dùng chung file kích thước gốc).
+Đo CPU / bộ nhớ: `python manage.py benchmark_image_ingest`.
+
+Bản thu nhỏ đọc / ghi qua storage của field ảnh (cùng chỗ với ảnh gốc, không phải default_storage).
+Ảnh gốc lưu theo nội dung (storage.py) => tên bản thu nhỏ cũng theo nội dung, dùng chung giữa
+các dòng cùng ảnh: dòng khác đã render xong => chép renditions, không render lại. Bản thu nhỏ
+không xóa theo dòng mà cùng file gốc khi hết tham chiếu (media.py, collect_media).
+"""
+
+import os
+import posixpath
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from io import BytesIO
+
+from PIL import Image, ImageOps
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import ProductAttributeOption, ProductImage
+from .storage import media_storage
+from .utils import read_image_info
+
+
+RENDITION_MODELS = {
+    'product': ProductImage,
+    'option': ProductAttributeOption,
+}
+RENDITION_FORMATS = {
+    'jpeg': ('JPEG', 'jpg', {'quality': 85, 'optimize': True, 'progressive': True}),
+    'webp': ('WEBP', 'webp', {'quality': 80, 'method': 4}),
+}
+RUN_IN_THREAD = getattr(settings, 'IMAGE_RENDITIONS_IN_THREAD', True)
+THREAD_WORKERS = getattr(settings, 'IMAGE_RENDITION_WORKERS', 2)
+STALE_AFTER = timedelta(minutes=10)     # "processing" quá lâu => coi như worker đã chết
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+# ===== ẢNH GỐC =====
+
+def store_original(model, upload):
+    """Lưu file upload nguyên gốc qua storage của model.image (không resize, trùng nội dung => dùng lại); trả về tên file"""
+    field = model._meta.get_field('image')
+    upload.seek(0)
+    return field.storage.save(field.generate_filename(None, upload.name), upload)
+
+
+# ===== RENDER (không dùng DB, chạy được trong process con) =====
+
+def rendition_name(name, label, extension):
+    """products/gallery/2025/01/abc.jpg -> products/gallery/2025/01/renditions/abc_400.webp"""
+    directory, filename = posixpath.split(name)
+    stem = posixpath.splitext(filename)[0]
+    return posixpath.join(directory, 'renditions', f"{stem}_{label}.{extension}")
+
+
+def _save(storage, name, image, format):
+    """
+    Ghi bản thu nhỏ mà không lúc nào thiếu file: tên theo nội dung ảnh gốc => dòng khác cùng ảnh
+    có thể đang phục vụ file này. Storage trên đĩa: ghi file tạm cùng thư mục rồi os.replace
+    (đổi tên nguyên tử); storage khác không đổi tên được => file đã có thì giữ nguyên
+    """
+    try:
+        path = storage.path(name)
+    except NotImplementedError:
+        path = None
+        if storage.exists(name):
+            return name
+    pil_format, extension, options = RENDITION_FORMATS[format]
+    output = BytesIO()
+    image.save(output, format=pil_format, **options)
+    if path is None:
+        return storage.save(name, ContentFile(output.getvalue()))
+
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    descriptor, temporary = tempfile.mkstemp(dir=directory, prefix='.', suffix='.tmp')
+    try:
+        with os.fdopen(descriptor, 'wb') as file:
+            file.write(output.getvalue())
+        os.chmod(temporary, getattr(storage, 'file_permissions_mode', None) or 0o644)
+        os.replace(temporary, path)
+    except BaseException:
+        if os.path.exists(temporary):
+            os.unlink(temporary)
+        raise
+    return name
+
+
+def render_image(name, widths, storage=media_storage):
+    """
+    Sinh mọi bản {label: width} x RENDITION_FORMATS từ ảnh gốc `name` trong `storage`
+    (storage của field ảnh, bản thu nhỏ ghi cạnh ảnh gốc)
+    - Đọc file một lần: header (kích thước / định dạng / EXIF) + SHA-256 trên cùng buffer
+    - JPEG: draft() => libjpeg giải mã thẳng ở 1/2, 1/4, 1/8 kích thước, vừa đủ cho bản lớn nhất
+    - Bản nhỏ resize từ bản lớn hơn liền trước (không resize lại từ ảnh gốc)
+    Trả về ({label: {"width", "height", "jpeg", "webp"}}, read_image_info của ảnh gốc)
+    """
+    with storage.open(name, 'rb') as file:
+        buffer = BytesIO(file.read())
+    info = read_image_info(buffer)
+
+    source = Image.open(buffer)
+    largest = min(max(widths.values()), info['width'])
+    scale = largest / info['width']
+    if source.format == 'JPEG':
+        # draft tính theo pixel lưu (trước khi xoay EXIF) => kích thước tối thiểu cần giữ
+        source.draft('RGB', (max(1, int(source.width * scale)), max(1, int(source.height * scale))))
+    source.load()
+    source = ImageOps.exif_transpose(source)
+    if source.mode != 'RGB':
+        # JPEG không có kênh alpha => nền trắng
+        background = Image.new('RGB', source.size, (255, 255, 255))
+        source = source.convert('RGBA')
+        background.paste(source, mask=source.getchannel('A'))
+        source = background
+
+    renditions, by_width = {}, {}
+    for label, width in sorted(widths.items(), key=lambda item: -item[1]):
+        width = min(width, info['width'])
+        if width not in by_width:
+            height = max(1, round(info['height'] * width / info['width']))
+            if source.size != (width, height):
+                source = source.resize((width, height), Image.Resampling.LANCZOS, reducing_gap=3.0)
+            by_width[width] = {'width': width, 'height': height}
+            for format, (_, extension, _) in RENDITION_FORMATS.items():
+                by_width[width][format] = _save(storage, rendition_name(name, width, extension), source, format)
+        renditions[label] = by_width[width]
+    return renditions, info
+
+
+def _render(task):
+    """render_image cho executor.map: lỗi được trả về thay vì raise (không dừng cả lô)"""
+    name, widths, storage = task
+    try:
+        return render_image(name, widths, storage)
+    except Exception as e:
+        return e
+
+
+# ===== HÀNG ĐỢI TRONG DB =====
+
+def _claimable(stale_after=None):
+    claimable = Q(renditions_status='pending')
+    if stale_after is not None:
+        claimable |= Q(renditions_status='processing', renditions_updated_at__lt=timezone.now() - stale_after)
+    return claimable & ~Q(image='') & Q(image__isnull=False)
+
+
+def claim_renditions(model, pks=None, stale_after=None, limit=None):
+    """
+    Nhận tối đa limit ảnh cần render (pending / processing quá hạn)
+    Trả về (mốc nhận, [(pk, tên ảnh gốc, renditions cũ)])
+    """
+    queryset = model.objects.filter(_claimable(stale_after))
+    if pks is not None:
+        queryset = queryset.filter(pk__in=pks)
+    candidates = list(queryset.order_by('pk').values_list('pk', flat=True)[:limit])
+    token = timezone.now()
+    if candidates:
+        model.objects.filter(_claimable(stale_after), pk__in=candidates).update(
+            renditions_status='processing', renditions_updated_at=token
+        )
+    return token, list(
+        model.objects.filter(pk__in=candidates, renditions_status='processing', renditions_updated_at=token)
+        .values_list('pk', 'image', 'renditions')
+    )
+
+
+def _ready_renditions(model, names, exclude):
+    """{tên ảnh gốc: (renditions, width, height, format, content_hash)} của dòng khác đã render xong"""
+    return {
+        row[0]: row[1:]
+        for row in model.objects.filter(image__in=names, renditions_status='ready')
+        .exclude(pk__in=exclude).exclude(renditions={})
+        .values_list('image', 'renditions', 'width', 'height', 'format', 'content_hash')
+    }
+
+
+def process_renditions(model, pks=None, stale_after=None, limit=None, map=map):
+    """
+    Nhận và render các ảnh của model; map: map của executor để render song song
+    Trả về (số ảnh xong, số ảnh lỗi)
+    """
+    token, rows = claim_renditions(model, pks, stale_after, limit)
+    ready_by_name = _ready_renditions(model, {name for _, name, _ in rows}, [pk for pk, _, _ in rows])
+    todo = list(dict.fromkeys(name for _, name, _ in rows if name not in ready_by_name))
+    storage = model._meta.get_field('image').storage
+    rendered = dict(zip(todo, map(_render, [(name, model.RENDITION_WIDTHS, storage) for name in todo])))
+    ready = failed = 0
+    for pk, name, _ in rows:
+        mine = model.objects.filter(pk=pk, renditions_status='processing', renditions_updated_at=token)
+        if name in ready_by_name:
+            renditions, width, height, format, content_hash = ready_by_name[name]
+            info = {'width': width, 'height': height, 'format': format, 'hash': content_hash}
+        else:
+            result = rendered[name]
+            if isinstance(result, Exception):
+                failed += mine.update(renditions_status='failed', renditions_updated_at=timezone.now())
+                continue
+            renditions, info = result
+        # Ảnh bị thay / xóa trong lúc render => không ghi (file thuộc ảnh gốc, collect_media dọn)
+        ready += mine.update(
+            renditions=renditions,
+            renditions_status='ready',
+            renditions_updated_at=timezone.now(),
+            # Ảnh cũ / thay qua admin chưa có thông tin => điền từ lần đọc này
+            width=info['width'],
+            height=info['height'],
+            format=info['format'],
+            content_hash=info['hash'],
+        )
+    return ready, failed
+
+
+def _process_in_thread(model, pk):
+    try:
+        process_renditions(model, [pk])
+    finally:
+        connection.close()
+
+
+def _get_executor():
+    """Thread pool dùng chung của process, tạo lần đầu cần (khóa => các request đồng thời không tạo nhiều pool)"""
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=THREAD_WORKERS, thread_name_prefix='image-renditions')
+    return _executor
+
+
+def schedule_renditions(instance):
+    """Sau commit: render ảnh của instance trong thread pool (IMAGE_RENDITIONS_IN_THREAD = False => để command)"""
+    if not RUN_IN_THREAD:
+        return
+    model, pk = type(instance), instance.pk
+    transaction.on_commit(lambda: _get_executor().submit(_process_in_thread, model, pk))
+
+
+def rerender(queryset):
+    """Đánh dấu render lại (sau khi đổi RENDITION_WIDTHS / định dạng); trả về số ảnh"""
+    return queryset.exclude(image='').filter(image__isnull=False).update(
+        renditions_status='pending', renditions_updated_at=None
+    )
@@ -0,0 +1,547 @@
+"""
+Nhập sản phẩm / biến thể từ file theo luồng (CSV có header, JSON lines, XLSX)
+
+Mỗi dòng một SKU (dòng không có sku chỉ tạo / cập nhật product):
+    model_code   khóa product để upsert; trống => product mới, gom theo name trong lần nhập
+    name, description, category (id / tên), brand (id / tên), base_price, is_active
+    sku, price (mặc định base_price), stock (số nguyên), weight
+    options      {"Size": "39", "Màu": "Đen"} hoặc "Size=39; Màu=Đen" (tên ProductAttribute có sẵn)
+Ô trống khi cập nhật = giữ giá trị cũ.
+
+Xử lý (ProductImporter):
+- Danh mục / thương hiệu / thuộc tính nạp một lần cho cả file
+- Mỗi khối CHUNK_SIZE dòng một transaction: product / SKU đã có lấy 1 query / khối
+  (SKU khóa select_for_update tới hết khối), upsert bằng bulk_create(update_conflicts=True)
+  theo model_code / sku
+- bulk_create không bắn signal => tự tạo ProductSalesStats, ProductAttributeOption,
+  đồng bộ VariantOptionValue, tóm tắt variant và ghi lịch sử kho / giá (source='import')
+- Tiến độ + lỗi từng dòng ghi vào ProductImportJob cùng transaction với khối =>
+  job bị dừng giữa chừng chạy lại (process_product_imports) tiếp từ khối chưa xong
+
+File lớn chỉ tốn bộ nhớ cho một khối. XLSX cần openpyxl (import khi dùng).
+"""
+
+import codecs
+import csv
+import json
+import threading
+from datetime import timedelta
+from decimal import Decimal, InvalidOperation
+from itertools import islice
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F, Q, Value
+from django.db.models.functions import Coalesce, Lower
+from django.utils import timezone
+
+from SHOEX.brand.models import Brand
+from .history import record_price_changes, record_stock_changes
+from .identifiers import allocate_model_codes, assign_identifiers
+from .models import (
+    Category, Product, ProductAttribute, ProductAttributeOption, ProductImportJob,
+    ProductSalesStats, ProductVariant
+)
+from .utils import schedule_variant_options, schedule_variant_summary, variant_summary_batch
+
+
+CHUNK_SIZE = getattr(settings, 'PRODUCT_IMPORT_CHUNK_SIZE', 1000)
+RUN_IN_THREAD = getattr(settings, 'PRODUCT_IMPORT_RUN_IN_THREAD', True)
+STALE_AFTER = timedelta(minutes=30)     # Job "running" không cập nhật quá lâu => coi như process đã chết
+MAX_JOB_ERRORS = 1000
+
+PRODUCT_UPDATE_FIELDS = ['name', 'description', 'category', 'brand', 'base_price', 'is_active', 'updated_at']
+VARIANT_UPDATE_FIELDS = ['price', 'stock', 'weight', 'option_combinations', 'updated_at']
+FORMAT_EXTENSIONS = {
+    '.csv': 'csv',
+    '.jsonl': 'jsonl',
+    '.ndjson': 'jsonl',
+    '.xlsx': 'xlsx',
+}
+TRUE_VALUES = {'1', 'true', 'yes', 'y', 'x'}
+FALSE_VALUES = {'0', 'false', 'no', 'n'}
+
+
+# ===== ĐỌC FILE =====
+
+def detect_format(filename):
+    """'csv' | 'jsonl' | 'xlsx' theo đuôi file, None nếu không hỗ trợ"""
+    name = (filename or '').lower()
+    for extension, format in FORMAT_EXTENSIONS.items():
+        if name.endswith(extension):
+            return format
+    return None
+
+
+def iter_records(file, format):
+    """
+    Đọc file theo luồng: từng (số dòng, dict), dòng JSON hỏng => (số dòng, ValueError)
+    Raise ValueError nếu cả file không đọc được
+    """
+    if format == 'jsonl':
+        for number, line in enumerate(codecs.iterdecode(file, 'utf-8-sig'), 1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError as e:
+                yield number, e
+                continue
+            yield number, record if isinstance(record, dict) else ValueError("row must be a JSON object")
+
+    elif format == 'xlsx':
+        try:
+            from openpyxl import load_workbook
+        except ImportError:
+            raise ValueError("reading XLSX requires openpyxl")
+        try:
+            rows = load_workbook(file, read_only=True, data_only=True).active.iter_rows(values_only=True)
+            header = [str(cell).strip() if cell is not None else '' for cell in next(rows, ())]
+        except Exception as e:
+            raise ValueError(f"cannot read XLSX: {e}")
+        for number, values in enumerate(rows, 2):
+            if any(value not in (None, '') for value in values):
+                yield number, {key: value for key, value in zip(header, values) if key}
+
+    else:
+        reader = csv.DictReader(codecs.iterdecode(file, 'utf-8-sig'))
+        try:
+            for record in reader:
+                yield reader.line_num, record
+        except (csv.Error, UnicodeDecodeError) as e:
+            raise ValueError(f"cannot parse CSV: {e}")
+
+
+def _text(record, key):
+    value = record.get(key)
+    return '' if value is None else str(value).strip()
+
+
+def _decimal(record, key):
+    value = _text(record, key)
+    if not value:
+        return None
+    try:
+        return Decimal(value)
+    except InvalidOperation:
+        raise ValueError(f"invalid {key} '{value}'")
+
+
+def _int(record, key):
+    value = _text(record, key)
+    if not value:
+        return None
+    try:
+        number = Decimal(value)
+    except InvalidOperation:
+        raise ValueError(f"invalid {key} '{value}'")
+    # "10" / "10.0" (Excel) được, "1.5" không bị cắt thành 1
+    if not number.is_finite() or number != number.to_integral_value():
+        raise ValueError(f"{key} must be a whole number, got '{value}'")
+    return int(number)
+
+
+def _bool(record, key):
+    value = _text(record, key).lower()
+    if not value:
+        return None
+    if value in TRUE_VALUES:
+        return True
+    if value in FALSE_VALUES:
+        return False
+    raise ValueError(f"invalid {key} '{value}'")
+
+
+def parse_options(value):
+    """{"Size": "39"} / '{"Size": "39"}' / "Size=39; Màu=Đen" -> dict, rỗng => None"""
+    if isinstance(value, dict):
+        return {str(name).strip(): str(option).strip() for name, option in value.items()} or None
+    text = '' if value is None else str(value).strip()
+    if not text:
+        return None
+    if text.startswith('{'):
+        options = json.loads(text)
+        if not isinstance(options, dict):
+            raise ValueError("options must be an object")
+        return parse_options(options)
+    options = {}
+    for part in text.replace('|', ';').split(';'):
+        if not part.strip():
+            continue
+        name, separator, option = part.partition('=')
+        if not separator:
+            name, separator, option = part.partition(':')
+        if not separator or not name.strip() or not option.strip():
+            raise ValueError(f"invalid options '{part.strip()}'")
+        options[name.strip()] = option.strip()
+    return options or None
+
+
+# ===== NHẬP THEO KHỐI =====
+
+class ProductImporter:
+    """Chạy một ProductImportJob: tra cứu dùng chung cho cả file, ghi từng khối"""
+
+    def __init__(self, job, chunk_size=CHUNK_SIZE):
+        self.job = job
+        self.chunk_size = chunk_size
+        self.categories = self._lookup(Category.objects.filter(is_active=True).order_by('pk'), 'category_id')
+        self.brands = self._lookup(Brand.objects.filter(is_active=True).order_by('pk'), 'id', 'slug')
+        # Tên thuộc tính không phân biệt hoa thường -> (attribute_id, tên chuẩn trong DB)
+        self.attributes = {
+            name.lower(): (attribute_id, name)
+            for attribute_id, name in ProductAttribute.objects.values_list('attribute_id', 'name')
+        }
+        # Product không có model_code: tên -> mã đã cấp cho job này (kể cả lần chạy trước, xem _imported_codes)
+        self.name_codes = {}
+        self.resumed = job.processed_rows > 0
+
+    @staticmethod
+    def _lookup(queryset, pk_field, *extra_fields):
+        """{id / tên / slug viết thường: id}"""
+        lookup = {}
+        for pk, name, *extra in queryset.values_list(pk_field, 'name', *extra_fields):
+            lookup[str(pk)] = pk
+            for key in (name, *extra):
+                if key:
+                    lookup.setdefault(str(key).strip().lower(), pk)
+        return lookup
+
+    def _reference(self, lookup, record, key):
+        value = _text(record, key)
+        if not value:
+            return None
+        pk = lookup.get(value.lower())
+        if pk is None:
+            raise ValueError(f"{key} '{value}' not found")
+        return pk
+
+    def _options(self, value):
+        options = parse_options(value)
+        if options is None:
+            return None
+        canonical = {}
+        for name, option in options.items():
+            attribute = self.attributes.get(name.lower())
+            if attribute is None:
+                raise ValueError(f"attribute '{name}' not found")
+            canonical[attribute[1]] = option
+        return canonical
+
+    def parse_row(self, number, record):
+        """dict thô -> dict đã kiểm tra kiểu; lỗi => ValueError"""
+        row = {
+            'number': number,
+            'model_code': _text(record, 'model_code') or None,
+            'name': _text(record, 'name') or None,
+            'description': _text(record, 'description') or None,
+            'category_id': self._reference(self.categories, record, 'category'),
+            'brand_id': self._reference(self.brands, record, 'brand'),
+            'base_price': _decimal(record, 'base_price'),
+            'is_active': _bool(record, 'is_active'),
+            'sku': _text(record, 'sku') or None,
+            'price': _decimal(record, 'price'),
+            'stock': _int(record, 'stock'),
+            'weight': _decimal(record, 'weight'),
+            'options': self._options(record.get('options')),
+        }
+        if not row['model_code'] and not row['name']:
+            raise ValueError("model_code or name is required")
+        if row['base_price'] is not None and row['base_price'] < 0:
+            raise ValueError("base_price must not be negative")
+        if row['price'] is not None and row['price'] <= 0:
+            raise ValueError("price must be positive")
+        if row['stock'] is not None and row['stock'] < 0:
+            raise ValueError("stock must not be negative")
+        if row['weight'] is not None and row['weight'] <= 0:
+            raise ValueError("weight must be positive")
+        if not row['sku'] and any(row[key] is not None for key in ('price', 'stock', 'weight', 'options')):
+            raise ValueError("sku is required for variant columns")
+        return row
+
+    @staticmethod
+    def _first(rows, key):
+        return next((row[key] for row in rows if row[key] is not None), None)
+
+    def _group_products(self, rows):
+        """{model_code: [rows]}; product không có model_code được cấp mã (nhớ theo tên)"""
+        unnamed = []
+        for row in rows:
+            if not row['model_code']:
+                row['model_code'] = self.name_codes.get(row['name'].lower())
+                if not row['model_code']:
+                    unnamed.append(row)
+        new_names = list(dict.fromkeys(row['name'].lower() for row in unnamed))
+        if new_names and self.resumed:
+            self.name_codes.update(self._imported_codes(new_names))
+            new_names = [name for name in new_names if name not in self.name_codes]
+        for name, code in zip(new_names, allocate_model_codes(len(new_names)) if new_names else ()):
+            self.name_codes[name] = code
+        groups = {}
+        for row in rows:
+            row['model_code'] = row['model_code'] or self.name_codes[row['name'].lower()]
+            groups.setdefault(row['model_code'], []).append(row)
+        return groups
+
+    def _imported_codes(self, names):
+        """
+        Job chạy tiếp sau khi bị dừng: name_codes của lần trước đã mất => tìm product cùng store,
+        cùng tên (không phân biệt hoa thường) do job tạo (từ started_at) để cập nhật thay vì tạo trùng
+        """
+        job = self.job
+        codes = {}
+        for name, code in Product.objects.annotate(name_lower=Lower('name')).filter(
+            store_id=job.store_id,
+            name_lower__in=names,
+            created_at__gte=job.started_at or job.created_at
+        ).order_by('pk').values_list('name_lower', 'model_code'):
+            codes.setdefault(name, code)
+        return codes
+
+    def _upsert_products(self, groups, errors):
+        """bulk_create(update_conflicts) product của khối; trả về ({model_code: product_id}, số mới, số cập nhật)"""
+        store_id = self.job.store_id
+        existing = {product.model_code: product for product in Product.objects.filter(model_code__in=groups.keys())}
+        products, new = [], []
+        for code, rows in list(groups.items()):
+            current = existing.get(code)
+            values = {
+                'name': self._first(rows, 'name'),
+                'description': self._first(rows, 'description'),
+                'category_id': self._first(rows, 'category_id'),
+                'brand_id': self._first(rows, 'brand_id'),
+                'base_price': self._first(rows, 'base_price'),
+                'is_active': self._first(rows, 'is_active'),
+            }
+            if current is not None and current.store_id != store_id:
+                message = f"product {code} belongs to another store"
+            elif current is None and not (values['name'] and values['category_id']):
+                message = f"name and category are required for new product {code}"
+            else:
+                message = None
+            if message:
+                errors.extend(f"Row {row['number']}: {message}" for row in rows)
+                del groups[code]
+                continue
+
+            if current is None:
+                product = Product(
+                    model_code=code,
+                    store_id=store_id,
+                    name=values['name'],
+                    description=values['description'] or '',
+                    category_id=values['category_id'],
+                    brand_id=values['brand_id'],
+                    base_price=values['base_price'] or Decimal('0'),
+                    is_active=values['is_active'] if values['is_active'] is not None else True,
+                )
+                product.min_price = product.max_price = product.base_price
+                new.append(product)
+            else:
+                # Bản mới không có pk: INSERT ... ON CONFLICT (model_code) DO UPDATE
+                product = Product(
+                    model_code=code,
+                    slug=current.slug,
+                    store_id=store_id,
+                    min_price=current.min_price,
+                    max_price=current.max_price,
+                    **{
+                        field: value if value is not None else getattr(current, field)
+                        for field, value in values.items()
+                    }
+                )
+            products.append(product)
+
+        assign_identifiers(new)
+        Product.objects.bulk_create(
+            products,
+            update_conflicts=True,
+            unique_fields=['model_code'],
+            update_fields=PRODUCT_UPDATE_FIELDS
+        )
+        product_ids = dict(Product.objects.filter(model_code__in=groups.keys()).values_list('model_code', 'pk'))
+        # post_save không chạy => tạo dòng thống kê như create_product_sales_stats
+        ProductSalesStats.objects.bulk_create(
+            [ProductSalesStats(product_id=product_ids[product.model_code]) for product in new],
+            ignore_conflicts=True
+        )
+        return product_ids, len(new), len(products) - len(new)
+
+    def _upsert_variants(self, groups, product_ids, errors):
+        """bulk_create(update_conflicts) variant của khối; trả về (số mới, số cập nhật)"""
+        rows = [row for code, group in groups.items() for row in group if row['sku']]
+        # Khóa các SKU đã có tới hết transaction của khối: trừ kho đồng thời (adjust_stock) chờ
+        # => chênh lệch ghi sổ cái tính trên tồn kho thật, không ghi đè mất lần trừ kho
+        existing = {
+            sku: (variant_id, product_id, stock, price, weight, option_combinations)
+            for sku, variant_id, product_id, stock, price, weight, option_combinations in
+            ProductVariant.objects.select_for_update().filter(sku__in={row['sku'] for row in rows})
+            .order_by('pk')
+            .values_list('sku', 'pk', 'product_id', 'stock', 'price', 'weight', 'option_combinations')
+        }
+        base_prices = dict(Product.objects.filter(pk__in=product_ids.values()).values_list('pk', 'base_price'))
+
+        variants, seen, options = [], set(), set()
+        stock_changes, price_changes = {}, []
+        for row in rows:
+            sku, product_id = row['sku'], product_ids[row['model_code']]
+            current = existing.get(sku)
+            if sku in seen:
+                errors.append(f"Row {row['number']}: duplicate sku {sku} in file")
+                continue
+            if current is not None and current[1] != product_id:
+                errors.append(f"Row {row['number']}: sku {sku} belongs to another product")
+                continue
+            price = row['price'] or (current[3] if current else base_prices[product_id])
+            if not price or price <= 0:
+                errors.append(f"Row {row['number']}: price is required (base_price is 0)")
+                continue
+            seen.add(sku)
+            variant = ProductVariant(
+                product_id=product_id,
+                sku=sku,
+                price=price,
+                stock=row['stock'] if row['stock'] is not None else (current[2] if current else 0),
+                weight=row['weight'] or (current[4] if current else ProductVariant._meta.get_field('weight').default),
+                option_combinations=row['options'] if row['options'] is not None else (current[5] if current else {}),
+            )
+            variants.append(variant)
+            for name, value in (row['options'] or {}).items():
+                options.add((product_id, self.attributes[name.lower()][0], value))
+            if current is not None:
+                if variant.stock != current[2]:
+                    stock_changes[current[0]] = variant.stock - current[2]
+                price_changes.append((current[0], current[3], variant.price))
+
+        ProductAttributeOption.objects.bulk_create([
+            ProductAttributeOption(product_id=product_id, attribute_id=attribute_id, value=value)
+            for product_id, attribute_id, value in options
+        ], ignore_conflicts=True)
+        ProductVariant.objects.bulk_create(
+            variants,
+            update_conflicts=True,
+            unique_fields=['sku'],
+            update_fields=VARIANT_UPDATE_FIELDS
+        )
+        user_id = self.job.user_id
+        record_stock_changes(stock_changes, source='import', user=user_id)
+        # SKU mới: tồn kho ban đầu (bulk_create không bắn post_save)
+        record_stock_changes({
+            variant.pk: variant.stock for variant in variants if variant.sku not in existing
+        }, source='create', user=user_id)
+        record_price_changes(price_changes, source='import', user=user_id)
+        created = sum(1 for variant in variants if variant.sku not in existing)
+        return created, len(variants) - created
+
+    def process_chunk(self, records):
+        """
+        Ghi một khối [(số dòng, dict | ValueError)] trong một transaction
+        Trả về danh sách lỗi "Row N: ..." của khối
+        """
+        errors, rows = [], []
+        for number, record in records:
+            if isinstance(record, Exception):
+                errors.append(f"Row {number}: {record}")
+                continue
+            try:
+                rows.append(self.parse_row(number, record))
+            except (ValueError, TypeError, ArithmeticError) as e:
+                errors.append(f"Row {number}: {e}")
+
+        job = self.job
+        with transaction.atomic(), variant_summary_batch():
+            if rows:
+                groups = self._group_products(rows)
+                product_ids, created_products, updated_products = self._upsert_products(groups, errors)
+                created_variants, updated_variants = self._upsert_variants(groups, product_ids, errors)
+                # Option mới / variant mới => đồng bộ chỉ mục + tóm tắt của các product trong khối
+                schedule_variant_options(product_ids=product_ids.values())
+                schedule_variant_summary(product_ids.values())
+                job.created_products += created_products
+                job.updated_products += updated_products
+                job.created_variants += created_variants
+                job.updated_variants += updated_variants
+            self._advance(len(records), errors)
+        return errors
+
+    def _advance(self, count, errors):
+        job = self.job
+        job.processed_rows += count
+        job.error_count += len(errors)
+        job.errors = (job.errors + errors)[:MAX_JOB_ERRORS]
+        job.save(update_fields=[
+            'processed_rows', 'created_products', 'updated_products', 'created_variants',
+            'updated_variants', 'error_count', 'errors', 'updated_at'
+        ])
+
+    def run(self):
+        """Đọc file từ dòng chưa xử lý tới hết, mỗi khối một transaction"""
+        job = self.job
+        try:
+            with job.file.open('rb') as file:
+                records = islice(iter_records(file, job.format), job.processed_rows, None)
+                while True:
+                    chunk = list(islice(records, self.chunk_size))
+                    if not chunk:
+                        break
+                    try:
+                        self.process_chunk(chunk)
+                    except Exception as e:
+                        # Khối đã rollback => ghi nhận cả khối là lỗi, đi tiếp khối sau
+                        job.refresh_from_db(fields=[
+                            'processed_rows', 'created_products', 'updated_products',
+                            'created_variants', 'updated_variants', 'error_count', 'errors'
+                        ])
+                        self._advance(len(chunk), [f"Row {chunk[0][0]} - Row {chunk[-1][0]}: {e}"])
+            job.status = 'completed'
+            job.total_rows = job.processed_rows
+        except (ValueError, OSError) as e:
+            job.status = 'failed'
+            job.errors = (job.errors + [f"File: {e}"])[:MAX_JOB_ERRORS]
+        job.finished_at = timezone.now()
+        job.save(update_fields=['status', 'total_rows', 'errors', 'finished_at', 'updated_at'])
+        return job
+
+
+# ===== CHẠY JOB =====
+
+def claim_job(job_id, stale_after=None):
+    """
+    Chuyển job sang running (một câu UPDATE có điều kiện => hai worker không chạy trùng)
+    stale_after: nhận cả job "running" không cập nhật quá khoảng này (process đã chết)
+    """
+    claimable = Q(status='pending')
+    if stale_after is not None:
+        claimable |= Q(status='running', updated_at__lt=timezone.now() - stale_after)
+    now = timezone.now()
+    return ProductImportJob.objects.filter(claimable, pk=job_id).update(
+        status='running',
+        started_at=Coalesce(F('started_at'), Value(now)),
+        updated_at=now
+    ) == 1
+
+
+def run_import(job_id, stale_after=None, chunk_size=CHUNK_SIZE):
+    """Chạy (hoặc chạy tiếp) một job; None nếu job không chờ / đang do worker khác chạy"""
+    if not claim_job(job_id, stale_after):
+        return None
+    return ProductImporter(ProductImportJob.objects.get(pk=job_id), chunk_size).run()
+
+
+def start_import(job_id):
+    """
+    Sau khi transaction tạo job commit: chạy job ở thread nền của process
+    PRODUCT_IMPORT_RUN_IN_THREAD = False => để `python manage.py process_product_imports` chạy
+    """
+    if not RUN_IN_THREAD:
+        return
+
+    def run():
+        try:
+            run_import(job_id)
+        finally:
+            connection.close()
+
+    transaction.on_commit(
+        lambda: threading.Thread(target=run, name=f'product-import-{job_id}', daemon=True).start()
+    )
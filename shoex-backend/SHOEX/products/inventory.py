@@ -0,0 +1,194 @@
+"""
+Trừ / cộng tồn kho nguyên tử và giữ hàng có thời hạn
+
+Không đọc stock vào Python rồi save() (hai checkout cùng đọc "còn 1" sẽ cùng trừ).
+Mọi thay đổi kho đi qua adjust_stock(): MỘT câu UPDATE cho nhiều SKU
+
+    UPDATE variant SET stock = stock + CASE variant_id WHEN 1 THEN -2 WHEN 2 THEN -1 END
+    WHERE (variant_id = 1 AND stock >= 2) OR (variant_id = 2 AND stock >= 1)
+
+Số dòng cập nhật < số SKU => có SKU không đủ hàng => rollback cả lô (all-or-nothing).
+Điều kiện nằm trên chính bảng được UPDATE nên PostgreSQL kiểm tra lại sau khi chờ
+row lock => 1.000 người mua cùng một SKU vẫn không bán vượt. CheckConstraint
+variant_stock_non_negative là chốt chặn cuối.
+
+Giữ hàng (StockReservation):
+- reserve_stock: trừ kho + tạo bản ghi held có expires_at (gắn giỏ hàng / đơn hàng)
+- commit_reservations: chốt vào đơn (không hết hạn nữa)
+- release_reservations / release_expired_reservations: trả kho theo lô
+- restock_orders: đơn bị hủy => trả lại phần đã chốt
+
+UPDATE bỏ qua save() => tóm tắt variant (total_stock, availability_matrix) không tính lại
+trong checkout: product được đánh dấu variant_summary_stale cùng transaction (xem
+mark_variant_summary_stale), `python manage.py refresh_variant_summaries` tính lại theo lô.
+Mỗi lần đổi kho được ghi sổ cái InventoryLedger theo lô (xem history.py).
+"""
+
+from collections import Counter
+from datetime import timedelta
+from functools import reduce
+from operator import or_
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, Q, Value, When
+from django.utils import timezone
+
+from .history import record_stock_changes
+from .models import ProductVariant, StockReservation
+from .utils import mark_variant_summary_stale
+
+
+RESERVATION_TTL = getattr(settings, 'STOCK_RESERVATION_TTL', timedelta(minutes=15))
+
+
+class InsufficientStock(Exception):
+    """Một hoặc nhiều SKU không đủ hàng"""
+
+    def __init__(self, variant_ids):
+        self.variant_ids = sorted(variant_ids)
+        super().__init__(f"Không đủ tồn kho cho variant {', '.join(map(str, self.variant_ids))}")
+
+
+# ===== THAY ĐỔI TỒN KHO =====
+
+def _variant_product_ids(variant_ids):
+    return set(ProductVariant.objects.filter(pk__in=variant_ids).values_list('product_id', flat=True))
+
+
+def adjust_stock(changes, source='adjust', reason='', user=None, log=True, product_ids=None):
+    """
+    Cộng / trừ kho nhiều SKU trong một câu UPDATE
+    changes: {variant_id: delta} (delta âm = trừ kho)
+    Raise InsufficientStock (không SKU nào bị đổi) nếu có SKU không đủ hàng
+    source / reason / user: ghi vào sổ cái; log=False khi người gọi tự ghi sổ
+    (ví dụ bulk update ghi từng dòng kèm lý do riêng)
+    product_ids: product của các SKU nếu người gọi đã biết => không SELECT lại
+    """
+    changes = {int(variant_id): int(delta) for variant_id, delta in changes.items() if delta}
+    if not changes:
+        return
+    condition = reduce(or_, (
+        Q(pk=variant_id, stock__gte=-delta) if delta < 0 else Q(pk=variant_id)
+        for variant_id, delta in changes.items()
+    ))
+    delta = Case(
+        *(When(pk=variant_id, then=Value(delta)) for variant_id, delta in changes.items()),
+        default=Value(0),
+        output_field=IntegerField()
+    )
+    with transaction.atomic():
+        if len(changes) > 1:
+            # Khóa theo thứ tự variant_id => hai giỏ chung nhiều SKU không deadlock
+            list(ProductVariant.objects.select_for_update().filter(pk__in=changes.keys())
+                 .order_by('pk').values_list('pk', flat=True))
+        updated = ProductVariant.objects.filter(condition).update(stock=F('stock') + delta)
+        if updated != len(changes):
+            # Có SKU không đủ hàng => hủy cả câu UPDATE (savepoint)
+            transaction.set_rollback(True)
+        else:
+            mark_variant_summary_stale(product_ids if product_ids is not None else _variant_product_ids(changes))
+    if updated != len(changes):
+        stock = dict(ProductVariant.objects.filter(pk__in=changes.keys()).values_list('pk', 'stock'))
+        raise InsufficientStock([
+            variant_id for variant_id, delta in changes.items()
+            if variant_id not in stock or stock[variant_id] + delta < 0
+        ])
+    if log:
+        record_stock_changes(changes, source, reason, user)
+
+
+# ===== GIỮ HÀNG =====
+
+def reserve_stock(quantities, cart=None, order=None, ttl=None, product_ids=None):
+    """
+    Trừ kho và giữ hàng cho giỏ / đơn trong `ttl` (mặc định STOCK_RESERVATION_TTL)
+    quantities: {variant_id: số lượng > 0}, product_ids: như adjust_stock
+    Trả về danh sách StockReservation; thiếu hàng => InsufficientStock, không giữ gì
+    """
+    quantities = {int(variant_id): int(quantity) for variant_id, quantity in quantities.items()}
+    if any(quantity <= 0 for quantity in quantities.values()):
+        raise ValueError("Số lượng giữ hàng phải lớn hơn 0")
+    expires_at = timezone.now() + (ttl or RESERVATION_TTL)
+    with transaction.atomic():
+        adjust_stock(
+            {variant_id: -quantity for variant_id, quantity in quantities.items()},
+            source='reservation',
+            product_ids=product_ids
+        )
+        return StockReservation.objects.bulk_create([
+            StockReservation(
+                variant_id=variant_id,
+                cart=cart,
+                order=order,
+                quantity=quantity,
+                expires_at=expires_at,
+            )
+            for variant_id, quantity in quantities.items()
+        ])
+
+
+def release_queryset(queryset, skip_locked=False):
+    """Trả kho cho các reservation trong queryset (đã lọc status), trả về số reservation"""
+    with transaction.atomic():
+        # Khóa trước => hai lần release đồng thời không cộng kho hai lần
+        rows = list(
+            queryset.select_for_update(skip_locked=skip_locked, of=('self',))
+            .values_list('pk', 'variant_id', 'quantity', 'variant__product_id')
+        )
+        if not rows:
+            return 0
+        StockReservation.objects.filter(pk__in=[row[0] for row in rows])\
+            .update(status='released', updated_at=timezone.now())
+        restock = Counter()
+        for _, variant_id, quantity, _ in rows:
+            restock[variant_id] += quantity
+        adjust_stock(restock, source='release', product_ids={row[3] for row in rows})
+        return len(rows)
+
+
+def release_reservations(cart=None, order=None):
+    """Trả lại hàng đang giữ của giỏ / đơn (bỏ giỏ, đổi số lượng, thanh toán thất bại)"""
+    queryset = StockReservation.objects.filter(status='held')
+    if cart is not None:
+        queryset = queryset.filter(cart=cart)
+    if order is not None:
+        queryset = queryset.filter(order=order)
+    return release_queryset(queryset)
+
+
+def commit_reservations(order, cart=None):
+    """Chốt hàng đang giữ (của cart nếu có, không thì của chính order) vào đơn hàng"""
+    queryset = StockReservation.objects.filter(status='held')
+    queryset = queryset.filter(cart=cart) if cart is not None else queryset.filter(order=order)
+    return queryset.update(status='committed', order=order, updated_at=timezone.now())
+
+
+def restock_orders(order_ids):
+    """Đơn bị hủy => trả kho phần hàng đã chốt (gọi lại nhiều lần không cộng trùng)"""
+    return release_queryset(StockReservation.objects.filter(
+        order_id__in=order_ids,
+        status__in=['held', 'committed']
+    ))
+
+
+def release_expired_reservations(now=None, batch_size=1000):
+    """
+    Trả kho cho các lần giữ hàng đã hết hạn, theo lô (chạy định kỳ:
+    `python manage.py release_expired_reservations`)
+    Dòng đang bị transaction khác khóa được bỏ qua, lần quét sau xử lý
+    """
+    now = now or timezone.now()
+    released = 0
+    while True:
+        batch = StockReservation.objects.filter(
+            pk__in=list(
+                StockReservation.objects.filter(status='held', expires_at__lt=now)
+                .order_by('expires_at').values_list('pk', flat=True)[:batch_size]
+            ),
+            status='held'
+        )
+        count = release_queryset(batch, skip_locked=True)
+        released += count
+        if count < batch_size:
+            return released
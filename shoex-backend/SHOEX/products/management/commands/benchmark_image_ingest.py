@@ -0,0 +1,155 @@
+"""
+Đo CPU và bộ nhớ đỉnh cho mỗi ảnh upload (ảnh điện thoại 12MP mặc định):
+    python manage.py benchmark_image_ingest
+    python manage.py benchmark_image_ingest --file photo.jpg --runs 5
+
+So sánh:
+- legacy:  validate_image + resize_image (800x600) + create_thumbnail - đường upload cũ,
+           giải mã đầy đủ ảnh gốc hai lần, chỉ ra 2 bản
+- decode:  giải mã đầy đủ một lần, mỗi bản resize lại từ ảnh gốc (không draft)
+- ingest:  validate_image (chỉ header + hash) + render_image (JPEG draft, resize nối tiếp),
+           ra đủ RENDITION_WIDTHS x JPEG / WebP
+Mỗi lần đo chạy trong process con riêng (fork) => CPU / bộ nhớ đỉnh không lẫn giữa các cách.
+File sinh ra ghi vào thư mục tạm, không đụng MEDIA_ROOT.
+"""
+
+import multiprocessing
+import os
+import resource
+import statistics
+import tempfile
+import time
+from io import BytesIO
+
+from PIL import Image, ImageOps
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import override_settings
+
+from SHOEX.products.images import RENDITION_FORMATS, render_image, store_original
+from SHOEX.products.models import ProductImage
+from SHOEX.products.utils import create_thumbnail, resize_image, validate_image
+
+
+def _sample_photo(width, height):
+    """Ảnh giả lập ảnh chụp (nhiễu + chi tiết) => kích thước JPEG gần ảnh thật"""
+    detail = Image.effect_mandelbrot((width, height), (-2.2, -1.2, 1.0, 1.2), 60)
+    noise = Image.effect_noise((width, height), 40)
+    gradient = Image.linear_gradient('L').resize((width, height))
+    image = Image.merge('RGB', (detail, noise, gradient))
+    output = BytesIO()
+    image.save(output, format='JPEG', quality=90)
+    return output.getvalue()
+
+
+def _legacy(data, name, widths):
+    upload = SimpleUploadedFile(name, data)
+    if not validate_image(upload)['valid']:
+        raise ValueError('invalid image')
+    upload.seek(0)
+    resize_image(upload)
+    upload.seek(0)
+    create_thumbnail(upload)
+
+
+def _decode(data, name, widths):
+    upload = SimpleUploadedFile(name, data)
+    validate_image(upload)
+    source = ImageOps.exif_transpose(Image.open(BytesIO(data)).convert('RGB'))
+    for width in sorted(widths.values(), reverse=True):
+        width = min(width, source.width)
+        image = source.resize((width, max(1, round(source.height * width / source.width))), Image.Resampling.LANCZOS)
+        for pil_format, _, options in RENDITION_FORMATS.values():
+            image.save(BytesIO(), format=pil_format, **options)
+
+
+def _ingest(data, name, widths):
+    upload = SimpleUploadedFile(name, data)
+    if not validate_image(upload)['valid']:
+        raise ValueError('invalid image')
+    render_image(store_original(ProductImage, upload), widths, ProductImage._meta.get_field('image').storage)
+
+
+PATHS = {
+    'legacy': _legacy,
+    'decode': _decode,
+    'ingest': _ingest,
+}
+
+
+def _rss_kb(field):
+    with open('/proc/self/status') as status:
+        for line in status:
+            if line.startswith(field):
+                return int(line.split()[1])
+    raise OSError(field)
+
+
+def _measure(path, data, name, widths, pipe):
+    """Chạy trong process con: (CPU ms, wall ms, bộ nhớ tăng thêm lúc đỉnh MB)"""
+    try:
+        try:
+            # Đặt lại VmHWM về RSS hiện tại (Linux) => đo đúng đỉnh của lần chạy này
+            with open('/proc/self/clear_refs', 'w') as clear_refs:
+                clear_refs.write('5')
+            baseline = _rss_kb('VmRSS:')
+            peak = lambda: _rss_kb('VmHWM:')
+        except OSError:
+            baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            peak = lambda: resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        cpu, wall = time.process_time(), time.perf_counter()
+        PATHS[path](data, name, widths)
+        pipe.send((
+            (time.process_time() - cpu) * 1000,
+            (time.perf_counter() - wall) * 1000,
+            (peak() - baseline) / 1024,
+        ))
+    except Exception as e:
+        pipe.send(e)
+    finally:
+        pipe.close()
+
+
+class Command(BaseCommand):
+    help = 'Benchmark per-upload CPU time and peak memory of image ingest (legacy vs single decode)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--file', help='Ảnh dùng để đo (mặc định ảnh giả lập)')
+        parser.add_argument('--width', type=int, default=4032)
+        parser.add_argument('--height', type=int, default=3024)
+        parser.add_argument('--runs', type=int, default=3)
+        parser.add_argument('--path', choices=PATHS, action='append', help='Chỉ đo các cách này')
+
+    def handle(self, *args, **options):
+        if options['file']:
+            with open(options['file'], 'rb') as file:
+                data = file.read()
+            name = os.path.basename(options['file'])
+        else:
+            data = _sample_photo(options['width'], options['height'])
+            name = 'sample.jpg'
+        with Image.open(BytesIO(data)) as image:
+            self.stdout.write(
+                f'{name}: {image.width}x{image.height} {image.format}, {len(data) / 2**20:.1f}MB, '
+                f'{options["runs"]} runs each'
+            )
+
+        context = multiprocessing.get_context('fork')
+        widths = ProductImage.RENDITION_WIDTHS
+        with tempfile.TemporaryDirectory() as media_root, override_settings(MEDIA_ROOT=media_root):
+            for path in options['path'] or PATHS:
+                results = []
+                for _ in range(options['runs']):
+                    receiver, sender = context.Pipe(duplex=False)
+                    process = context.Process(target=_measure, args=(path, data, name, widths, sender))
+                    process.start()
+                    result = receiver.recv()
+                    process.join()
+                    if isinstance(result, Exception):
+                        raise CommandError(f'{path}: {result}')
+                    results.append(result)
+                cpu, wall, memory = zip(*results)
+                self.stdout.write(
+                    f'{path:>7}: cpu {statistics.median(cpu):8.1f} ms   wall {statistics.median(wall):8.1f} ms   '
+                    f'peak +{max(memory):6.1f} MB'
+                )
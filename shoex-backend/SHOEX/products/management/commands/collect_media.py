@@ -0,0 +1,45 @@
+"""
+Xóa file media (và bản thu nhỏ) không còn dòng nào dùng, quá thời gian chờ
+Chạy định kỳ (cron mỗi giờ / mỗi đêm):
+    python manage.py collect_media
+    python manage.py collect_media --rebuild      # lần đầu / khi nghi ref_count lệch
+    python manage.py collect_media --dry-run --grace-hours 0
+"""
+
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+
+from SHOEX.products.media import GC_BATCH_SIZE, GC_GRACE, collect_media, rebuild_refcounts
+
+
+class Command(BaseCommand):
+    help = 'Delete unreferenced content-addressed media files after a grace period'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--grace-hours', type=float, default=GC_GRACE.total_seconds() / 3600,
+            help='Chỉ xóa file hết tham chiếu lâu hơn số giờ này'
+        )
+        parser.add_argument('--batch-size', type=int, default=GC_BATCH_SIZE, help='Số file mỗi lô')
+        parser.add_argument('--rebuild', action='store_true', help='Đếm lại tham chiếu từ các bảng trước khi xóa')
+        parser.add_argument('--dry-run', action='store_true', help='Chỉ đếm, không xóa')
+
+    def handle(self, *args, **options):
+        if options['batch_size'] <= 0:
+            raise CommandError('--batch-size must be positive')
+        if options['grace_hours'] < 0:
+            raise CommandError('--grace-hours must not be negative')
+        if options['rebuild']:
+            fixed, created = rebuild_refcounts(batch_size=options['batch_size'])
+            self.stdout.write(f'Reference counts: {fixed} fixed, {created} new blobs')
+
+        deleted, freed, revived = collect_media(
+            grace=timedelta(hours=options['grace_hours']),
+            batch_size=options['batch_size'],
+            dry_run=options['dry_run']
+        )
+        verb = 'Would delete' if options['dry_run'] else 'Deleted'
+        self.stdout.write(self.style.SUCCESS(
+            f'{verb} {deleted} files ({freed / 2**20:.1f} MB freed), {revived} still referenced'
+        ))
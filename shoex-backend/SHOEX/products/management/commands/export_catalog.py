@@ -0,0 +1,56 @@
+"""
+Xuất catalog (product + variant + ảnh) theo luồng ra file hoặc stdout:
+    python manage.py export_catalog --output catalog.ndjson.gz --gzip
+    python manage.py export_catalog --format csv --store 3 --output store3.csv
+    python manage.py export_catalog --since 2025-01-01T10:00:00+07:00 --output delta.ndjson
+"""
+
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from SHOEX.products.exports import EXPORT_CHUNK_SIZE, FORMATS, export_catalog, next_since
+
+
+class Command(BaseCommand):
+    help = 'Stream the product catalog (products, variants, images) as JSON lines or CSV'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--format', choices=FORMATS, default='ndjson')
+        parser.add_argument('--output', default='-', help='Đường dẫn file (mặc định stdout)')
+        parser.add_argument('--since', help='Chỉ product thay đổi từ thời điểm này (ISO 8601)')
+        parser.add_argument('--store', help='Chỉ product của store')
+        parser.add_argument('--inactive', action='store_true', help='Gồm cả product đã ẩn (bản đầy đủ)')
+        parser.add_argument('--gzip', action='store_true', help='Nén gzip')
+        parser.add_argument('--chunk-size', type=int, default=EXPORT_CHUNK_SIZE, help='Số product mỗi khối')
+
+    def handle(self, *args, **options):
+        since = None
+        if options['since']:
+            since = parse_datetime(options['since'])
+            if since is None:
+                raise CommandError('--since must be an ISO 8601 datetime')
+            if timezone.is_naive(since):
+                since = timezone.make_aware(since)
+
+        resume_at = next_since()
+        chunks = export_catalog(
+            options['format'],
+            since=since,
+            store_id=options['store'],
+            include_inactive=options['inactive'],
+            compress=options['gzip'],
+            chunk_size=options['chunk_size']
+        )
+        if options['output'] == '-':
+            for chunk in chunks:
+                sys.stdout.buffer.write(chunk)
+            sys.stdout.buffer.flush()
+        else:
+            with open(options['output'], 'wb') as file:
+                for chunk in chunks:
+                    file.write(chunk)
+        # Ra stderr để không lẫn vào dữ liệu khi xuất ra stdout
+        self.stderr.write(f'Use --since {resume_at.isoformat()} for the next delta')
@@ -0,0 +1,56 @@
+"""
+Tạo các biến thể còn thiếu từ tùy chọn thuộc tính (tích Descartes) cho nhiều product:
+    python manage.py generate_variants --product 12 --product 15
+    python manage.py generate_variants --store 3 --stock 10
+    python manage.py generate_variants --all
+"""
+
+from django.core.management.base import BaseCommand, CommandError
+
+from SHOEX.products.models import Product
+from SHOEX.products.variants import generate_variants
+
+
+class Command(BaseCommand):
+    help = 'Generate missing variants from product attribute options (cartesian product)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--product', type=int, action='append', default=[], help='product_id (lặp lại được)')
+        parser.add_argument('--store', type=int, help='Mọi product của store')
+        parser.add_argument('--all', action='store_true', help='Mọi product đang active')
+        parser.add_argument('--stock', type=int, default=0, help='Tồn kho ban đầu của variant mới')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Số variant mỗi lần bulk_create')
+        parser.add_argument('--chunk', type=int, default=500, help='Số product mỗi lần gọi (mỗi lần một transaction)')
+
+    def handle(self, *args, **options):
+        if options['product']:
+            queryset = Product.objects.filter(pk__in=options['product'])
+        elif options['store']:
+            queryset = Product.objects.filter(store_id=options['store'])
+        elif options['all']:
+            queryset = Product.objects.filter(is_active=True)
+        else:
+            raise CommandError('Use --product, --store or --all')
+        if options['stock'] < 0:
+            raise CommandError('--stock must not be negative')
+
+        product_ids = list(queryset.order_by('pk').values_list('pk', flat=True))
+        created = skipped = 0
+        for start in range(0, len(product_ids), options['chunk']):
+            try:
+                result = generate_variants(
+                    product_ids[start:start + options['chunk']],
+                    stock=options['stock'],
+                    batch_size=options['batch_size']
+                )
+            except ValueError as e:
+                raise CommandError(str(e))
+            created += sum(count for count in result.values() if count)
+            skipped += sum(1 for count in result.values() if count is None)
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'Created {created} variants for {len(product_ids)} products '
+                f'({skipped} without attribute options)'
+            )
+        )
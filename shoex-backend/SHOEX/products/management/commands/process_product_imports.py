@@ -0,0 +1,44 @@
+"""
+Chạy các lần nhập sản phẩm đang chờ (PRODUCT_IMPORT_RUN_IN_THREAD = False) và chạy tiếp
+các lần nhập bị dừng giữa chừng (process chết khi đang chạy):
+    python manage.py process_product_imports
+    python manage.py process_product_imports --job 12 --stale-minutes 5
+"""
+
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+from django.utils import timezone
+
+from SHOEX.products.imports import STALE_AFTER, run_import
+from SHOEX.products.models import ProductImportJob
+
+
+class Command(BaseCommand):
+    help = 'Run pending product import jobs and resume stalled ones'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--job', type=int, action='append', default=[], help='job_id (lặp lại được)')
+        parser.add_argument(
+            '--stale-minutes', type=int, default=int(STALE_AFTER.total_seconds() // 60),
+            help='Job "running" không cập nhật quá số phút này => chạy tiếp'
+        )
+
+    def handle(self, *args, **options):
+        stale_after = timedelta(minutes=options['stale_minutes'])
+        queryset = ProductImportJob.objects.filter(
+            Q(status='pending') | Q(status='running', updated_at__lt=timezone.now() - stale_after)
+        )
+        if options['job']:
+            queryset = queryset.filter(pk__in=options['job'])
+
+        for job_id in queryset.order_by('created_at').values_list('pk', flat=True):
+            job = run_import(job_id, stale_after=stale_after)
+            if job is None:
+                continue
+            self.stdout.write(
+                f'Import #{job.pk}: {job.status}, {job.processed_rows} rows, '
+                f'{job.created_products + job.updated_products} products, '
+                f'{job.created_variants + job.updated_variants} variants, {job.error_count} errors'
+            )
@@ -0,0 +1,19 @@
+"""
+Dựng lại bảng CategoryClosure từ Category.parent_id
+Dùng sau khi sửa cây danh mục bằng queryset.update() / SQL tay:
+    python manage.py rebuild_category_closure
+"""
+
+from django.core.management.base import BaseCommand
+
+from SHOEX.products.models import CategoryClosure
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the CategoryClosure (ancestor, descendant, depth) table from Category.parent'
+
+    def handle(self, *args, **options):
+        count = CategoryClosure.rebuild()
+        self.stdout.write(
+            self.style.SUCCESS(f'Rebuilt category closure for {count} categories')
+        )
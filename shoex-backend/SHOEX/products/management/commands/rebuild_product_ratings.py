@@ -0,0 +1,44 @@
+"""
+Đối soát tổng hợp đánh giá trên Product (rating, review_count, rating_sum, histogram 1-5 sao)
+với bảng Review, tính lại theo lô và ghi các product bị lệch:
+    python manage.py rebuild_product_ratings
+    python manage.py rebuild_product_ratings --dry-run
+    python manage.py rebuild_product_ratings --product 12 --product 15
+"""
+
+from django.core.management.base import BaseCommand, CommandError
+
+from SHOEX.products.models import Product
+
+
+class Command(BaseCommand):
+    help = 'Rebuild product rating aggregates (sum, count, average, 1-5 star histogram) from reviews'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--product',
+            type=int,
+            action='append',
+            dest='products',
+            help='Chỉ tính lại cho product_id này (có thể lặp lại)'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Số product mỗi lô'
+        )
+        parser.add_argument('--dry-run', action='store_true', help='Chỉ báo số product lệch, không ghi')
+
+    def handle(self, *args, **options):
+        if options['batch_size'] <= 0:
+            raise CommandError('--batch-size must be positive')
+        checked, drifted = Product.rebuild_ratings(
+            product_ids=options['products'],
+            batch_size=options['batch_size'],
+            dry_run=options['dry_run']
+        )
+        verb = 'would be fixed' if options['dry_run'] else 'fixed'
+        self.stdout.write(
+            self.style.SUCCESS(f'Checked {checked} products, {drifted} {verb}')
+        )
@@ -0,0 +1,38 @@
+"""
+Tính lại bảng rollup ProductSalesStats từ OrderItem / Review
+Chạy định kỳ (vd mỗi đêm) để làm mới cửa sổ 30 ngày:
+    python manage.py rebuild_product_stats
+    python manage.py rebuild_product_stats --product 12 --product 15
+"""
+
+from django.core.management.base import BaseCommand
+
+from SHOEX.products.models import ProductSalesStats
+
+
+class Command(BaseCommand):
+    help = 'Rebuild ProductSalesStats (sold count, 30-day sales and rating) from orders and reviews'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--product',
+            type=int,
+            action='append',
+            dest='products',
+            help='Chỉ tính lại cho product_id này (có thể lặp lại)'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Số product mỗi lô'
+        )
+
+    def handle(self, *args, **options):
+        count = ProductSalesStats.rebuild(
+            product_ids=options['products'],
+            batch_size=options['batch_size']
+        )
+        self.stdout.write(
+            self.style.SUCCESS(f'Rebuilt sales stats for {count} products')
+        )
@@ -0,0 +1,27 @@
+"""
+Dựng lại chỉ mục VariantOptionValue từ ProductVariant.option_combinations
+Dùng sau khi sửa variant / option bằng queryset.update() hoặc SQL tay:
+    python manage.py rebuild_variant_options
+"""
+
+from django.core.management.base import BaseCommand
+
+from SHOEX.products.models import VariantOptionValue
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the VariantOptionValue index from ProductVariant.option_combinations'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Số product mỗi lô'
+        )
+
+    def handle(self, *args, **options):
+        count = VariantOptionValue.rebuild(batch_size=options['batch_size'])
+        self.stdout.write(
+            self.style.SUCCESS(f'Indexed {count} variant option values')
+        )
@@ -0,0 +1,28 @@
+"""
+Tính lại tóm tắt variant (min/max price, total_stock, variant_count, availability_matrix)
+của các product có kho đổi qua checkout / giữ hàng (variant_summary_stale)
+Chạy định kỳ (cron mỗi phút):
+    python manage.py refresh_variant_summaries
+"""
+
+from django.core.management.base import BaseCommand
+
+from SHOEX.products.utils import refresh_stale_variant_summaries
+
+
+class Command(BaseCommand):
+    help = 'Refresh variant summaries of products marked stale by stock changes'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='Số product mỗi lô'
+        )
+
+    def handle(self, *args, **options):
+        count = refresh_stale_variant_summaries(batch_size=options['batch_size'])
+        self.stdout.write(
+            self.style.SUCCESS(f'Refreshed {count} product summaries')
+        )
@@ -0,0 +1,27 @@
+"""
+Trả lại kho cho các lần giữ hàng (StockReservation) đã hết hạn
+Chạy định kỳ (cron mỗi phút):
+    python manage.py release_expired_reservations
+"""
+
+from django.core.management.base import BaseCommand
+
+from SHOEX.products.inventory import release_expired_reservations
+
+
+class Command(BaseCommand):
+    help = 'Release expired stock reservations back to variant stock'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Số reservation mỗi lô'
+        )
+
+    def handle(self, *args, **options):
+        count = release_expired_reservations(batch_size=options['batch_size'])
+        self.stdout.write(
+            self.style.SUCCESS(f'Released {count} expired reservations')
+        )
@@ -0,0 +1,65 @@
+"""
+Sinh bản thu nhỏ cho ảnh đang chờ (IMAGE_RENDITIONS_IN_THREAD = False, ảnh cũ trước khi có
+bản thu nhỏ, worker bị dừng giữa chừng) và render lại hàng loạt, song song bằng process pool:
+    python manage.py render_images
+    python manage.py render_images --all --workers 8
+    python manage.py render_images --model option --failed
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from SHOEX.products.images import RENDITION_MODELS, STALE_AFTER, process_renditions, rerender
+
+
+class Command(BaseCommand):
+    help = 'Generate image renditions (thumbnail, 400/800/1600px, JPEG + WebP) for pending or all images'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--model', choices=RENDITION_MODELS, action='append', help='product / option (mặc định cả hai)')
+        parser.add_argument('--all', action='store_true', help='Render lại mọi ảnh')
+        parser.add_argument('--failed', action='store_true', help='Thử lại các ảnh bị lỗi')
+        parser.add_argument('--workers', type=int, default=None, help='Số process (mặc định số CPU, 0 = chạy tuần tự)')
+        parser.add_argument('--batch-size', type=int, default=100, help='Số ảnh mỗi lần nhận việc')
+        parser.add_argument(
+            '--stale-minutes', type=int, default=int(STALE_AFTER.total_seconds() // 60),
+            help='Ảnh "processing" quá số phút này => render lại'
+        )
+
+    def handle(self, *args, **options):
+        if options['batch_size'] <= 0:
+            raise CommandError('--batch-size must be positive')
+        models = [RENDITION_MODELS[name] for name in options['model'] or RENDITION_MODELS]
+        stale_after = timedelta(minutes=options['stale_minutes'])
+        for model in models:
+            if options['all']:
+                rerender(model.objects.all())
+            elif options['failed']:
+                rerender(model.objects.filter(renditions_status='failed'))
+
+        executor = None
+        if options['workers'] != 0:
+            # Process con (fork) chỉ đọc / ghi storage, không dùng kết nối DB của process cha
+            connections.close_all()
+            executor = ProcessPoolExecutor(max_workers=options['workers'])
+        try:
+            for model in models:
+                ready = failed = 0
+                while True:
+                    batch_ready, batch_failed = process_renditions(
+                        model,
+                        stale_after=stale_after,
+                        limit=options['batch_size'],
+                        map=executor.map if executor else map
+                    )
+                    if not batch_ready and not batch_failed:
+                        break
+                    ready += batch_ready
+                    failed += batch_failed
+                self.stdout.write(f'{model._meta.verbose_name}: {ready} rendered, {failed} failed')
+        finally:
+            if executor:
+                executor.shutdown()
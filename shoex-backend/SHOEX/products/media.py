@@ -0,0 +1,224 @@
+"""
+Đếm tham chiếu và thu gom file media (ảnh sản phẩm / tùy chọn / danh mục / cửa hàng)
+
+- Các field trong MEDIA_FIELDS lưu qua media_storage (storage.py): tên theo SHA-256 nội dung,
+  cùng nội dung => một file dùng chung
+- Lưu / đổi / xóa dòng => MediaBlob.acquire / release trong cùng transaction (signals.py);
+  request không xóa file
+- collect_media(): xóa theo lô file hết tham chiếu quá grace (mặc định MEDIA_GC_GRACE_HOURS giờ)
+  kèm bản thu nhỏ; trước khi xóa kiểm tra lại trực tiếp trên các bảng => ref_count lệch
+  không làm mất file đang dùng
+- rebuild_refcounts(): đếm lại từ các bảng + nhận file mồ côi trong thư mục cas/
+  (transaction rollback sau khi đã lưu file...)
+
+Chạy: `python manage.py collect_media` (cron), `--rebuild` lần đầu / khi nghi lệch.
+"""
+
+import os
+import posixpath
+import re
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count
+from django.utils import timezone
+
+from SHOEX.store.models import Store, StoreImage
+from .models import Category, MediaBlob, Product, ProductAttributeOption, ProductImage
+from .storage import media_storage
+
+
+MEDIA_FIELDS = {
+    ProductImage: ('image',),
+    ProductAttributeOption: ('image',),
+    Category: ('thumbnail_image',),
+    Product: ('size_guide_image',),
+    Store: ('avatar', 'cover_image', 'logo'),
+    StoreImage: ('image',),
+}
+GC_GRACE = timedelta(hours=getattr(settings, 'MEDIA_GC_GRACE_HOURS', 24))
+GC_BATCH_SIZE = 500
+RENDITION_PATTERN = r'{stem}_\d+\.(jpg|webp)'
+
+
+# ===== THAM CHIẾU TỪ MỘT DÒNG (signals.py) =====
+
+def media_names(instance):
+    """Tên file media instance đang dùng (lặp tên nếu nhiều field cùng một file)"""
+    names = []
+    for field in MEDIA_FIELDS[type(instance)]:
+        file = getattr(instance, field)
+        if file and file.name:
+            names.append(file.name)
+    return names
+
+
+def remember_media(instance, update_fields=None):
+    """
+    pre_save: nhớ file đang lưu trong DB để tính chênh lệch sau khi lưu
+    _loaded_media (from_db / lần lưu trước): file không đổi => bỏ qua, không SELECT lại
+    """
+    fields = MEDIA_FIELDS[type(instance)]
+    instance._media_old = None
+    if instance._state.adding or instance.pk is None:
+        instance._media_old = []
+        return
+    if update_fields is not None and not set(fields) & set(update_fields):
+        return
+    loaded = getattr(instance, '_loaded_media', None)
+    if loaded is not None:
+        if sorted(media_names(instance)) != sorted(loaded):
+            instance._media_old = list(loaded)
+        return
+    row = type(instance).objects.filter(pk=instance.pk).values_list(*fields).first()
+    instance._media_old = [name for name in row or () if name]
+
+
+def update_media_refs(instance):
+    """post_save: +1 file mới, -1 file bị thay"""
+    old = getattr(instance, '_media_old', None)
+    if old is None:
+        return
+    new = media_names(instance)
+    added, removed = list(new), []
+    for name in old:
+        if name in added:
+            added.remove(name)
+        else:
+            removed.append(name)
+    MediaBlob.acquire(added)
+    MediaBlob.release(removed)
+    instance._media_old = None
+    instance._loaded_media = new
+
+
+def release_media(instance):
+    """post_delete: -1 mọi file của dòng"""
+    MediaBlob.release(media_names(instance))
+
+
+# ===== ĐẾM LẠI =====
+
+def count_references(names=None):
+    """{tên: số dòng đang dùng} trên mọi field trong MEDIA_FIELDS (names: chỉ đếm các tên này)"""
+    counts = {}
+    for model, fields in MEDIA_FIELDS.items():
+        for field in fields:
+            queryset = model.objects.exclude(**{field: ''}).filter(**{f'{field}__isnull': False})
+            if names is not None:
+                queryset = queryset.filter(**{f'{field}__in': names})
+            for name, count in queryset.values_list(field).annotate(count=Count('pk')).order_by():
+                counts[name] = counts.get(name, 0) + count
+    return counts
+
+
+def _content_files():
+    """Tên (trong storage) các file gốc dưới thư mục cas/ (bỏ qua renditions/)"""
+    root = media_storage.path(media_storage.prefix)
+    for directory, subdirectories, files in os.walk(root):
+        subdirectories[:] = [name for name in subdirectories if name != 'renditions']
+        relative = os.path.relpath(directory, media_storage.location).replace(os.sep, '/')
+        for filename in files:
+            yield posixpath.join(relative, filename)
+
+
+def rebuild_refcounts(batch_size=GC_BATCH_SIZE):
+    """
+    Đặt lại ref_count theo số dòng thực tế; tạo MediaBlob cho file chưa được ghi nhận
+    (file trước khi có bảng này, file mồ côi trong cas/). Trả về (số blob sửa, số blob mới)
+    """
+    counts = count_references()
+    before = MediaBlob.objects.count()
+    MediaBlob.track(list(counts))
+    orphans = []
+    for name in _content_files():
+        if name not in counts:
+            orphans.append(name)
+            if len(orphans) >= batch_size:
+                MediaBlob.track(orphans)
+                orphans = []
+    MediaBlob.track(orphans)
+    created = MediaBlob.objects.count() - before
+
+    fixed = 0
+    now = timezone.now()
+    stale = [
+        name for name, ref_count in MediaBlob.objects.values_list('name', 'ref_count').iterator(chunk_size=batch_size)
+        if counts.get(name, 0) != ref_count
+    ]
+    for name in stale:
+        count = counts.get(name, 0)
+        fixed += MediaBlob.objects.filter(name=name).update(ref_count=count, released_at=None if count else now)
+    return fixed, created
+
+
+# ===== THU GOM =====
+
+def _rendition_files(name, listings):
+    """Bản thu nhỏ của file gốc (images.rendition_name): <thư mục>/renditions/<tên>_<rộng>.<jpg|webp>"""
+    directory, filename = posixpath.split(name)
+    renditions = posixpath.join(directory, 'renditions')
+    if renditions not in listings:
+        try:
+            listings[renditions] = media_storage.listdir(renditions)[1]
+        except OSError:
+            listings[renditions] = []
+    pattern = re.compile(RENDITION_PATTERN.format(stem=re.escape(posixpath.splitext(filename)[0])))
+    return [posixpath.join(renditions, file) for file in listings[renditions] if pattern.fullmatch(file)]
+
+
+def _touched_since(name, cutoff):
+    try:
+        return media_storage.get_modified_time(name) >= cutoff
+    except OSError:
+        return False
+
+
+def collect_media(grace=GC_GRACE, batch_size=GC_BATCH_SIZE, dry_run=False):
+    """
+    Xóa file (và bản thu nhỏ) hết tham chiếu từ trước now - grace
+    Trả về (số file xóa, số byte giải phóng, số blob còn được dùng => sửa lại ref_count)
+    """
+    cutoff = timezone.now() - grace
+    deleted = freed = revived = 0
+    last = ''
+    listings = {}
+    while True:
+        names = list(
+            MediaBlob.objects.filter(ref_count=0, released_at__lt=cutoff, name__gt=last)
+            .order_by('name').values_list('name', flat=True)[:batch_size]
+        )
+        if not names:
+            break
+        last = names[-1]
+        with transaction.atomic():
+            # Khóa các blob => upload cùng nội dung (acquire) chờ tới khi xóa xong
+            names = list(
+                MediaBlob.objects.select_for_update()
+                .filter(name__in=names, ref_count=0, released_at__lt=cutoff)
+                .values_list('name', flat=True)
+            )
+            referenced = count_references(names)
+            orphans = [
+                name for name in names
+                if name not in referenced and not _touched_since(name, cutoff)
+            ]
+            if dry_run:
+                revived += len(referenced)
+            else:
+                for name, count in referenced.items():
+                    revived += MediaBlob.objects.filter(name=name).update(ref_count=count, released_at=None)
+            for name in orphans:
+                for file in [name] + _rendition_files(name, listings):
+                    try:
+                        freed += media_storage.size(file)
+                        if not dry_run:
+                            media_storage.purge(file)
+                    except OSError:
+                        pass
+            if dry_run:
+                deleted += len(orphans)
+            else:
+                deleted += MediaBlob.objects.filter(name__in=orphans).delete()[0]
+    return deleted, freed, revived
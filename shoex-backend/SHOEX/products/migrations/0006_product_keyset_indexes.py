@@ -0,0 +1,28 @@
+# Generated by Django 5.2.6 on 2026-10-18 04:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('brand', '0001_initial'),
+        ('collection', '0002_initial'),
+        ('products', '0005_alter_product_brand'),
+        ('store', '0003_addressstore'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['is_active', '-created_at', '-product_id'], name='product_active_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['is_active', 'base_price', 'product_id'], name='product_active_price_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['is_active', 'name', 'product_id'], name='product_active_name_idx'),
+        ),
+    ]
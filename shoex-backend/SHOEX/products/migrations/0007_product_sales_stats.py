@@ -0,0 +1,89 @@
+# Generated by Django 5.2.6 on 2026-10-18 04:05
+
+from datetime import timedelta
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.utils import timezone
+
+
+WINDOW_DAYS = 30
+
+
+def create_stats_rows(apps, schema_editor, batch_size=1000):
+    """
+    Tạo dòng thống kê cho product hiện có với số liệu từ OrderItem / Review
+    (cùng cách tính với ProductSalesStats.rebuild; migration không gọi được method của model)
+    """
+    Product = apps.get_model('products', 'Product')
+    ProductSalesStats = apps.get_model('products', 'ProductSalesStats')
+    OrderItem = apps.get_model('orders', 'OrderItem')
+    Review = apps.get_model('reviews', 'Review')
+
+    now = timezone.now()
+    since = now - timedelta(days=WINDOW_DAYS)
+    products = list(Product.objects.order_by('pk').values_list('pk', flat=True))
+    for start in range(0, len(products), batch_size):
+        batch = products[start:start + batch_size]
+        sales = {
+            row['variant__product_id']: row
+            for row in OrderItem.objects.filter(variant__product_id__in=batch)
+            .values('variant__product_id')
+            .annotate(
+                total=models.Sum('quantity'),
+                recent=models.Sum('quantity', filter=models.Q(order__created_at__gte=since))
+            )
+        }
+        ratings = {
+            row['order_item__variant__product_id']: row
+            for row in Review.objects.filter(
+                order_item__variant__product_id__in=batch,
+                order_item__order__created_at__gte=since
+            )
+            .values('order_item__variant__product_id')
+            .annotate(total=models.Sum('rating'), count=models.Count('pk'))
+        }
+        rows = []
+        for product_id in batch:
+            sale = sales.get(product_id, {})
+            rating = ratings.get(product_id, {})
+            rating_sum = rating.get('total') or 0
+            rating_count = rating.get('count') or 0
+            rows.append(ProductSalesStats(
+                product_id=product_id,
+                sold_count=sale.get('total') or 0,
+                sold_count_last_30=sale.get('recent') or 0,
+                rating_sum_last_30=rating_sum,
+                rating_count_last_30=rating_count,
+                avg_rating_last_30=rating_sum / rating_count if rating_count else 0.0,
+            ))
+        ProductSalesStats.objects.bulk_create(rows, batch_size=batch_size, ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0006_product_keyset_indexes'),
+        ('orders', '0002_initial'),
+        ('reviews', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductSalesStats',
+            fields=[
+                ('product', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='sales_stats', serialize=False, to='products.product', verbose_name='Sản phẩm')),
+                ('sold_count', models.IntegerField(db_index=True, default=0, verbose_name='Tổng số đã bán')),
+                ('sold_count_last_30', models.IntegerField(db_index=True, default=0, verbose_name='Số đã bán 30 ngày')),
+                ('rating_sum_last_30', models.IntegerField(default=0, verbose_name='Tổng điểm đánh giá 30 ngày')),
+                ('rating_count_last_30', models.IntegerField(default=0, verbose_name='Số đánh giá 30 ngày')),
+                ('avg_rating_last_30', models.FloatField(db_index=True, default=0.0, verbose_name='Điểm đánh giá trung bình 30 ngày')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Ngày cập nhật')),
+            ],
+            options={
+                'verbose_name': 'Thống kê bán hàng sản phẩm',
+                'verbose_name_plural': 'Thống kê bán hàng sản phẩm',
+            },
+        ),
+        migrations.RunPython(create_stats_rows, migrations.RunPython.noop),
+    ]
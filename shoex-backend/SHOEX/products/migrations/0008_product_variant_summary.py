@@ -0,0 +1,74 @@
+# Generated by Django 5.2.6 on 2026-10-18 04:07
+
+from django.db import migrations, models
+from django.db.models import Count, F, Max, Min, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+
+def fill_variant_summary(apps, schema_editor):
+    """Tính min_price, max_price, total_stock, variant_count cho product hiện có"""
+    Product = apps.get_model('products', 'Product')
+    ProductVariant = apps.get_model('products', 'ProductVariant')
+    active = ProductVariant.objects.filter(
+        product=OuterRef('pk'), is_active=True
+    ).order_by().values('product')
+
+    def summary(aggregate):
+        return Subquery(active.annotate(value=aggregate).values('value')[:1])
+
+    Product.objects.update(
+        min_price=Coalesce(summary(Min('price')), F('base_price')),
+        max_price=Coalesce(summary(Max('price')), F('base_price')),
+        total_stock=Coalesce(summary(Sum('stock')), 0),
+        variant_count=Coalesce(summary(Count('variant_id')), 0),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('brand', '0001_initial'),
+        ('collection', '0002_initial'),
+        ('products', '0007_product_sales_stats'),
+        ('store', '0003_addressstore'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='product',
+            name='product_active_price_idx',
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='max_price',
+            field=models.DecimalField(decimal_places=2, default=0.0, help_text='Giá variant cao nhất, bằng base_price khi chưa có variant', max_digits=12, verbose_name='Giá cao nhất'),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='min_price',
+            field=models.DecimalField(decimal_places=2, default=0.0, help_text='Giá variant thấp nhất, bằng base_price khi chưa có variant', max_digits=12, verbose_name='Giá thấp nhất'),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='total_stock',
+            field=models.IntegerField(default=0, verbose_name='Tổng tồn kho'),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='variant_count',
+            field=models.IntegerField(default=0, verbose_name='Số biến thể'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['is_active', 'min_price', 'product_id'], name='product_active_min_price_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['is_active', '-max_price', '-product_id'], name='product_active_max_price_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['is_active', 'total_stock'], name='product_active_stock_idx'),
+        ),
+        migrations.RunPython(fill_variant_summary, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,52 @@
+from django.contrib.postgres.operations import TrigramExtension, UnaccentExtension
+from django.db import migrations
+
+
+# Cột search_vector chỉ tồn tại ở DB (không khai báo trên model), xem SHOEX/products/search.py
+FORWARD_SQL = [
+    # unaccent() là STABLE => bọc lại thành IMMUTABLE để dùng trong generated column / index
+    """
+    CREATE OR REPLACE FUNCTION shoex_unaccent(text) RETURNS text AS $$
+        SELECT public.unaccent('public.unaccent'::regdictionary, $1)
+    $$ LANGUAGE sql IMMUTABLE PARALLEL SAFE STRICT;
+    """,
+    """
+    ALTER TABLE products_product ADD COLUMN search_vector tsvector GENERATED ALWAYS AS (
+        setweight(to_tsvector('simple', shoex_unaccent(coalesce(name, ''))), 'A') ||
+        setweight(to_tsvector('simple', shoex_unaccent(coalesce(model_code, ''))), 'B') ||
+        setweight(to_tsvector('simple', shoex_unaccent(coalesce(description, ''))), 'C')
+    ) STORED;
+    """,
+    "CREATE INDEX product_search_vector_idx ON products_product USING GIN (search_vector);",
+    "CREATE INDEX product_name_trgm_idx ON products_product USING GIN (shoex_unaccent(lower(name)) gin_trgm_ops);",
+]
+
+REVERSE_SQL = [
+    "DROP INDEX IF EXISTS product_name_trgm_idx;",
+    "DROP INDEX IF EXISTS product_search_vector_idx;",
+    "ALTER TABLE products_product DROP COLUMN IF EXISTS search_vector;",
+    "DROP FUNCTION IF EXISTS shoex_unaccent(text);",
+]
+
+
+def _run_on_postgres(statements):
+    def run(apps, schema_editor):
+        # Giống CreateExtension: bỏ qua khi không phải PostgreSQL (sqlite khi dev)
+        if schema_editor.connection.vendor != 'postgresql':
+            return
+        for statement in statements:
+            schema_editor.execute(statement)
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0008_product_variant_summary'),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        UnaccentExtension(),
+        migrations.RunPython(_run_on_postgres(FORWARD_SQL), _run_on_postgres(REVERSE_SQL)),
+    ]
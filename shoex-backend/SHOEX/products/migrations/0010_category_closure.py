@@ -0,0 +1,45 @@
+# Generated by Django 5.2.6 on 2026-10-18 04:11
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def build_closure(apps, schema_editor):
+    """Dựng closure cho cây danh mục hiện có (giống CategoryClosure.rebuild)"""
+    Category = apps.get_model('products', 'Category')
+    CategoryClosure = apps.get_model('products', 'CategoryClosure')
+    parents = dict(Category.objects.values_list('category_id', 'parent_id'))
+    rows = []
+    for category_id in parents:
+        node, depth, seen = category_id, 0, set()
+        while node is not None and node not in seen:
+            seen.add(node)
+            rows.append(CategoryClosure(ancestor_id=node, descendant_id=category_id, depth=depth))
+            node, depth = parents.get(node), depth + 1
+    CategoryClosure.objects.bulk_create(rows, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0009_product_search'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CategoryClosure',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('depth', models.PositiveIntegerField(default=0, verbose_name='Khoảng cách')),
+                ('ancestor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='descendant_links', to='products.category', verbose_name='Tổ tiên')),
+                ('descendant', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ancestor_links', to='products.category', verbose_name='Hậu duệ')),
+            ],
+            options={
+                'verbose_name': 'Quan hệ danh mục',
+                'verbose_name_plural': 'Quan hệ danh mục',
+                'indexes': [models.Index(fields=['descendant', 'depth'], name='category_closure_path_idx')],
+                'constraints': [models.UniqueConstraint(fields=('ancestor', 'descendant'), name='category_closure_unique')],
+            },
+        ),
+        migrations.RunPython(build_closure, migrations.RunPython.noop),
+    ]
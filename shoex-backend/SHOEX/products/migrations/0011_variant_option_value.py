@@ -0,0 +1,59 @@
+# Generated by Django 5.2.6 on 2026-10-18 04:14
+
+import django.db.models.deletion
+import json
+
+from django.db import migrations, models
+
+
+def build_index(apps, schema_editor):
+    """Điền VariantOptionValue từ option_combinations của variant hiện có"""
+    ProductVariant = apps.get_model('products', 'ProductVariant')
+    ProductAttributeOption = apps.get_model('products', 'ProductAttributeOption')
+    VariantOptionValue = apps.get_model('products', 'VariantOptionValue')
+    options = {
+        (product_id, attribute_name, value): (option_id, attribute_id)
+        for option_id, product_id, attribute_id, attribute_name, value in
+        ProductAttributeOption.objects.values_list('option_id', 'product_id', 'attribute_id', 'attribute__name', 'value')
+    }
+    rows = []
+    for variant_id, product_id, combinations in ProductVariant.objects.values_list(
+        'variant_id', 'product_id', 'option_combinations'
+    ).iterator():
+        try:
+            combinations = json.loads(combinations) if isinstance(combinations, str) else combinations
+        except (ValueError, TypeError):
+            continue
+        if not isinstance(combinations, dict):
+            continue
+        for attribute_name, value in combinations.items():
+            match = options.get((product_id, attribute_name, str(value)))
+            if match:
+                rows.append(VariantOptionValue(variant_id=variant_id, option_id=match[0], attribute_id=match[1]))
+    VariantOptionValue.objects.bulk_create(rows, batch_size=1000, ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0010_category_closure'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VariantOptionValue',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('attribute', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='variant_values', to='products.productattribute', verbose_name='Thuộc tính')),
+                ('option', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='variant_values', to='products.productattributeoption', verbose_name='Tùy chọn')),
+                ('variant', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='option_values', to='products.productvariant', verbose_name='Biến thể')),
+            ],
+            options={
+                'verbose_name': 'Giá trị tùy chọn của biến thể',
+                'verbose_name_plural': 'Giá trị tùy chọn của biến thể',
+                'indexes': [models.Index(fields=['option', 'variant'], name='variant_option_option_idx'), models.Index(fields=['attribute', 'option', 'variant'], name='variant_option_attr_idx')],
+                'constraints': [models.UniqueConstraint(fields=('variant', 'attribute'), name='variant_option_unique')],
+            },
+        ),
+        migrations.RunPython(build_index, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 5.2.6 on 2026-10-18 04:15
+
+from django.db import migrations, models
+
+
+def build_matrices(apps, schema_editor):
+    """Tính availability_matrix cho product hiện có (dùng hàm thuần Product.build_availability_matrix)"""
+    from SHOEX.products.models import Product as CurrentProduct
+
+    Product = apps.get_model('products', 'Product')
+    ProductVariant = apps.get_model('products', 'ProductVariant')
+    ProductAttributeOption = apps.get_model('products', 'ProductAttributeOption')
+    product_ids = list(Product.objects.order_by('pk').values_list('pk', flat=True))
+    for start in range(0, len(product_ids), 500):
+        batch = product_ids[start:start + 500]
+        options, variants = {}, {}
+        for option in ProductAttributeOption.objects.filter(product_id__in=batch)\
+                .select_related('attribute').order_by('attribute_id', 'display_order', 'value'):
+            options.setdefault(option.product_id, []).append(option)
+        for variant_id, product_id, stock, combinations in ProductVariant.objects.filter(
+            product_id__in=batch, is_active=True
+        ).order_by('variant_id').values_list('variant_id', 'product_id', 'stock', 'option_combinations'):
+            variants.setdefault(product_id, []).append((variant_id, stock, combinations))
+        Product.objects.bulk_update([
+            Product(pk=pk, availability_matrix=CurrentProduct.build_availability_matrix(
+                options.get(pk, []), variants.get(pk, [])
+            ))
+            for pk in batch
+        ], ['availability_matrix'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0011_variant_option_value'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='availability_matrix',
+            field=models.JSONField(blank=True, default=dict, editable=False, help_text='Màu x Size còn hàng, tính lại khi ghi variant / tùy chọn - xem build_availability_matrix', verbose_name='Ma trận còn hàng'),
+        ),
+        migrations.RunPython(build_matrices, migrations.RunPython.noop),
+    ]
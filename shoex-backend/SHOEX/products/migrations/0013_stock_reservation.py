@@ -0,0 +1,69 @@
+# Generated by Django 5.2.6 on 2026-10-18 04:28
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def clamp_negative_stock(apps, schema_editor):
+    """Dữ liệu cũ từng bị bán vượt (stock < 0) => đưa về 0 trước khi thêm constraint"""
+    ProductVariant = apps.get_model('products', 'ProductVariant')
+    ProductVariant.objects.filter(stock__lt=0).update(stock=0)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cart', '0002_initial'),
+        ('orders', '0002_initial'),
+        ('products', '0012_product_availability_matrix'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StockReservation',
+            fields=[
+                ('reservation_id', models.AutoField(primary_key=True, serialize=False, verbose_name='Mã giữ hàng')),
+                ('quantity', models.PositiveIntegerField(verbose_name='Số lượng')),
+                ('status', models.CharField(choices=[('held', 'Đang giữ'), ('committed', 'Đã chốt đơn'), ('released', 'Đã trả lại')], default='held', max_length=20, verbose_name='Trạng thái')),
+                ('expires_at', models.DateTimeField(help_text='Chỉ áp dụng khi đang giữ (held)', verbose_name='Hết hạn lúc')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Ngày tạo')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Ngày cập nhật')),
+            ],
+            options={
+                'verbose_name': 'Giữ hàng',
+                'verbose_name_plural': 'Giữ hàng',
+            },
+        ),
+        migrations.RunPython(clamp_negative_stock, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='productvariant',
+            constraint=models.CheckConstraint(condition=models.Q(('stock__gte', 0)), name='variant_stock_non_negative'),
+        ),
+        migrations.AddField(
+            model_name='stockreservation',
+            name='cart',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='stock_reservations', to='cart.cart', verbose_name='Giỏ hàng'),
+        ),
+        migrations.AddField(
+            model_name='stockreservation',
+            name='order',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='stock_reservations', to='orders.order', verbose_name='Đơn hàng'),
+        ),
+        migrations.AddField(
+            model_name='stockreservation',
+            name='variant',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reservations', to='products.productvariant', verbose_name='Biến thể'),
+        ),
+        migrations.AddIndex(
+            model_name='stockreservation',
+            index=models.Index(fields=['status', 'expires_at'], name='products_st_status_657db7_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='stockreservation',
+            index=models.Index(fields=['cart', 'status'], name='products_st_cart_id_dc2326_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='stockreservation',
+            index=models.Index(fields=['order', 'status'], name='products_st_order_i_c65a4c_idx'),
+        ),
+    ]
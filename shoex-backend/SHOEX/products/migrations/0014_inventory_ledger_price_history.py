@@ -0,0 +1,54 @@
+# Generated by Django 5.2.6 on 2026-10-18 04:36
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0013_stock_reservation'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='InventoryLedger',
+            fields=[
+                ('entry_id', models.BigAutoField(primary_key=True, serialize=False, verbose_name='Mã bút toán')),
+                ('change', models.IntegerField(help_text='Dương = nhập thêm, âm = trừ kho', verbose_name='Thay đổi')),
+                ('source', models.CharField(choices=[('adjust', 'Điều chỉnh'), ('bulk', 'Cập nhật hàng loạt'), ('import', 'Đồng bộ từ file'), ('transfer', 'Chuyển kho'), ('reservation', 'Giữ hàng'), ('release', 'Trả lại kho'), ('edit', 'Sửa biến thể')], default='adjust', max_length=20, verbose_name='Nguồn')),
+                ('reason', models.CharField(blank=True, max_length=255, verbose_name='Lý do')),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now, editable=False, verbose_name='Thời điểm')),
+                ('user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL, verbose_name='Người thực hiện')),
+                ('variant', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ledger_entries', to='products.productvariant', verbose_name='Biến thể')),
+            ],
+            options={
+                'verbose_name': 'Sổ cái tồn kho',
+                'verbose_name_plural': 'Sổ cái tồn kho',
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['variant', 'created_at'], name='products_in_variant_15fc9e_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='PriceHistory',
+            fields=[
+                ('history_id', models.BigAutoField(primary_key=True, serialize=False, verbose_name='Mã lịch sử')),
+                ('old_price', models.DecimalField(decimal_places=2, max_digits=12, verbose_name='Giá cũ')),
+                ('new_price', models.DecimalField(decimal_places=2, max_digits=12, verbose_name='Giá mới')),
+                ('source', models.CharField(choices=[('adjust', 'Điều chỉnh'), ('bulk', 'Cập nhật hàng loạt'), ('import', 'Đồng bộ từ file'), ('transfer', 'Chuyển kho'), ('reservation', 'Giữ hàng'), ('release', 'Trả lại kho'), ('edit', 'Sửa biến thể')], default='adjust', max_length=20, verbose_name='Nguồn')),
+                ('reason', models.CharField(blank=True, max_length=255, verbose_name='Lý do')),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now, editable=False, verbose_name='Thời điểm')),
+                ('user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL, verbose_name='Người thực hiện')),
+                ('variant', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='price_history', to='products.productvariant', verbose_name='Biến thể')),
+            ],
+            options={
+                'verbose_name': 'Lịch sử giá',
+                'verbose_name_plural': 'Lịch sử giá',
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['variant', 'created_at'], name='products_pr_variant_9e941d_idx'), models.Index(fields=['created_at'], name='products_pr_created_bd06aa_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,50 @@
+# Generated by Django 5.2.6 on 2026-10-18 04:43
+
+from django.db import migrations, models
+
+
+MODEL_CODE_SEQUENCE = 'products_model_code_seq'
+
+
+def seed_model_code_sequence(apps, schema_editor):
+    """Bộ đếm bắt đầu sau mã "PRD-xxxx" lớn nhất đang có (mã cũ sinh từ count() + 1)"""
+    Product = apps.get_model('products', 'Product')
+    CodeSequence = apps.get_model('products', 'CodeSequence')
+    last = 0
+    for code in Product.objects.filter(model_code__startswith='PRD-').values_list('model_code', flat=True).iterator():
+        number = code[len('PRD-'):]
+        if number.isdigit():
+            last = max(last, int(number))
+
+    CodeSequence.objects.update_or_create(name=MODEL_CODE_SEQUENCE, defaults={'value': last})
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(f"CREATE SEQUENCE IF NOT EXISTS {MODEL_CODE_SEQUENCE}")
+        # setval(seq, n, false): nextval tiếp theo trả về n
+        schema_editor.execute("SELECT setval(%s, %s, false)", [MODEL_CODE_SEQUENCE, last + 1])
+
+
+def drop_model_code_sequence(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(f"DROP SEQUENCE IF EXISTS {MODEL_CODE_SEQUENCE}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0014_inventory_ledger_price_history'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CodeSequence',
+            fields=[
+                ('name', models.CharField(max_length=50, primary_key=True, serialize=False, verbose_name='Tên bộ đếm')),
+                ('value', models.BigIntegerField(default=0, verbose_name='Giá trị đã cấp gần nhất')),
+            ],
+            options={
+                'verbose_name': 'Bộ đếm mã',
+                'verbose_name_plural': 'Bộ đếm mã',
+            },
+        ),
+        migrations.RunPython(seed_model_code_sequence, drop_model_code_sequence),
+    ]
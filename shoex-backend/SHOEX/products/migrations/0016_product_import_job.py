@@ -0,0 +1,46 @@
+# Generated by Django 5.2.6 on 2026-10-18 04:46
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0015_code_sequence'),
+        ('store', '0003_addressstore'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductImportJob',
+            fields=[
+                ('job_id', models.AutoField(primary_key=True, serialize=False, verbose_name='Mã lần nhập')),
+                ('file', models.FileField(upload_to='imports/products/%Y/%m/', verbose_name='File nhập')),
+                ('format', models.CharField(choices=[('csv', 'CSV'), ('jsonl', 'JSON lines'), ('xlsx', 'Excel (XLSX)')], max_length=10, verbose_name='Định dạng')),
+                ('status', models.CharField(choices=[('pending', 'Chờ xử lý'), ('running', 'Đang chạy'), ('completed', 'Hoàn tất'), ('failed', 'Thất bại')], default='pending', max_length=20, verbose_name='Trạng thái')),
+                ('total_rows', models.IntegerField(blank=True, help_text='Biết khi đọc hết file', null=True, verbose_name='Tổng số dòng')),
+                ('processed_rows', models.IntegerField(default=0, verbose_name='Số dòng đã xử lý')),
+                ('created_products', models.IntegerField(default=0, verbose_name='Sản phẩm mới')),
+                ('updated_products', models.IntegerField(default=0, verbose_name='Sản phẩm cập nhật')),
+                ('created_variants', models.IntegerField(default=0, verbose_name='Biến thể mới')),
+                ('updated_variants', models.IntegerField(default=0, verbose_name='Biến thể cập nhật')),
+                ('error_count', models.IntegerField(default=0, verbose_name='Số dòng lỗi')),
+                ('errors', models.JSONField(blank=True, default=list, help_text='Tối đa MAX_JOB_ERRORS lỗi đầu tiên', verbose_name='Lỗi từng dòng')),
+                ('started_at', models.DateTimeField(blank=True, null=True, verbose_name='Bắt đầu lúc')),
+                ('finished_at', models.DateTimeField(blank=True, null=True, verbose_name='Kết thúc lúc')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Ngày tạo')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Ngày cập nhật')),
+                ('store', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='product_imports', to='store.store', verbose_name='Cửa hàng')),
+                ('user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='product_imports', to=settings.AUTH_USER_MODEL, verbose_name='Người nhập')),
+            ],
+            options={
+                'verbose_name': 'Nhập sản phẩm',
+                'verbose_name_plural': 'Nhập sản phẩm',
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['status', 'updated_at'], name='products_pr_status_bdbe67_idx'), models.Index(fields=['store', '-created_at'], name='products_pr_store_i_a94c5a_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 5.2.6 on 2026-10-18 04:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0016_product_import_job'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='productattributeoption',
+            name='renditions',
+            field=models.JSONField(blank=True, default=dict, editable=False, help_text='{"400": {"width": 400, "height": 300, "jpeg": "...jpg", "webp": "...webp"}, ...}', verbose_name='Các bản thu nhỏ'),
+        ),
+        migrations.AddField(
+            model_name='productattributeoption',
+            name='renditions_status',
+            field=models.CharField(choices=[('pending', 'Chờ xử lý'), ('processing', 'Đang xử lý'), ('ready', 'Sẵn sàng'), ('failed', 'Lỗi')], default='pending', editable=False, max_length=20, verbose_name='Trạng thái bản thu nhỏ'),
+        ),
+        migrations.AddField(
+            model_name='productattributeoption',
+            name='renditions_updated_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True, verbose_name='Cập nhật bản thu nhỏ lúc'),
+        ),
+        migrations.AddField(
+            model_name='productimage',
+            name='renditions',
+            field=models.JSONField(blank=True, default=dict, editable=False, help_text='{"400": {"width": 400, "height": 300, "jpeg": "...jpg", "webp": "...webp"}, ...}', verbose_name='Các bản thu nhỏ'),
+        ),
+        migrations.AddField(
+            model_name='productimage',
+            name='renditions_status',
+            field=models.CharField(choices=[('pending', 'Chờ xử lý'), ('processing', 'Đang xử lý'), ('ready', 'Sẵn sàng'), ('failed', 'Lỗi')], default='pending', editable=False, max_length=20, verbose_name='Trạng thái bản thu nhỏ'),
+        ),
+        migrations.AddField(
+            model_name='productimage',
+            name='renditions_updated_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True, verbose_name='Cập nhật bản thu nhỏ lúc'),
+        ),
+    ]
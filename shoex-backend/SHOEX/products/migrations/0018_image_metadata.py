@@ -0,0 +1,53 @@
+# Generated by Django 5.2.6 on 2026-10-18 04:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0017_image_renditions'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='productattributeoption',
+            name='content_hash',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=64, verbose_name='SHA-256 ảnh gốc'),
+        ),
+        migrations.AddField(
+            model_name='productattributeoption',
+            name='format',
+            field=models.CharField(blank=True, editable=False, max_length=10, verbose_name='Định dạng ảnh gốc'),
+        ),
+        migrations.AddField(
+            model_name='productattributeoption',
+            name='height',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True, verbose_name='Chiều cao ảnh gốc (px)'),
+        ),
+        migrations.AddField(
+            model_name='productattributeoption',
+            name='width',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True, verbose_name='Chiều rộng ảnh gốc (px)'),
+        ),
+        migrations.AddField(
+            model_name='productimage',
+            name='content_hash',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=64, verbose_name='SHA-256 ảnh gốc'),
+        ),
+        migrations.AddField(
+            model_name='productimage',
+            name='format',
+            field=models.CharField(blank=True, editable=False, max_length=10, verbose_name='Định dạng ảnh gốc'),
+        ),
+        migrations.AddField(
+            model_name='productimage',
+            name='height',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True, verbose_name='Chiều cao ảnh gốc (px)'),
+        ),
+        migrations.AddField(
+            model_name='productimage',
+            name='width',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True, verbose_name='Chiều rộng ảnh gốc (px)'),
+        ),
+    ]
@@ -0,0 +1,48 @@
+# Generated by Django 5.2.6 on 2026-10-18 05:02
+
+import SHOEX.products.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0018_image_metadata'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='category',
+            name='thumbnail_image',
+            field=models.ImageField(blank=True, help_text='Ảnh thumbnail cho danh mục', null=True, storage=SHOEX.products.storage.ContentAddressedStorage(), upload_to='categories/thumbnails/', verbose_name='Ảnh đại diện danh mục'),
+        ),
+        migrations.AlterField(
+            model_name='product',
+            name='size_guide_image',
+            field=models.ImageField(blank=True, help_text='Upload ảnh bảng hướng dẫn chọn size cho sản phẩm', null=True, storage=SHOEX.products.storage.ContentAddressedStorage(), upload_to='products/size_guides/', verbose_name='Ảnh hướng dẫn chọn size'),
+        ),
+        migrations.AlterField(
+            model_name='productattributeoption',
+            name='image',
+            field=models.ImageField(blank=True, help_text='Upload ảnh cho tùy chọn này (nếu attribute.has_image = True)', null=True, storage=SHOEX.products.storage.ContentAddressedStorage(), upload_to='products/attributes/%Y/%m/', verbose_name='Ảnh'),
+        ),
+        migrations.AlterField(
+            model_name='productimage',
+            name='image',
+            field=models.ImageField(help_text='Upload ảnh sản phẩm', storage=SHOEX.products.storage.ContentAddressedStorage(), upload_to='products/gallery/%Y/%m/', verbose_name='Ảnh sản phẩm'),
+        ),
+        migrations.CreateModel(
+            name='MediaBlob',
+            fields=[
+                ('name', models.CharField(max_length=255, primary_key=True, serialize=False, verbose_name='Tên file trong storage')),
+                ('ref_count', models.IntegerField(default=0, verbose_name='Số tham chiếu')),
+                ('released_at', models.DateTimeField(blank=True, help_text='NULL khi còn được dùng', null=True, verbose_name='Hết tham chiếu lúc')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Ngày tạo')),
+            ],
+            options={
+                'verbose_name': 'File media',
+                'verbose_name_plural': 'File media',
+                'indexes': [models.Index(fields=['ref_count', 'released_at'], name='products_me_ref_cou_cb206f_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,72 @@
+# Generated by Django 5.2.6 on 2026-10-18 05:04
+
+from django.db import migrations, models
+from django.db.models import Count, Q, Sum
+
+
+def backfill_rating_aggregates(apps, schema_editor):
+    """Tổng điểm / histogram từ Review hiện có (đối soát sau này: manage.py rebuild_product_ratings)"""
+    Product = apps.get_model('products', 'Product')
+    Review = apps.get_model('reviews', 'Review')
+    products = []
+    for row in Review.objects.values('order_item__variant__product_id').annotate(
+        total=Sum('rating'),
+        count=Count('review_id'),
+        **{f'rating_{stars}_count': Count('review_id', filter=Q(rating=stars)) for stars in range(1, 6)}
+    ):
+        product = Product(
+            pk=row['order_item__variant__product_id'],
+            rating_sum=row['total'],
+            review_count=row['count'],
+            rating=row['total'] / row['count'],
+        )
+        for stars in range(1, 6):
+            setattr(product, f'rating_{stars}_count', row[f'rating_{stars}_count'])
+        products.append(product)
+    Product.objects.bulk_update(
+        products,
+        ['rating_sum', 'review_count', 'rating'] + [f'rating_{stars}_count' for stars in range(1, 6)],
+        batch_size=100,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0019_media_storage'),
+        ('reviews', '0002_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='rating_1_count',
+            field=models.IntegerField(default=0, verbose_name='Số đánh giá 1 sao'),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_2_count',
+            field=models.IntegerField(default=0, verbose_name='Số đánh giá 2 sao'),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_3_count',
+            field=models.IntegerField(default=0, verbose_name='Số đánh giá 3 sao'),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_4_count',
+            field=models.IntegerField(default=0, verbose_name='Số đánh giá 4 sao'),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_5_count',
+            field=models.IntegerField(default=0, verbose_name='Số đánh giá 5 sao'),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_sum',
+            field=models.IntegerField(default=0, verbose_name='Tổng điểm đánh giá'),
+        ),
+        migrations.RunPython(backfill_rating_aggregates, migrations.RunPython.noop),
+    ]
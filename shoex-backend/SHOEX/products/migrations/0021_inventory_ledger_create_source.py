@@ -0,0 +1,23 @@
+# Generated by Django 5.2.6 on 2026-10-18 05:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0020_product_rating_aggregates'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='inventoryledger',
+            name='source',
+            field=models.CharField(choices=[('adjust', 'Điều chỉnh'), ('bulk', 'Cập nhật hàng loạt'), ('import', 'Đồng bộ từ file'), ('transfer', 'Chuyển kho'), ('reservation', 'Giữ hàng'), ('release', 'Trả lại kho'), ('edit', 'Sửa biến thể'), ('create', 'Tồn kho ban đầu')], default='adjust', max_length=20, verbose_name='Nguồn'),
+        ),
+        migrations.AlterField(
+            model_name='pricehistory',
+            name='source',
+            field=models.CharField(choices=[('adjust', 'Điều chỉnh'), ('bulk', 'Cập nhật hàng loạt'), ('import', 'Đồng bộ từ file'), ('transfer', 'Chuyển kho'), ('reservation', 'Giữ hàng'), ('release', 'Trả lại kho'), ('edit', 'Sửa biến thể'), ('create', 'Tồn kho ban đầu')], default='adjust', max_length=20, verbose_name='Nguồn'),
+        ),
+    ]
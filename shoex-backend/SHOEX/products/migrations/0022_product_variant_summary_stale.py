@@ -0,0 +1,22 @@
+# Generated by Django 5.2.6 on 2026-10-18 05:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0021_inventory_ledger_create_source'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='variant_summary_stale',
+            field=models.BooleanField(default=False, editable=False, help_text='Kho đổi qua checkout / giữ hàng - refresh_variant_summaries tính lại theo lô', verbose_name='Tóm tắt variant cần tính lại'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(condition=models.Q(('variant_summary_stale', True)), fields=['product_id'], name='product_summary_stale_idx'),
+        ),
+    ]
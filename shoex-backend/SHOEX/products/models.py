@@ -1,8 +1,12 @@
-from django.db import models
+from django.db import IntegrityError, models, transaction
+from .storage import media_storage
 from django.core.exceptions import ValidationError
 import json
-from django.utils.text import slugify
-from django.db.models import Avg, Count
+from decimal import Decimal
+from django.db.models import Count
+from django.db.models.functions import Cast, Coalesce, Greatest
+from django.utils import timezone
+from datetime import timedelta
 # Create your models here.
 
 class Category(models.Model):
@@ -30,6 +34,7 @@ class Category(models.Model):
     )
     thumbnail_image = models.ImageField(
         upload_to='categories/thumbnails/',
+        storage=media_storage,
         blank=True,
         null=True,
         verbose_name="Ảnh đại diện danh mục",
@@ -52,6 +57,171 @@ class Category(models.Model):
     def __str__(self):
         return self.name
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Ghi nhớ parent lúc load để save() biết có di chuyển nhánh hay không
+        if 'parent_id' in instance.__dict__:
+            instance._loaded_parent_id = instance.parent_id
+        return instance
+
+    def is_descendant_of_self(self, category_id):
+        """category_id là chính nó hoặc nằm trong cây con của nó"""
+        return self.pk is not None and CategoryClosure.objects.filter(
+            ancestor_id=self.pk, descendant_id=category_id
+        ).exists()
+
+    def clean(self):
+        if self.parent_id is not None and self.is_descendant_of_self(self.parent_id):
+            raise ValidationError({'parent': "Không thể chọn chính danh mục này hoặc danh mục con của nó làm danh mục cha"})
+
+    def save(self, *args, **kwargs):
+        adding = self._state.adding
+        moved = False
+        if not adding:
+            if hasattr(self, '_loaded_parent_id'):
+                old_parent_id = self._loaded_parent_id
+            else:
+                old_parent_id = Category.objects.filter(pk=self.pk).values_list('parent_id', flat=True).first()
+            moved = old_parent_id != self.parent_id
+        if moved and self.parent_id is not None and self.is_descendant_of_self(self.parent_id):
+            raise ValidationError("Không thể chuyển danh mục vào chính nó hoặc danh mục con của nó")
+
+        super().save(*args, **kwargs)
+
+        if adding:
+            CategoryClosure.insert_node(self)
+        elif moved:
+            CategoryClosure.move_subtree(self)
+        self._loaded_parent_id = self.parent_id
+
+
+class CategoryClosure(models.Model):
+    """
+    Bảng closure của cây danh mục: mỗi cặp (tổ tiên, hậu duệ) một dòng, kể cả (chính nó, 0)
+
+    - Cây con của một danh mục / đường dẫn từ gốc: một query có index, không đệ quy
+    - Cập nhật trong Category.save() (mutation, admin); xóa danh mục => CASCADE xóa dòng
+    - Sửa parent_id bằng queryset.update() / SQL tay không đi qua save():
+      chạy `python manage.py rebuild_category_closure`
+    """
+    ancestor = models.ForeignKey(
+        Category,
+        on_delete=models.CASCADE,
+        related_name='descendant_links',
+        verbose_name="Tổ tiên"
+    )
+    descendant = models.ForeignKey(
+        Category,
+        on_delete=models.CASCADE,
+        related_name='ancestor_links',
+        verbose_name="Hậu duệ"
+    )
+    depth = models.PositiveIntegerField(
+        default=0,
+        verbose_name="Khoảng cách"
+    )
+
+    class Meta:
+        verbose_name = "Quan hệ danh mục"
+        verbose_name_plural = "Quan hệ danh mục"
+        constraints = [
+            models.UniqueConstraint(fields=['ancestor', 'descendant'], name='category_closure_unique'),
+        ]
+        indexes = [
+            # Đường dẫn từ gốc (full_path): WHERE descendant = ? ORDER BY depth
+            models.Index(fields=['descendant', 'depth'], name='category_closure_path_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.ancestor_id} -> {self.descendant_id} ({self.depth})"
+
+    # ===== CẬP NHẬT =====
+
+    @classmethod
+    def insert_node(cls, category):
+        """Danh mục mới (lá): chính nó + mọi tổ tiên của parent"""
+        rows = [cls(ancestor_id=category.pk, descendant_id=category.pk, depth=0)]
+        if category.parent_id is not None:
+            rows += [
+                cls(ancestor_id=ancestor_id, descendant_id=category.pk, depth=depth + 1)
+                for ancestor_id, depth in cls.objects.filter(
+                    descendant_id=category.parent_id
+                ).values_list('ancestor_id', 'depth')
+            ]
+        cls.objects.bulk_create(rows, ignore_conflicts=True)
+
+    @classmethod
+    def move_subtree(cls, category):
+        """
+        Chuyển cả nhánh sang parent mới:
+        bỏ liên kết từ tổ tiên cũ tới nhánh, nối tổ tiên mới x mọi nút trong nhánh
+        """
+        subtree = list(cls.objects.filter(ancestor_id=category.pk).values_list('descendant_id', 'depth'))
+        if not subtree:
+            # Danh mục có từ trước khi có bảng closure => dựng lại toàn bộ
+            cls.rebuild()
+            return
+        subtree_ids = [descendant_id for descendant_id, _ in subtree]
+        cls.objects.filter(descendant_id__in=subtree_ids).exclude(ancestor_id__in=subtree_ids).delete()
+        if category.parent_id is None:
+            return
+        ancestors = cls.objects.filter(descendant_id=category.parent_id).values_list('ancestor_id', 'depth')
+        cls.objects.bulk_create([
+            cls(ancestor_id=ancestor_id, descendant_id=descendant_id, depth=up + down + 1)
+            for ancestor_id, up in ancestors
+            for descendant_id, down in subtree
+        ], batch_size=1000)
+
+    @classmethod
+    def rebuild(cls, batch_size=1000):
+        """Dựng lại toàn bộ bảng từ Category.parent_id (đọc cây một lần, tính trong bộ nhớ)"""
+        parents = dict(Category.objects.values_list('category_id', 'parent_id'))
+        rows = []
+        for category_id in parents:
+            node, depth, seen = category_id, 0, set()
+            while node is not None and node not in seen:
+                seen.add(node)
+                rows.append(cls(ancestor_id=node, descendant_id=category_id, depth=depth))
+                node, depth = parents.get(node), depth + 1
+        with transaction.atomic():
+            cls.objects.all().delete()
+            cls.objects.bulk_create(rows, batch_size=batch_size)
+        return len(parents)
+
+    # ===== TRUY VẤN =====
+
+    @classmethod
+    def subtree_ids(cls, category_ids, active_only=True):
+        """
+        Subquery id của các danh mục trong cây con (gồm chính category_ids)
+        Dùng trực tiếp: Product.objects.filter(category_id__in=CategoryClosure.subtree_ids([...]))
+
+        active_only: bỏ danh mục ngừng hoạt động và toàn bộ nhánh bên dưới nó
+        (danh mục gốc được truyền vào luôn được giữ)
+        """
+        links = cls.objects.filter(ancestor_id__in=category_ids)
+        if active_only:
+            # Có một nút inactive nằm giữa gốc (depth > 0) và hậu duệ => bị chặn
+            blocked = cls.objects.filter(
+                descendant_id=models.OuterRef('descendant_id'),
+                ancestor__is_active=False,
+                ancestor__ancestor_links__ancestor_id=models.OuterRef('ancestor_id'),
+                ancestor__ancestor_links__depth__gt=0,
+            )
+            links = links.exclude(models.Exists(blocked))
+        return links.order_by().values('descendant_id')
+
+    @classmethod
+    def ancestors_of(cls, category_ids):
+        """{category_id: [gốc, ..., chính nó]} - một query cho nhiều danh mục"""
+        paths = {category_id: [] for category_id in category_ids}
+        links = cls.objects.filter(descendant_id__in=category_ids)\
+            .select_related('ancestor').order_by('descendant_id', '-depth')
+        for link in links:
+            paths[link.descendant_id].append(link.ancestor)
+        return paths
+
 
 class Product(models.Model):
     """Sản phẩm chính - Master data"""
@@ -108,6 +278,7 @@ class Product(models.Model):
     # Hướng dẫn chọn size
     size_guide_image = models.ImageField(
         upload_to='products/size_guides/',
+        storage=media_storage,
         blank=True,
         null=True,
         verbose_name="Ảnh hướng dẫn chọn size",
@@ -141,6 +312,54 @@ class Product(models.Model):
     )
     rating = models.FloatField(default=0.0)
     review_count = models.IntegerField(default=0)
+
+    # Tổng hợp đánh giá (denormalized, cộng dồn bằng F() khi ghi Review - xem apply_review)
+    rating_sum = models.IntegerField(
+        default=0,
+        verbose_name="Tổng điểm đánh giá"
+    )
+    rating_1_count = models.IntegerField(default=0, verbose_name="Số đánh giá 1 sao")
+    rating_2_count = models.IntegerField(default=0, verbose_name="Số đánh giá 2 sao")
+    rating_3_count = models.IntegerField(default=0, verbose_name="Số đánh giá 3 sao")
+    rating_4_count = models.IntegerField(default=0, verbose_name="Số đánh giá 4 sao")
+    rating_5_count = models.IntegerField(default=0, verbose_name="Số đánh giá 5 sao")
+
+    # Tổng hợp từ variants active (denormalized, tính lại khi ghi variant - xem refresh_variant_summary)
+    min_price = models.DecimalField(
+        max_digits=12,
+        decimal_places=2,
+        default=0.00,
+        verbose_name="Giá thấp nhất",
+        help_text="Giá variant thấp nhất, bằng base_price khi chưa có variant"
+    )
+    max_price = models.DecimalField(
+        max_digits=12,
+        decimal_places=2,
+        default=0.00,
+        verbose_name="Giá cao nhất",
+        help_text="Giá variant cao nhất, bằng base_price khi chưa có variant"
+    )
+    total_stock = models.IntegerField(
+        default=0,
+        verbose_name="Tổng tồn kho"
+    )
+    variant_count = models.IntegerField(
+        default=0,
+        verbose_name="Số biến thể"
+    )
+    availability_matrix = models.JSONField(
+        default=dict,
+        blank=True,
+        editable=False,
+        verbose_name="Ma trận còn hàng",
+        help_text="Màu x Size còn hàng, tính lại khi ghi variant / tùy chọn - xem build_availability_matrix"
+    )
+    variant_summary_stale = models.BooleanField(
+        default=False,
+        editable=False,
+        verbose_name="Tóm tắt variant cần tính lại",
+        help_text="Kho đổi qua checkout / giữ hàng - refresh_variant_summaries tính lại theo lô"
+    )
     class Meta:
         verbose_name = "Sản phẩm"
         verbose_name_plural = "Sản phẩm" 
@@ -148,50 +367,324 @@ class Product(models.Model):
         indexes = [
             models.Index(fields=['store', 'is_active']),
             models.Index(fields=['category', 'is_active']),
+            # Keyset pagination: (sort key, product_id)
+            models.Index(fields=['is_active', '-created_at', '-product_id'], name='product_active_created_idx'),
+            models.Index(fields=['is_active', 'min_price', 'product_id'], name='product_active_min_price_idx'),
+            models.Index(fields=['is_active', '-max_price', '-product_id'], name='product_active_max_price_idx'),
+            models.Index(fields=['is_active', 'total_stock'], name='product_active_stock_idx'),
+            models.Index(fields=['is_active', 'name', 'product_id'], name='product_active_name_idx'),
+            # Chỉ vài product đang chờ tính lại => index nhỏ cho refresh_variant_summaries
+            models.Index(
+                fields=['product_id'], name='product_summary_stale_idx',
+                condition=models.Q(variant_summary_stale=True)
+            ),
         ]
 
+    VARIANT_SUMMARY_FIELDS = ['min_price', 'max_price', 'total_stock', 'variant_count']
+    # Tính từ variant / tùy chọn (refresh_variant_summary / refresh_availability_matrix) và cờ chờ tính lại
+    # => save() thường không ghi đè
+    DERIVED_FIELDS = VARIANT_SUMMARY_FIELDS + ['availability_matrix', 'variant_summary_stale']
+    # Chỉ đổi bằng UPDATE F() (apply_review / rebuild_ratings) => save() thường không ghi đè
+    RATING_AGGREGATE_FIELDS = [
+        'rating', 'review_count', 'rating_sum',
+        'rating_1_count', 'rating_2_count', 'rating_3_count', 'rating_4_count', 'rating_5_count',
+    ]
+
     def __str__(self):
         return self.name
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Ảnh hướng dẫn size lúc load => pre_save (media.remember_media) không SELECT lại khi ảnh không đổi
+        if 'size_guide_image' in instance.__dict__:
+            name = instance.size_guide_image.name
+            instance._loaded_media = [name] if name else []
+        # base_price lúc load => save() chỉ tính lại khoảng giá khi giá cơ bản thật sự đổi
+        if 'base_price' in instance.__dict__:
+            instance._loaded_base_price = instance.base_price
+        return instance
+
+    def refresh_from_db(self, using=None, fields=None, from_queryset=None):
+        super().refresh_from_db(using=using, fields=fields, from_queryset=from_queryset)
+        if fields is None or 'base_price' in fields:
+            self._loaded_base_price = self.base_price
+
     def save(self, *args, **kwargs):
-        if not self.slug:
-            self.slug = slugify(self.name)
-        if not self.model_code:
-            # Đếm xem hiện có bao nhiêu sản phẩm
-            count = Product.objects.count() + 1
-            # Gộp lại: prefix + số thứ tự (4 chữ số)
-            self.model_code = f"PRD-{count:04d}"
-        super().save(*args, **kwargs)
-    @property   
-    def min_price(self):
-        """Giá thấp nhất từ variants"""
-        return self.variants.filter(is_active=True).aggregate(
-            models.Min('price')
-        )['price__min'] or self.base_price
-    def update_rating(self):
-        """Cập nhật rating và số lượng review liên quan đến product này"""
-        from reviews.models import Review  # import tại chỗ tránh circular import
+        update_fields = kwargs.get('update_fields')
+        if not self._state.adding and update_fields is None and not kwargs.get('force_insert'):
+            # Instance (mutation / admin) có thể giữ số liệu đánh giá / variant cũ trong khi review
+            # hoặc variant mới vừa cộng dồn => chỉ ghi khi được nêu tên trong update_fields
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key
+                and field.name not in self.RATING_AGGREGATE_FIELDS
+                and field.name not in self.DERIVED_FIELDS
+            ]
+        auto_slug = not self.slug
+        if auto_slug or not self.model_code:
+            # model_code "PRD-0001" từ sequence, slug không trùng (xem identifiers.py)
+            from .identifiers import assign_identifiers
+            assign_identifiers([self])
+        adding = self._state.adding
+        if adding:
+            # Chưa có variant: khoảng giá = giá cơ bản
+            self.min_price = self.max_price = self.base_price
+        if auto_slug:
+            self._save_with_slug_retry(*args, **kwargs)
+        else:
+            super().save(*args, **kwargs)
+
+        base_price_changed = getattr(self, '_loaded_base_price', None) != self.base_price
+        self._loaded_base_price = self.base_price
+        if not adding and base_price_changed and (update_fields is None or 'base_price' in update_fields):
+            # Khoảng giá của product chưa có variant active = giá cơ bản => tính lại từ DB
+            Product.refresh_variant_summary([self.pk])
+            self.refresh_from_db(fields=self.VARIANT_SUMMARY_FIELDS)
+
+    def _save_with_slug_retry(self, *args, **kwargs):
+        """Slug tự sinh vừa bị product tạo đồng thời chiếm => cấp slug khác rồi lưu lại"""
+        from .identifiers import allocate_slugs
+        for attempt in range(3):
+            try:
+                with transaction.atomic():
+                    return super().save(*args, **kwargs)
+            except IntegrityError:
+                if attempt == 2 or not Product.objects.filter(slug=self.slug).exclude(pk=self.pk).exists():
+                    raise
+                self.slug = allocate_slugs([self.name])[0]
+
+    @classmethod
+    def refresh_variant_summary(cls, product_ids):
+        """
+        Tính lại min_price, max_price, total_stock, variant_count từ variants active
+        bằng một câu UPDATE (subquery) cho tất cả product_ids
+        """
+        product_ids = [pk for pk in set(product_ids) if pk is not None]
+        if not product_ids:
+            return 0
+        active = ProductVariant.objects.filter(
+            product=models.OuterRef('pk'), is_active=True
+        ).order_by().values('product')
+
+        def summary(aggregate):
+            return models.Subquery(active.annotate(value=aggregate).values('value')[:1])
 
-        agg = Review.objects.filter(order_item__variant__product=self).aggregate(
-            avg_rating=Avg('rating'),
-            total_reviews=Count('review_id')
+        return cls.objects.filter(pk__in=product_ids).update(
+            min_price=Coalesce(summary(models.Min('price')), models.F('base_price')),
+            max_price=Coalesce(summary(models.Max('price')), models.F('base_price')),
+            total_stock=Coalesce(summary(models.Sum('stock')), 0),
+            variant_count=Coalesce(summary(Count('variant_id')), 0),
         )
 
-        self.rating = agg['avg_rating'] or 0
-        self.review_count = agg['total_reviews'] or 0
-        self.save(update_fields=['rating', 'review_count'])
-    @property  
-    def max_price(self):
-        """Giá cao nhất từ variants"""
-        return self.variants.filter(is_active=True).aggregate(
-            models.Max('price')
-        )['price__max'] or self.base_price
+    @staticmethod
+    def build_availability_matrix(options, variants):
+        """
+        Ma trận còn hàng gọn cho trang chi tiết sản phẩm
+
+        options: ProductAttributeOption của product (đã select_related attribute)
+        variants: [(variant_id, stock, option_combinations)] của variants active
+
+        Kết quả:
+        {
+            "axes": [{"attribute": "Màu", "options": [{"id", "value", "code", "image"}]},
+                     {"attribute": "Size", "options": [...]}],
+            "available": [bitmask, ...],   # hàng i (tùy chọn của trục 0), bit j (cột) = còn hàng
+            "variants": {"i,j": variant_id}
+        }
+        Trục 0 là thuộc tính có ảnh / màu (nếu có); cột j là chỉ số hỗn hợp (mixed radix)
+        của các trục còn lại => với Màu x Size, j chính là chỉ số size
+        """
+        axes = []
+        for option in options:
+            attribute = option.attribute
+            if not axes or axes[-1]['attribute_id'] != attribute.attribute_id:
+                axes.append({
+                    'attribute_id': attribute.attribute_id,
+                    'attribute': attribute.name,
+                    'is_color': attribute.has_image or attribute.type == 'color',
+                    'order': (attribute.display_order, attribute.name),
+                    'options': [],
+                })
+            axes[-1]['options'].append(option)
+        axes.sort(key=lambda axis: (not axis['is_color'], axis['order']))
+        if not axes:
+            return {}
+
+        index = [
+            {option.value: position for position, option in enumerate(axis['options'])}
+            for axis in axes
+        ]
+        available = [0] * len(axes[0]['options'])
+        variant_ids = {}
+        for variant_id, stock, option_combinations in variants:
+            combination = ProductVariant.parse_options(option_combinations)
+            positions = []
+            for axis, values in zip(axes, index):
+                position = values.get(str(combination.get(axis['attribute'])))
+                if position is None:
+                    break
+                positions.append(position)
+            else:
+                row, column = positions[0], 0
+                for axis, position in zip(axes[1:], positions[1:]):
+                    column = column * len(axis['options']) + position
+                variant_ids[f"{row},{column}"] = variant_id
+                options_available = all(
+                    axis['options'][position].is_available for axis, position in zip(axes, positions)
+                )
+                if stock > 0 and options_available:
+                    available[row] |= 1 << column
+
+        return {
+            'axes': [
+                {
+                    'attribute': axis['attribute'],
+                    'options': [
+                        {
+                            'id': option.option_id,
+                            'value': option.value,
+                            'code': option.value_code,
+                            'image': option.image.url if option.image else None,
+                        }
+                        for option in axis['options']
+                    ],
+                }
+                for axis in axes
+            ],
+            'available': available,
+            'variants': variant_ids,
+        }
+
+    @classmethod
+    def refresh_availability_matrix(cls, product_ids):
+        """Tính lại availability_matrix cho các product (2 query đọc + 1 bulk_update)"""
+        product_ids = [pk for pk in set(product_ids) if pk is not None]
+        if not product_ids:
+            return 0
+        options = {}
+        for option in ProductAttributeOption.objects.filter(product_id__in=product_ids)\
+                .select_related('attribute').order_by('attribute_id', 'display_order', 'value'):
+            options.setdefault(option.product_id, []).append(option)
+        variants = {}
+        for variant_id, product_id, stock, option_combinations in ProductVariant.objects.filter(
+            product_id__in=product_ids, is_active=True
+        ).order_by('variant_id').values_list('variant_id', 'product_id', 'stock', 'option_combinations'):
+            variants.setdefault(product_id, []).append((variant_id, stock, option_combinations))
+
+        products = [
+            cls(product_id=product_id, availability_matrix=cls.build_availability_matrix(
+                options.get(product_id, []), variants.get(product_id, [])
+            ))
+            for product_id in cls.objects.filter(pk__in=product_ids).values_list('pk', flat=True)
+        ]
+        cls.objects.bulk_update(products, ['availability_matrix'], batch_size=500)
+        return len(products)
+
+    # ===== ĐÁNH GIÁ (rating, review_count, rating_sum, histogram 1-5 sao) =====
+
+    RATING_STARS = (1, 2, 3, 4, 5)
+
+    @staticmethod
+    def rating_count_field(stars):
+        return f'rating_{stars}_count'
 
     @property
-    def total_stock(self):
-        """Tổng tồn kho"""
-        return self.variants.filter(is_active=True).aggregate(
-            models.Sum('stock')
-        )['stock__sum'] or 0
+    def rating_histogram(self):
+        """[số đánh giá 1 sao, ..., 5 sao]"""
+        return [getattr(self, self.rating_count_field(stars)) for stars in self.RATING_STARS]
+
+    @classmethod
+    def apply_review(cls, product_id, added=None, removed=None):
+        """
+        Thêm một đánh giá `added` sao và / hoặc bớt một đánh giá `removed` sao (None = không có)
+        Tổng, số lượng, histogram và trung bình đổi trong cùng một câu UPDATE bằng F()
+        """
+        if product_id is None or added == removed:
+            return
+        count_delta = (added is not None) - (removed is not None)
+        new_sum = models.F('rating_sum') + (added or 0) - (removed or 0)
+        new_count = models.F('review_count') + count_delta
+        changes = {
+            'rating_sum': new_sum,
+            'review_count': new_count,
+            'rating': models.Case(
+                models.When(
+                    review_count__gt=-count_delta,
+                    then=models.ExpressionWrapper(
+                        Cast(new_sum, models.FloatField()) / new_count,
+                        output_field=models.FloatField()
+                    )
+                ),
+                default=models.Value(0.0),
+                output_field=models.FloatField()
+            ),
+        }
+        if added is not None:
+            field = cls.rating_count_field(added)
+            changes[field] = models.F(field) + 1
+        if removed is not None:
+            field = cls.rating_count_field(removed)
+            changes[field] = models.F(field) - 1
+        cls.objects.filter(pk=product_id).update(**changes)
+
+    @classmethod
+    def rebuild_ratings(cls, product_ids=None, batch_size=1000, dry_run=False):
+        """
+        Tính lại tổng hợp đánh giá từ Review theo từng lô product_id (đối soát)
+        Một câu GROUP BY mỗi lô; chỉ ghi product bị lệch
+        Trả về (số product đã kiểm tra, số product lệch)
+        """
+        from SHOEX.reviews.models import Review  # import tại chỗ tránh circular import
+
+        histogram = [cls.rating_count_field(stars) for stars in cls.RATING_STARS]
+        fields = ['rating_sum', 'review_count', *histogram, 'rating']
+        products = cls.objects.order_by('product_id').values_list('product_id', flat=True)
+        if product_ids is not None:
+            products = products.filter(product_id__in=product_ids)
+        products = list(products)
+
+        checked = drifted = 0
+        for start in range(0, len(products), batch_size):
+            batch = {
+                row[0]: row[1:]
+                for row in cls.objects.filter(product_id__in=products[start:start + batch_size])
+                .values_list('product_id', *fields)
+            }
+            aggregates = {
+                row['order_item__variant__product_id']: row
+                for row in Review.objects.filter(order_item__variant__product_id__in=batch)
+                .values('order_item__variant__product_id')
+                .annotate(
+                    total=models.Sum('rating'),
+                    count=Count('review_id'),
+                    **{
+                        field: Count('review_id', filter=models.Q(rating=stars))
+                        for stars, field in zip(cls.RATING_STARS, histogram)
+                    }
+                )
+            }
+            stale = []
+            for product_id, current in batch.items():
+                row = aggregates.get(product_id, {})
+                total, count = row.get('total') or 0, row.get('count') or 0
+                expected = (total, count, *(row.get(field) or 0 for field in histogram), total / count if count else 0.0)
+                # Trung bình là số thực => so với sai số nhỏ
+                if current[:-1] != expected[:-1] or abs(current[-1] - expected[-1]) > 1e-9:
+                    stale.append(cls(product_id=product_id, **dict(zip(fields, expected))))
+            checked += len(batch)
+            drifted += len(stale)
+            if stale and not dry_run:
+                cls.objects.bulk_update(stale, fields, batch_size=100)
+        return checked, drifted
+
+    def update_rating(self):
+        """Tính lại rating và số lượng review của product này từ Review"""
+        self.rebuild_ratings(product_ids=[self.pk])
+        self.refresh_from_db(fields=['rating', 'review_count', 'rating_sum'] + [
+            self.rating_count_field(stars) for stars in self.RATING_STARS
+        ])
+
     @property
     def color_images(self):
         return self.attribute_options.filter(attribute__type='color')
@@ -256,8 +749,109 @@ class ProductAttribute(models.Model):
         return self.name
 
 
-class ProductAttributeOption(models.Model):
+class RenditionsModel(models.Model):
+    """
+    Ảnh kèm các bản thu nhỏ (JPEG + WebP theo RENDITION_WIDTHS) sinh nền sau khi lưu ảnh gốc,
+    cùng thông tin ảnh gốc đọc từ header lúc upload (width / height / format / content_hash)
+    Xem SHOEX/products/images.py
+    """
+    RENDITION_STATUS_CHOICES = [
+        ('pending', 'Chờ xử lý'),
+        ('processing', 'Đang xử lý'),
+        ('ready', 'Sẵn sàng'),
+        ('failed', 'Lỗi'),
+    ]
+    RENDITION_WIDTHS = {'thumb': 150, '400': 400, '800': 800, '1600': 1600}
+    DEFAULT_RENDITION = '800'     # Bản dùng cho image_url khi đã render
+
+    renditions = models.JSONField(
+        default=dict,
+        blank=True,
+        editable=False,
+        verbose_name="Các bản thu nhỏ",
+        help_text='{"400": {"width": 400, "height": 300, "jpeg": "...jpg", "webp": "...webp"}, ...}'
+    )
+    renditions_status = models.CharField(
+        max_length=20,
+        choices=RENDITION_STATUS_CHOICES,
+        default='pending',
+        editable=False,
+        verbose_name="Trạng thái bản thu nhỏ"
+    )
+    renditions_updated_at = models.DateTimeField(
+        null=True,
+        blank=True,
+        editable=False,
+        verbose_name="Cập nhật bản thu nhỏ lúc"
+    )
+    width = models.PositiveIntegerField(
+        null=True,
+        blank=True,
+        editable=False,
+        verbose_name="Chiều rộng ảnh gốc (px)"
+    )
+    height = models.PositiveIntegerField(
+        null=True,
+        blank=True,
+        editable=False,
+        verbose_name="Chiều cao ảnh gốc (px)"
+    )
+    format = models.CharField(
+        max_length=10,
+        blank=True,
+        editable=False,
+        verbose_name="Định dạng ảnh gốc"
+    )
+    content_hash = models.CharField(
+        max_length=64,
+        blank=True,
+        editable=False,
+        db_index=True,
+        verbose_name="SHA-256 ảnh gốc"
+    )
+
+    class Meta:
+        abstract = True
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Ảnh lúc load => pre_save (đổi ảnh? / media.remember_media) không SELECT lại
+        if 'image' in instance.__dict__:
+            name = instance.image.name
+            instance._loaded_media = [name] if name else []
+        return instance
+
+    def set_image_info(self, info):
+        """Gán thông tin từ read_image_info() (utils.py)"""
+        self.width = info['width']
+        self.height = info['height']
+        self.format = info['format']
+        self.content_hash = info['hash']
+
+    def rendition_url(self, label=None, format='jpeg'):
+        """URL bản label (mặc định DEFAULT_RENDITION); None nếu chưa render"""
+        rendition = (self.renditions or {}).get(label or self.DEFAULT_RENDITION)
+        if not rendition or not rendition.get(format):
+            return None
+        return self._meta.get_field('image').storage.url(rendition[format])
+
+    def srcset(self, format='webp'):
+        """Chuỗi srcset "url 400w, url 800w" (bỏ bản trùng chiều rộng); rỗng nếu chưa render"""
+        widths = {}
+        for rendition in (self.renditions or {}).values():
+            if rendition.get(format):
+                widths.setdefault(rendition['width'], rendition[format])
+        storage = self._meta.get_field('image').storage
+        return ", ".join(f"{storage.url(name)} {width}w" for width, name in sorted(widths.items()))
+
+
+class ProductAttributeOption(RenditionsModel):
     """Các tùy chọn cụ thể cho từng thuộc tính của sản phẩm"""
+    # Ảnh tùy chọn (swatch) hiển thị nhỏ
+    RENDITION_WIDTHS = {'thumb': 150, '300': 300, '600': 600}
+    DEFAULT_RENDITION = '300'
+
     option_id = models.AutoField(
         primary_key=True,
         verbose_name="Mã tùy chọn"
@@ -288,6 +882,7 @@ class ProductAttributeOption(models.Model):
     )
     image = models.ImageField(
         upload_to='products/attributes/%Y/%m/',
+        storage=media_storage,
         blank=True,
         null=True,
         verbose_name="Ảnh",
@@ -318,34 +913,12 @@ class ProductAttributeOption(models.Model):
         ]
 
     def get_variants(self):
-        """Lấy tất cả variants có tùy chọn này"""
-        return self.product.variants.filter(
-            option_combinations__contains=f'"{self.attribute.name}": "{self.value}"',
-            is_active=True
-        )
+        """Lấy tất cả variants có tùy chọn này (join qua VariantOptionValue)"""
+        return ProductVariant.objects.filter(option_values__option=self, is_active=True)
 
     def get_available_combinations(self, exclude_attributes=None):
-        """Lấy các kết hợp khác có sẵn khi đã chọn tùy chọn này"""
-        exclude_attributes = exclude_attributes or []
-        variants = self.get_variants().filter(stock__gt=0)
-        
-        combinations = {}
-        for variant in variants:
-            try:
-                options = json.loads(variant.option_combinations)
-                for attr_name, attr_value in options.items():
-                    if attr_name not in exclude_attributes and attr_name != self.attribute.name:
-                        if attr_name not in combinations:
-                            combinations[attr_name] = set()
-                        combinations[attr_name].add(attr_value)
-            except (json.JSONDecodeError, TypeError):
-                pass
-        
-        # Convert sets to sorted lists
-        for attr_name in combinations:
-            combinations[attr_name] = sorted(list(combinations[attr_name]))
-        
-        return combinations
+        """Lấy các kết hợp khác có sẵn (còn hàng) khi đã chọn tùy chọn này"""
+        return VariantOptionValue.available_combinations([self.pk], exclude_attributes).get(self.pk, {})
 
     @property
     def image_url(self):
@@ -423,10 +996,54 @@ class ProductVariant(models.Model):
             models.Index(fields=['product', 'is_active']),
             models.Index(fields=['sku']),
         ]
+        constraints = [
+            # Chốt chặn ở DB cho mọi đường trừ kho (xem inventory.py)
+            models.CheckConstraint(
+                condition=models.Q(stock__gte=0),
+                name='variant_stock_non_negative'
+            ),
+        ]
 
     def __str__(self):
         return f"{self.product.name} - {self.sku}"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Ghi nhớ option_combinations lúc load để chỉ đồng bộ VariantOptionValue khi nó đổi
+        if 'option_combinations' in instance.__dict__:
+            instance._loaded_option_combinations = instance.option_combinations
+        # stock / price lúc load => save() ghi lịch sử phần chênh lệch (xem signals.py)
+        if 'stock' in instance.__dict__:
+            instance._loaded_stock = instance.stock
+        if 'price' in instance.__dict__:
+            instance._loaded_price = instance.price
+        return instance
+
+    def refresh_from_db(self, using=None, fields=None, from_queryset=None):
+        super().refresh_from_db(using=using, fields=fields, from_queryset=from_queryset)
+        # Giá trị mới từ DB (ví dụ sau adjust_stock) là mốc so sánh cho lần save() sau
+        if fields is None or 'stock' in fields:
+            self._loaded_stock = self.stock
+        if fields is None or 'price' in fields:
+            self._loaded_price = self.price
+
+    @staticmethod
+    def parse_options(option_combinations):
+        """option_combinations (dict hoặc chuỗi JSON) -> dict {tên thuộc tính: giá trị}"""
+        try:
+            options = json.loads(option_combinations) if isinstance(option_combinations, str) else option_combinations
+        except (json.JSONDecodeError, TypeError):
+            return {}
+        return options if isinstance(options, dict) else {}
+
+    @property
+    def options_changed(self):
+        """option_combinations khác lúc load (variant mới / load không kèm field => coi như đổi)"""
+        if not hasattr(self, '_loaded_option_combinations'):
+            return True
+        return self._loaded_option_combinations != self.option_combinations
+
     @property
     def color_name(self):
         """Lấy tên màu từ option_combinations"""
@@ -474,7 +1091,128 @@ class ProductVariant(models.Model):
             raise ValidationError("option_combinations phải là JSON hợp lệ")
 
 
-class ProductImage(models.Model):
+class VariantOptionValue(models.Model):
+    """
+    Chỉ mục quan hệ của ProductVariant.option_combinations: mỗi (variant, thuộc tính) một dòng
+    trỏ tới ProductAttributeOption tương ứng
+
+    - option -> variants, lọc sản phẩm theo thuộc tính, ma trận kết hợp: join có index,
+      không so khớp chuỗi JSON
+    - Đồng bộ trong signals.py khi variant đổi option_combinations / option được tạo, đổi giá trị
+    - Giá trị trong JSON không có ProductAttributeOption tương ứng thì không được index
+    """
+    variant = models.ForeignKey(
+        ProductVariant,
+        on_delete=models.CASCADE,
+        related_name='option_values',
+        verbose_name="Biến thể"
+    )
+    attribute = models.ForeignKey(
+        ProductAttribute,
+        on_delete=models.CASCADE,
+        related_name='variant_values',
+        verbose_name="Thuộc tính"
+    )
+    option = models.ForeignKey(
+        ProductAttributeOption,
+        on_delete=models.CASCADE,
+        related_name='variant_values',
+        verbose_name="Tùy chọn"
+    )
+
+    class Meta:
+        verbose_name = "Giá trị tùy chọn của biến thể"
+        verbose_name_plural = "Giá trị tùy chọn của biến thể"
+        constraints = [
+            models.UniqueConstraint(fields=['variant', 'attribute'], name='variant_option_unique'),
+        ]
+        indexes = [
+            # option -> variants (get_variants, đếm variant, ma trận kết hợp)
+            models.Index(fields=['option', 'variant'], name='variant_option_option_idx'),
+            # Lọc sản phẩm theo thuộc tính: attribute -> option -> variant
+            models.Index(fields=['attribute', 'option', 'variant'], name='variant_option_attr_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.variant_id}: {self.attribute_id} = {self.option_id}"
+
+    # ===== ĐỒNG BỘ =====
+
+    @classmethod
+    def sync_variants(cls, variant_ids):
+        """Dựng lại chỉ mục cho các variant (số query cố định, không phụ thuộc số variant)"""
+        variant_ids = [pk for pk in set(variant_ids) if pk is not None]
+        if not variant_ids:
+            return 0
+        variants = list(ProductVariant.objects.filter(pk__in=variant_ids)
+                        .values_list('variant_id', 'product_id', 'option_combinations'))
+        options = {
+            (product_id, attribute_name, value): (option_id, attribute_id)
+            for option_id, product_id, attribute_id, attribute_name, value in
+            ProductAttributeOption.objects.filter(product_id__in={row[1] for row in variants})
+            .values_list('option_id', 'product_id', 'attribute_id', 'attribute__name', 'value')
+        }
+
+        rows = []
+        for variant_id, product_id, option_combinations in variants:
+            for attribute_name, value in ProductVariant.parse_options(option_combinations).items():
+                match = options.get((product_id, attribute_name, str(value)))
+                if match:
+                    rows.append(cls(variant_id=variant_id, option_id=match[0], attribute_id=match[1]))
+
+        with transaction.atomic():
+            cls.objects.filter(variant_id__in=variant_ids).delete()
+            cls.objects.bulk_create(rows, batch_size=1000, ignore_conflicts=True)
+        return len(rows)
+
+    @classmethod
+    def sync_products(cls, product_ids):
+        """Dựng lại chỉ mục cho toàn bộ variant của các product"""
+        if not product_ids:
+            return 0
+        return cls.sync_variants(
+            ProductVariant.objects.filter(product_id__in=product_ids).values_list('variant_id', flat=True)
+        )
+
+    @classmethod
+    def rebuild(cls, batch_size=1000):
+        """Dựng lại toàn bộ bảng, theo lô product"""
+        product_ids = list(Product.objects.order_by('product_id').values_list('product_id', flat=True))
+        total = 0
+        for start in range(0, len(product_ids), batch_size):
+            total += cls.sync_products(product_ids[start:start + batch_size])
+        return total
+
+    # ===== TRUY VẤN =====
+
+    @classmethod
+    def available_combinations(cls, option_ids, exclude_attributes=None):
+        """
+        {option_id: {tên thuộc tính khác: [giá trị, ...]}} của các variant active, còn hàng
+        có option đó - một query (self-join trên bảng index) cho nhiều option
+        """
+        exclude_attributes = exclude_attributes or []
+        rows = cls.objects.filter(
+            variant__option_values__option_id__in=option_ids,
+            variant__is_active=True,
+            variant__stock__gt=0,
+        ).values_list(
+            'variant__option_values__option_id', 'variant__option_values__attribute_id',
+            'attribute_id', 'attribute__name', 'option__value'
+        ).distinct()
+
+        combinations = {}
+        for option_id, option_attribute_id, attribute_id, attribute_name, value in rows:
+            if attribute_id == option_attribute_id or attribute_name in exclude_attributes:
+                continue
+            combinations.setdefault(option_id, {}).setdefault(attribute_name, set()).add(value)
+        return {
+            option_id: {name: sorted(values) for name, values in attributes.items()}
+            for option_id, attributes in combinations.items()
+        }
+
+
+class ProductImage(RenditionsModel):
     """
     Bảng lưu trữ ảnh cho Product (ảnh đại diện + ảnh chính)
     Thiết kế đơn giản: 1 Product có 1 ảnh đại diện + nhiều ảnh chính
@@ -495,6 +1233,7 @@ class ProductImage(models.Model):
     
     image = models.ImageField(
         upload_to='products/gallery/%Y/%m/',
+        storage=media_storage,
         verbose_name="Ảnh sản phẩm",
         help_text="Upload ảnh sản phẩm"
     )
@@ -547,4 +1286,678 @@ class ProductImage(models.Model):
         return f"{img_type} - {self.product.name}"
 
 
-# Bỏ phần cũ vì đã được thay thế ở trên
\ No newline at end of file
+# Bỏ phần cũ vì đã được thay thế ở trên
+
+
+class ProductSalesStats(models.Model):
+    """
+    Số liệu bán hàng / đánh giá tổng hợp sẵn của sản phẩm (rollup)
+
+    - Cập nhật tăng dần bằng F() khi OrderItem / Review thay đổi (xem signals.py)
+    - Cửa sổ 30 ngày trôi theo thời gian => chạy định kỳ
+      `python manage.py rebuild_product_stats` để tính lại chính xác
+    - Sort / filter bán chạy, đánh giá chỉ đọc cột có index, không SUM/AVG theo lịch sử đơn
+    """
+    WINDOW_DAYS = 30
+    HOT_SOLD_THRESHOLD = 50
+
+    product = models.OneToOneField(
+        Product,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='sales_stats',
+        verbose_name="Sản phẩm"
+    )
+    sold_count = models.IntegerField(
+        default=0,
+        db_index=True,
+        verbose_name="Tổng số đã bán"
+    )
+    sold_count_last_30 = models.IntegerField(
+        default=0,
+        db_index=True,
+        verbose_name="Số đã bán 30 ngày"
+    )
+    rating_sum_last_30 = models.IntegerField(
+        default=0,
+        verbose_name="Tổng điểm đánh giá 30 ngày"
+    )
+    rating_count_last_30 = models.IntegerField(
+        default=0,
+        verbose_name="Số đánh giá 30 ngày"
+    )
+    avg_rating_last_30 = models.FloatField(
+        default=0.0,
+        db_index=True,
+        verbose_name="Điểm đánh giá trung bình 30 ngày"
+    )
+    updated_at = models.DateTimeField(
+        auto_now=True,
+        verbose_name="Ngày cập nhật"
+    )
+
+    class Meta:
+        verbose_name = "Thống kê bán hàng sản phẩm"
+        verbose_name_plural = "Thống kê bán hàng sản phẩm"
+
+    def __str__(self):
+        return f"Thống kê - {self.product_id}"
+
+    @classmethod
+    def window_start(cls):
+        return timezone.now() - timedelta(days=cls.WINDOW_DAYS)
+
+    # ===== CẬP NHẬT TĂNG DẦN =====
+
+    @classmethod
+    def apply_sales(cls, product_id, quantity, recent=True):
+        """Cộng (hoặc trừ nếu âm) số lượng bán cho product"""
+        if not quantity:
+            return
+        changes = {'sold_count': models.F('sold_count') + quantity}
+        if recent:
+            changes['sold_count_last_30'] = models.F('sold_count_last_30') + quantity
+        if not cls.objects.filter(product_id=product_id).update(**changes):
+            cls.objects.get_or_create(product_id=product_id)
+            cls.objects.filter(product_id=product_id).update(**changes)
+
+    @classmethod
+    def apply_rating(cls, product_id, rating_delta, count_delta):
+        """Cộng dồn điểm / số đánh giá 30 ngày và tính lại trung bình trong cùng câu UPDATE"""
+        if not rating_delta and not count_delta:
+            return
+        new_sum = models.F('rating_sum_last_30') + rating_delta
+        new_count = models.F('rating_count_last_30') + count_delta
+        changes = {
+            'rating_sum_last_30': new_sum,
+            'rating_count_last_30': new_count,
+            'avg_rating_last_30': models.Case(
+                models.When(
+                    rating_count_last_30__gt=-count_delta,
+                    then=models.ExpressionWrapper(
+                        Cast(new_sum, models.FloatField()) / new_count,
+                        output_field=models.FloatField()
+                    )
+                ),
+                default=models.Value(0.0),
+                output_field=models.FloatField()
+            ),
+        }
+        if not cls.objects.filter(product_id=product_id).update(**changes):
+            cls.objects.get_or_create(product_id=product_id)
+            cls.objects.filter(product_id=product_id).update(**changes)
+
+    # ===== TÍNH LẠI TOÀN BỘ =====
+
+    @classmethod
+    def rebuild(cls, product_ids=None, batch_size=1000):
+        """
+        Tính lại chính xác từ OrderItem / Review, theo từng lô product_id
+        Mỗi nguồn được aggregate riêng => không bị nhân dòng do join OrderItem x Review
+        Trả về số product đã cập nhật
+        """
+        from django.db.models import Sum, Q
+        from SHOEX.orders.models import OrderItem
+        from SHOEX.reviews.models import Review
+
+        now = timezone.now()
+        since = now - timedelta(days=cls.WINDOW_DAYS)
+        products = Product.objects.order_by('product_id').values_list('product_id', flat=True)
+        if product_ids is not None:
+            products = products.filter(product_id__in=product_ids)
+        products = list(products)
+
+        updated = 0
+        for start in range(0, len(products), batch_size):
+            batch = products[start:start + batch_size]
+            sales = {
+                row['variant__product_id']: row
+                for row in OrderItem.objects.filter(variant__product_id__in=batch)
+                .values('variant__product_id')
+                .annotate(
+                    total=Sum('quantity'),
+                    recent=Sum('quantity', filter=Q(order__created_at__gte=since))
+                )
+            }
+            ratings = {
+                row['order_item__variant__product_id']: row
+                for row in Review.objects.filter(
+                    order_item__variant__product_id__in=batch,
+                    order_item__order__created_at__gte=since
+                )
+                .values('order_item__variant__product_id')
+                .annotate(total=Sum('rating'), count=Count('review_id'))
+            }
+
+            rows = []
+            for product_id in batch:
+                sale = sales.get(product_id, {})
+                rating = ratings.get(product_id, {})
+                rating_sum = rating.get('total') or 0
+                rating_count = rating.get('count') or 0
+                rows.append(cls(
+                    product_id=product_id,
+                    sold_count=sale.get('total') or 0,
+                    sold_count_last_30=sale.get('recent') or 0,
+                    rating_sum_last_30=rating_sum,
+                    rating_count_last_30=rating_count,
+                    avg_rating_last_30=rating_sum / rating_count if rating_count else 0.0,
+                    updated_at=now,
+                ))
+            cls.objects.bulk_create(
+                rows,
+                update_conflicts=True,
+                unique_fields=['product'],
+                update_fields=[
+                    'sold_count', 'sold_count_last_30', 'rating_sum_last_30',
+                    'rating_count_last_30', 'avg_rating_last_30', 'updated_at'
+                ],
+            )
+            updated += len(rows)
+        return updated
+
+
+class StockReservation(models.Model):
+    """
+    Giữ hàng có thời hạn cho giỏ hàng / đơn hàng (xem SHOEX/products/inventory.py)
+
+    - held: đã trừ khỏi ProductVariant.stock, hết hạn (expires_at) thì trả lại kho
+    - committed: đã chốt vào đơn hàng, không hết hạn; hủy đơn => trả lại kho
+    - released: đã trả lại kho
+    """
+    STATUS_CHOICES = [
+        ('held', 'Đang giữ'),
+        ('committed', 'Đã chốt đơn'),
+        ('released', 'Đã trả lại'),
+    ]
+
+    reservation_id = models.AutoField(
+        primary_key=True,
+        verbose_name="Mã giữ hàng"
+    )
+    variant = models.ForeignKey(
+        ProductVariant,
+        on_delete=models.CASCADE,
+        related_name='reservations',
+        verbose_name="Biến thể"
+    )
+    cart = models.ForeignKey(
+        'cart.Cart',
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='stock_reservations',
+        verbose_name="Giỏ hàng"
+    )
+    order = models.ForeignKey(
+        'orders.Order',
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='stock_reservations',
+        verbose_name="Đơn hàng"
+    )
+    quantity = models.PositiveIntegerField(
+        verbose_name="Số lượng"
+    )
+    status = models.CharField(
+        max_length=20,
+        choices=STATUS_CHOICES,
+        default='held',
+        verbose_name="Trạng thái"
+    )
+    expires_at = models.DateTimeField(
+        verbose_name="Hết hạn lúc",
+        help_text="Chỉ áp dụng khi đang giữ (held)"
+    )
+    created_at = models.DateTimeField(
+        auto_now_add=True,
+        verbose_name="Ngày tạo"
+    )
+    updated_at = models.DateTimeField(
+        auto_now=True,
+        verbose_name="Ngày cập nhật"
+    )
+
+    class Meta:
+        verbose_name = "Giữ hàng"
+        verbose_name_plural = "Giữ hàng"
+        indexes = [
+            # Quét giữ hàng hết hạn: status = 'held' AND expires_at < now
+            models.Index(fields=['status', 'expires_at']),
+            models.Index(fields=['cart', 'status']),
+            models.Index(fields=['order', 'status']),
+        ]
+
+    def __str__(self):
+        return f"{self.variant_id} x{self.quantity} ({self.get_status_display()})"
+
+
+class AppendOnlyModel(models.Model):
+    """Bản ghi lịch sử chỉ thêm, không sửa / xóa từng dòng (ghi theo lô qua history.py)"""
+
+    class Meta:
+        abstract = True
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding:
+            raise ValidationError(f"{self._meta.verbose_name} chỉ được thêm mới, không được sửa")
+        super().save(*args, **kwargs)
+
+    def delete(self, *args, **kwargs):
+        raise ValidationError(f"{self._meta.verbose_name} không được xóa")
+
+
+class InventoryLedger(AppendOnlyModel):
+    """
+    Sổ cái tồn kho: mỗi dòng là một lần cộng / trừ kho của một variant
+
+    Ghi theo lô sau commit (xem SHOEX/products/history.py), không INSERT từng dòng
+    trên đường trừ kho. Tồn kho tại thời điểm T = stock hiện tại - tổng change sau T
+    """
+    SOURCE_CHOICES = [
+        ('adjust', 'Điều chỉnh'),
+        ('bulk', 'Cập nhật hàng loạt'),
+        ('import', 'Đồng bộ từ file'),
+        ('transfer', 'Chuyển kho'),
+        ('reservation', 'Giữ hàng'),
+        ('release', 'Trả lại kho'),
+        ('edit', 'Sửa biến thể'),
+        ('create', 'Tồn kho ban đầu'),
+    ]
+
+    entry_id = models.BigAutoField(
+        primary_key=True,
+        verbose_name="Mã bút toán"
+    )
+    variant = models.ForeignKey(
+        ProductVariant,
+        on_delete=models.CASCADE,
+        related_name='ledger_entries',
+        verbose_name="Biến thể"
+    )
+    change = models.IntegerField(
+        verbose_name="Thay đổi",
+        help_text="Dương = nhập thêm, âm = trừ kho"
+    )
+    source = models.CharField(
+        max_length=20,
+        choices=SOURCE_CHOICES,
+        default='adjust',
+        verbose_name="Nguồn"
+    )
+    reason = models.CharField(
+        max_length=255,
+        blank=True,
+        verbose_name="Lý do"
+    )
+    user = models.ForeignKey(
+        'users.User',
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='+',
+        verbose_name="Người thực hiện"
+    )
+    # Thời điểm thay đổi (lúc gọi, không phải lúc flush lô)
+    created_at = models.DateTimeField(
+        default=timezone.now,
+        editable=False,
+        verbose_name="Thời điểm"
+    )
+
+    class Meta:
+        verbose_name = "Sổ cái tồn kho"
+        verbose_name_plural = "Sổ cái tồn kho"
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['variant', 'created_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.variant_id} {self.change:+d} ({self.get_source_display()})"
+
+    @classmethod
+    def stock_at_many(cls, variant_ids, at):
+        """
+        {variant_id: tồn kho tại thời điểm at} (1 query)
+        Variant tạo sau at => 0 (variant cũ chưa có dòng 'create' cho tồn kho ban đầu)
+        """
+        changed_after = models.Subquery(
+            cls.objects.filter(variant_id=models.OuterRef('pk'), created_at__gt=at)
+            .values('variant_id')
+            .annotate(total=models.Sum('change'))
+            .values('total')[:1]
+        )
+        return dict(
+            ProductVariant.objects.filter(pk__in=variant_ids)
+            .annotate(stock_at=models.Case(
+                models.When(created_at__gt=at, then=models.Value(0)),
+                default=models.F('stock') - Coalesce(changed_after, 0),
+                output_field=models.IntegerField()
+            ))
+            .values_list('pk', 'stock_at')
+        )
+
+    @classmethod
+    def stock_at(cls, sku, at):
+        """Tồn kho của SKU tại thời điểm at, None nếu SKU không tồn tại"""
+        variant_id = ProductVariant.objects.filter(sku=sku).values_list('pk', flat=True).first()
+        if variant_id is None:
+            return None
+        return cls.stock_at_many([variant_id], at).get(variant_id)
+
+
+class PriceHistory(AppendOnlyModel):
+    """Lịch sử giá bán của variant (ghi theo lô như InventoryLedger)"""
+    history_id = models.BigAutoField(
+        primary_key=True,
+        verbose_name="Mã lịch sử"
+    )
+    variant = models.ForeignKey(
+        ProductVariant,
+        on_delete=models.CASCADE,
+        related_name='price_history',
+        verbose_name="Biến thể"
+    )
+    old_price = models.DecimalField(
+        max_digits=12,
+        decimal_places=2,
+        verbose_name="Giá cũ"
+    )
+    new_price = models.DecimalField(
+        max_digits=12,
+        decimal_places=2,
+        verbose_name="Giá mới"
+    )
+    source = models.CharField(
+        max_length=20,
+        choices=InventoryLedger.SOURCE_CHOICES,
+        default='adjust',
+        verbose_name="Nguồn"
+    )
+    reason = models.CharField(
+        max_length=255,
+        blank=True,
+        verbose_name="Lý do"
+    )
+    user = models.ForeignKey(
+        'users.User',
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='+',
+        verbose_name="Người thực hiện"
+    )
+    created_at = models.DateTimeField(
+        default=timezone.now,
+        editable=False,
+        verbose_name="Thời điểm"
+    )
+
+    class Meta:
+        verbose_name = "Lịch sử giá"
+        verbose_name_plural = "Lịch sử giá"
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['variant', 'created_at']),
+            # Quét giảm giá toàn catalog theo khoảng thời gian
+            models.Index(fields=['created_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.variant_id}: {self.old_price} -> {self.new_price}"
+
+    @property
+    def change_percent(self):
+        """% thay đổi giá (âm = giảm giá)"""
+        if not self.old_price:
+            return None
+        return (self.new_price - self.old_price) / self.old_price * 100
+
+    @classmethod
+    def price_at(cls, variant_id, at):
+        """Giá của variant tại thời điểm at (giá hiện tại nếu không đổi giá từ sau at)"""
+        entry = cls.objects.filter(variant_id=variant_id, created_at__gt=at)\
+            .order_by('created_at').values_list('old_price', flat=True).first()
+        if entry is not None:
+            return entry
+        return ProductVariant.objects.filter(pk=variant_id).values_list('price', flat=True).first()
+
+    @classmethod
+    def price_drops(cls, since, min_percent=0, variant_ids=None):
+        """
+        Các lần giảm giá từ `since`, giảm ít nhất min_percent %
+        Queryset annotate drop_percent, giảm nhiều nhất trước
+        """
+        queryset = cls.objects.filter(created_at__gte=since, new_price__lt=models.F('old_price'))
+        if min_percent:
+            min_ratio = 1 - Decimal(str(min_percent)) / 100
+            queryset = queryset.filter(new_price__lte=models.F('old_price') * models.Value(min_ratio))
+        if variant_ids is not None:
+            queryset = queryset.filter(variant_id__in=variant_ids)
+        return queryset.annotate(
+            drop_percent=models.ExpressionWrapper(
+                (models.F('old_price') - models.F('new_price')) * 100 / models.F('old_price'),
+                output_field=models.DecimalField(max_digits=7, decimal_places=2)
+            )
+        ).order_by('-drop_percent', '-created_at')
+
+
+class CodeSequence(models.Model):
+    """
+    Bộ đếm cấp mã theo khối (model_code sản phẩm...) cho CSDL không có SEQUENCE
+    PostgreSQL dùng SEQUENCE thật, bảng này là dự phòng (xem SHOEX/products/identifiers.py)
+    """
+    name = models.CharField(
+        max_length=50,
+        primary_key=True,
+        verbose_name="Tên bộ đếm"
+    )
+    value = models.BigIntegerField(
+        default=0,
+        verbose_name="Giá trị đã cấp gần nhất"
+    )
+
+    class Meta:
+        verbose_name = "Bộ đếm mã"
+        verbose_name_plural = "Bộ đếm mã"
+
+    def __str__(self):
+        return f"{self.name} = {self.value}"
+
+
+class ProductImportJob(models.Model):
+    """
+    Một lần nhập sản phẩm / biến thể từ file (CSV, JSON lines, XLSX) cho một store
+
+    File được đọc theo luồng, mỗi khối dòng một transaction (xem SHOEX/products/imports.py);
+    processed_rows cập nhật cùng transaction với khối => chạy lại tiếp từ khối chưa xong
+    """
+    STATUS_CHOICES = [
+        ('pending', 'Chờ xử lý'),
+        ('running', 'Đang chạy'),
+        ('completed', 'Hoàn tất'),
+        ('failed', 'Thất bại'),
+    ]
+    FORMAT_CHOICES = [
+        ('csv', 'CSV'),
+        ('jsonl', 'JSON lines'),
+        ('xlsx', 'Excel (XLSX)'),
+    ]
+
+    job_id = models.AutoField(
+        primary_key=True,
+        verbose_name="Mã lần nhập"
+    )
+    store = models.ForeignKey(
+        'store.Store',
+        on_delete=models.CASCADE,
+        related_name='product_imports',
+        verbose_name="Cửa hàng"
+    )
+    user = models.ForeignKey(
+        'users.User',
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='product_imports',
+        verbose_name="Người nhập"
+    )
+    file = models.FileField(
+        upload_to='imports/products/%Y/%m/',
+        verbose_name="File nhập"
+    )
+    format = models.CharField(
+        max_length=10,
+        choices=FORMAT_CHOICES,
+        verbose_name="Định dạng"
+    )
+    status = models.CharField(
+        max_length=20,
+        choices=STATUS_CHOICES,
+        default='pending',
+        verbose_name="Trạng thái"
+    )
+    total_rows = models.IntegerField(
+        null=True,
+        blank=True,
+        verbose_name="Tổng số dòng",
+        help_text="Biết khi đọc hết file"
+    )
+    processed_rows = models.IntegerField(
+        default=0,
+        verbose_name="Số dòng đã xử lý"
+    )
+    created_products = models.IntegerField(default=0, verbose_name="Sản phẩm mới")
+    updated_products = models.IntegerField(default=0, verbose_name="Sản phẩm cập nhật")
+    created_variants = models.IntegerField(default=0, verbose_name="Biến thể mới")
+    updated_variants = models.IntegerField(default=0, verbose_name="Biến thể cập nhật")
+    error_count = models.IntegerField(
+        default=0,
+        verbose_name="Số dòng lỗi"
+    )
+    errors = models.JSONField(
+        default=list,
+        blank=True,
+        verbose_name="Lỗi từng dòng",
+        help_text="Tối đa MAX_JOB_ERRORS lỗi đầu tiên"
+    )
+    started_at = models.DateTimeField(
+        null=True,
+        blank=True,
+        verbose_name="Bắt đầu lúc"
+    )
+    finished_at = models.DateTimeField(
+        null=True,
+        blank=True,
+        verbose_name="Kết thúc lúc"
+    )
+    created_at = models.DateTimeField(
+        auto_now_add=True,
+        verbose_name="Ngày tạo"
+    )
+    updated_at = models.DateTimeField(
+        auto_now=True,
+        verbose_name="Ngày cập nhật"
+    )
+
+    class Meta:
+        verbose_name = "Nhập sản phẩm"
+        verbose_name_plural = "Nhập sản phẩm"
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['status', 'updated_at']),
+            models.Index(fields=['store', '-created_at']),
+        ]
+
+    def __str__(self):
+        return f"Import #{self.job_id} ({self.get_status_display()})"
+
+
+class MediaBlob(models.Model):
+    """
+    Một file media trong storage (ảnh sản phẩm, tùy chọn, danh mục, cửa hàng) và số dòng đang dùng nó
+
+    File mới lưu qua media_storage (SHOEX/products/storage.py) có tên theo SHA-256 nội dung =>
+    nhiều dòng dùng chung một file. ref_count tăng / giảm trong cùng transaction với dòng (signals.py);
+    file về 0 tham chiếu không xóa ngay mà để `python manage.py collect_media` xóa theo lô
+    sau MEDIA_GC_GRACE_HOURS (xem SHOEX/products/media.py)
+    """
+    name = models.CharField(
+        max_length=255,
+        primary_key=True,
+        verbose_name="Tên file trong storage"
+    )
+    ref_count = models.IntegerField(
+        default=0,
+        verbose_name="Số tham chiếu"
+    )
+    released_at = models.DateTimeField(
+        null=True,
+        blank=True,
+        verbose_name="Hết tham chiếu lúc",
+        help_text="NULL khi còn được dùng"
+    )
+    created_at = models.DateTimeField(
+        auto_now_add=True,
+        verbose_name="Ngày tạo"
+    )
+
+    class Meta:
+        verbose_name = "File media"
+        verbose_name_plural = "File media"
+        indexes = [
+            models.Index(fields=['ref_count', 'released_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.name} ({self.ref_count})"
+
+    @classmethod
+    def track(cls, names):
+        """Ghi nhận file vừa lưu (chưa có dòng nào dùng => collect_media xóa nếu không ai nhận)"""
+        now = timezone.now()
+        cls.objects.bulk_create(
+            [cls(name=name, released_at=now) for name in names if name],
+            ignore_conflicts=True
+        )
+
+    @classmethod
+    def _group(cls, names):
+        """{số lần: [tên]} - mỗi nhóm một câu UPDATE"""
+        counts = {}
+        for name in names:
+            if name:
+                counts[name] = counts.get(name, 0) + 1
+        groups = {}
+        for name, count in counts.items():
+            groups.setdefault(count, []).append(name)
+        return counts, groups
+
+    @classmethod
+    def acquire(cls, names):
+        """Thêm một tham chiếu cho mỗi tên (lặp tên = nhiều tham chiếu)"""
+        counts, groups = cls._group(names)
+        if not counts:
+            return
+        cls.track(counts)
+        for count, group in groups.items():
+            cls.objects.filter(name__in=group).update(
+                ref_count=models.F('ref_count') + count,
+                released_at=None
+            )
+
+    @classmethod
+    def release(cls, names):
+        """Bớt một tham chiếu cho mỗi tên; về 0 => ghi released_at (chờ collect_media)"""
+        counts, groups = cls._group(names)
+        if not counts:
+            return
+        # File cũ (trước khi có bảng này) chưa có dòng => tạo với 0 tham chiếu
+        cls.track(counts)
+        for count, group in groups.items():
+            cls.objects.filter(name__in=group).update(
+                ref_count=Greatest(models.F('ref_count') - count, 0)
+            )
+        cls.objects.filter(name__in=counts, ref_count=0, released_at__isnull=True).update(released_at=timezone.now())
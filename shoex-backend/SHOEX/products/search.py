@@ -0,0 +1,93 @@
+"""
+Tìm kiếm sản phẩm
+
+PostgreSQL (production):
+- Cột `search_vector` (tsvector, GENERATED ... STORED) trên bảng products_product, tạo trong
+  migration 0009_product_search: name (A) + model_code (B) + description (C), đã bỏ dấu
+- GIN index trên search_vector và GIN pg_trgm trên shoex_unaccent(lower(name))
+- Từ khóa được bỏ dấu ("giày" == "giay"), khớp tiền tố cho từng từ (gõ tới đâu tìm tới đó)
+  và chịu lỗi chính tả qua word_similarity của pg_trgm
+- Xếp hạng: ts_rank + word_similarity
+
+Cột search_vector không khai báo trên model để các query danh sách không phải SELECT nó.
+Database khác (sqlite khi dev) dùng icontains như trước.
+"""
+
+import re
+import unicodedata
+
+from django.contrib.postgres.search import TrigramWordSimilarity
+from django.db import connection
+from django.db.models import BooleanField, CharField, FloatField, Func, Q, Value
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import Lower
+
+from .models import Product
+
+
+SEARCH_CONFIG = 'simple'
+SEARCH_VECTOR_COLUMN = 'search_vector'
+
+
+def normalize_search_text(text):
+    """Chuẩn hóa giống shoex_unaccent(lower(...)) phía DB: chữ thường, bỏ dấu, đ -> d"""
+    text = (text or '').lower().replace('đ', 'd')
+    text = unicodedata.normalize('NFKD', text)
+    return ''.join(ch for ch in text if not unicodedata.combining(ch)).strip()
+
+
+def _tsquery(normalized):
+    """'giay chay' -> 'giay:* & chay:*' (chỉ giữ ký tự chữ/số nên an toàn cho to_tsquery)"""
+    return ' & '.join(f"{token}:*" for token in re.findall(r'\w+', normalized))
+
+
+class Unaccent(Func):
+    """shoex_unaccent(): bản IMMUTABLE của unaccent() (dùng được trong index / generated column)"""
+    function = 'shoex_unaccent'
+    output_field = CharField()
+
+
+def _vector_sql(template, tsquery, output_field):
+    column = f"{connection.ops.quote_name(Product._meta.db_table)}.{connection.ops.quote_name(SEARCH_VECTOR_COLUMN)}"
+    sql = template.format(column=column, config=SEARCH_CONFIG)
+    return RawSQL(sql, [tsquery], output_field=output_field)
+
+
+def search_products(queryset, query, rank=False):
+    """
+    Lọc queryset Product theo từ khóa
+
+    rank=True: thêm annotation `search_rank` và sắp xếp theo độ liên quan
+    """
+    normalized = normalize_search_text(query)
+    if not normalized:
+        return queryset
+
+    if connection.vendor != 'postgresql':
+        queryset = queryset.filter(Q(name__icontains=query) | Q(description__icontains=query))
+        if rank:
+            queryset = queryset.annotate(search_rank=Value(0.0, output_field=FloatField()))\
+                .order_by('-search_rank', '-created_at')
+        return queryset
+
+    tsquery = _tsquery(normalized)
+    queryset = queryset.alias(search_name=Unaccent(Lower('name')))
+
+    condition = Q(search_name__trigram_word_similar=normalized)
+    if tsquery:
+        condition |= Q(_vector_sql(
+            "{column} @@ to_tsquery('{config}', %s)", tsquery, BooleanField()
+        ))
+    queryset = queryset.filter(condition)
+
+    if rank:
+        similarity = TrigramWordSimilarity(Value(normalized), 'search_name')
+        if tsquery:
+            text_rank = _vector_sql(
+                "ts_rank({column}, to_tsquery('{config}', %s))", tsquery, FloatField()
+            )
+            queryset = queryset.annotate(search_rank=text_rank + similarity)
+        else:
+            queryset = queryset.annotate(search_rank=similarity)
+        queryset = queryset.order_by('-search_rank', '-created_at')
+    return queryset
@@ -1,72 +1,252 @@
-import os
-from django.db.models.signals import post_delete, pre_save
-from django.dispatch import receiver
-from django.conf import settings
-from django.db.models.signals import post_delete,pre_save
+from django.db.models.signals import post_delete, pre_save, post_save
 from django.dispatch import receiver
 from SHOEX.reviews.models import Review
-from .models import ProductImage, ProductAttributeOption
+from SHOEX.orders.models import Order, OrderItem
+from SHOEX.store.models import Store, StoreImage
+from .models import Category, Product, ProductImage, ProductAttributeOption, ProductVariant, ProductSalesStats
+from .utils import schedule_variant_summary, schedule_variant_options
+from .inventory import restock_orders
+from .history import record_stock_changes, record_price_changes
+from .images import schedule_renditions
+from .media import media_names, release_media, remember_media, update_media_refs
 
-@receiver(pre_save, sender=Review)
-def update_product_rating_on_save(sender, instance, **kwargs):
-    instance.order_item.variant.product.update_rating()
+@receiver(pre_save, sender=ProductImage)
+@receiver(pre_save, sender=ProductAttributeOption)
+def reset_renditions_on_image_change(sender, instance, update_fields=None, **kwargs):
+    """Đổi ảnh => render lại (file cũ: collect_media xóa khi hết tham chiếu)"""
+    if instance._state.adding or (update_fields is not None and 'image' not in update_fields):
+        return
+    # Ảnh lúc load / lần lưu trước (from_db, media.update_media_refs) => không SELECT
+    loaded = getattr(instance, '_loaded_media', None)
+    if loaded is None:
+        loaded = [name for name in sender.objects.filter(pk=instance.pk).values_list('image', flat=True) if name]
+    if loaded != media_names(instance):
+        reset_renditions(instance)
 
-@receiver(post_delete, sender=Review)
-def update_product_rating_on_delete(sender, instance, **kwargs):
-    instance.order_item.variant.product.update_rating()
-@receiver(post_delete, sender=ProductImage)
-def delete_product_image_file(sender, instance, **kwargs):
+
+def reset_renditions(instance):
     """
-    Xóa file ảnh khi xóa ProductImage
+    Ảnh gốc đổi => đánh dấu render lại
+    Bản thu nhỏ cũ thuộc về file gốc (có thể dòng khác vẫn dùng) => không xóa ở đây
     """
-    if instance.image:
-        if os.path.isfile(instance.image.path):
-            os.remove(instance.image.path)
+    instance.renditions = {}
+    instance.renditions_status = 'pending'
+    instance.renditions_updated_at = None
 
 
-@receiver(post_delete, sender=ProductAttributeOption)
-def delete_product_attribute_option_image_file(sender, instance, **kwargs):
-    """
-    Xóa file ảnh khi xóa ProductAttributeOption
-    """
-    if instance.image:
-        if os.path.isfile(instance.image.path):
-            os.remove(instance.image.path)
+@receiver(post_save, sender=ProductImage)
+@receiver(post_save, sender=ProductAttributeOption)
+def render_image_on_save(sender, instance, **kwargs):
+    """Ảnh mới / vừa đổi => sinh bản thu nhỏ nền sau commit"""
+    if instance.image and instance.renditions_status == 'pending':
+        schedule_renditions(instance)
 
 
+# ===== MEDIA (đếm tham chiếu file, media.py) =====
+
 @receiver(pre_save, sender=ProductImage)
-def delete_old_product_image_file_on_update(sender, instance, **kwargs):
-    """
-    Xóa file ảnh cũ khi cập nhật ProductImage
-    """
-    if not instance.pk:
-        return False
+@receiver(pre_save, sender=ProductAttributeOption)
+@receiver(pre_save, sender=Category)
+@receiver(pre_save, sender=Product)
+@receiver(pre_save, sender=Store)
+@receiver(pre_save, sender=StoreImage)
+def remember_media_on_save(sender, instance, update_fields=None, raw=False, **kwargs):
+    if not raw:
+        remember_media(instance, update_fields)
 
-    try:
-        old_file = ProductImage.objects.get(pk=instance.pk).image
-    except ProductImage.DoesNotExist:
-        return False
 
-    new_file = instance.image
-    if not old_file == new_file:
-        if old_file and os.path.isfile(old_file.path):
-            os.remove(old_file.path)
+@receiver(post_save, sender=ProductImage)
+@receiver(post_save, sender=ProductAttributeOption)
+@receiver(post_save, sender=Category)
+@receiver(post_save, sender=Product)
+@receiver(post_save, sender=Store)
+@receiver(post_save, sender=StoreImage)
+def update_media_refs_on_save(sender, instance, raw=False, **kwargs):
+    if not raw:
+        update_media_refs(instance)
 
 
-@receiver(pre_save, sender=ProductAttributeOption)
-def delete_old_product_attribute_option_image_file_on_update(sender, instance, **kwargs):
-    """
-    Xóa file ảnh cũ khi cập nhật ProductAttributeOption
-    """
-    if not instance.pk:
-        return False
-
-    try:
-        old_file = ProductAttributeOption.objects.get(pk=instance.pk).image
-    except ProductAttributeOption.DoesNotExist:
-        return False
-
-    new_file = instance.image
-    if not old_file == new_file:
-        if old_file and os.path.isfile(old_file.path):
-            os.remove(old_file.path)
\ No newline at end of file
+@receiver(post_delete, sender=ProductImage)
+@receiver(post_delete, sender=ProductAttributeOption)
+@receiver(post_delete, sender=Category)
+@receiver(post_delete, sender=Product)
+@receiver(post_delete, sender=Store)
+@receiver(post_delete, sender=StoreImage)
+def release_media_on_delete(sender, instance, **kwargs):
+    """File không xóa trong request: hết tham chiếu => collect_media xóa theo lô"""
+    release_media(instance)
+
+
+# ===== VARIANT SUMMARY (Product.min_price, max_price, total_stock, variant_count) =====
+
+@receiver(post_save, sender=ProductVariant)
+def update_variant_summary_on_save(sender, instance, **kwargs):
+    schedule_variant_summary({instance.product_id})
+
+
+@receiver(post_delete, sender=ProductVariant)
+def update_variant_summary_on_delete(sender, instance, **kwargs):
+    schedule_variant_summary({instance.product_id})
+
+
+# ===== VARIANT OPTION INDEX (VariantOptionValue) =====
+
+@receiver(post_save, sender=ProductVariant)
+def sync_variant_options_on_save(sender, instance, created, **kwargs):
+    if created or instance.options_changed:
+        schedule_variant_options(variant_ids={instance.pk})
+        instance._loaded_option_combinations = instance.option_combinations
+
+
+# ===== LỊCH SỬ KHO / GIÁ (sửa variant qua save(), ví dụ admin / ProductVariantUpdate) =====
+
+@receiver(post_save, sender=ProductVariant)
+def record_variant_history_on_save(sender, instance, created, **kwargs):
+    if created:
+        # Tồn kho ban đầu => stock_at() trước các lần sửa sau này không lệch
+        record_stock_changes({instance.pk: instance.stock}, source='create')
+        instance._loaded_stock = instance.stock
+        instance._loaded_price = instance.price
+        return
+    loaded_stock = getattr(instance, '_loaded_stock', None)
+    if loaded_stock is not None and loaded_stock != instance.stock:
+        record_stock_changes({instance.pk: instance.stock - loaded_stock}, source='edit')
+    loaded_price = getattr(instance, '_loaded_price', None)
+    if loaded_price is not None and loaded_price != instance.price:
+        record_price_changes([(instance.pk, loaded_price, instance.price)], source='edit')
+    instance._loaded_stock = instance.stock
+    instance._loaded_price = instance.price
+
+
+@receiver(post_save, sender=ProductAttributeOption)
+def sync_variant_options_on_option_save(sender, instance, **kwargs):
+    # Option mới / đổi giá trị => variant của product có thể khớp (hoặc hết khớp) option này
+    schedule_variant_options(product_ids={instance.product_id})
+    # Trục của availability_matrix đổi theo
+    schedule_variant_summary({instance.product_id})
+
+
+@receiver(post_delete, sender=ProductAttributeOption)
+def update_availability_on_option_delete(sender, instance, **kwargs):
+    schedule_variant_summary({instance.product_id})
+
+
+# ===== STOCK RESERVATION (inventory.py) =====
+
+@receiver(post_save, sender=Order)
+def restock_on_order_cancel(sender, instance, **kwargs):
+    # Cùng transaction với việc hủy đơn; phần đã trả kho không bị cộng lại lần nữa
+    if instance.status == 'cancelled':
+        restock_orders([instance.pk])
+
+
+# ===== PRODUCT SALES STATS (rollup) =====
+
+def _variant_product_id(instance, variant_id):
+    """product_id của variant: lấy từ instance.variant đã load (checkout / admin) thay vì SELECT"""
+    variant = instance._state.fields_cache.get('variant')
+    if variant is not None and variant.pk == variant_id:
+        return variant.product_id
+    return ProductVariant.objects.filter(pk=variant_id).values_list('product_id', flat=True).first()
+
+
+def _is_recent_order(instance):
+    """Đơn hàng có nằm trong cửa sổ 30 ngày của ProductSalesStats không"""
+    order = instance._state.fields_cache.get('order')
+    if order is not None and order.pk == instance.order_id and order.created_at is not None:
+        return order.created_at >= ProductSalesStats.window_start()
+    return Order.objects.filter(
+        pk=instance.order_id,
+        created_at__gte=ProductSalesStats.window_start()
+    ).exists()
+
+
+@receiver(post_save, sender=Product)
+def create_product_sales_stats(sender, instance, created, **kwargs):
+    """Mỗi product luôn có 1 dòng thống kê (sort / filter không gặp NULL)"""
+    if created:
+        ProductSalesStats.objects.get_or_create(product=instance)
+
+
+@receiver(pre_save, sender=OrderItem)
+def remember_order_item_quantity(sender, instance, **kwargs):
+    """Lưu số lượng / variant cũ để tính chênh lệch khi cập nhật (đã ghi nhớ lúc load => không SELECT)"""
+    if instance._state.adding:
+        instance._stats_old = None
+    elif hasattr(instance, '_loaded_stats'):
+        instance._stats_old = instance._loaded_stats
+    else:
+        instance._stats_old = OrderItem.objects.filter(pk=instance.pk).values_list(
+            'variant_id', 'quantity'
+        ).first()
+
+
+@receiver(post_save, sender=OrderItem)
+def update_sales_stats_on_order_item_save(sender, instance, created, **kwargs):
+    old = getattr(instance, '_stats_old', None)
+    new = (instance.variant_id, instance.quantity)
+    instance._loaded_stats = new
+    if old == new:
+        # Sửa trường khác (giá, giảm giá): số lượng bán không đổi
+        return
+    recent = _is_recent_order(instance)
+    if old and old[0] != instance.variant_id:
+        ProductSalesStats.apply_sales(_variant_product_id(instance, old[0]), -old[1], recent)
+        old = None
+    delta = instance.quantity - (old[1] if old else 0)
+    ProductSalesStats.apply_sales(_variant_product_id(instance, instance.variant_id), delta, recent)
+
+
+@receiver(post_delete, sender=OrderItem)
+def update_sales_stats_on_order_item_delete(sender, instance, **kwargs):
+    product_id = _variant_product_id(instance, instance.variant_id)
+    if product_id is not None:
+        ProductSalesStats.apply_sales(product_id, -instance.quantity, _is_recent_order(instance))
+
+
+def _review_stats_target(order_item_id):
+    """(product_id, recent) của order item được đánh giá"""
+    row = OrderItem.objects.filter(pk=order_item_id).values_list(
+        'variant__product_id', 'order__created_at'
+    ).first()
+    if row is None:
+        return None, False
+    return row[0], row[1] >= ProductSalesStats.window_start()
+
+
+@receiver(pre_save, sender=Review)
+def remember_review_rating(sender, instance, **kwargs):
+    instance._stats_old = None
+    if instance.pk:
+        instance._stats_old = Review.objects.filter(pk=instance.pk).values_list(
+            'order_item_id', 'rating'
+        ).first()
+
+
+@receiver(post_save, sender=Review)
+def update_rating_aggregates_on_review_save(sender, instance, created, **kwargs):
+    """Product.rating / review_count / histogram và ProductSalesStats 30 ngày: cộng chênh lệch bằng F()"""
+    old = getattr(instance, '_stats_old', None)
+    product_id, recent = _review_stats_target(instance.order_item_id)
+    if old and old[0] == instance.order_item_id:
+        # Chỉ đổi số sao: một câu UPDATE với chênh lệch
+        Product.apply_review(product_id, added=instance.rating, removed=old[1])
+        if recent:
+            ProductSalesStats.apply_rating(product_id, instance.rating - old[1], 0)
+        return
+    if old:
+        old_product_id, old_recent = _review_stats_target(old[0])
+        Product.apply_review(old_product_id, removed=old[1])
+        if old_recent:
+            ProductSalesStats.apply_rating(old_product_id, -old[1], -1)
+    Product.apply_review(product_id, added=instance.rating)
+    if recent:
+        ProductSalesStats.apply_rating(product_id, instance.rating, 1)
+
+
+@receiver(post_delete, sender=Review)
+def update_rating_aggregates_on_review_delete(sender, instance, **kwargs):
+    product_id, recent = _review_stats_target(instance.order_item_id)
+    Product.apply_review(product_id, removed=instance.rating)
+    if recent:
+        ProductSalesStats.apply_rating(product_id, -instance.rating, -1)
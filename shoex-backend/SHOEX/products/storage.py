@@ -0,0 +1,84 @@
+"""
+Storage đặt tên file theo nội dung (SHA-256): cas/ab/cd/<sha256>.<ext>
+
+- Cùng nội dung => cùng tên => chỉ lưu một file (ảnh dùng cho 30 tùy chọn màu, upload lại
+  bằng công cụ hàng loạt...)
+- delete() không xóa: file có thể đang được dòng khác dùng. Số tham chiếu nằm ở MediaBlob,
+  file hết tham chiếu được xóa theo lô bằng `python manage.py collect_media` (xem media.py)
+- upload_to của field bị bỏ qua (tên do nội dung quyết định)
+
+Module không import model ở đầu file => dùng được trong models.py của mọi app.
+"""
+
+import hashlib
+import os
+import posixpath
+
+from django.core.files.storage import FileSystemStorage
+from django.utils.deconstruct import deconstructible
+
+
+HASH_CHUNK_SIZE = 1024 * 1024
+EXTENSION_ALIASES = {'.jpeg': '.jpg'}
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    prefix = 'cas'
+
+    @classmethod
+    def content_name(cls, content_hash, filename):
+        extension = posixpath.splitext(filename or '')[1].lower()
+        extension = EXTENSION_ALIASES.get(extension, extension)
+        return f"{cls.prefix}/{content_hash[:2]}/{content_hash[2:4]}/{content_hash}{extension}"
+
+    @staticmethod
+    def hash_content(content):
+        digest = hashlib.sha256()
+        if hasattr(content, 'seek'):
+            content.seek(0)
+        for chunk in content.chunks(HASH_CHUNK_SIZE) if hasattr(content, 'chunks') else iter(
+                lambda: content.read(HASH_CHUNK_SIZE), b''):
+            digest.update(chunk)
+        if hasattr(content, 'seek'):
+            content.seek(0)
+        return digest.hexdigest()
+
+    def save(self, name, content, max_length=None):
+        """Lưu (nếu chưa có) dưới tên theo nội dung; trả về tên đó"""
+        if not hasattr(content, 'chunks'):
+            from django.core.files import File
+            content = File(content, name)
+        name = self.content_name(self.hash_content(content), name or getattr(content, 'name', ''))
+        if self.exists(name):
+            self.touch(name)
+        else:
+            try:
+                name = self._save(name, content)
+            except FileExistsError:
+                # Request khác vừa ghi cùng nội dung
+                pass
+        from .models import MediaBlob
+        MediaBlob.track([name])
+        return name
+
+    def touch(self, name):
+        """Dùng lại file có sẵn => cập nhật mtime, collect_media bỏ qua file vừa được chạm"""
+        try:
+            os.utime(self.path(name))
+        except OSError:
+            pass
+
+    def get_available_name(self, name, max_length=None):
+        # Cùng tên = cùng nội dung => ghi đè / dùng lại, không thêm hậu tố ngẫu nhiên
+        return name
+
+    def delete(self, name):
+        """Không xóa ngay (file dùng chung) - collect_media xóa khi hết tham chiếu"""
+
+    def purge(self, name):
+        """Xóa thật file (chỉ dùng trong bộ thu gom)"""
+        super().delete(name)
+
+
+media_storage = ContentAddressedStorage()
@@ -1,3 +1,864 @@
-from django.test import TestCase
+import os
+import posixpath
+import shutil
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from decimal import Decimal
+from io import BytesIO
+from types import SimpleNamespace
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from PIL import Image
+from django.core.exceptions import ValidationError
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection, connections
+from django.db.models import F
+from django.test import TestCase, TransactionTestCase
+from django.utils import timezone
+import graphene
+from graphql import GraphQLError
+
+from SHOEX.address.models import Address
+from SHOEX.brand.models import Brand
+from SHOEX.orders.models import Order, OrderItem, SubOrder
+from SHOEX.store.models import Store, StoreUser
+from SHOEX.users.models import User
+from graphql_api.core.connection import create_connection_slice
+from graphql_api.core.optimizer import QueryHint, optimize_queryset
+from graphql_api.product.bulk_mutations.bulk_product_mutations import apply_price_rows, apply_stock_rows
+from graphql_api.product.schema import ProductCountableConnection
+from graphql_api.product.sort.sorting import apply_product_sorting
+from graphql_api.product.ultis.ultis import annotate_sales_stats
+
+from . import images
+from .images import claim_renditions, process_renditions
+from .imports import ProductImporter
+from .media import collect_media
+from .inventory import (
+    InsufficientStock, adjust_stock, release_reservations, reserve_stock
+)
+from .models import (
+    Category, CategoryClosure, InventoryLedger, MediaBlob, Product, ProductAttribute, ProductImage, ProductImportJob,
+    ProductSalesStats, ProductVariant
+)
+from .storage import media_storage
+from .utils import read_image_info, refresh_stale_variant_summaries, validate_image, variant_summary_batch
+
+
+def create_store(store_id='s1'):
+    return Store.objects.create(
+        store_id=store_id, name=store_id.upper(), slug=store_id, email=f'{store_id}@shoex.vn',
+        join_date=timezone.now()
+    )
+
+
+def create_product(store, category, name='Giày chạy bộ', stocks=(5, 5), brand=None):
+    """Product kèm một variant / phần tử của stocks"""
+    product = Product.objects.create(
+        store=store, category=category, brand=brand, name=name, base_price=Decimal('100000')
+    )
+    for index, stock in enumerate(stocks):
+        ProductVariant.objects.create(
+            product=product, sku=f'{product.pk}-{index}', price=Decimal('100000') + index * 1000,
+            stock=stock, option_combinations={'Size': str(39 + index)}
+        )
+    return product
+
+
+def image_upload(name='giay.jpg', size=(1200, 800), color=(200, 30, 30), format='JPEG'):
+    buffer = BytesIO()
+    Image.new('RGB', size, color).save(buffer, format=format)
+    return SimpleUploadedFile(name, buffer.getvalue())
+
+
+def use_temporary_media(test):
+    """MEDIA_ROOT tạm cho một test (file CAS / bản thu nhỏ ghi thật ra đĩa)"""
+    root = tempfile.mkdtemp()
+    test.addCleanup(shutil.rmtree, root, ignore_errors=True)
+    override = test.settings(MEDIA_ROOT=root)
+    override.enable()
+    test.addCleanup(override.disable)
+
+
+def paginate(queryset, size, backward=False):
+    """Mọi node qua các trang cursor (backward => last / before, ghép lại theo thứ tự gốc)"""
+    seen, cursor = [], None
+    while True:
+        if backward:
+            page = create_connection_slice(
+                queryset, None, {'last': size, 'before': cursor}, ProductCountableConnection
+            )
+            seen = [edge.node.pk for edge in page.edges] + seen
+            if not page.page_info.has_previous_page:
+                return seen
+            cursor = page.page_info.start_cursor
+        else:
+            page = create_connection_slice(
+                queryset, None, {'first': size, 'after': cursor}, ProductCountableConnection
+            )
+            seen += [edge.node.pk for edge in page.edges]
+            if not page.page_info.has_next_page:
+                return seen
+            cursor = page.page_info.end_cursor
+
+
+# ===== TRANG SẢN PHẨM GRAPHQL (graphql_api/core/dataloaders.py) =====
+
+PRODUCT_PAGE_QUERY = """
+{
+  products(first: 20) {
+    edges { node {
+      productId name
+      category { name }
+      variants { edges { node { sku price stock isActive product { name } } } }
+      galleryImages { imageUrl }
+      thumbnailImage { imageUrl }
+    } }
+  }
+}
+"""
+
+
+class ProductPageQueryTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.store, cls.category = create_store(), Category.objects.create(name='Giày')
+        for index in range(3):
+            cls.create_product(index)
+
+    @classmethod
+    def create_product(cls, index):
+        product = create_product(cls.store, cls.category, name=f'Giày {index}', stocks=(5, 0, 2))
+        # bulk_create: bỏ qua bước đọc file ảnh khi lưu (file không tồn tại trong test)
+        ProductImage.objects.bulk_create([
+            ProductImage(product=product, image=f'cas/00/{product.pk}-{order}.jpg',
+                         is_thumbnail=order == 0, display_order=order)
+            for order in range(2)
+        ])
+        return product
+
+    def query_page(self):
+        response = self.client.post('/graphql/', {'query': PRODUCT_PAGE_QUERY}, content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        return [edge['node'] for edge in response.json()['data']['products']['edges']]
+
+    def test_query_count_does_not_grow_with_page(self):
+        # product + category (1) + variants (1) + product của variant (1) + ảnh (1) + transaction của request (2)
+        with self.assertNumQueries(6):
+            products = self.query_page()
+        self.assertEqual(len(products), 3)
+
+        for index in range(3, 8):
+            self.create_product(index)
+        with self.assertNumQueries(6):
+            products = self.query_page()
+        self.assertEqual(len(products), 8)
+        for product in products:
+            variants = [edge['node'] for edge in product['variants']['edges']]
+            self.assertEqual(len(variants), 3)
+            self.assertEqual({variant['product']['name'] for variant in variants}, {product['name']})
+            self.assertEqual(product['category'], {'name': 'Giày'})
+            self.assertEqual(len(product['galleryImages']), 2)
+            self.assertIsNotNone(product['thumbnailImage'])
+
+    def test_variants_include_inactive(self):
+        product = Product.objects.get(name='Giày 0')
+        hidden = product.variants.order_by('pk').first()
+        ProductVariant.objects.filter(pk=hidden.pk).update(is_active=False)
+
+        node = next(node for node in self.query_page() if node['name'] == 'Giày 0')
+        variants = {edge['node']['sku']: edge['node']['isActive'] for edge in node['variants']['edges']}
+        self.assertEqual(len(variants), 3)
+        self.assertFalse(variants[hidden.sku])
+
+
+# ===== TỐI ƯU QUERYSET (graphql_api/core/optimizer.py) =====
+
+class OptimizedProduct(graphene.ObjectType):
+    product_id = graphene.ID()
+    name = graphene.String()
+    category_name = graphene.String()
+    total_stock = graphene.Int()
+    label = graphene.String(description="Không phải cột, không có hint")
+
+    query_hints = {
+        'category_name': QueryHint(select_related=['category']),
+        'total_stock': QueryHint(only=['total_stock']),
+    }
+
+    def resolve_category_name(self, info):
+        return self.category.name
+
+    def resolve_label(self, info):
+        return f"{self.name} - {self.description}"
+
+
+class OptimizerQuery(graphene.ObjectType):
+    products = graphene.List(OptimizedProduct)
+
+    def resolve_products(self, info):
+        info.context.queryset = optimize_queryset(Product.objects.order_by('pk'), info, OptimizedProduct)
+        return info.context.queryset
+
+
+class OptimizeQuerysetTests(TestCase):
+    schema = graphene.Schema(query=OptimizerQuery)
+
+    @classmethod
+    def setUpTestData(cls):
+        store, category = create_store(), Category.objects.create(name='Giày')
+        for index in range(3):
+            create_product(store, category, name=f'Giày {index}', stocks=())
+
+    def execute(self, query):
+        context = SimpleNamespace()
+        result = self.schema.execute(query, context_value=context)
+        self.assertIsNone(result.errors)
+        return result.data['products'], context.queryset.query.deferred_loading
+
+    def test_only_selected_columns(self):
+        with self.assertNumQueries(1):
+            products, (fields, defer) = self.execute('{ products { name totalStock } }')
+        self.assertEqual((set(fields), defer), ({'product_id', 'name', 'total_stock'}, False))
+        self.assertEqual(len(products), 3)
+
+    def test_hint_select_related(self):
+        with self.assertNumQueries(1):
+            products, (fields, defer) = self.execute('{ products { categoryName } }')
+        self.assertEqual((set(fields), defer), ({'product_id', 'category'}, False))
+        self.assertEqual({product['categoryName'] for product in products}, {'Giày'})
+
+    def test_unknown_field_drops_only(self):
+        # label đọc description: nếu vẫn only() thì mỗi product thêm một query lấy cột bị defer
+        with self.assertNumQueries(1):
+            products, (fields, defer) = self.execute('{ products { name label } }')
+        self.assertEqual((set(fields), defer), (set(), True))
+        self.assertTrue(all(product['label'].startswith('Giày') for product in products))
+
+
+# ===== CÂY DANH MỤC (CategoryClosure) =====
+
+class CategoryClosureTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        # Giày > Chạy bộ > Trail, Giày > Dép
+        cls.root = Category.objects.create(name='Giày')
+        cls.running = Category.objects.create(name='Chạy bộ', parent=cls.root)
+        cls.trail = Category.objects.create(name='Trail', parent=cls.running)
+        cls.sandals = Category.objects.create(name='Dép', parent=cls.root)
+
+    def closure(self):
+        return set(CategoryClosure.objects.values_list('ancestor_id', 'descendant_id', 'depth'))
+
+    def expected_closure(self):
+        """Đi ngược chuỗi parent_id của từng danh mục"""
+        parents = dict(Category.objects.values_list('category_id', 'parent_id'))
+        rows = set()
+        for category_id in parents:
+            node, depth = category_id, 0
+            while node is not None:
+                rows.add((node, category_id, depth))
+                node, depth = parents[node], depth + 1
+        return rows
+
+    def subtree(self, category, active_only=True):
+        return set(Category.objects.filter(
+            pk__in=CategoryClosure.subtree_ids([category.pk], active_only=active_only)
+        ).values_list('name', flat=True))
+
+    def test_insert(self):
+        self.assertEqual(self.closure(), self.expected_closure())
+        self.assertEqual(
+            [category.name for category in CategoryClosure.ancestors_of([self.trail.pk])[self.trail.pk]],
+            ['Giày', 'Chạy bộ', 'Trail']
+        )
+
+    def test_move_subtree(self):
+        running = Category.objects.get(pk=self.running.pk)
+        running.parent = self.sandals
+        running.save()
+        self.assertEqual(self.closure(), self.expected_closure())
+        self.assertEqual(self.subtree(self.sandals), {'Dép', 'Chạy bộ', 'Trail'})
+
+        # Không chuyển được vào nhánh con của chính nó
+        root = Category.objects.get(pk=self.root.pk)
+        root.parent = self.trail
+        with self.assertRaises(ValidationError):
+            root.save()
+        self.assertEqual(self.closure(), self.expected_closure())
+
+    def test_active_only_hides_inactive_branch(self):
+        Category.objects.filter(pk=self.running.pk).update(is_active=False)
+        self.assertEqual(self.subtree(self.root), {'Giày', 'Dép'})
+        self.assertEqual(self.subtree(self.root, active_only=False), {'Giày', 'Chạy bộ', 'Trail', 'Dép'})
+        # Danh mục gốc được truyền vào luôn được giữ
+        self.assertEqual(self.subtree(self.running), {'Chạy bộ', 'Trail'})
+
+    def test_rebuild_matches_parent_chain(self):
+        # Sửa parent bằng queryset.update() không đi qua save() => bảng closure lệch
+        Category.objects.filter(pk=self.trail.pk).update(parent=self.sandals)
+        self.assertNotEqual(self.closure(), self.expected_closure())
+        self.assertEqual(CategoryClosure.rebuild(), 4)
+        self.assertEqual(self.closure(), self.expected_closure())
+
+
+# ===== TỒN KHO (inventory.py) =====
+
+class StockTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.product = create_product(create_store(), Category.objects.create(name='Giày'), stocks=(5, 1))
+        cls.first, cls.second = cls.product.variants.order_by('pk')
+
+    def stock(self, variant):
+        return ProductVariant.objects.values_list('stock', flat=True).get(pk=variant.pk)
+
+    def test_adjust_stock_is_all_or_nothing(self):
+        with self.assertRaises(InsufficientStock) as raised:
+            adjust_stock({self.first.pk: -2, self.second.pk: -2})
+        self.assertEqual(raised.exception.variant_ids, [self.second.pk])
+        self.assertEqual((self.stock(self.first), self.stock(self.second)), (5, 1))
+
+        adjust_stock({self.first.pk: -2, self.second.pk: -1})
+        self.assertEqual((self.stock(self.first), self.stock(self.second)), (3, 0))
+
+    def test_adjust_stock_logs_ledger_after_commit(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            adjust_stock({self.first.pk: -2}, source='order', reason='Đơn 1')
+        self.assertEqual(
+            list(InventoryLedger.objects.filter(source='order').values_list('variant_id', 'change', 'reason')),
+            [(self.first.pk, -2, 'Đơn 1')]
+        )
+
+    def test_checkout_marks_summary_stale(self):
+        # Kho đổi qua checkout: không tính lại tóm tắt, chỉ đánh dấu (đã đánh dấu => UPDATE không ghi gì)
+        # Mỗi lần: SAVEPOINT, UPDATE kho, UPDATE đánh dấu, RELEASE - không SELECT product_id
+        with self.assertNumQueries(8):
+            adjust_stock({self.first.pk: -1}, product_ids={self.product.pk})
+            adjust_stock({self.second.pk: -1}, product_ids={self.product.pk})
+        adjust_stock({self.first.pk: 1})
+        product = Product.objects.get(pk=self.product.pk)
+        self.assertEqual((product.variant_summary_stale, product.total_stock), (True, 6))
+
+        # Instance cũ lưu lại không xóa cờ
+        product.name = 'Giày đổi tên'
+        product.save()
+        self.assertEqual(refresh_stale_variant_summaries(), 1)
+        product = Product.objects.get(pk=self.product.pk)
+        self.assertEqual((product.variant_summary_stale, product.total_stock), (False, 5))
+        self.assertEqual(refresh_stale_variant_summaries(), 0)
+
+    def test_rollback_drops_stale_mark(self):
+        with self.assertRaises(InsufficientStock):
+            adjust_stock({self.first.pk: -1, self.second.pk: -2})
+        self.assertFalse(Product.objects.get(pk=self.product.pk).variant_summary_stale)
+
+    def test_summary_batch_refreshes_on_exit(self):
+        with variant_summary_batch():
+            adjust_stock({self.first.pk: -1}, product_ids={self.product.pk})
+        product = Product.objects.get(pk=self.product.pk)
+        self.assertEqual((product.variant_summary_stale, product.total_stock), (False, 5))
+
+    def test_release_reservations_restocks_once(self):
+        reserve_stock({self.first.pk: 3, self.second.pk: 1})
+        self.assertEqual((self.stock(self.first), self.stock(self.second)), (2, 0))
+        with self.assertRaises(InsufficientStock):
+            reserve_stock({self.second.pk: 1})
+
+        self.assertEqual(release_reservations(), 2)
+        self.assertEqual(release_reservations(), 0)
+        self.assertEqual((self.stock(self.first), self.stock(self.second)), (5, 1))
+
+
+@skipUnless(connection.vendor == 'postgresql', "Cần PostgreSQL (row lock) để kiểm tra đồng thời")
+class StockConcurrencyTests(TransactionTestCase):
+    def test_parallel_checkouts_do_not_oversell(self):
+        product = create_product(create_store(), Category.objects.create(name='Giày'), stocks=(5,))
+        variant = product.variants.get()
+        results = []
+        barrier = threading.Barrier(10)
+
+        def checkout():
+            try:
+                barrier.wait()
+                adjust_stock({variant.pk: -1}, source='order')
+                results.append(True)
+            except InsufficientStock:
+                results.append(False)
+            finally:
+                connections.close_all()
+
+        threads = [threading.Thread(target=checkout) for _ in range(10)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(results.count(True), 5)
+        variant.refresh_from_db()
+        self.assertEqual(variant.stock, 0)
+
+
+# ===== PHÂN TRANG CURSOR (graphql_api/core/connection.py) =====
+
+class KeysetPaginationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        store, category = create_store(), Category.objects.create(name='Giày')
+        brands = [Brand.objects.create(name=name, slug=name.lower()) for name in ('Adidas', 'Nike')]
+        for index in range(11):
+            # Cứ 3 product có 1 product không có brand => cột sắp xếp có NULL
+            brand = None if index % 3 == 0 else brands[index % 2]
+            create_product(store, category, name=f'Giày {index}', stocks=(), brand=brand)
+
+    def test_pages_cover_every_row_once(self):
+        orderings = (
+            ['pk'], ['-pk'], ['brand_id'], ['-brand_id'], ['brand_name', '-product_id'],
+            # Vị trí NULL khai báo tường minh (sort bán hàng: F(...).desc(nulls_last=True))
+            [F('brand_id').desc(nulls_last=True)], [F('brand_name').asc(nulls_first=True), '-product_id'],
+        )
+        for ordering in orderings:
+            with self.subTest(ordering=ordering):
+                queryset = Product.objects.annotate(brand_name=F('brand__name')).order_by(*ordering)
+                expected = list(queryset.values_list('pk', flat=True))
+                forward = paginate(queryset, 4)
+                self.assertEqual(sorted(forward), sorted(expected))
+                self.assertEqual(len(forward), len(set(forward)))
+                self.assertEqual(paginate(queryset, 4, backward=True), forward)
+
+    def test_unsupported_ordering(self):
+        with self.assertRaises(GraphQLError):
+            create_connection_slice(Product.objects.order_by('?'), None, {'first': 2}, ProductCountableConnection)
+
+
+# ===== CẬP NHẬT HÀNG LOẠT (bulk_product_mutations.py) =====
+
+class BulkUpdateTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name='Giày')
+        own_store, other_store = create_store('s1'), create_store('s2')
+        cls.user = User.objects.create_user(username='manager', email='manager@shoex.vn', password='x')
+        StoreUser.objects.create(store=own_store, user=cls.user, role='manager', status='active')
+        cls.own = create_product(own_store, category, name='Giày chạy bộ', stocks=(5, 2)).variants.order_by('pk')[0]
+        cls.other = create_product(other_store, category, name='Giày đá bóng', stocks=(5,)).variants.get()
+
+    def test_stock_rows(self):
+        rows = [
+            ('Row 1', self.own.pk, None, -3, 'Kiểm kho'),
+            ('Row 2', None, self.own.sku, -3, ''),            # 5 - 3 - 3 < 0
+            ('Row 3', None, self.own.sku, 1, ''),
+            ('Row 4', self.other.pk, None, 1, ''),
+            ('Row 5', None, 'KHONG-CO', 1, ''),
+        ]
+        with self.captureOnCommitCallbacks(execute=True):
+            success_count, errors = apply_stock_rows(self.user, rows)
+
+        self.assertEqual(success_count, 2)
+        self.assertEqual(errors, [
+            "Row 4: Permission denied",
+            "Row 5: Variant not found",
+            "Row 2: Stock cannot be negative",
+        ])
+        self.own.refresh_from_db()
+        self.other.refresh_from_db()
+        self.assertEqual((self.own.stock, self.other.stock), (3, 5))
+        self.assertEqual(
+            list(InventoryLedger.objects.filter(source='bulk').order_by('pk').values_list('change', 'reason')),
+            [(-3, 'Kiểm kho'), (1, '')]
+        )
+
+    def test_price_rows(self):
+        rows = [
+            ('Row 1', self.own.pk, None, Decimal('0'), ''),
+            ('Row 2', self.own.pk, None, Decimal('90000'), ''),
+            ('Row 3', None, self.own.sku, Decimal('95000'), ''),
+            ('Row 4', self.other.pk, None, Decimal('95000'), ''),
+        ]
+        with self.captureOnCommitCallbacks(execute=True):
+            success_count, errors = apply_price_rows(self.user, rows)
+
+        self.assertEqual(success_count, 2)
+        self.assertEqual(errors, ["Row 4: Permission denied", "Row 1: Price must be positive"])
+        self.own.refresh_from_db()
+        self.assertEqual(self.own.price, Decimal('95000'))
+        self.own.product.refresh_from_db()
+        self.assertEqual(self.own.product.min_price, Decimal('95000'))
+
+    def test_staff_edits_any_store(self):
+        staff = User.objects.create_user(username='staff', email='staff@shoex.vn', password='x', is_staff=True)
+        success_count, errors = apply_stock_rows(staff, [('Row 1', self.other.pk, None, 2, '')])
+        self.assertEqual((success_count, errors), (1, []))
+
+
+# ===== NHẬP FILE (imports.py) =====
+
+class ProductImporterTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.store = create_store()
+        Category.objects.create(name='Giày')
+        ProductAttribute.objects.create(name='Size', type='select')
+
+    def create_job(self, **kwargs):
+        return ProductImportJob.objects.create(
+            store=self.store, file='imports/products.csv', format='csv', status='running',
+            started_at=timezone.now(), **kwargs
+        )
+
+    @staticmethod
+    def records(*rows):
+        return list(enumerate(rows, start=2))
+
+    def test_upsert_by_sku(self):
+        records = self.records(
+            {'name': 'Giày A', 'category': 'Giày', 'base_price': '100', 'sku': 'A-39', 'stock': '3',
+             'options': 'Size=39'},
+            {'name': 'Giày A', 'sku': 'A-40', 'stock': '1', 'options': 'Size=40'},
+        )
+        job = self.create_job()
+        self.assertEqual(ProductImporter(job).process_chunk(records), [])
+        self.assertEqual((job.created_products, job.created_variants), (1, 2))
+
+        product = Product.objects.get(name='Giày A')
+        update = self.records({'model_code': product.model_code, 'sku': 'A-39', 'stock': '7', 'price': '120'})
+        job = self.create_job()
+        self.assertEqual(ProductImporter(job).process_chunk(update), [])
+        self.assertEqual((job.created_products, job.updated_products, job.updated_variants), (0, 1, 1))
+
+        variant = ProductVariant.objects.get(sku='A-39')
+        self.assertEqual((variant.stock, variant.price, variant.product_id), (7, Decimal('120'), product.pk))
+        self.assertEqual(Product.objects.filter(name='Giày A').count(), 1)
+
+    def test_row_errors(self):
+        records = self.records(
+            {'sku': 'X-1'},
+            {'name': 'Giày B', 'category': 'Không có', 'sku': 'X-2'},
+            {'name': 'Giày C', 'category': 'Giày', 'base_price': '100', 'sku': 'X-3', 'stock': '1.5'},
+            ValueError("invalid JSON"),
+        )
+        job = self.create_job()
+        errors = ProductImporter(job).process_chunk(records)
+        self.assertEqual(errors, [
+            "Row 2: model_code or name is required",
+            "Row 3: category 'Không có' not found",
+            "Row 4: stock must be a whole number, got '1.5'",
+            "Row 5: invalid JSON",
+        ])
+        self.assertEqual((job.processed_rows, job.error_count), (4, 4))
+        self.assertFalse(Product.objects.exists())
+
+    def test_resumed_job_does_not_duplicate_products(self):
+        row = {'name': 'Giày D', 'category': 'Giày', 'base_price': '100'}
+        job = self.create_job()
+        ProductImporter(job).process_chunk(self.records(dict(row, sku='D-1')))
+
+        # Process mới chạy tiếp job (name_codes của lần trước đã mất)
+        job = ProductImportJob.objects.get(pk=job.pk)
+        ProductImporter(job).process_chunk([(3, dict(row, sku='D-2'))])
+
+        product = Product.objects.get(name='Giày D')
+        self.assertEqual(
+            sorted(product.variants.values_list('sku', flat=True)), ['D-1', 'D-2']
+        )
+
+
+# ===== LƯU PRODUCT (Product.save) =====
+
+class ProductSaveTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.product = create_product(create_store(), Category.objects.create(name='Giày'), stocks=(5, 5))
+
+    def test_stale_save_keeps_variant_summary(self):
+        stale = Product.objects.get(pk=self.product.pk)
+        ProductVariant.objects.filter(product=self.product).update(stock=1)
+        Product.refresh_variant_summary([self.product.pk])
+        stale.name = 'Giày đổi tên'
+        # Giá cơ bản không đổi => chỉ một câu UPDATE, không tính lại khoảng giá
+        with self.assertNumQueries(1):
+            stale.save()
+
+        product = Product.objects.get(pk=self.product.pk)
+        self.assertEqual((product.name, product.total_stock, product.variant_count), ('Giày đổi tên', 2, 2))
+
+    def test_base_price_change_refreshes_summary(self):
+        ProductVariant.objects.filter(product=self.product).update(is_active=False)
+        product = Product.objects.get(pk=self.product.pk)
+        product.base_price = Decimal('80000')
+        product.save()
+        # Không còn variant active => khoảng giá = giá cơ bản mới
+        self.assertEqual((product.min_price, product.max_price, product.variant_count), (80000, 80000, 0))
+
+
+# ===== ĐÁNH GIÁ (Product.apply_review) =====
+
+class RatingTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.product = create_product(create_store(), Category.objects.create(name='Giày'), stocks=())
+
+    def test_apply_review_deltas(self):
+        product = self.product
+        Product.apply_review(product.pk, added=5)
+        Product.apply_review(product.pk, added=3)
+        Product.apply_review(product.pk, added=2, removed=3)   # sửa đánh giá 3 sao thành 2 sao
+        product.refresh_from_db()
+        self.assertEqual((product.review_count, product.rating_sum), (2, 7))
+        self.assertAlmostEqual(product.rating, 3.5)
+        self.assertEqual((product.rating_5_count, product.rating_3_count, product.rating_2_count), (1, 0, 1))
+
+        Product.apply_review(product.pk, removed=5)
+        Product.apply_review(product.pk, removed=2)
+        product.refresh_from_db()
+        self.assertEqual((product.review_count, product.rating_sum, product.rating), (0, 0, 0.0))
+
+    def test_stale_save_keeps_rating(self):
+        stale = Product.objects.get(pk=self.product.pk)
+        Product.apply_review(self.product.pk, added=4)
+        stale.name = 'Giày đổi tên'
+        stale.save()
+
+        product = Product.objects.get(pk=self.product.pk)
+        self.assertEqual((product.name, product.review_count, product.rating_4_count), ('Giày đổi tên', 1, 1))
+        self.assertAlmostEqual(product.rating, 4.0)
+
+
+# ===== THỐNG KÊ BÁN HÀNG (signals.py, ProductSalesStats) =====
+
+class SalesStatsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        store, category = create_store(), Category.objects.create(name='Giày')
+        cls.products = [
+            create_product(store, category, name=name, stocks=(5,)) for name in ('Giày chạy bộ', 'Giày đá bóng')
+        ]
+        cls.variants = [product.variants.get() for product in cls.products]
+        user = User.objects.create_user(username='buyer', email='buyer@shoex.vn', password='x')
+        address = Address.objects.create(user=user, province='HCM', ward='Bến Nghé', detail='1 Lê Lợi')
+        cls.order = Order.objects.create(buyer=user, address=address, total_amount=Decimal('200000'))
+        cls.sub_order = SubOrder.objects.create(order=cls.order, store=store, subtotal=Decimal('200000'))
+
+    def sold(self, product):
+        return ProductSalesStats.objects.values_list('sold_count', 'sold_count_last_30').get(product=product)
+
+    def create_item(self, variant, quantity):
+        return OrderItem.objects.create(
+            order=self.order, sub_order=self.sub_order, variant=variant, quantity=quantity,
+            price_at_order=variant.price
+        )
+
+    def test_loaded_order_and_variant_skip_lookups(self):
+        # INSERT + UPDATE thống kê: product / ngày đặt lấy từ variant / order đã load
+        with self.assertNumQueries(2):
+            item = self.create_item(self.variants[0], 2)
+        item.quantity = 3
+        with self.assertNumQueries(2):
+            item.save()
+        item.discount_amount = Decimal('1000')
+        with self.assertNumQueries(1):
+            item.save()
+        self.assertEqual(self.sold(self.products[0]), (3, 3))
+
+    def test_update_and_delete(self):
+        self.create_item(self.variants[0], 2)
+        item = OrderItem.objects.get()     # không có cache variant / order
+        item.variant_id, item.quantity = self.variants[1].pk, 4
+        item.save()
+        self.assertEqual((self.sold(self.products[0]), self.sold(self.products[1])), ((0, 0), (4, 4)))
+
+        item.delete()
+        self.assertEqual(self.sold(self.products[1]), (0, 0))
+
+    def test_missing_stats_row_sorts_last(self):
+        self.create_item(self.variants[0], 1)
+        self.create_item(self.variants[1], 2)
+        # bulk_create bỏ qua signal => product không có dòng ProductSalesStats
+        orphan, = Product.objects.bulk_create([
+            Product(store=self.products[0].store, category=self.products[0].category, name='Dép',
+                    slug='dep', base_price=Decimal('50000'))
+        ])
+        queryset = apply_product_sorting(annotate_sales_stats(Product.objects.all()), 'sales_desc')
+        expected = [self.products[1].pk, self.products[0].pk, orphan.pk]
+        self.assertEqual(list(queryset.values_list('pk', flat=True)), expected)
+        self.assertEqual(queryset.get(pk=orphan.pk).sold_count, 0)
+        self.assertEqual(paginate(queryset, 2), expected)
+        self.assertEqual(paginate(queryset, 2, backward=True), expected)
+
+
+# ===== THÔNG TIN ẢNH (utils.read_image_info) =====
+
+class ImageInfoTests(TestCase):
+    def test_exif_rotated_photo(self):
+        # Ảnh điện thoại chụp dọc: pixel lưu 1200x800 + EXIF orientation 6
+        exif = Image.Exif()
+        exif[0x0112] = 6
+        buffer = BytesIO()
+        Image.new('RGB', (1200, 800), (200, 30, 30)).save(buffer, format='JPEG', exif=exif)
+        upload = SimpleUploadedFile('doc.jpg', buffer.getvalue())
+
+        info = validate_image(upload)['info']
+        self.assertEqual((info['width'], info['height'], info['format']), (800, 1200, 'JPEG'))
+        self.assertEqual(info['hash'], media_storage.hash_content(upload))
+        self.assertEqual(info['size'], len(buffer.getvalue()))
+
+        # Bản thu nhỏ xoay theo EXIF như kích thước đã đọc
+        use_temporary_media(self)
+        renditions, _ = images.render_image(media_storage.save('doc.jpg', upload), {'400': 400})
+        self.assertEqual((renditions['400']['width'], renditions['400']['height']), (400, 600))
+
+    def test_not_an_image(self):
+        with self.assertRaises(ValueError):
+            read_image_info(BytesIO(b'not an image'))
+
+
+# ===== BẢN THU NHỎ (images.py) =====
+
+class ImageRenditionTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.product = create_product(create_store(), Category.objects.create(name='Giày'), stocks=())
+
+    def setUp(self):
+        use_temporary_media(self)
+        self.image = ProductImage.objects.create(product=self.product, image=image_upload())
+
+    def test_renders_beside_original(self):
+        self.assertEqual(process_renditions(ProductImage), (1, 0))
+        image = ProductImage.objects.get(pk=self.image.pk)
+        self.assertEqual((image.renditions_status, image.width, image.height, image.format), ('ready', 1200, 800, 'JPEG'))
+        directory = posixpath.join(posixpath.dirname(image.image.name), 'renditions')
+        for rendition in image.renditions.values():
+            for format in ('jpeg', 'webp'):
+                self.assertEqual(posixpath.dirname(rendition[format]), directory)
+                self.assertTrue(media_storage.exists(rendition[format]))
+        self.assertEqual(image.rendition_url(), media_storage.url(image.renditions['800']['jpeg']))
+
+    def test_claim_once_and_stale_claim(self):
+        _, rows = claim_renditions(ProductImage)
+        self.assertEqual([row[0] for row in rows], [self.image.pk])
+        # Đang processing => không ai nhận lại, kể cả khi cho phép nhận việc quá hạn
+        self.assertEqual(claim_renditions(ProductImage)[1], [])
+        self.assertEqual(claim_renditions(ProductImage, stale_after=images.STALE_AFTER)[1], [])
+
+        # Worker chết giữa chừng => quá STALE_AFTER thì nhận lại được
+        ProductImage.objects.filter(pk=self.image.pk).update(
+            renditions_updated_at=timezone.now() - images.STALE_AFTER - timedelta(minutes=1)
+        )
+        self.assertEqual(claim_renditions(ProductImage)[1], [])
+        _, rows = claim_renditions(ProductImage, stale_after=images.STALE_AFTER)
+        self.assertEqual([row[0] for row in rows], [self.image.pk])
+
+    def test_replaced_mid_render_drops_result(self):
+        def replace_then_render(func, tasks):
+            image = ProductImage.objects.get(pk=self.image.pk)
+            image.image = image_upload('moi.png', color=(0, 90, 200), format='PNG')
+            image.save()
+            return map(func, tasks)
+
+        self.assertEqual(process_renditions(ProductImage, map=replace_then_render), (0, 0))
+        image = ProductImage.objects.get(pk=self.image.pk)
+        self.assertEqual((image.renditions_status, image.renditions), ('pending', {}))
+        self.assertTrue(image.image.name.endswith('.png'))
+
+        # Lần chạy sau render ảnh mới
+        self.assertEqual(process_renditions(ProductImage), (1, 0))
+        self.assertEqual(ProductImage.objects.get(pk=self.image.pk).format, 'PNG')
+
+    def test_executor_created_once(self):
+        created = []
+
+        def slow_executor(**kwargs):
+            time.sleep(0.01)     # Nới khoảng hở giữa kiểm tra và gán
+            created.append(kwargs)
+            return mock.Mock()
+
+        barrier = threading.Barrier(8)
+
+        def schedule():
+            barrier.wait()
+            executors.append(images._get_executor())
+
+        executors = []
+        with mock.patch.object(images, '_executor', None), \
+                mock.patch.object(images, 'ThreadPoolExecutor', side_effect=slow_executor):
+            threads = [threading.Thread(target=schedule) for _ in range(8)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        self.assertEqual(len(created), 1)
+        self.assertEqual(len({id(executor) for executor in executors}), 1)
+
+
+# ===== ĐẾM THAM CHIẾU / THU GOM MEDIA (media.py) =====
+
+class MediaRefcountTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.product = create_product(create_store(), Category.objects.create(name='Giày'), stocks=())
+
+    def setUp(self):
+        use_temporary_media(self)
+
+    def refs(self, name):
+        return MediaBlob.objects.values_list('ref_count', flat=True).get(name=name)
+
+    def age(self, name):
+        """Hết tham chiếu từ 2 ngày trước, file không bị chạm từ đó"""
+        released = timezone.now() - timedelta(days=2)
+        MediaBlob.objects.filter(name=name).update(released_at=released)
+        os.utime(media_storage.path(name), (released.timestamp(), released.timestamp()))
+
+    def test_refcount_save_replace_delete(self):
+        first = ProductImage.objects.create(product=self.product, image=image_upload())
+        second = ProductImage.objects.create(product=self.product, image=image_upload('ban-sao.jpg'))
+        red = first.image.name
+        # Cùng nội dung => một file dùng chung
+        self.assertEqual((second.image.name, self.refs(red)), (red, 2))
+
+        # Không đổi ảnh: chỉ câu UPDATE, không SELECT ảnh cũ
+        image = ProductImage.objects.get(pk=first.pk)
+        image.alt_text = 'Giày đỏ'
+        with self.assertNumQueries(1):
+            image.save()
+
+        image.image = image_upload('xanh.png', color=(0, 90, 200), format='PNG')
+        image.save()
+        blue = image.image.name
+        self.assertEqual((self.refs(red), self.refs(blue)), (1, 1))
+        self.assertEqual(ProductImage.objects.get(pk=first.pk).renditions_status, 'pending')
+
+        second.delete()
+        self.assertEqual(self.refs(red), 0)
+        self.assertIsNotNone(MediaBlob.objects.get(name=red).released_at)
+
+    def test_collect_media_grace_and_recheck(self):
+        image = ProductImage.objects.create(product=self.product, image=image_upload())
+        process_renditions(ProductImage)
+        red = image.image.name
+        renditions = [
+            name for rendition in ProductImage.objects.get(pk=image.pk).renditions.values()
+            for name in (rendition['jpeg'], rendition['webp'])
+        ]
+        kept = ProductImage.objects.create(product=self.product, image=image_upload('xanh.png', color=(0, 90, 200), format='PNG'))
+        blue = kept.image.name
+        image.delete()
+
+        # Vừa hết tham chiếu => còn trong thời gian grace
+        self.assertEqual(collect_media(), (0, 0, 0))
+        self.assertTrue(media_storage.exists(red))
+
+        self.age(red)
+        # ref_count lệch về 0 nhưng dòng vẫn dùng file => kiểm tra lại trên bảng, không xóa
+        MediaBlob.objects.filter(name=blue).update(ref_count=0)
+        self.age(blue)
+        deleted, freed, revived = collect_media()
+        self.assertEqual((deleted, revived), (1, 1))
+        self.assertGreater(freed, 0)
+        self.assertFalse(any(media_storage.exists(name) for name in [red] + renditions))
+        self.assertTrue(media_storage.exists(blue))
+        self.assertEqual(self.refs(blue), 1)
+        self.assertFalse(MediaBlob.objects.filter(name=red).exists())
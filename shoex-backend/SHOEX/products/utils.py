@@ -1,8 +1,12 @@
+import hashlib
 import os
 import uuid
+import threading
+from contextlib import contextmanager
 from PIL import Image
 from django.core.files.base import ContentFile
 from django.core.files.storage import default_storage
+from django.db import transaction
 from io import BytesIO
 
 
@@ -96,48 +100,80 @@ def create_thumbnail(image, size=(150, 150)):
     return ContentFile(output.read())
 
 
+IMAGE_FORMATS = ('JPEG', 'PNG', 'WEBP')
+IMAGE_MAX_SIZE = 10 * 1024 * 1024       # 10MB
+IMAGE_MAX_PIXELS = 40_000_000           # ~40MP (ảnh điện thoại 12-24MP), chặn ảnh "bom giải nén"
+EXIF_ORIENTATION = 0x0112
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def read_image_info(image):
+    """
+    Đọc thông tin ảnh chỉ từ header (Image.open không giải mã pixel) + SHA-256 nội dung theo từng khối
+
+    Returns:
+        dict: {'width', 'height' (theo hướng hiển thị EXIF), 'format', 'hash', 'size'}
+    Raise ValueError nếu không phải ảnh đọc được
+    """
+    image.seek(0)
+    try:
+        with Image.open(image) as img:
+            width, height = img.size
+            format = img.format
+            # Ảnh điện thoại chụp dọc: pixel lưu nằm ngang + EXIF orientation 5-8
+            if format == 'JPEG' and img.getexif().get(EXIF_ORIENTATION) in (5, 6, 7, 8):
+                width, height = height, width
+    except (OSError, SyntaxError, Image.DecompressionBombError) as e:
+        raise ValueError(str(e))
+
+    image.seek(0)
+    digest, size = hashlib.sha256(), 0
+    for chunk in iter(lambda: image.read(HASH_CHUNK_SIZE), b''):
+        digest.update(chunk)
+        size += len(chunk)
+    image.seek(0)
+    return {'width': width, 'height': height, 'format': format, 'hash': digest.hexdigest(), 'size': size}
+
+
 def validate_image(image):
     """
-    Validate file upload là ảnh hợp lệ
+    Validate file upload là ảnh hợp lệ (chỉ đọc header, không giải mã ảnh)
     
     Args:
         image: Django UploadedFile
     
     Returns:
-        dict: {'valid': bool, 'error': str}
+        dict: {'valid': bool, 'error': str, 'info': read_image_info(image) khi hợp lệ}
     """
-    # Kiểm tra kích thước file (max 5MB)
-    max_size = 5 * 1024 * 1024  # 5MB
-    if image.size > max_size:
+    # Kiểm tra kích thước file
+    if image.size > IMAGE_MAX_SIZE:
         return {
             'valid': False,
-            'error': f'File quá lớn. Kích thước tối đa: {max_size // (1024*1024)}MB'
+            'error': f'File quá lớn. Kích thước tối đa: {IMAGE_MAX_SIZE // (1024*1024)}MB'
         }
     
     # Kiểm tra định dạng file
-    allowed_formats = ['JPEG', 'JPG', 'PNG', 'WEBP']
     try:
-        img = Image.open(image)
-        if img.format not in allowed_formats:
-            return {
-                'valid': False,
-                'error': f'Định dạng không hỗ trợ. Chỉ chấp nhận: {", ".join(allowed_formats)}'
-            }
-    except Exception as e:
+        info = read_image_info(image)
+    except ValueError:
         return {
             'valid': False,
             'error': 'File không phải là ảnh hợp lệ'
         }
+    if info['format'] not in IMAGE_FORMATS:
+        return {
+            'valid': False,
+            'error': f'Định dạng không hỗ trợ. Chỉ chấp nhận: {", ".join(IMAGE_FORMATS)}'
+        }
     
-    # Kiểm tra kích thước ảnh
-    max_dimensions = (2000, 2000)  # 2000x2000px
-    if img.size[0] > max_dimensions[0] or img.size[1] > max_dimensions[1]:
+    # Kiểm tra số điểm ảnh (ảnh gốc giữ nguyên, bản thu nhỏ sinh nền - xem images.py)
+    if info['width'] * info['height'] > IMAGE_MAX_PIXELS:
         return {
             'valid': False,
-            'error': f'Kích thước ảnh quá lớn. Tối đa: {max_dimensions[0]}x{max_dimensions[1]}px'
+            'error': f'Kích thước ảnh quá lớn. Tối đa: {IMAGE_MAX_PIXELS // 1_000_000}MP'
         }
     
-    return {'valid': True, 'error': None}
+    return {'valid': True, 'error': None, 'info': info}
 
 
 # Upload path functions
@@ -150,4 +186,109 @@ def product_image_upload_path(instance, filename):
 def product_attribute_option_upload_path(instance, filename):
     """Upload path cho ProductAttributeOption"""
     filename = generate_unique_filename(instance, filename)
-    return f'products/attributes/{instance.product.product_id}/{instance.attribute.name}/{filename}'
\ No newline at end of file
+    return f'products/attributes/{instance.product.product_id}/{instance.attribute.name}/{filename}'
+
+
+# ===== TÓM TẮT VARIANT (min/max price, total_stock, variant_count, availability_matrix) =====
+
+_variant_summary = threading.local()
+
+
+def schedule_variant_summary(product_ids):
+    """
+    Đánh dấu product cần tính lại tóm tắt variant
+    - Trong khối variant_summary_batch(): gom lại, tính 1 lần khi thoát khối
+    - Ngoài khối: tính ngay
+    """
+    pending = getattr(_variant_summary, 'pending', None)
+    if pending is not None:
+        pending.update(product_ids)
+        return
+    from .models import Product
+    Product.refresh_variant_summary(product_ids)
+    Product.refresh_availability_matrix(product_ids)
+
+
+def mark_variant_summary_stale(product_ids):
+    """
+    Kho đổi bằng UPDATE (checkout, giữ hàng): không tính lại ngay trên dòng product nóng
+    - Trong khối variant_summary_batch(): gom lại, tính khi thoát khối
+    - Ngoài khối: đánh dấu variant_summary_stale trong transaction hiện tại (rollback => bỏ luôn);
+      đã đánh dấu thì câu UPDATE không ghi gì. refresh_stale_variant_summaries tính lại định kỳ
+    """
+    pending = getattr(_variant_summary, 'pending', None)
+    if pending is not None:
+        pending.update(product_ids)
+        return
+    from .models import Product
+    Product.objects.filter(pk__in=product_ids, variant_summary_stale=False).update(variant_summary_stale=True)
+
+
+def refresh_stale_variant_summaries(batch_size=500):
+    """
+    Tính lại tóm tắt của các product đã đánh dấu, theo lô khóa chính tăng dần
+    (chạy định kỳ: `python manage.py refresh_variant_summaries`). Trả về số product
+    """
+    from .models import Product
+    refreshed, last_id = 0, 0
+    while True:
+        with transaction.atomic():
+            product_ids = list(
+                Product.objects.filter(variant_summary_stale=True, pk__gt=last_id)
+                .order_by('pk').values_list('pk', flat=True)[:batch_size]
+            )
+            if not product_ids:
+                return refreshed
+            # Bỏ cờ trước khi tính: checkout đổi kho sau đó sẽ đánh dấu lại (chờ row lock tới khi lô commit)
+            Product.objects.filter(pk__in=product_ids).update(variant_summary_stale=False)
+            Product.refresh_variant_summary(product_ids)
+            Product.refresh_availability_matrix(product_ids)
+        refreshed += len(product_ids)
+        last_id = product_ids[-1]
+
+
+def schedule_variant_options(variant_ids=(), product_ids=()):
+    """
+    Đánh dấu variant (hoặc toàn bộ variant của product) cần đồng bộ VariantOptionValue
+    Cùng cơ chế gom với schedule_variant_summary
+    """
+    pending = getattr(_variant_summary, 'option_variants', None)
+    if pending is not None:
+        pending.update(variant_ids)
+        _variant_summary.option_products.update(product_ids)
+        return
+    from .models import VariantOptionValue
+    VariantOptionValue.sync_variants(variant_ids)
+    VariantOptionValue.sync_products(product_ids)
+
+
+@contextmanager
+def variant_summary_batch():
+    """
+    Gom các thay đổi variant (bulk mutation, admin action...) => một câu UPDATE
+    cho tất cả product liên quan thay vì mỗi variant một lần
+    Chỉ mục VariantOptionValue cũng được đồng bộ một lần khi thoát khối
+    """
+    if getattr(_variant_summary, 'pending', None) is not None:
+        # Khối lồng nhau: khối ngoài cùng sẽ tính
+        yield
+        return
+
+    _variant_summary.pending = set()
+    _variant_summary.option_variants = set()
+    _variant_summary.option_products = set()
+    try:
+        yield
+        pending = _variant_summary.pending
+        option_variants = _variant_summary.option_variants
+        option_products = _variant_summary.option_products
+    finally:
+        _variant_summary.pending = None
+        _variant_summary.option_variants = None
+        _variant_summary.option_products = None
+
+    from .models import Product, VariantOptionValue
+    VariantOptionValue.sync_products(option_products)
+    VariantOptionValue.sync_variants(option_variants)
+    Product.refresh_variant_summary(pending)
+    Product.refresh_availability_matrix(pending)
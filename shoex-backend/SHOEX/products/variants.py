@@ -0,0 +1,161 @@
+"""
+Sinh toàn bộ biến thể (tích Descartes các tùy chọn thuộc tính) cho nhiều product
+
+Số query cố định, không phụ thuộc số tổ hợp:
+- 1 query product, 1 query tùy chọn (mọi product), 1 query tổ hợp đã có
+- SKU đã dùng: lấy theo tiền tố "{model_code}-" của từng product (theo lô) vào một set,
+  đụng SKU được giải quyết trong bộ nhớ (base, base-1, base-2, ...)
+- bulk_create variant theo lô; chỉ mục VariantOptionValue ghi thẳng từ option đã biết
+  (không parse lại JSON), tóm tắt variant của product tính một lần cuối
+
+Dùng chung cho admin action, GraphQL (GenerateProductVariants) và
+`python manage.py generate_variants`.
+"""
+
+from decimal import Decimal
+from functools import reduce
+from itertools import product as cartesian_product
+from operator import or_
+
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+
+from .models import Product, ProductAttributeOption, ProductVariant, VariantOptionValue
+from .history import record_stock_changes
+from .utils import schedule_variant_summary, variant_summary_batch
+
+
+DEFAULT_WEIGHT = Decimal('0.3')
+MAX_COMBINATIONS = 5000       # Số tổ hợp tối đa / product (chặn tích Descartes bùng nổ)
+SKU_PREFIX_BATCH = 200        # Số tiền tố SKU mỗi query
+MAX_SKU_RETRIES = 3
+
+
+def combination_key(option_combinations):
+    """Khóa so sánh tổ hợp, không phụ thuộc thứ tự / dạng lưu (dict hoặc chuỗi JSON)"""
+    return frozenset(
+        (str(name), str(value)) for name, value in ProductVariant.parse_options(option_combinations).items()
+    )
+
+
+def _sku_code(product):
+    return str(product.model_code or product.product_id)
+
+
+def _base_sku(product, combo):
+    suffix = "".join(str(option.value_code or option.value)[:4] for option in combo).upper()
+    return f"{_sku_code(product)}-{suffix}"
+
+
+def _taken_skus(prefixes):
+    """Mọi SKU bắt đầu bằng một trong các tiền tố"""
+    prefixes = sorted(set(prefixes))
+    taken = set()
+    for start in range(0, len(prefixes), SKU_PREFIX_BATCH):
+        condition = reduce(or_, (Q(sku__startswith=prefix) for prefix in prefixes[start:start + SKU_PREFIX_BATCH]))
+        taken.update(ProductVariant.objects.filter(condition).values_list('sku', flat=True))
+    return taken
+
+
+def _next_sku(base, taken):
+    sku, i = base, 1
+    while sku in taken:
+        sku = f"{base}-{i}"
+        i += 1
+    taken.add(sku)
+    return sku
+
+
+def _create_batch(batch, taken):
+    """bulk_create một lô; SKU vừa bị ghi đồng thời => lấy lại SKU đã dùng, đặt lại tên, thử lại"""
+    for attempt in range(MAX_SKU_RETRIES):
+        try:
+            with transaction.atomic():
+                return ProductVariant.objects.bulk_create([variant for variant, _, _ in batch])
+        except IntegrityError:
+            if attempt == MAX_SKU_RETRIES - 1:
+                raise
+            # Lô đã rollback => SKU của lô trống lại, trừ những SKU process khác vừa tạo
+            for variant, _, _ in batch:
+                taken.discard(variant.sku)
+            taken.update(_taken_skus({base for _, base, _ in batch}))
+            for variant, base, _ in batch:
+                variant.sku = _next_sku(base, taken)
+
+
+def generate_variants(product_ids, price=None, stock=0, weight=DEFAULT_WEIGHT, batch_size=1000):
+    """
+    Tạo các biến thể còn thiếu từ tùy chọn thuộc tính (is_available) của từng product
+    price: giá cho variant mới (mặc định base_price của product)
+    Trả về {product_id: số variant mới}, None cho product chưa có tùy chọn nào
+    Raise ValueError nếu product có quá MAX_COMBINATIONS tổ hợp (không tạo gì)
+    """
+    products = {
+        product.pk: product
+        for product in Product.objects.filter(pk__in=product_ids).only('product_id', 'model_code', 'base_price')
+    }
+    groups = {product_id: {} for product_id in products}
+    for option in ProductAttributeOption.objects.filter(product_id__in=products.keys(), is_available=True)\
+            .select_related('attribute'):
+        groups[option.product_id].setdefault(option.attribute_id, []).append(option)
+
+    too_large = []
+    for product_id, attributes in groups.items():
+        size = 1
+        for options in attributes.values():
+            size *= len(options)
+        if attributes and size > MAX_COMBINATIONS:
+            too_large.append(f"{product_id} ({size})")
+    if too_large:
+        raise ValueError(f"Quá {MAX_COMBINATIONS} tổ hợp cho product: {', '.join(too_large)}")
+
+    existing = {
+        (product_id, combination_key(option_combinations))
+        for product_id, option_combinations in ProductVariant.objects.filter(product_id__in=products.keys())
+        .values_list('product_id', 'option_combinations')
+    }
+    taken = _taken_skus(f"{_sku_code(product)}-" for product in products.values())
+
+    # (variant chưa lưu, SKU gốc, [(attribute_id, option_id)])
+    pending = []
+    result = {}
+    for product_id, product in products.items():
+        attributes = groups[product_id]
+        if not attributes:
+            result[product_id] = None
+            continue
+        result[product_id] = 0
+        for combo in cartesian_product(*attributes.values()):
+            combination = {option.attribute.name: option.value for option in combo}
+            if (product_id, combination_key(combination)) in existing:
+                continue
+            base = _base_sku(product, combo)
+            pending.append((
+                ProductVariant(
+                    product_id=product_id,
+                    sku=_next_sku(base, taken),
+                    price=product.base_price if price is None else price,
+                    stock=stock,
+                    weight=weight,
+                    option_combinations=combination,
+                    is_active=True,
+                ),
+                base,
+                [(option.attribute_id, option.pk) for option in combo],
+            ))
+            result[product_id] += 1
+
+    with transaction.atomic(), variant_summary_batch():
+        for start in range(0, len(pending), batch_size):
+            batch = pending[start:start + batch_size]
+            variants = _create_batch(batch, taken)
+            # bulk_create không bắn post_save => tự ghi tồn kho ban đầu vào sổ cái
+            record_stock_changes({variant.pk: variant.stock for variant in variants}, source='create')
+            VariantOptionValue.objects.bulk_create([
+                VariantOptionValue(variant_id=variant.pk, attribute_id=attribute_id, option_id=option_id)
+                for variant, (_, _, option_pairs) in zip(variants, batch)
+                for attribute_id, option_id in option_pairs
+            ], batch_size=batch_size, ignore_conflicts=True)
+        # bulk_create không bắn post_save => tự làm mới min/max price, variant_count, availability_matrix
+        schedule_variant_summary({product_id for product_id, count in result.items() if count})
+    return result
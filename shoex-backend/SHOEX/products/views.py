@@ -1,4 +1,72 @@
-from django.shortcuts import render
+from django.core.exceptions import ValidationError
+from django.http import HttpResponseBadRequest, HttpResponseForbidden, StreamingHttpResponse
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from django.views.decorators.http import require_GET
+
+from SHOEX.store.models import Store, StoreUser
+from .exports import export_catalog, next_since
 
-# Create your views here.
 # Chỉ sử dụng GraphQL cho API, không cần REST API views
+# Ngoại lệ: file xuất catalog lớn, trả theo luồng thay vì dựng cả danh sách trong bộ nhớ
+
+CONTENT_TYPES = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv; charset=utf-8',
+}
+
+
+@require_GET
+def catalog_export(request):
+    """
+    GET /exports/catalog/?format=ndjson|csv&since=<ISO 8601>&store=<store_id>&gzip=1&inactive=1
+    Staff: toàn bộ catalog; thành viên store: bắt buộc store
+    Header X-Export-Started-At: dùng làm since cho lần đồng bộ sau (đã lùi EXPORT_SINCE_OVERLAP)
+    """
+    user = request.user
+    store_id = request.GET.get('store') or None
+    if not user.is_authenticated:
+        return HttpResponseForbidden("Authentication required")
+    if store_id is not None:
+        # store_id là CharField: giá trị quá dài / có ký tự NUL làm lỗi DB (500) => 400
+        try:
+            Store._meta.pk.run_validators(store_id)
+        except ValidationError:
+            return HttpResponseBadRequest("store must be a valid store id")
+    if not user.is_staff and (
+        store_id is None
+        or not StoreUser.objects.filter(store_id=store_id, user=user, status='active').exists()
+    ):
+        return HttpResponseForbidden("Permission denied")
+
+    # Thành viên store đã được kiểm tra ở trên; staff gõ sai mã => 400 thay vì file rỗng
+    if user.is_staff and store_id is not None and not Store.objects.filter(pk=store_id).exists():
+        return HttpResponseBadRequest("store does not exist")
+    format = request.GET.get('format', 'ndjson')
+    if format not in CONTENT_TYPES:
+        return HttpResponseBadRequest("format must be ndjson or csv")
+    since = request.GET.get('since')
+    if since:
+        since = parse_datetime(since.replace(' ', '+'))   # '+' của múi giờ bị decode thành khoảng trắng
+        if since is None:
+            return HttpResponseBadRequest("since must be an ISO 8601 datetime")
+        if timezone.is_naive(since):
+            since = timezone.make_aware(since)
+    compress = request.GET.get('gzip') in ('1', 'true')
+
+    started_at = timezone.now()
+    resume_at = next_since()
+    response = StreamingHttpResponse(
+        export_catalog(
+            format,
+            since=since or None,
+            store_id=store_id,
+            include_inactive=request.GET.get('inactive') in ('1', 'true'),
+            compress=compress
+        ),
+        content_type='application/gzip' if compress else CONTENT_TYPES[format]
+    )
+    filename = f"catalog-{started_at:%Y%m%d%H%M%S}.{format}" + ('.gz' if compress else '')
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    response['X-Export-Started-At'] = resume_at.isoformat()
+    return response
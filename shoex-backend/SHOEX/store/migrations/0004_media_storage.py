@@ -0,0 +1,34 @@
+# Generated by Django 5.2.6 on 2026-10-18 05:02
+
+import SHOEX.products.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0003_addressstore'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='store',
+            name='avatar',
+            field=models.ImageField(blank=True, null=True, storage=SHOEX.products.storage.ContentAddressedStorage(), upload_to='store/avatars/', verbose_name='Ảnh đại diện'),
+        ),
+        migrations.AlterField(
+            model_name='store',
+            name='cover_image',
+            field=models.ImageField(blank=True, null=True, storage=SHOEX.products.storage.ContentAddressedStorage(), upload_to='store/covers/', verbose_name='Ảnh bìa'),
+        ),
+        migrations.AlterField(
+            model_name='store',
+            name='logo',
+            field=models.ImageField(blank=True, null=True, storage=SHOEX.products.storage.ContentAddressedStorage(), upload_to='store/logos/', verbose_name='Logo'),
+        ),
+        migrations.AlterField(
+            model_name='storeimage',
+            name='image',
+            field=models.ImageField(storage=SHOEX.products.storage.ContentAddressedStorage(), upload_to='store/gallery/', verbose_name='Hình ảnh'),
+        ),
+    ]
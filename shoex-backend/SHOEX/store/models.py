@@ -1,5 +1,6 @@
 from django.db import models
 from django.contrib.auth import get_user_model
+from SHOEX.products.storage import media_storage
 
 User = get_user_model()
 
@@ -59,6 +60,7 @@ class Store(models.Model):
     
     avatar = models.ImageField(
         upload_to='store/avatars/',
+        storage=media_storage,
         blank=True,
         null=True,
         verbose_name="Ảnh đại diện"
@@ -66,6 +68,7 @@ class Store(models.Model):
     
     cover_image = models.ImageField(
         upload_to='store/covers/',
+        storage=media_storage,
         blank=True,
         null=True,
         verbose_name="Ảnh bìa"
@@ -73,6 +76,7 @@ class Store(models.Model):
     
     logo = models.ImageField(
         upload_to='store/logos/',
+        storage=media_storage,
         blank=True,
         null=True,
         verbose_name="Logo"
@@ -628,6 +632,7 @@ class StoreImage(models.Model):
     
     image = models.ImageField(
         upload_to='store/gallery/',
+        storage=media_storage,
         verbose_name="Hình ảnh"
     )
     
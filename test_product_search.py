@@ -10,10 +10,14 @@ from SHOEX.graphql_api.api import schema
 
 query = '''
 query {
-  products(search: "Shoes") {
-    productId
-    name
-    basePrice
+  products(search: "Shoes", first: 20) {
+    edges {
+      node {
+        productId
+        name
+        basePrice
+      }
+    }
   }
 }
 '''
@@ -21,7 +25,7 @@ query {
 result = schema.execute(query)
 print('Search result for Shoes:')
 if result.data:
-    products = result.data['products']
+    products = [edge['node'] for edge in result.data['products']['edges']]
     print(f'Found {len(products)} products')
     for p in products[:5]:  # Show first 5
         print(f'- {p["name"]}: {p["basePrice"]}')